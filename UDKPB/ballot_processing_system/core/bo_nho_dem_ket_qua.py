@@ -0,0 +1,99 @@
+# bo_nho_dem_ket_qua.py - Bộ nhớ đệm kết quả xử lý phiếu theo nội dung ảnh
+import os
+import json
+import hashlib
+import tempfile
+from typing import Dict, List, Optional
+
+# Kích thước mỗi lần đọc file khi tính hash
+KICH_THUOC_DOC = 64 * 1024
+
+def bam_file(duong_dan: str) -> str:
+    """
+    Tính SHA-256 nội dung file (đọc theo từng đoạn, không giữ cả file trong bộ nhớ)
+    """
+    bam = hashlib.sha256()
+    with open(duong_dan, 'rb') as f:
+        while True:
+            doan = f.read(KICH_THUOC_DOC)
+            if not doan:
+                break
+            bam.update(doan)
+    return bam.hexdigest()
+
+def ma_phien_ban(thong_tin_phien_ban: Dict) -> str:
+    """
+    Mã ngắn đại diện cho thông tin phiên bản (hash của JSON đã sắp xếp khóa)
+    """
+    chuoi_phien_ban = json.dumps(thong_tin_phien_ban, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(chuoi_phien_ban.encode('utf-8')).hexdigest()[:16]
+
+class BoNhoDemKetQua:
+    """
+    Lưu kết quả xử lý phiếu (output của xu_ly_phieu_bau_hoan_chinh) ra file JSON theo khóa nội dung ảnh
+
+    Kết quả được đặt trong thư mục con theo mã phiên bản (model, layout...) nên khi đổi model
+    hoặc layout thì các kết quả cũ không còn được dùng lại.
+    """
+
+    def __init__(self, thu_muc: str, thong_tin_phien_ban: Dict):
+        """
+        Args:
+            thu_muc: Thư mục gốc của bộ nhớ đệm
+            thong_tin_phien_ban: Các thông tin quyết định kết quả xử lý (phiên bản model, layout...)
+        """
+        self.ma_phien_ban = ma_phien_ban(thong_tin_phien_ban)
+        self.thu_muc = os.path.join(thu_muc, self.ma_phien_ban)
+        os.makedirs(self.thu_muc, exist_ok=True)
+
+        # Ghi lại thông tin phiên bản để tra cứu thư mục nào ứng với model/layout nào
+        file_phien_ban = os.path.join(self.thu_muc, "phien_ban.json")
+        if not os.path.exists(file_phien_ban):
+            self._ghi_json(file_phien_ban, thong_tin_phien_ban)
+
+    def _duong_dan(self, khoa: str) -> str:
+        """
+        Đường dẫn file kết quả của một khóa (chia thư mục con theo 2 ký tự đầu để tránh thư mục quá lớn)
+        """
+        return os.path.join(self.thu_muc, khoa[:2], f"{khoa}.json")
+
+    def _ghi_json(self, duong_dan: str, du_lieu):
+        """
+        Ghi JSON ra file tạm rồi đổi tên, để process khác không bao giờ đọc phải file ghi dở
+        """
+        thu_muc = os.path.dirname(duong_dan)
+        os.makedirs(thu_muc, exist_ok=True)
+        fd, file_tam = tempfile.mkstemp(dir=thu_muc, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(du_lieu, f, ensure_ascii=False, default=str)
+            os.replace(file_tam, duong_dan)
+        except Exception:
+            if os.path.exists(file_tam):
+                os.remove(file_tam)
+            raise
+
+    def lay(self, khoa: str) -> Optional[List[Dict]]:
+        """
+        Lấy kết quả đã lưu của khóa
+
+        Returns:
+            List kết quả từng dòng, None nếu chưa có (hoặc file hỏng)
+        """
+        try:
+            with open(self._duong_dan(khoa), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Không đọc được kết quả đã lưu {khoa}: {e}")
+            return None
+
+    def luu(self, khoa: str, ket_qua: List[Dict]):
+        """
+        Lưu kết quả của khóa (lỗi ghi chỉ được cảnh báo, không làm dừng việc kiểm phiếu)
+        """
+        try:
+            self._ghi_json(self._duong_dan(khoa), ket_qua)
+        except Exception as e:
+            print(f"[WARNING] Không lưu được kết quả {khoa} vào bộ nhớ đệm: {e}")
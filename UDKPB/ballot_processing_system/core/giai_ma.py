@@ -0,0 +1,27 @@
+# giai_ma.py - Các bước giải mã TrOCR dùng chung cho backend PyTorch và ONNX Runtime
+from typing import List
+
+def token_bi_cam_lap_ngram(chuoi: List[int], n: int) -> List[int]:
+    """
+    Các token không được sinh tiếp vì sẽ lặp lại một n-gram đã có (no_repeat_ngram_size)
+    """
+    if n <= 0 or len(chuoi) < n:
+        return []
+    tien_to = tuple(chuoi[len(chuoi) - n + 1:])
+    return [chuoi[i + n - 1] for i in range(len(chuoi) - n + 1) if tuple(chuoi[i:i + n - 1]) == tien_to]
+
+def chan_lap_ngram(logits, cac_chuoi, n: int):
+    """
+    Gán -inf (tại chỗ) cho logits của các token sẽ lặp lại n-gram, cho từng chuỗi của lô
+
+    Args:
+        logits: Logits token tiếp theo (số chuỗi, kích thước từ điển), numpy array hoặc torch tensor
+        cac_chuoi: Các token đã sinh của từng chuỗi (cùng thứ tự với logits)
+        n: no_repeat_ngram_size của model (0: không chặn)
+    """
+    if not n:
+        return
+    for i in range(len(cac_chuoi)):
+        cam = token_bi_cam_lap_ngram(cac_chuoi[i].tolist(), n)
+        if cam:
+            logits[i, cam] = float('-inf')
@@ -0,0 +1,175 @@
+# giai_ma_ung_vien.py - Đọc ô họ tên bằng giải mã TrOCR ràng buộc theo danh sách ứng viên của cuộc bỏ phiếu
+import heapq
+import math
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Số giả thuyết giữ lại cho mỗi ô ở mỗi bước giải mã (beam search trên cây tiền tố)
+SO_BEAM_UNG_VIEN = 5
+
+# Độ tin cậy (xác suất hậu nghiệm giữa các ứng viên) tối thiểu để nhận ứng viên từ giải mã ràng buộc;
+# thấp hơn thì ô được đọc tự do rồi so khớp như cũ
+NGUONG_TIN_CAY_UNG_VIEN = 0.9
+
+# Xác suất trung bình (trung bình nhân) mỗi token của tên được chọn tối thiểu: giải mã ràng buộc
+# luôn chọn được một ứng viên kể cả khi ô ghi tên không có trong danh sách, ngưỡng này loại các ô đó
+NGUONG_XAC_SUAT_TOKEN = 0.5
+
+def bo_dau(ten: str) -> str:
+    """
+    Bỏ dấu tiếng Việt (kể cả đ/Đ)
+    """
+    ten = ten.replace('đ', 'd').replace('Đ', 'D')
+    return ''.join(c for c in unicodedata.normalize('NFD', ten) if not unicodedata.combining(c))
+
+def bien_the_ten(ho_ten: str) -> List[str]:
+    """
+    Các cách viết của một họ tên mà model có thể đọc ra: nguyên gốc, chữ in hoa và chữ in hoa không dấu
+    (model TrOCR printed thường không đọc đúng dấu tiếng Việt)
+    """
+    ten = ' '.join((ho_ten or '').split())
+    cac_bien_the = []
+    for bien_the in (ten, ten.upper(), bo_dau(ten).upper()):
+        if bien_the and bien_the not in cac_bien_the:
+            cac_bien_the.append(bien_the)
+    return cac_bien_the
+
+class _Nut:
+    """
+    Nút của cây tiền tố: các nút con theo token, id ứng viên kết thúc tại nút (chỉ nút sau token eos)
+    """
+    __slots__ = ('con', 'ung_vien')
+
+    def __init__(self):
+        self.con = {}
+        self.ung_vien = []
+
+class BoGiaiMaUngVien:
+    """
+    Giải mã ràng buộc: mỗi bước decoder chỉ được chọn token đi tiếp trên cây tiền tố (trie) xây từ
+    chuỗi token tên các ứng viên, nên kết quả luôn là tên một ứng viên kèm log xác suất của cả chuỗi
+    """
+
+    def __init__(self, danh_sach_ung_vien: Iterable[Tuple], tokenizer, bat_dau_token_id: int, eos_token_id: int,
+                 so_beam: int = SO_BEAM_UNG_VIEN):
+        """
+        Args:
+            danh_sach_ung_vien: Các cặp (id, họ tên) ứng viên
+            tokenizer: Tokenizer của TrOCR (có bos_token_id thì tên được thêm cả dạng bắt đầu bằng bos)
+            bat_dau_token_id: decoder_start_token_id của model
+            eos_token_id: Token kết thúc chuỗi
+            so_beam: Số giả thuyết giữ lại cho mỗi ô ở mỗi bước
+        """
+        self.bat_dau = bat_dau_token_id
+        self.eos = eos_token_id
+        self.so_beam = max(1, so_beam)
+        self.goc = _Nut()
+        self.ho_ten = {}
+        self.thu_tu = {}
+        self.do_dai_toi_da = 0
+        # Model có thể sinh <s> ngay sau decoder_start_token_id (như khi huấn luyện với nhãn có token đặc biệt)
+        # hoặc vào thẳng tên, nên cây có cả hai nhánh
+        bos = getattr(tokenizer, 'bos_token_id', None)
+        cac_tien_to = [[]] if bos is None or bos == bat_dau_token_id else [[], [bos]]
+
+        for uv_id, ho_ten in danh_sach_ung_vien:
+            if uv_id in self.ho_ten:
+                continue
+            self.ho_ten[uv_id] = ho_ten
+            self.thu_tu[uv_id] = len(self.thu_tu)
+            for bien_the in bien_the_ten(ho_ten):
+                chuoi_token = tokenizer(bien_the, add_special_tokens=False).input_ids
+                for tien_to in cac_tien_to:
+                    self._them(tien_to + chuoi_token + [self.eos], uv_id)
+
+    def _them(self, chuoi_token: List[int], uv_id):
+        """
+        Thêm chuỗi token (kết thúc bằng eos) của một cách viết tên ứng viên vào cây
+        """
+        nut = self.goc
+        for token in chuoi_token:
+            nut = nut.con.setdefault(token, _Nut())
+        if uv_id not in nut.ung_vien:
+            nut.ung_vien.append(uv_id)
+        self.do_dai_toi_da = max(self.do_dai_toi_da, len(chuoi_token))
+
+    def giai_ma(self, ham_log_xac_suat: Callable[[np.ndarray, np.ndarray], np.ndarray], so_anh: int) -> List[Optional[Dict]]:
+        """
+        Beam search trên cây tiền tố cho một lô ảnh; mọi giả thuyết của mọi ảnh cùng độ dài
+        nên mỗi bước chỉ gọi decoder một lần cho cả lô
+
+        Args:
+            ham_log_xac_suat: Hàm (chỉ số ảnh của từng chuỗi, mảng chuỗi token) -> log xác suất
+                token tiếp theo (số chuỗi, kích thước từ điển)
+            so_anh: Số ảnh trong lô
+
+        Returns:
+            List dict {'ung_vien_id', 'ho_ten', 'do_tin_cay', 'log_xac_suat', 'xac_suat_token_tb'}
+            cho từng ảnh (None nếu không có ứng viên nào)
+        """
+        if not self.goc.con:
+            return [None] * so_anh
+
+        # Giả thuyết: (log xác suất, chuỗi token, nút hiện tại trên cây)
+        cac_beam = [[(0.0, [self.bat_dau], self.goc)] for _ in range(so_anh)]
+        # Ứng viên đã giải mã xong: id -> (log xác suất tốt nhất, số token)
+        hoan_thanh = [{} for _ in range(so_anh)]
+        diem_hoan_thanh = [[] for _ in range(so_anh)]
+
+        for _ in range(self.do_dai_toi_da):
+            hang = [(a, gia_thuyet) for a in range(so_anh) for gia_thuyet in cac_beam[a]]
+            if not hang:
+                break
+            log_p = ham_log_xac_suat(np.array([a for a, _ in hang], dtype=np.int64),
+                                     np.array([gia_thuyet[1] for _, gia_thuyet in hang], dtype=np.int64))
+
+            mo_rong = [[] for _ in range(so_anh)]
+            for r, (a, (diem, chuoi, nut)) in enumerate(hang):
+                for token, con in nut.con.items():
+                    diem_moi = diem + float(log_p[r, token])
+                    if token != self.eos:
+                        mo_rong[a].append((diem_moi, chuoi + [token], con))
+                        continue
+                    diem_hoan_thanh[a].append(diem_moi)
+                    for uv_id in con.ung_vien:
+                        if diem_moi > hoan_thanh[a].get(uv_id, (-math.inf,))[0]:
+                            hoan_thanh[a][uv_id] = (diem_moi, len(chuoi))
+
+            for a in range(so_anh):
+                cac_beam[a] = heapq.nlargest(self.so_beam, mo_rong[a], key=lambda gia_thuyet: gia_thuyet[0])
+                # Log xác suất chỉ giảm khi chuỗi dài thêm: dừng khi giả thuyết tốt nhất còn lại
+                # không thể vượt so_beam kết quả tốt nhất đã xong
+                tot_nhat = heapq.nlargest(self.so_beam, diem_hoan_thanh[a])
+                if cac_beam[a] and len(tot_nhat) >= self.so_beam and cac_beam[a][0][0] <= tot_nhat[-1]:
+                    cac_beam[a] = []
+
+        return [self._ket_qua(xong) for xong in hoan_thanh]
+
+    def _ket_qua(self, hoan_thanh: Dict) -> Optional[Dict]:
+        """
+        Chọn ứng viên có log xác suất cao nhất; độ tin cậy là xác suất hậu nghiệm của ứng viên đó
+        giữa các ứng viên đã giải mã xong (bằng điểm giữ ứng viên đứng trước trong danh sách)
+        """
+        if not hoan_thanh:
+            return None
+        cac_id = sorted(hoan_thanh, key=lambda uv_id: (-hoan_thanh[uv_id][0], self.thu_tu[uv_id]))
+        diem = np.array([hoan_thanh[uv_id][0] for uv_id in cac_id])
+        xac_suat = np.exp(diem - diem[0])
+        uv_id = cac_id[0]
+        log_xac_suat, so_token = hoan_thanh[uv_id]
+        return {
+            'ung_vien_id': uv_id,
+            'ho_ten': self.ho_ten[uv_id],
+            'do_tin_cay': float(xac_suat[0] / xac_suat.sum()),
+            'log_xac_suat': log_xac_suat,
+            'xac_suat_token_tb': math.exp(log_xac_suat / so_token),
+        }
+
+def tin_cay_du(ket_qua: Optional[Dict], nguong_tin_cay: float = NGUONG_TIN_CAY_UNG_VIEN) -> bool:
+    """
+    Kết quả giải mã ràng buộc đủ tin cậy để gắn ứng viên mà không cần đọc tự do và so khớp
+    """
+    return (ket_qua is not None and ket_qua['do_tin_cay'] >= nguong_tin_cay
+            and ket_qua['xac_suat_token_tb'] >= NGUONG_XAC_SUAT_TOKEN)
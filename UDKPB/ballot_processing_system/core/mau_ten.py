@@ -0,0 +1,189 @@
+# mau_ten.py - Mẫu họ tên của một cuộc bỏ phiếu: cột họ tên in sẵn giống nhau trên mọi phiếu nên chỉ đọc
+# một lần từ phiếu tham chiếu, các phiếu sau chỉ so perceptual hash (dHash) của ô họ tên với mẫu
+import os
+import json
+import tempfile
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+# Tên file lưu mẫu, nằm trong thư mục kết quả của cuộc bỏ phiếu
+TEN_FILE_MAU_TEN = "mau_ten.json"
+
+# Kích thước (rộng, cao) thu nhỏ ô họ tên trước khi tính dHash: ô họ tên dài và thấp nên lấy
+# nhiều cột hơn hàng; mỗi cặp điểm ảnh liền kề trên một hàng cho một bit -> 32 x 8 = 256 bit
+KICH_THUOC_BAM = (32, 8)
+
+# Tỷ lệ lề bị bỏ ở mỗi cạnh ô (đường kẻ bảng lệch theo làm phẳng)
+TY_LE_LE_BAM = 0.05
+
+# Điểm ảnh tối hơn nền (trung vị của ô) từ bấy nhiêu mức xám là mực; ô không có mực có hash 0
+DO_DAM_MUC_BAM = 60
+
+# Chênh lệch mức xám tối thiểu giữa hai điểm ảnh liền kề để bit là 1 (vùng nền phẳng luôn là 0,
+# không bị nhiễu giấy làm đổi bit)
+CHENH_LECH_BAM = 20
+
+# Thành phần mực được giữ khi lấy khung bao chữ (theo tỷ lệ với kích thước ô sau khi bỏ lề): chữ cao
+# trong khoảng này và không dài quá nửa ô; đường kẻ bảng còn sót, dấu chấm nhiễu bị bỏ
+TY_LE_CAO_CHU_TOI_THIEU = 0.15
+TY_LE_CAO_CHU_TOI_DA = 0.7
+TY_LE_RONG_CHU_TOI_DA = 0.5
+
+# Độ mờ (Gaussian, sigma theo tỷ lệ chiều cao vùng chữ) trước khi thu nhỏ: nét chữ lệch một hai điểm ảnh
+# không còn làm đổi bit ở mép nét
+TY_LE_LAM_MO_BAM = 0.1
+
+# Số bit khác nhau tối đa (trên 256) để coi ô họ tên trùng với dòng tương ứng của mẫu. Đo trên ô họ tên in
+# tổng hợp (lệch tới 5 điểm ảnh, mờ, nhiễu giấy, còn đường kẻ): cùng tên trung bình khoảng 15 bit, lệch
+# nhiều và mờ nặng tới khoảng 38 bit; hai tên chỉ khác một chữ cái cách khoảng 40 bit, khác nhau hơn thì
+# từ 70 bit. Hai phân bố chạm nhau nên ngưỡng đặt thấp, xa khoảng cách giữa các tên: chỉ nhận ô giống mẫu
+# rõ ràng (khoảng ba phần tư ô cùng tên), ô còn lại vẫn được đọc bằng OCR như khi chưa có mẫu
+NGUONG_KHOANG_CACH_BAM = 24
+
+# Ô chỉ khớp khi dòng tương ứng của mẫu gần hơn mọi dòng khác ít nhất bấy nhiêu bit (tránh nhận nhầm
+# khi hai dòng của mẫu giống nhau, ví dụ hai ứng viên cùng họ và tên đệm)
+CHENH_LECH_DONG_KHAC = 16
+
+# Điểm so khớp tối thiểu để thay họ tên đọc từ phiếu tham chiếu bằng đúng tên ứng viên
+NGUONG_KHOP_UNG_VIEN_MAU = 0.8
+
+def bam_o_ho_ten(anh: np.ndarray) -> int:
+    """
+    dHash của ô họ tên: thu nhỏ vùng chữ của ảnh xám, bit là 1 khi điểm ảnh bên phải sáng hơn bên trái rõ rệt
+
+    Args:
+        anh: Ảnh ô họ tên nguyên kích thước (numpy array BGR hoặc ảnh xám)
+
+    Returns:
+        Hash dạng số nguyên (KICH_THUOC_BAM[0] * KICH_THUOC_BAM[1] bit)
+    """
+    if anh.ndim == 3:
+        anh = cv2.cvtColor(anh, cv2.COLOR_BGR2GRAY)
+    cao, rong = anh.shape
+    le_doc, le_ngang = int(cao * TY_LE_LE_BAM), int(rong * TY_LE_LE_BAM)
+    anh = anh[le_doc:cao - le_doc, le_ngang:rong - le_ngang]
+
+    # Chỉ lấy khung bao các thành phần mực có kích thước chữ để hash không đổi khi phiếu làm phẳng lệch
+    # vài điểm ảnh; mực không phải chữ (đường kẻ, nhiễu) được tô về màu nền
+    nen = np.median(anh)
+    muc = (nen.astype(np.int16) - anh.astype(np.int16) >= DO_DAM_MUC_BAM).astype(np.uint8)
+    cao, rong = anh.shape
+    _, nhan, thong_so, _ = cv2.connectedComponentsWithStats(muc, connectivity=8)
+    rong_tp, cao_tp = thong_so[:, cv2.CC_STAT_WIDTH], thong_so[:, cv2.CC_STAT_HEIGHT]
+    la_chu = ((rong_tp < TY_LE_RONG_CHU_TOI_DA * rong) & (cao_tp >= TY_LE_CAO_CHU_TOI_THIEU * cao)
+              & (cao_tp < TY_LE_CAO_CHU_TOI_DA * cao))
+    la_chu[0] = False
+    if not la_chu.any():
+        return 0
+    anh = anh.copy()
+    anh[(muc > 0) & ~la_chu[nhan]] = nen
+    y, x = np.nonzero(la_chu[nhan])
+    anh = anh[y.min():y.max() + 1, x.min():x.max() + 1].astype(np.float32)
+    anh = cv2.GaussianBlur(anh, (0, 0), TY_LE_LAM_MO_BAM * anh.shape[0])
+
+    so_cot, so_hang = KICH_THUOC_BAM
+    nho = cv2.resize(anh, (so_cot + 1, so_hang), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bit = (nho[:, 1:] - nho[:, :-1]) > CHENH_LECH_BAM
+    return int(''.join('1' if b else '0' for b in bit.ravel()), 2)
+
+def khoang_cach_bam(a: int, b: int) -> int:
+    """
+    Số bit khác nhau giữa hai hash (khoảng cách Hamming)
+    """
+    return bin(a ^ b).count('1')
+
+def khop_mau(bam: int, dong: int, bam_mau: List[int], nguong: int = NGUONG_KHOANG_CACH_BAM,
+             chenh_lech: int = CHENH_LECH_DONG_KHAC) -> Optional[int]:
+    """
+    Đối chiếu hash ô họ tên của một dòng với mẫu: khớp khi gần dòng cùng thứ tự của mẫu trong ngưỡng
+    và gần dòng đó hơn mọi dòng khác của mẫu ít nhất chenh_lech bit (xác nhận đúng thứ tự dòng)
+
+    Args:
+        bam: Hash ô họ tên
+        dong: Thứ tự dòng trên phiếu (bắt đầu từ 0)
+        bam_mau: Hash ô họ tên các dòng của mẫu
+        nguong: Số bit khác nhau tối đa với dòng tương ứng
+        chenh_lech: Khoảng cách tối thiểu hơn dòng tương ứng của các dòng khác
+
+    Returns:
+        Khoảng cách tới dòng tương ứng của mẫu nếu khớp, None nếu không
+    """
+    if dong >= len(bam_mau) or bam == 0 or bam_mau[dong] == 0:
+        return None
+    khoang_cach = khoang_cach_bam(bam, bam_mau[dong])
+    if khoang_cach > nguong:
+        return None
+    dong_khac = [khoang_cach_bam(bam, b) for i, b in enumerate(bam_mau) if i != dong]
+    if dong_khac and min(dong_khac) - khoang_cach < chenh_lech:
+        return None
+    return khoang_cach
+
+class MauTen:
+    """
+    Mẫu họ tên theo từng layout phiếu của một cuộc bỏ phiếu, lưu ở file mau_ten.json trong thư mục kết quả
+
+    Mỗi dòng của mẫu gồm họ tên (đọc từ phiếu tham chiếu hoặc lấy theo ứng viên), hash ô họ tên
+    và kết quả giải mã ràng buộc theo ứng viên (nếu có). Mẫu gắn với mã phiên bản của lần chạy
+    (model, layout, danh sách ứng viên...), đổi phiên bản thì mẫu được tạo lại.
+    """
+
+    def __init__(self, thu_muc_ket_qua: str, phien_ban: str):
+        """
+        Args:
+            thu_muc_ket_qua: Thư mục kết quả của cuộc bỏ phiếu
+            phien_ban: Mã phiên bản của lần chạy
+        """
+        self.duong_dan = os.path.join(thu_muc_ket_qua, TEN_FILE_MAU_TEN)
+        self.phien_ban = phien_ban
+        self.layout = {}
+        try:
+            with open(self.duong_dan, 'r', encoding='utf-8') as f:
+                du_lieu = json.load(f)
+            if du_lieu.get('phien_ban') == phien_ban:
+                self.layout = du_lieu.get('layout', {})
+            else:
+                print(f"[INFO] Mẫu họ tên {self.duong_dan} thuộc phiên bản khác, sẽ tạo lại")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"[WARNING] Không đọc được mẫu họ tên {self.duong_dan}: {e}")
+
+    def dat(self, ten_layout: str, anh_tham_chieu: str, cac_dong: List[Dict]):
+        """
+        Đặt mẫu của một layout
+
+        Args:
+            ten_layout: Tên layout (data1/data2)
+            anh_tham_chieu: Ảnh phiếu dùng làm tham chiếu
+            cac_dong: List dict {'ho_ten', 'bam', 'ho_ten_ung_vien'} theo thứ tự dòng
+        """
+        self.layout[ten_layout] = {
+            'anh_tham_chieu': anh_tham_chieu,
+            'dong': [{**dong, 'bam': format(dong['bam'], 'x')} for dong in cac_dong],
+        }
+
+    def theo_layout(self) -> Dict[str, List[Dict]]:
+        """
+        Các dòng mẫu theo từng layout, hash đã đổi về số nguyên (gửi kèm công việc cho worker)
+        """
+        return {ten: [{**dong, 'bam': int(dong['bam'], 16)} for dong in mau['dong']]
+                for ten, mau in self.layout.items()}
+
+    def luu(self):
+        """
+        Ghi mẫu ra file tạm rồi đổi tên (lỗi ghi chỉ được cảnh báo)
+        """
+        thu_muc = os.path.dirname(self.duong_dan) or '.'
+        file_tam = None
+        try:
+            os.makedirs(thu_muc, exist_ok=True)
+            fd, file_tam = tempfile.mkstemp(dir=thu_muc, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'phien_ban': self.phien_ban, 'layout': self.layout}, f, ensure_ascii=False, indent=2)
+            os.replace(file_tam, self.duong_dan)
+        except Exception as e:
+            if file_tam and os.path.exists(file_tam):
+                os.remove(file_tam)
+            print(f"[WARNING] Không lưu được mẫu họ tên {self.duong_dan}: {e}")
@@ -0,0 +1,166 @@
+# phan_loai_o_dau_x.py - Phân loại nhanh ô đồng ý/không đồng ý theo mật độ điểm ảnh mực
+import json
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+# Kích thước chuẩn hóa ô (rộng, cao) trước khi tính đặc trưng, để xử lý cả lô ô bằng numpy
+KICH_THUOC_O_CHUAN = (80, 64)
+
+# Kết quả phân loại nhanh
+TRONG = 'trong'          # Chắc chắn trống
+DANH_DAU = 'danh_dau'    # Chắc chắn có dấu X
+KHONG_RO = 'khong_ro'    # Không chắc chắn, chuyển cho model (YOLO/TrOCR)
+
+# Ngưỡng mặc định; các tỷ lệ kích thước tính theo ô sau khi bỏ lề
+NGUONG_MAC_DINH = {
+    'ty_le_le': 0.1,                # Tỷ lệ lề bị bỏ ở mỗi cạnh (đường kẻ bảng)
+    'do_dam_muc': 40,               # Điểm ảnh tối hơn nền (trung vị của ô) từ bấy nhiêu mức xám là mực
+    'do_dam_muc_nhat': 15,          # Tối hơn nền từ bấy nhiêu mức xám là nét nhạt (bút chì, ảnh thiếu tương phản)
+    'ty_le_muc_nhat_toi_da': 0.01,  # Ô trống không được có nhiều nét nhạt hơn, nếu có thì chuyển cho model
+    'ty_le_duong_ke': 0.5,          # Hàng/cột có tỷ lệ mực lớn hơn là đường kẻ còn sót, bị bỏ qua
+    'ty_le_hang_ke_toi_da': 0.2,    # Quá nhiều hàng/cột như vậy thì là vết tô kín chứ không phải đường kẻ, chuyển cho model
+    'kich_thuoc_trong': 0.06,       # Cạnh ngắn của nét lớn nhất nhỏ hơn -> ô trống (chấm bẩn, vệt kẻ)
+    'chieu_cao_danh_dau': 0.3,      # Nét lớn nhất cao ít nhất bấy nhiêu...
+    'chieu_rong_danh_dau': 0.15,    # ...và rộng ít nhất bấy nhiêu thì có thể là dấu X
+    'mat_do_net_toi_thieu': 0.1,    # Tỷ lệ mực trong khung bao nét lớn nhất: dấu X thưa,
+    'mat_do_net_toi_da': 0.4,       # vết tô/gạch xóa dày hơn
+    'ty_le_net_chinh': 0.7,         # Nét lớn nhất chiếm ít nhất bấy nhiêu lượng mực của ô (dấu X liền nét)
+    'ty_le_muc_toi_da': 0.08,       # Ô nhiều mực hơn (tô đậm, gạch xóa) luôn chuyển cho model
+}
+
+class BoPhanLoaiODauX:
+    """
+    Phân loại nhanh các ô đồng ý/không đồng ý theo tỷ lệ điểm ảnh mực và thống kê nét,
+    chỉ các ô không rõ ràng mới cần chạy model
+    """
+
+    def __init__(self, nguong: Dict = None):
+        """
+        Args:
+            nguong: Các ngưỡng ghi đè NGUONG_MAC_DINH
+        """
+        khong_ho_tro = set(nguong or {}) - set(NGUONG_MAC_DINH)
+        if khong_ho_tro:
+            raise ValueError(f"Ngưỡng phân loại không hỗ trợ: {', '.join(sorted(khong_ho_tro))}")
+        self.nguong = {**NGUONG_MAC_DINH, **(nguong or {})}
+
+    def _anh_muc(self, danh_sach_anh: List):
+        """
+        Chuẩn hóa các ô về cùng kích thước, bỏ lề và tách điểm ảnh mực (tính cho cả lô)
+
+        Returns:
+            Tuple (điểm ảnh mực, điểm ảnh có nét nhạt gồm cả mực: mảng bool (số ô, cao, rộng);
+            tỷ lệ hàng/cột bị bỏ như đường kẻ, độ tối của nền so với phần sáng nhất của mỗi ô)
+        """
+        xam = []
+        for anh in danh_sach_anh:
+            if anh.ndim == 3:
+                anh = cv2.cvtColor(anh, cv2.COLOR_BGR2GRAY)
+            xam.append(cv2.resize(anh, KICH_THUOC_O_CHUAN, interpolation=cv2.INTER_AREA))
+        xam = np.stack(xam).astype(np.int16)
+
+        rong, cao = KICH_THUOC_O_CHUAN
+        le_doc = int(cao * self.nguong['ty_le_le'])
+        le_ngang = int(rong * self.nguong['ty_le_le'])
+        xam = xam[:, le_doc:cao - le_doc, le_ngang:rong - le_ngang]
+
+        # Mực là điểm ảnh tối hơn hẳn nền của chính ô đó (chịu được giấy tối/ảnh chụp thiếu sáng)
+        phang = xam.reshape(len(xam), -1)
+        nen = np.median(phang, axis=1)[:, None, None]
+        # Ô bị tô gần kín thì trung vị là mực: so với phần sáng nhất (giấy) để nhận ra
+        do_toi_nen = np.percentile(phang, 95, axis=1) - nen[:, 0, 0]
+        do_dam = nen - xam
+        muc = do_dam >= self.nguong['do_dam_muc']
+        muc_nhat = do_dam >= self.nguong['do_dam_muc_nhat']
+
+        # Bỏ các hàng/cột gần như toàn mực (đường kẻ bảng lọt vào do làm phẳng lệch)
+        hang_ke = muc_nhat.mean(axis=2, keepdims=True) > self.nguong['ty_le_duong_ke']
+        cot_ke = muc_nhat.mean(axis=1, keepdims=True) > self.nguong['ty_le_duong_ke']
+        khong_ke = ~hang_ke & ~cot_ke
+        ty_le_hang_ke = (hang_ke.sum(axis=(1, 2)) + cot_ke.sum(axis=(1, 2))) / float(xam.shape[1] + xam.shape[2])
+        return muc & khong_ke, muc_nhat & khong_ke, ty_le_hang_ke, do_toi_nen
+
+    def dac_trung(self, danh_sach_anh: List) -> List[Dict]:
+        """
+        Tính đặc trưng mực và nét của từng ô
+
+        Args:
+            danh_sach_anh: List ảnh ô (numpy array BGR hoặc ảnh xám)
+
+        Returns:
+            List dict: ty_le_muc (tỷ lệ điểm ảnh mực), ty_le_muc_nhat (tỷ lệ điểm ảnh có nét, kể cả nét nhạt),
+            ty_le_hang_ke (tỷ lệ hàng/cột bị bỏ như đường kẻ), do_toi_nen (nền tối hơn phần sáng nhất của ô
+            bao nhiêu mức xám), chieu_cao/chieu_rong (khung bao nét lớn nhất),
+            mat_do_net (tỷ lệ mực trong khung bao đó), ty_le_net_chinh (phần mực thuộc nét lớn nhất)
+        """
+        if not danh_sach_anh:
+            return []
+        muc, muc_nhat, ty_le_hang_ke, do_toi_nen = self._anh_muc(danh_sach_anh)
+        _, cao, rong = muc.shape
+        tong_muc = muc.sum(axis=(1, 2))
+        tong_muc_nhat = muc_nhat.sum(axis=(1, 2))
+
+        cac_dac_trung = []
+        for i in range(len(muc)):
+            dac_trung = {'ty_le_muc': float(tong_muc[i]) / (cao * rong),
+                         'ty_le_muc_nhat': float(tong_muc_nhat[i]) / (cao * rong),
+                         'ty_le_hang_ke': float(ty_le_hang_ke[i]), 'do_toi_nen': float(do_toi_nen[i]),
+                         'chieu_cao': 0.0, 'chieu_rong': 0.0, 'mat_do_net': 0.0, 'ty_le_net_chinh': 0.0}
+            if tong_muc[i]:
+                so_net, _, thong_so, _ = cv2.connectedComponentsWithStats(muc[i].astype(np.uint8), connectivity=8)
+                lon_nhat = 1 + int(np.argmax(thong_so[1:, cv2.CC_STAT_AREA]))
+                _, _, w, h, dien_tich = thong_so[lon_nhat]
+                dac_trung.update({
+                    'chieu_cao': h / cao,
+                    'chieu_rong': w / rong,
+                    'mat_do_net': dien_tich / (w * h),
+                    'ty_le_net_chinh': dien_tich / float(tong_muc[i]),
+                })
+            cac_dac_trung.append(dac_trung)
+        return cac_dac_trung
+
+    def _quyet_dinh(self, dac_trung: Dict) -> str:
+        """
+        Quyết định trống/có dấu X/không rõ từ đặc trưng của một ô
+        """
+        nguong = self.nguong
+        # Vết tô kín (nền là mực, hoặc mực bị bỏ như đường kẻ): chuyển cho model
+        if dac_trung['do_toi_nen'] >= nguong['do_dam_muc'] or dac_trung['ty_le_hang_ke'] > nguong['ty_le_hang_ke_toi_da']:
+            return KHONG_RO
+        if min(dac_trung['chieu_cao'], dac_trung['chieu_rong']) < nguong['kich_thuoc_trong']:
+            # Không có nét đậm nhưng có nét nhạt (dấu bút chì, ảnh mờ/thiếu sáng): không chắc là ô trống
+            if dac_trung['ty_le_muc_nhat'] > nguong['ty_le_muc_nhat_toi_da']:
+                return KHONG_RO
+            return TRONG
+        if (dac_trung['chieu_cao'] >= nguong['chieu_cao_danh_dau']
+                and dac_trung['chieu_rong'] >= nguong['chieu_rong_danh_dau']
+                and nguong['mat_do_net_toi_thieu'] <= dac_trung['mat_do_net'] <= nguong['mat_do_net_toi_da']
+                and dac_trung['ty_le_net_chinh'] >= nguong['ty_le_net_chinh']
+                and dac_trung['ty_le_muc'] <= nguong['ty_le_muc_toi_da']):
+            return DANH_DAU
+        return KHONG_RO
+
+    def phan_loai(self, danh_sach_anh: List) -> List[Dict]:
+        """
+        Phân loại nhanh một lô ô
+
+        Returns:
+            List dict {'phan_loai': TRONG/DANH_DAU/KHONG_RO, 'dac_trung': {...}}, cùng thứ tự với danh_sach_anh
+        """
+        return [{'phan_loai': self._quyet_dinh(dac_trung),
+                 'dac_trung': {k: round(v, 4) for k, v in dac_trung.items()}}
+                for dac_trung in self.dac_trung(danh_sach_anh)]
+
+
+def doc_nguong_phan_loai(chuoi: str) -> Dict:
+    """
+    Đọc ngưỡng phân loại nhanh từ chuỗi JSON của tham số dòng lệnh (vd '{"do_dam_muc": 50}')
+    """
+    if not chuoi:
+        return None
+    nguong = json.loads(chuoi)
+    if not isinstance(nguong, dict):
+        raise ValueError("Ngưỡng phân loại nhanh phải là JSON object")
+    return nguong
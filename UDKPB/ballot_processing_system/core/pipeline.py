@@ -0,0 +1,136 @@
+# pipeline.py - Chạy xử lý theo nhiều giai đoạn nối với nhau bằng hàng đợi có giới hạn
+import queue
+import threading
+import time
+
+# Đánh dấu hết dữ liệu trong hàng đợi
+_KET_THUC = object()
+
+class GiaiDoan:
+    """
+    Một giai đoạn của pipeline
+    """
+
+    def __init__(self, ten: str, ham, so_luong: int = 1, kich_thuoc_lo: int = 1):
+        """
+        Args:
+            ten: Tên giai đoạn (dùng để ghi thời gian xử lý)
+            ham: Hàm xử lý, nhận một dict (hoặc list dict nếu kich_thuoc_lo > 1) và cập nhật trực tiếp vào dict
+            so_luong: Số thread chạy song song cho giai đoạn này
+            kich_thuoc_lo: Số phần tử tối đa gom lại cho một lần gọi ham
+        """
+        self.ten = ten
+        self.ham = ham
+        self.so_luong = max(1, so_luong)
+        self.kich_thuoc_lo = max(1, kich_thuoc_lo)
+
+def _lay_lo(vao: queue.Queue, muc_dau, kich_thuoc_lo: int):
+    """
+    Gom thêm các phần tử đang có sẵn trong hàng đợi (không chờ) để tạo thành một lô
+    """
+    lo = [muc_dau]
+    while len(lo) < kich_thuoc_lo:
+        try:
+            muc = vao.get_nowait()
+        except queue.Empty:
+            break
+        if muc is _KET_THUC:
+            # Trả lại dấu kết thúc để vòng lặp sau dừng
+            vao.put(_KET_THUC)
+            break
+        lo.append(muc)
+    return lo
+
+def _chay_ham(giai_doan: GiaiDoan, lo):
+    """
+    Gọi hàm của giai đoạn cho một lô, ghi lỗi và thời gian xử lý vào từng phần tử
+    """
+    # Phần tử đã lỗi ở giai đoạn trước thì chỉ chuyển tiếp
+    can_xu_ly = [muc for muc in lo if not muc.get('loi')]
+    if not can_xu_ly:
+        return
+
+    bat_dau = time.perf_counter()
+    try:
+        if giai_doan.kich_thuoc_lo > 1:
+            giai_doan.ham(can_xu_ly)
+        else:
+            giai_doan.ham(can_xu_ly[0])
+    except Exception as e:
+        for muc in can_xu_ly:
+            muc['loi'] = f"{giai_doan.ten}: {e}"
+
+    # Thời gian của một lô được chia đều cho các phần tử trong lô
+    thoi_gian = (time.perf_counter() - bat_dau) / len(can_xu_ly)
+    for muc in can_xu_ly:
+        muc.setdefault('thoi_gian_giai_doan', {})[giai_doan.ten] = thoi_gian
+
+def chay_pipeline(nguon, cac_giai_doan, kich_thuoc_hang_doi: int = 4):
+    """
+    Chạy các phần tử của nguon qua lần lượt các giai đoạn, các giai đoạn chạy đồng thời
+
+    Mỗi cặp giai đoạn liền kề nối với nhau bằng hàng đợi có giới hạn, nên giai đoạn
+    nhanh sẽ tự chờ khi giai đoạn sau chưa kịp xử lý và bộ nhớ không tăng theo số phiếu.
+
+    Args:
+        nguon: Iterable các dict đầu vào
+        cac_giai_doan: List GiaiDoan theo thứ tự xử lý
+        kich_thuoc_hang_doi: Số phần tử tối đa chờ giữa hai giai đoạn
+
+    Yields:
+        Dict đã qua tất cả giai đoạn (theo thứ tự hoàn thành, không theo thứ tự đầu vào);
+        phần tử bị lỗi có khóa 'loi'
+
+    Raises:
+        Lỗi của nguon (sau khi các phần tử đã nạp trước đó đi hết pipeline)
+    """
+    hang_doi = [queue.Queue(maxsize=max(1, kich_thuoc_hang_doi)) for _ in range(len(cac_giai_doan) + 1)]
+    khoa = threading.Lock()
+    loi_nguon = []
+
+    def nap_nguon():
+        # Luôn báo kết thúc, kể cả khi nguon lỗi, để các giai đoạn và vòng lặp nhận kết quả không chờ mãi
+        try:
+            for muc in nguon:
+                hang_doi[0].put(muc)
+        except BaseException as e:
+            loi_nguon.append(e)
+        finally:
+            hang_doi[0].put(_KET_THUC)
+
+    def chay_giai_doan(chi_so: int, giai_doan: GiaiDoan, con_lai: list):
+        vao, ra = hang_doi[chi_so], hang_doi[chi_so + 1]
+        while True:
+            muc = vao.get()
+            if muc is _KET_THUC:
+                # Trả lại dấu kết thúc cho các thread khác cùng giai đoạn
+                vao.put(_KET_THUC)
+                with khoa:
+                    con_lai[0] -= 1
+                    la_thread_cuoi = con_lai[0] == 0
+                # Thread cuối cùng của giai đoạn báo kết thúc cho giai đoạn sau
+                if la_thread_cuoi:
+                    ra.put(_KET_THUC)
+                return
+
+            lo = _lay_lo(vao, muc, giai_doan.kich_thuoc_lo)
+            _chay_ham(giai_doan, lo)
+            for muc in lo:
+                ra.put(muc)
+
+    threads = [threading.Thread(target=nap_nguon, daemon=True)]
+    for chi_so, giai_doan in enumerate(cac_giai_doan):
+        con_lai = [giai_doan.so_luong]
+        for _ in range(giai_doan.so_luong):
+            threads.append(threading.Thread(target=chay_giai_doan, args=(chi_so, giai_doan, con_lai), daemon=True))
+
+    for thread in threads:
+        thread.start()
+
+    while True:
+        muc = hang_doi[-1].get()
+        if muc is _KET_THUC:
+            break
+        yield muc
+    if loi_nguon:
+        raise loi_nguon[0]
@@ -0,0 +1,157 @@
+# so_ghi_kiem_phieu.py - Sổ ghi các phiếu đã xử lý để chạy tiếp/chạy bổ sung khi kiểm phiếu
+import os
+import json
+import time
+import tempfile
+from typing import Dict, Optional
+
+from .bo_nho_dem_ket_qua import bam_file
+
+# Tên file sổ ghi, nằm trong thư mục kết quả của từng thư mục ảnh
+TEN_FILE_SO_GHI = "so_ghi_kiem_phieu.jsonl"
+
+def doc_so_ghi(duong_dan: str) -> Dict[str, Dict]:
+    """
+    Đọc sổ ghi (mỗi dòng một JSON), dòng ghi sau của cùng một ảnh thay cho dòng trước
+
+    Dòng ghi dở (process bị dừng giữa chừng) hoặc hỏng được bỏ qua.
+
+    Returns:
+        Dict tên file ảnh -> dòng ghi ({anh, bam, phien_ban, ket_qua, on_dinh, kich_thuoc, mtime_ns, thoi_diem})
+    """
+    cac_muc = {}
+    if not os.path.exists(duong_dan):
+        return cac_muc
+    with open(duong_dan, 'r', encoding='utf-8') as f:
+        for dong in f:
+            try:
+                muc = json.loads(dong)
+                cac_muc[muc['anh']] = muc
+            except (ValueError, KeyError, TypeError):
+                continue
+    return cac_muc
+
+class SoGhiKiemPhieu:
+    """
+    Sổ ghi các phiếu đã xử lý của một thư mục kết quả: ảnh nào, nội dung (hash) nào,
+    với phiên bản model/layout nào và file kết quả tương ứng
+
+    Mỗi phiếu xong được ghi thêm một dòng ngay lập tức, nên khi process bị dừng giữa chừng
+    thì lần chạy sau chỉ phải xử lý các phiếu chưa có trong sổ (hoặc đã đổi ảnh, đổi phiên bản).
+    """
+
+    def __init__(self, thu_muc_ket_qua: str, phien_ban: str):
+        """
+        Args:
+            thu_muc_ket_qua: Thư mục chứa các file kết quả JSON của từng phiếu
+            phien_ban: Mã phiên bản của lần chạy (model, layout, danh sách ứng viên...)
+        """
+        self.thu_muc_ket_qua = thu_muc_ket_qua
+        self.duong_dan = os.path.join(thu_muc_ket_qua, TEN_FILE_SO_GHI)
+        self.phien_ban = phien_ban
+        self.cac_muc = doc_so_ghi(self.duong_dan)
+        self._file = None
+        # Kích thước, thời điểm sửa của ảnh lúc tính hash (ghi vào sổ cùng hash đó)
+        self._thong_tin_khi_bam = {}
+        self._gon_lai()
+
+    def _gon_lai(self):
+        """
+        Ghi lại sổ chỉ với dòng mới nhất của từng ảnh khi sổ có quá nhiều dòng cũ
+        """
+        if not os.path.exists(self.duong_dan):
+            return
+        with open(self.duong_dan, 'r', encoding='utf-8') as f:
+            so_dong = sum(1 for _ in f)
+        if so_dong <= 2 * len(self.cac_muc) + 100:
+            return
+        fd, file_tam = tempfile.mkstemp(dir=self.thu_muc_ket_qua, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for muc in self.cac_muc.values():
+                    f.write(json.dumps(muc, ensure_ascii=False) + "\n")
+            os.replace(file_tam, self.duong_dan)
+        except Exception as e:
+            if os.path.exists(file_tam):
+                os.remove(file_tam)
+            print(f"[WARNING] Không gọn lại được sổ ghi {self.duong_dan}: {e}")
+
+    def bam(self, image_path: str) -> str:
+        """
+        Hash nội dung ảnh; dùng lại hash trong sổ nếu kích thước và thời điểm sửa file không đổi
+        """
+        thong_tin = os.stat(image_path)
+        self._thong_tin_khi_bam[image_path] = (thong_tin.st_size, thong_tin.st_mtime_ns)
+        muc = self.cac_muc.get(os.path.basename(image_path))
+        if muc and muc.get('kich_thuoc') == thong_tin.st_size and muc.get('mtime_ns') == thong_tin.st_mtime_ns:
+            return muc['bam']
+        return bam_file(image_path)
+
+    def da_xu_ly(self, image_path: str, bam: str) -> Optional[Dict]:
+        """
+        Dòng ghi của phiếu nếu phiếu đã được xử lý với cùng nội dung ảnh và phiên bản,
+        kết quả ổn định và file kết quả vẫn còn; None nếu phải xử lý lại
+        """
+        muc = self.cac_muc.get(os.path.basename(image_path))
+        if (not muc or muc.get('bam') != bam or muc.get('phien_ban') != self.phien_ban
+                or not muc.get('on_dinh')):
+            return None
+        if not os.path.exists(os.path.join(self.thu_muc_ket_qua, muc['ket_qua'])):
+            return None
+        return muc
+
+    def _mo_de_ghi_them(self):
+        """
+        Mở sổ để ghi thêm; nếu dòng cuối đang ghi dở (process trước bị dừng) thì xuống dòng trước
+        """
+        thieu_xuong_dong = False
+        if os.path.exists(self.duong_dan) and os.path.getsize(self.duong_dan) > 0:
+            with open(self.duong_dan, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                thieu_xuong_dong = f.read(1) != b"\n"
+        f = open(self.duong_dan, 'a', encoding='utf-8')
+        if thieu_xuong_dong:
+            f.write("\n")
+        return f
+
+    def ghi(self, image_path: str, bam: str, ten_file_ket_qua: str, on_dinh: bool):
+        """
+        Ghi thêm dòng cho phiếu vừa lưu kết quả (ghi ngay xuống file)
+
+        Args:
+            image_path: Đường dẫn ảnh phiếu
+            bam: Hash nội dung ảnh
+            ten_file_ket_qua: Tên file kết quả JSON trong thư mục kết quả
+            on_dinh: Kết quả không có lỗi OCR/YOLO (kết quả lỗi sẽ được xử lý lại ở lần chạy sau)
+        """
+        try:
+            if image_path in self._thong_tin_khi_bam:
+                kich_thuoc, mtime_ns = self._thong_tin_khi_bam[image_path]
+            else:
+                thong_tin = os.stat(image_path)
+                kich_thuoc, mtime_ns = thong_tin.st_size, thong_tin.st_mtime_ns
+            muc = {
+                'anh': os.path.basename(image_path),
+                'bam': bam,
+                'phien_ban': self.phien_ban,
+                'ket_qua': ten_file_ket_qua,
+                'on_dinh': on_dinh,
+                'kich_thuoc': kich_thuoc,
+                'mtime_ns': mtime_ns,
+                'thoi_diem': time.time(),
+            }
+            if self._file is None:
+                self._file = self._mo_de_ghi_them()
+            self._file.write(json.dumps(muc, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.cac_muc[muc['anh']] = muc
+        except Exception as e:
+            print(f"[WARNING] Không ghi được sổ ghi cho {image_path}: {e}")
+
+    def dong(self):
+        """
+        Đóng file sổ ghi
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,160 @@
+# so_khop_ung_vien.py - So khớp họ tên OCR với danh sách ứng viên của cuộc bỏ phiếu
+import json
+import difflib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+# Độ dài n-gram dùng để lọc nhanh ứng viên
+DO_DAI_NGRAM = 3
+# Số ứng viên có nhiều n-gram chung nhất được chấm lại bằng difflib
+SO_UNG_VIEN_XET = 10
+# Điểm tối thiểu của ứng viên tốt nhất trong các ứng viên được chọn theo n-gram; thấp hơn (OCR đọc sai
+# nhiều ký tự, n-gram chung không còn phản ánh đúng độ giống) thì chấm thêm tất cả ứng viên còn lại
+NGUONG_DIEM_UNG_VIEN_XET = 0.9
+
+def chuan_hoa_ten(ten: str) -> str:
+    """
+    Chuẩn hóa họ tên để so khớp: viết hoa, bỏ khoảng trắng thừa
+    """
+    if not ten:
+        return ""
+    return " ".join(str(ten).upper().split())
+
+def tach_ngram(ten: str, n: int = DO_DAI_NGRAM) -> set:
+    """
+    Tách họ tên đã chuẩn hóa thành tập n-gram ký tự (có đệm khoảng trắng hai đầu)
+    """
+    ten = f" {ten} "
+    if len(ten) <= n:
+        return {ten}
+    return {ten[i:i + n] for i in range(len(ten) - n + 1)}
+
+class BoSoKhopUngVien:
+    """
+    Bộ so khớp họ tên với danh sách ứng viên, dựng một lần cho mỗi cuộc bỏ phiếu
+
+    Dùng chỉ mục n-gram để chọn ra vài ứng viên gần nhất, sau đó chấm điểm bằng
+    difflib.SequenceMatcher như trước; nếu điểm cao nhất dưới NGUONG_DIEM_UNG_VIEN_XET thì
+    chấm thêm các ứng viên còn lại. Kết quả của cùng một chuỗi OCR được ghi nhớ.
+    """
+
+    def __init__(self, danh_sach_ung_vien: Iterable[Tuple], so_ung_vien_xet: int = SO_UNG_VIEN_XET):
+        """
+        Args:
+            danh_sach_ung_vien: Các cặp (id, họ tên) của ứng viên
+            so_ung_vien_xet: Số ứng viên tối đa được chấm điểm bằng difflib cho mỗi chuỗi
+        """
+        self.ung_vien: List[Tuple] = [(uv_id, chuan_hoa_ten(ten)) for uv_id, ten in danh_sach_ung_vien]
+        self.tap_id = {uv_id for uv_id, _ in self.ung_vien}
+        self.so_ung_vien_xet = max(1, so_ung_vien_xet)
+
+        # Tên trùng khớp hoàn toàn -> chỉ số ứng viên đầu tiên có tên đó
+        self._theo_ten: Dict[str, int] = {}
+        # n-gram -> danh sách chỉ số ứng viên chứa n-gram đó
+        self._chi_muc: Dict[str, List[int]] = defaultdict(list)
+        for chi_so, (_, ten) in enumerate(self.ung_vien):
+            self._theo_ten.setdefault(ten, chi_so)
+            for ngram in tach_ngram(ten):
+                self._chi_muc[ngram].append(chi_so)
+
+        self._bo_nho: Dict[str, Tuple] = {}
+
+    def _chon_ung_vien_xet(self, ten: str) -> List[int]:
+        """
+        Chọn các ứng viên có nhiều n-gram chung với ten nhất (giữ thứ tự gốc của ứng viên)
+        """
+        if len(self.ung_vien) <= self.so_ung_vien_xet:
+            return list(range(len(self.ung_vien)))
+
+        so_ngram_chung = defaultdict(int)
+        for ngram in tach_ngram(ten):
+            for chi_so in self._chi_muc.get(ngram, ()):
+                so_ngram_chung[chi_so] += 1
+        if not so_ngram_chung:
+            # Không có n-gram chung nào: chấm điểm tất cả ứng viên
+            return list(range(len(self.ung_vien)))
+
+        gan_nhat = sorted(so_ngram_chung, key=lambda chi_so: (-so_ngram_chung[chi_so], chi_so))
+        return sorted(gan_nhat[:self.so_ung_vien_xet])
+
+    def _cham_diem(self, ten: str, cac_chi_so: List[int], chi_so_tot: int = None, diem_tot: float = -1.0) -> Tuple:
+        """
+        Chấm điểm các ứng viên bằng difflib, bỏ qua ứng viên có cận trên của điểm (real_quick_ratio,
+        quick_ratio) không vượt được ứng viên tốt nhất hiện có; bằng điểm thì giữ ứng viên đứng trước
+
+        Returns:
+            Tuple (chỉ số ứng viên tốt nhất, điểm)
+        """
+        for chi_so in cac_chi_so:
+            bo_so = difflib.SequenceMatcher(None, ten, self.ung_vien[chi_so][1])
+            for can_tren in (bo_so.real_quick_ratio, bo_so.quick_ratio, bo_so.ratio):
+                diem = can_tren()
+                if diem < diem_tot or (diem == diem_tot and chi_so > chi_so_tot):
+                    break
+            else:
+                chi_so_tot, diem_tot = chi_so, diem
+        return chi_so_tot, diem_tot
+
+    def so_khop(self, ho_ten: str) -> Tuple:
+        """
+        Tìm ứng viên khớp nhất với họ tên đọc được
+
+        Args:
+            ho_ten: Họ tên đọc được từ phiếu
+
+        Returns:
+            Tuple (id ứng viên, điểm 0..1), (None, 0.0) nếu không có ứng viên
+        """
+        ten = chuan_hoa_ten(ho_ten)
+        if ten in self._bo_nho:
+            return self._bo_nho[ten]
+
+        if not self.ung_vien:
+            ket_qua = (None, 0.0)
+        elif ten in self._theo_ten:
+            ket_qua = (self.ung_vien[self._theo_ten[ten]][0], 1.0)
+        else:
+            chi_so_xet = self._chon_ung_vien_xet(ten)
+            chi_so_tot, diem_tot = self._cham_diem(ten, chi_so_xet)
+            if diem_tot < NGUONG_DIEM_UNG_VIEN_XET and len(chi_so_xet) < len(self.ung_vien):
+                # Ứng viên khớp nhất có thể không nằm trong các ứng viên được chọn theo n-gram
+                da_xet = set(chi_so_xet)
+                con_lai = [chi_so for chi_so in range(len(self.ung_vien)) if chi_so not in da_xet]
+                chi_so_tot, diem_tot = self._cham_diem(ten, con_lai, chi_so_tot, diem_tot)
+            ket_qua = (self.ung_vien[chi_so_tot][0], diem_tot)
+
+        self._bo_nho[ten] = ket_qua
+        return ket_qua
+
+    def gan_ung_vien(self, ket_qua_phieu: List[Dict]) -> List[Dict]:
+        """
+        Gắn ung_vien_id và diem_khop vào từng dòng kết quả của một phiếu (sửa trực tiếp);
+        dòng đã được giải mã ràng buộc theo ứng viên đủ tin cậy giữ ứng viên đó (diem_khop là độ tin cậy)
+        """
+        for dong in ket_qua_phieu:
+            giai_ma = dong.get('chi_tiet', {}).get('ho_ten_ung_vien')
+            if giai_ma and giai_ma.get('chap_nhan'):
+                dong['ung_vien_id'] = giai_ma['ung_vien_id']
+                dong['diem_khop'] = round(giai_ma['do_tin_cay'], 4)
+                continue
+            uv_id, diem = self.so_khop(dong.get('ho_ten', ''))
+            dong['ung_vien_id'] = uv_id
+            dong['diem_khop'] = round(diem, 4)
+        return ket_qua_phieu
+
+def doc_danh_sach_ung_vien(duong_dan: str) -> List[Tuple]:
+    """
+    Đọc danh sách ứng viên từ file JSON: list các {"id": ..., "ho_ten": ...} hoặc cặp [id, họ tên]
+
+    Returns:
+        List các cặp (id, họ tên)
+    """
+    with open(duong_dan, 'r', encoding='utf-8') as f:
+        du_lieu = json.load(f)
+    danh_sach = []
+    for uv in du_lieu:
+        if isinstance(uv, dict):
+            danh_sach.append((uv['id'], uv.get('ho_ten') or ""))
+        else:
+            danh_sach.append((uv[0], uv[1] or ""))
+    return danh_sach
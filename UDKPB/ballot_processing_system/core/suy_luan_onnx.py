@@ -0,0 +1,464 @@
+# suy_luan_onnx.py - Backend ONNX Runtime (CPU) cho TrOCR và YOLO: xuất model sang ONNX và chạy suy luận không cần torch
+import os
+import ast
+import json
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from core.giai_ma import chan_lap_ngram
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Số thread của ONNX Runtime (intra-op: trong một phép tính, inter-op: giữa các nhánh song song của đồ thị).
+# Đọc từ biến môi trường để các worker process dùng cùng cấu hình; 0 hoặc để trống là mặc định của ONNX Runtime.
+BIEN_MOI_TRUONG_INTRA = "ONNX_INTRA_OP_THREADS"
+BIEN_MOI_TRUONG_INTER = "ONNX_INTER_OP_THREADS"
+
+# File cấu hình sinh text của TrOCR, nằm cùng encoder.onnx/decoder.onnx
+TEN_FILE_CAU_HINH_TROCR = "trocr_onnx.json"
+# Decoder nhận token mới và KV cache của các bước trước (không có ở các bản xuất cũ)
+TEN_FILE_DECODER_CACHE = "decoder_with_past.onnx"
+# Thứ tự tensor KV cache của mỗi lớp decoder: key/value của self-attention, key/value của cross-attention
+CAC_PHAN_CACHE = ("self_key", "self_value", "cross_key", "cross_value")
+
+# Ngưỡng hậu xử lý YOLO, giống mặc định của ultralytics predict
+NGUONG_CONF_YOLO = 0.25
+NGUONG_IOU_YOLO = 0.7
+SO_PHAT_HIEN_TOI_DA = 300
+
+def dat_so_luong_onnx(intra: int = None, inter: int = None):
+    """
+    Đặt số thread của ONNX Runtime cho process hiện tại và các process con tạo sau đó (None để giữ nguyên)
+    """
+    if intra is not None:
+        os.environ[BIEN_MOI_TRUONG_INTRA] = str(intra)
+    if inter is not None:
+        os.environ[BIEN_MOI_TRUONG_INTER] = str(inter)
+
+def tao_session(duong_dan: str):
+    """
+    Tạo phiên ONNX Runtime trên CPU với số thread theo ONNX_INTRA_OP_THREADS/ONNX_INTER_OP_THREADS
+    """
+    if ort is None:
+        raise RuntimeError("Chưa cài onnxruntime (pip install onnxruntime)")
+    tuy_chon = ort.SessionOptions()
+    tuy_chon.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    intra = int(os.getenv(BIEN_MOI_TRUONG_INTRA) or 0)
+    inter = int(os.getenv(BIEN_MOI_TRUONG_INTER) or 0)
+    if intra > 0:
+        tuy_chon.intra_op_num_threads = intra
+    if inter > 0:
+        # Thread inter-op chỉ có tác dụng khi chạy song song các nhánh của đồ thị
+        tuy_chon.inter_op_num_threads = inter
+        tuy_chon.execution_mode = ort.ExecutionMode.ORT_PARALLEL if inter > 1 else ort.ExecutionMode.ORT_SEQUENTIAL
+    return ort.InferenceSession(duong_dan, sess_options=tuy_chon, providers=["CPUExecutionProvider"])
+
+# ===================== TrOCR =====================
+
+def thu_muc_trocr_onnx(model_path: str) -> str:
+    """
+    Thư mục chứa TrOCR đã xuất ONNX: model_trocr/onnx/<snapshot>, cạnh các snapshot đã tải về
+    """
+    # model_path = model_trocr/models--microsoft--trocr-base-printed/snapshots/<id>
+    model_trocr_root = os.path.normpath(os.path.join(model_path, "..", "..", ".."))
+    return os.path.join(model_trocr_root, "onnx", os.path.basename(model_path))
+
+def ten_cache(tien_to: str, so_lop: int, cac_phan=CAC_PHAN_CACHE) -> List[str]:
+    """
+    Tên các input/output KV cache của decoder ONNX theo thứ tự lớp, ví dụ past.0.self_key
+    """
+    return [f"{tien_to}.{lop}.{phan}" for lop in range(so_lop) for phan in cac_phan]
+
+def _cache_dang_tuple(past_key_values):
+    """
+    KV cache của transformers (Cache object ở bản mới hoặc tuple) về dạng tuple 4 tensor mỗi lớp
+    """
+    if hasattr(past_key_values, 'to_legacy_cache'):
+        past_key_values = past_key_values.to_legacy_cache()
+    return tuple(tuple(lop) for lop in past_key_values)
+
+def _cache_cho_decoder(cac_tensor):
+    """
+    Ghép list tensor phẳng (4 tensor mỗi lớp) thành KV cache truyền vào decoder của transformers
+    """
+    past = tuple(tuple(cac_tensor[i:i + len(CAC_PHAN_CACHE)]) for i in range(0, len(cac_tensor), len(CAC_PHAN_CACHE)))
+    try:
+        from transformers.cache_utils import EncoderDecoderCache
+    except ImportError:
+        return past
+    return EncoderDecoderCache.from_legacy_cache(past)
+
+def xuat_trocr_onnx(model_path: str, thu_muc: str, opset: int = 17) -> str:
+    """
+    Xuất TrOCR sang ONNX: encoder (ảnh -> trạng thái ẩn đã chiếu sang không gian decoder), decoder
+    (chuỗi token + trạng thái ẩn -> logits của token cuối và KV cache) và decoder_with_past (token mới
+    + KV cache -> logits và KV cache self-attention mới), kèm tokenizer, image processor và cấu hình sinh text
+
+    Args:
+        model_path: Thư mục snapshot của model TrOCR (PyTorch)
+        thu_muc: Thư mục lưu model ONNX
+        opset: Phiên bản opset ONNX
+
+    Returns:
+        Thư mục đã lưu
+    """
+    import torch
+    from transformers import VisionEncoderDecoderModel, AutoTokenizer, AutoImageProcessor
+
+    model = VisionEncoderDecoderModel.from_pretrained(model_path).eval()
+    image_processor = AutoImageProcessor.from_pretrained(model_path)
+    os.makedirs(thu_muc, exist_ok=True)
+
+    class BoMaHoa(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = model.encoder
+            self.chieu = getattr(model, 'enc_to_dec_proj', None)
+
+        def forward(self, pixel_values):
+            trang_thai = self.encoder(pixel_values=pixel_values).last_hidden_state
+            return self.chieu(trang_thai) if self.chieu is not None else trang_thai
+
+    class BoGiaiMa(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.decoder = model.decoder
+
+        def forward(self, input_ids, encoder_hidden_states):
+            dau_ra = self.decoder(input_ids=input_ids, encoder_hidden_states=encoder_hidden_states, use_cache=True)
+            cache = [t for lop in _cache_dang_tuple(dau_ra.past_key_values) for t in lop]
+            return (dau_ra.logits[:, -1, :], *cache)
+
+    class BoGiaiMaCoCache(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.decoder = model.decoder
+
+        def forward(self, input_ids, encoder_hidden_states, *cache):
+            dau_ra = self.decoder(input_ids=input_ids, encoder_hidden_states=encoder_hidden_states,
+                                  past_key_values=_cache_cho_decoder(list(cache)), use_cache=True)
+            # Cache cross-attention không đổi giữa các bước, chỉ trả về key/value self-attention mới
+            cache_moi = [t for lop in _cache_dang_tuple(dau_ra.past_key_values) for t in lop[:2]]
+            return (dau_ra.logits[:, -1, :], *cache_moi)
+
+    kich_thuoc = image_processor.size
+    anh_mau = torch.zeros(1, 3, kich_thuoc['height'], kich_thuoc['width'])
+    with torch.no_grad():
+        bo_ma_hoa = BoMaHoa().eval()
+        trang_thai_mau = bo_ma_hoa(anh_mau)
+        torch.onnx.export(bo_ma_hoa, (anh_mau,), os.path.join(thu_muc, "encoder.onnx"),
+                          input_names=["pixel_values"], output_names=["encoder_hidden_states"],
+                          dynamic_axes={"pixel_values": {0: "batch"}, "encoder_hidden_states": {0: "batch"}},
+                          opset_version=opset)
+        token_mau = torch.full((1, 2), model.config.decoder_start_token_id, dtype=torch.long)
+        bo_giai_ma = BoGiaiMa().eval()
+        cache_mau = bo_giai_ma(token_mau, trang_thai_mau)[1:]
+        so_lop = len(cache_mau) // len(CAC_PHAN_CACHE)
+        cac_truc_cache = {0: "batch", 2: "so_token_truoc"}
+        torch.onnx.export(bo_giai_ma, (token_mau, trang_thai_mau), os.path.join(thu_muc, "decoder.onnx"),
+                          input_names=["input_ids", "encoder_hidden_states"],
+                          output_names=["logits"] + ten_cache("present", so_lop),
+                          dynamic_axes={"input_ids": {0: "batch", 1: "so_token"},
+                                        "encoder_hidden_states": {0: "batch"}, "logits": {0: "batch"},
+                                        **{ten: cac_truc_cache for ten in ten_cache("present", so_lop)}},
+                          opset_version=opset)
+        ten_cache_self = ten_cache("present", so_lop, CAC_PHAN_CACHE[:2])
+        torch.onnx.export(BoGiaiMaCoCache().eval(), (token_mau[:, :1], trang_thai_mau, *cache_mau),
+                          os.path.join(thu_muc, TEN_FILE_DECODER_CACHE),
+                          input_names=["input_ids", "encoder_hidden_states"] + ten_cache("past", so_lop),
+                          output_names=["logits"] + ten_cache_self,
+                          dynamic_axes={"input_ids": {0: "batch"}, "encoder_hidden_states": {0: "batch"},
+                                        "logits": {0: "batch"},
+                                        **{ten: cac_truc_cache for ten in ten_cache("past", so_lop)},
+                                        **{ten: cac_truc_cache for ten in ten_cache_self}},
+                          opset_version=opset)
+
+    AutoTokenizer.from_pretrained(model_path).save_pretrained(thu_muc)
+    image_processor.save_pretrained(thu_muc)
+    cau_hinh_sinh = model.generation_config
+    with open(os.path.join(thu_muc, TEN_FILE_CAU_HINH_TROCR), 'w', encoding='utf-8') as f:
+        json.dump({
+            'snapshot': os.path.basename(model_path),
+            'decoder_start_token_id': model.config.decoder_start_token_id,
+            'eos_token_id': cau_hinh_sinh.eos_token_id if cau_hinh_sinh.eos_token_id is not None else model.config.eos_token_id,
+            'pad_token_id': cau_hinh_sinh.pad_token_id if cau_hinh_sinh.pad_token_id is not None else model.config.pad_token_id,
+            'max_length': cau_hinh_sinh.max_length,
+            'num_beams': cau_hinh_sinh.num_beams,
+            'no_repeat_ngram_size': cau_hinh_sinh.no_repeat_ngram_size or 0,
+            'so_lop_decoder': so_lop,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"[INFO] Đã xuất TrOCR sang ONNX: {thu_muc}")
+    return thu_muc
+
+class TrOCROnnx:
+    """
+    TrOCR chạy bằng ONNX Runtime, gọi giống transformers pipeline("image-to-text") (giải mã tham lam,
+    dùng KV cache nếu bản xuất có decoder_with_past.onnx)
+    """
+
+    def __init__(self, thu_muc: str):
+        """
+        Args:
+            thu_muc: Thư mục đã xuất bằng xuat_trocr_onnx
+        """
+        from transformers import AutoTokenizer, AutoImageProcessor
+
+        with open(os.path.join(thu_muc, TEN_FILE_CAU_HINH_TROCR), 'r', encoding='utf-8') as f:
+            self.cau_hinh = json.load(f)
+        self.encoder = tao_session(os.path.join(thu_muc, "encoder.onnx"))
+        self.decoder = tao_session(os.path.join(thu_muc, "decoder.onnx"))
+        # Bản xuất cũ (decoder chỉ trả về logits, không có decoder_with_past.onnx) tính lại cả chuỗi mỗi bước
+        self.so_lop = self.cau_hinh.get('so_lop_decoder', 0)
+        self.decoder_cache = None
+        duong_dan_cache = os.path.join(thu_muc, TEN_FILE_DECODER_CACHE)
+        if self.so_lop and os.path.exists(duong_dan_cache) and len(self.decoder.get_outputs()) > 1:
+            self.decoder_cache = tao_session(duong_dan_cache)
+            self._dau_vao_cache = {dau_vao.name for dau_vao in self.decoder_cache.get_inputs()}
+        else:
+            print("[WARNING] TrOCR ONNX không có decoder KV cache (bản xuất cũ), mỗi bước giải mã tính lại cả chuỗi; "
+                  "xuất lại bằng processors.xuat_onnx để dùng KV cache")
+        self.tokenizer = AutoTokenizer.from_pretrained(thu_muc)
+        self.image_processor = AutoImageProcessor.from_pretrained(thu_muc)
+        if self.cau_hinh.get('num_beams', 1) > 1:
+            print(f"[WARNING] Model cấu hình num_beams={self.cau_hinh['num_beams']}, backend ONNX giải mã tham lam")
+        self._da_canh_bao_beam = False
+
+    def ma_hoa(self, pixel_values: np.ndarray) -> np.ndarray:
+        """
+        Chạy encoder (đã gồm phép chiếu sang kích thước decoder) cho một lô ảnh
+        """
+        return self.encoder.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0]
+
+    def logits_token_tiep(self, chuoi: np.ndarray, trang_thai: np.ndarray) -> np.ndarray:
+        """
+        Logits token tiếp theo của từng chuỗi token (không dùng KV cache, tính lại cả chuỗi)
+        """
+        return self.decoder.run(["logits"], {"input_ids": chuoi, "encoder_hidden_states": trang_thai})[0]
+
+    def _buoc_giai_ma(self, chuoi: np.ndarray, trang_thai: np.ndarray, cache: List) -> Tuple[np.ndarray, List]:
+        """
+        Một bước giải mã: logits token tiếp theo và KV cache sau bước này (4 tensor mỗi lớp)
+
+        Args:
+            chuoi: Các token đã sinh của từng chuỗi
+            trang_thai: Trạng thái ẩn encoder của từng chuỗi
+            cache: KV cache của bước trước (None ở bước đầu: chạy decoder.onnx trên cả chuỗi)
+        """
+        if cache is None:
+            dau_ra = self.decoder.run(None, {"input_ids": chuoi, "encoder_hidden_states": trang_thai})
+            return dau_ra[0], dau_ra[1:]
+
+        dau_vao = {"input_ids": chuoi[:, -1:], "encoder_hidden_states": trang_thai,
+                   **dict(zip(ten_cache("past", self.so_lop), cache))}
+        # ONNX có thể bỏ input không dùng tới (trạng thái encoder khi đã có cache cross-attention)
+        dau_ra = self.decoder_cache.run(None, {ten: gia_tri for ten, gia_tri in dau_vao.items() if ten in self._dau_vao_cache})
+        cache_moi = list(cache)
+        for lop in range(self.so_lop):
+            vi_tri = lop * len(CAC_PHAN_CACHE)
+            cache_moi[vi_tri:vi_tri + 2] = dau_ra[1 + 2 * lop:3 + 2 * lop]
+        return dau_ra[0], cache_moi
+
+    def sinh_token(self, pixel_values: np.ndarray, giai_ma: Dict = None) -> np.ndarray:
+        """
+        Giải mã tham lam cho một lô ảnh (encoder chạy một lần, chuỗi gặp eos được bỏ khỏi lô),
+        dừng khi mọi chuỗi đã gặp eos hoặc đạt max_new_tokens/max_length
+
+        Args:
+            pixel_values: Ảnh đã qua image processor
+            giai_ma: Cấu hình giải mã (dùng max_new_tokens và use_cache; None: theo max_length của model,
+                backend ONNX không có beam search)
+
+        Returns:
+            Mảng token (số ảnh, độ dài), bắt đầu bằng decoder_start_token_id, phần sau eos là pad
+        """
+        giai_ma = giai_ma or {}
+        if (giai_ma.get('num_beams') or 1) > 1 and not self._da_canh_bao_beam:
+            print("[WARNING] Backend ONNX chỉ hỗ trợ giải mã tham lam, bỏ qua num_beams")
+            self._da_canh_bao_beam = True
+        so_token_toi_da = self.cau_hinh['max_length'] - 1
+        if giai_ma.get('max_new_tokens'):
+            so_token_toi_da = min(so_token_toi_da, int(giai_ma['max_new_tokens']))
+        n = self.cau_hinh.get('no_repeat_ngram_size', 0)
+        dung_cache = self.decoder_cache is not None and giai_ma.get('use_cache') is not False
+
+        trang_thai = self.ma_hoa(pixel_values)
+        so_anh = len(pixel_values)
+        ket_qua = np.full((so_anh, 1 + so_token_toi_da), self.cau_hinh['pad_token_id'], dtype=np.int64)
+        ket_qua[:, 0] = self.cau_hinh['decoder_start_token_id']
+        dang_chay = np.arange(so_anh)
+        chuoi = ket_qua[:, :1].copy()
+        cache = None
+        buoc = 0
+        for buoc in range(1, so_token_toi_da + 1):
+            if dung_cache:
+                logits, cache = self._buoc_giai_ma(chuoi, trang_thai, cache)
+            else:
+                logits = self.logits_token_tiep(chuoi, trang_thai)
+            chan_lap_ngram(logits, chuoi, n)
+            tiep = logits.argmax(axis=-1)
+            ket_qua[dang_chay, buoc] = tiep
+            chuoi = np.concatenate([chuoi, tiep[:, None]], axis=1)
+
+            con_lai = tiep != self.cau_hinh['eos_token_id']
+            if not con_lai.any():
+                break
+            if not con_lai.all():
+                dang_chay, chuoi, trang_thai = dang_chay[con_lai], chuoi[con_lai], trang_thai[con_lai]
+                if cache is not None:
+                    cache = [t[con_lai] for t in cache]
+        return ket_qua[:, :buoc + 1]
+
+    def __call__(self, danh_sach_anh: List, batch_size: int = 16) -> List[List[Dict]]:
+        """
+        Nhận dạng text cho list ảnh PIL theo từng lô
+
+        Returns:
+            List (mỗi ảnh một list [{'generated_text': ...}]) giống output của transformers pipeline
+        """
+        ket_qua = []
+        for bat_dau in range(0, len(danh_sach_anh), max(1, batch_size)):
+            lo_anh = danh_sach_anh[bat_dau:bat_dau + max(1, batch_size)]
+            pixel_values = self.image_processor(images=lo_anh, return_tensors="np").pixel_values
+            cac_text = self.tokenizer.batch_decode(self.sinh_token(pixel_values), skip_special_tokens=True)
+            ket_qua.extend([{'generated_text': text}] for text in cac_text)
+        return ket_qua
+
+# ===================== YOLO =====================
+
+def duong_dan_yolo_onnx(yolo_weights_path: str) -> str:
+    """
+    Đường dẫn file ONNX tương ứng với weights YOLO (.pt -> .onnx cùng thư mục, như ultralytics export)
+    """
+    if yolo_weights_path.lower().endswith('.onnx'):
+        return yolo_weights_path
+    return os.path.splitext(yolo_weights_path)[0] + '.onnx'
+
+def xuat_yolo_onnx(yolo_weights_path: str, opset: int = 17) -> str:
+    """
+    Xuất weights YOLO sang ONNX bằng ultralytics (batch động, kích thước ảnh lúc train)
+
+    Returns:
+        Đường dẫn file .onnx
+    """
+    from ultralytics import YOLO
+    duong_dan = YOLO(yolo_weights_path).export(format="onnx", dynamic=True, opset=opset, simplify=False)
+    print(f"[INFO] Đã xuất YOLO sang ONNX: {duong_dan}")
+    return duong_dan
+
+def _nms(hop: np.ndarray, diem: np.ndarray, nguong_iou: float) -> List[int]:
+    """
+    Non-maximum suppression cho các hộp xyxy, trả về chỉ số các hộp giữ lại theo điểm giảm dần
+    """
+    thu_tu = diem.argsort()[::-1]
+    dien_tich = (hop[:, 2] - hop[:, 0]) * (hop[:, 3] - hop[:, 1])
+    giu = []
+    while thu_tu.size:
+        i = thu_tu[0]
+        giu.append(int(i))
+        x1 = np.maximum(hop[i, 0], hop[thu_tu[1:], 0])
+        y1 = np.maximum(hop[i, 1], hop[thu_tu[1:], 1])
+        x2 = np.minimum(hop[i, 2], hop[thu_tu[1:], 2])
+        y2 = np.minimum(hop[i, 3], hop[thu_tu[1:], 3])
+        giao = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = giao / (dien_tich[i] + dien_tich[thu_tu[1:]] - giao + 1e-9)
+        thu_tu = thu_tu[1:][iou <= nguong_iou]
+    return giu
+
+class YoloOnnx:
+    """
+    Bộ phát hiện YOLO (định dạng đầu ra của ultralytics YOLOv8+) chạy bằng ONNX Runtime
+    """
+
+    def __init__(self, duong_dan: str):
+        """
+        Args:
+            duong_dan: File .onnx đã xuất bằng xuat_yolo_onnx
+        """
+        self.session = tao_session(duong_dan)
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = {int(k): v for k, v in ast.literal_eval(metadata['names']).items()}
+        self.kich_thuoc = tuple(ast.literal_eval(metadata.get('imgsz', '[640, 640]')))
+        dau_vao = self.session.get_inputs()[0]
+        self.ten_dau_vao = dau_vao.name
+        # Model xuất với batch cố định thì chạy từng ảnh
+        self.batch_dong = not isinstance(dau_vao.shape[0], int)
+
+    def _letterbox(self, anh: np.ndarray) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+        """
+        Resize giữ tỷ lệ và đệm (màu 114) về kích thước đầu vào của model, như LetterBox của ultralytics
+
+        Returns:
+            (ảnh đã đệm, tỷ lệ resize, (đệm trái, đệm trên))
+        """
+        cao, rong = anh.shape[:2]
+        cao_moi, rong_moi = self.kich_thuoc
+        ty_le = min(cao_moi / cao, rong_moi / rong)
+        rong_resize, cao_resize = int(round(rong * ty_le)), int(round(cao * ty_le))
+        if (rong_resize, cao_resize) != (rong, cao):
+            anh = cv2.resize(anh, (rong_resize, cao_resize), interpolation=cv2.INTER_LINEAR)
+        de_ngang, de_doc = (rong_moi - rong_resize) / 2, (cao_moi - cao_resize) / 2
+        tren, duoi = int(round(de_doc - 0.1)), int(round(de_doc + 0.1))
+        trai, phai = int(round(de_ngang - 0.1)), int(round(de_ngang + 0.1))
+        anh = cv2.copyMakeBorder(anh, tren, duoi, trai, phai, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return anh, ty_le, (trai, tren)
+
+    def _hau_xu_ly(self, du_doan: np.ndarray, ty_le: float, de: Tuple, kich_thuoc_goc: Tuple) -> Tuple:
+        """
+        Lọc theo ngưỡng, NMS theo từng class và đưa hộp về tọa độ ảnh gốc
+
+        Returns:
+            (boxes xyxy, classes, confidences) dạng numpy
+        """
+        du_doan = du_doan.T  # (số hộp, 4 + số class)
+        diem_class = du_doan[:, 4:]
+        classes = diem_class.argmax(axis=1)
+        conf = diem_class.max(axis=1)
+        giu = conf > NGUONG_CONF_YOLO
+        hop, classes, conf = du_doan[giu, :4], classes[giu], conf[giu]
+        if not len(conf):
+            return np.zeros((0, 4), dtype=np.float32), classes.astype(np.float32), conf.astype(np.float32)
+
+        xyxy = np.empty_like(hop)
+        xyxy[:, :2] = hop[:, :2] - hop[:, 2:] / 2
+        xyxy[:, 2:] = hop[:, :2] + hop[:, 2:] / 2
+        # Dịch hộp theo class để NMS không loại hộp của class khác
+        giu = _nms(xyxy + classes[:, None] * 7680.0, conf, NGUONG_IOU_YOLO)[:SO_PHAT_HIEN_TOI_DA]
+        xyxy, classes, conf = xyxy[giu], classes[giu], conf[giu]
+
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - de[0]) / ty_le
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - de[1]) / ty_le
+        cao, rong = kich_thuoc_goc
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, rong)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, cao)
+        return xyxy, classes.astype(np.float32), conf
+
+    def du_doan(self, danh_sach_anh: List) -> List[Tuple]:
+        """
+        Phát hiện trên một lô ảnh
+
+        Args:
+            danh_sach_anh: List ảnh (numpy array BGR hoặc đường dẫn)
+
+        Returns:
+            List (boxes xyxy, classes, confidences) cho từng ảnh, cùng thứ tự
+        """
+        cac_anh = [cv2.imread(anh) if isinstance(anh, str) else anh for anh in danh_sach_anh]
+        dau_vao, thong_tin = [], []
+        for anh in cac_anh:
+            if anh.ndim == 2:
+                anh = cv2.cvtColor(anh, cv2.COLOR_GRAY2BGR)
+            anh_dem, ty_le, de = self._letterbox(anh)
+            dau_vao.append(anh_dem[:, :, ::-1].transpose(2, 0, 1))
+            thong_tin.append((ty_le, de, anh.shape[:2]))
+        dau_vao = np.ascontiguousarray(np.stack(dau_vao), dtype=np.float32) / 255.0
+
+        if self.batch_dong:
+            dau_ra = self.session.run(None, {self.ten_dau_vao: dau_vao})[0]
+        else:
+            dau_ra = np.concatenate([self.session.run(None, {self.ten_dau_vao: anh[None]})[0] for anh in dau_vao])
+        return [self._hau_xu_ly(du_doan, *tt) for du_doan, tt in zip(dau_ra, thong_tin)]
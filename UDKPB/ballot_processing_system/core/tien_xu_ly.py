@@ -12,6 +12,9 @@ COL_BOUNDARIES1 = [385, 974, 1233, 1481]
 Y_MIN2, Y_MAX2 = 204, 2128
 COL_BOUNDARIES2 = [268, 1009, 1339, 1648]
 
+# Phiên bản của bước tiền xử lý (làm phẳng, cắt ô), tăng lên khi thay đổi cách xử lý làm kết quả khác đi
+PHIEN_BAN_TIEN_XU_LY = 1
+
 def sharpen_image(image):
     """Làm nét ảnh bằng unsharp masking"""
     kernel = np.array([[-1,-1,-1], [-1, 9,-1], [-1,-1,-1]])
@@ -403,94 +406,153 @@ def process_all_ballots(input_dirs=None, output_dir=None):
         
     return all_results
 
-def xu_ly_phieu_bau(duong_dan_anh, thu_muc_luu="results/ket_qua_tien_xu_ly", layout=None):
+def ten_layout(duong_dan_anh):
+    """Tên layout nhận diện từ đường dẫn ảnh: 'data1', 'data2' hoặc None nếu không xác định được"""
+    path_lower = duong_dan_anh.lower()
+    if "data1" in path_lower:
+        return "data1"
+    if "data2" in path_lower:
+        return "data2"
+    return None
+
+def thong_tin_tien_xu_ly():
+    """Phiên bản tiền xử lý và tọa độ các layout (thay đổi thì kết quả xử lý phiếu thay đổi)"""
+    return {
+        'phien_ban': PHIEN_BAN_TIEN_XU_LY,
+        'data1': get_layout1(),
+        'data2': get_layout2(),
+    }
+
+def chon_layout(duong_dan_anh):
+    """Tự nhận diện layout dựa trên đường dẫn ảnh (data1/data2), mặc định layout data1"""
+    ten = ten_layout(duong_dan_anh)
+    if ten == "data1":
+        return get_layout1()
+    if ten == "data2":
+        return get_layout2()
+    print("Không xác định được layout từ đường dẫn, mặc định dùng layout data1.")
+    #raise ValueError("Không thể xác định layout. Chỉ hỗ trợ ballot/data1 và ballot/data2. Vui lòng truyền layout cụ thể.")
+    return get_layout1()
+
+def cat_o_phieu(straightened_img, layout, base_name, thu_muc_luu=None):
     """
-    Xử lý một phiếu bầu cụ thể với ArUco markers và layout tùy chọn
+    Cắt các ô của phiếu đã làm phẳng theo layout, giữ kết quả trong bộ nhớ
     
     Args:
-        duong_dan_anh: Đường dẫn tới ảnh phiếu bầu
-        thu_muc_luu: Thư mục lưu kết quả
-        layout: Layout cụ thể (None để auto-detect)
+        straightened_img: Ảnh phiếu đã làm phẳng (numpy array BGR)
+        layout: Layout các ô theo dòng
+        base_name: Tên gốc của phiếu (dùng đặt tên file khi lưu debug)
+        thu_muc_luu: Thư mục lưu ảnh từng ô (None để không ghi ra đĩa)
         
     Returns:
-        List[List[Dict]]: Ma trận 2D chứa thông tin các ảnh đã cắt
+        List[List[Dict]]: Ma trận 2D chứa thông tin các ảnh đã cắt ('anh' đã resize/padding cho model,
+        'anh_goc' là vùng cắt nguyên kích thước)
     """
-    # Tạo thư mục lưu kết quả nếu chưa có
-    if not os.path.exists(thu_muc_luu):
-        os.makedirs(thu_muc_luu)
+    ket_qua_cat_anh = []
     
-    try:
-        filename = os.path.basename(duong_dan_anh)
-        base_name = os.path.splitext(filename)[0]
-        
-        # Bước 1: Làm phẳng ảnh
-        straightened_img = straighten_ballot(duong_dan_anh)
-        
-        # Lưu ảnh đã làm phẳng
-        straightened_path = os.path.join(thu_muc_luu, f"{base_name}_straightened.jpg")
-        cv2.imwrite(straightened_path, straightened_img)
+    for row_idx, row_data in layout.items():
+        danh_sach_o_trong_dong = []
         
-        # Bước 2: Chọn layout phù hợp
-        if layout is None:
-            # Auto-detect layout dựa trên đường dẫn
-            path_lower = duong_dan_anh.lower()
-            if "data1" in path_lower:
-                layout = get_layout1()
-            elif "data2" in path_lower:
-                layout = get_layout2()
+        for field, (x1, y1, x2, y2) in row_data.items():
+            # Cắt vùng từ ảnh gốc
+            cropped = straightened_img[y1:y2, x1:x2]
+            
+            if cropped.size == 0:
+                continue
+            
+            # Xử lý theo từng loại ô
+            if field == "name":
+                processed = resize_with_padding_high_quality(cropped, (384, 384))
+                filename_part = f"{base_name}_row{row_idx:02d}_hoten.jpg"
+                loai = "hoten"
+            elif field == "agree":
+                processed = add_padding_only(cropped, (640, 640))
+                filename_part = f"{base_name}_row{row_idx:02d}_dongy.jpg"
+                loai = "dongy"
+            elif field == "disagree":
+                processed = add_padding_only(cropped, (640, 640))
+                filename_part = f"{base_name}_row{row_idx:02d}_khongdongy.jpg"
+                loai = "khongdongy"
             else:
-                layout = get_layout1() # Mặc định chọn layout1 nếu không xác định được
-                print("Không xác định được layout từ đường dẫn, mặc định dùng layout data1.")
-                #raise ValueError("Không thể xác định layout. Chỉ hỗ trợ ballot/data1 và ballot/data2. Vui lòng truyền layout cụ thể.")
-        
-        # Bước 3: Cắt theo layout đã chọn
-        ket_qua_cat_anh = []
-        
-        for row_idx, row_data in layout.items():
-            danh_sach_o_trong_dong = []
+                processed = cropped
+                filename_part = f"{base_name}_row{row_idx:02d}_{field}.jpg"
+                loai = field
             
-            for field, (x1, y1, x2, y2) in row_data.items():
-                # Cắt vùng từ ảnh gốc
-                cropped = straightened_img[y1:y2, x1:x2]
-                
-                if cropped.size == 0:
-                    continue
-                
-                # Xử lý theo từng loại ô
-                if field == "name":
-                    processed = resize_with_padding_high_quality(cropped, (384, 384))
-                    filename_part = f"{base_name}_row{row_idx:02d}_hoten.jpg"
-                    loai = "hoten"
-                elif field == "agree":
-                    processed = add_padding_only(cropped, (640, 640))
-                    filename_part = f"{base_name}_row{row_idx:02d}_dongy.jpg"
-                    loai = "dongy"
-                elif field == "disagree":
-                    processed = add_padding_only(cropped, (640, 640))
-                    filename_part = f"{base_name}_row{row_idx:02d}_khongdongy.jpg"
-                    loai = "khongdongy"
-                else:
-                    processed = cropped
-                    filename_part = f"{base_name}_row{row_idx:02d}_{field}.jpg"
-                    loai = field
-                
-                # Lưu ảnh
+            # Chỉ lưu ảnh khi bật chế độ debug
+            filepath = None
+            if thu_muc_luu:
                 filepath = os.path.join(thu_muc_luu, filename_part)
                 cv2.imwrite(filepath, processed)
-                
-                danh_sach_o_trong_dong.append({
-                    'anh': processed,
-                    'duong_dan': filepath,
-                    'loai': loai
-                })
-                
-                # print(f"  → Đã cắt: {filename_part}")
             
-            if danh_sach_o_trong_dong:
-                ket_qua_cat_anh.append(danh_sach_o_trong_dong)
+            danh_sach_o_trong_dong.append({
+                'anh': processed,
+                'anh_goc': cropped,
+                'duong_dan': filepath,
+                'loai': loai
+            })
+        
+        if danh_sach_o_trong_dong:
+            ket_qua_cat_anh.append(danh_sach_o_trong_dong)
+    
+    return ket_qua_cat_anh
+
+def cat_phieu_da_lam_phang(duong_dan_anh, straightened_img, thu_muc_luu="results/ket_qua_tien_xu_ly", layout=None, luu_debug=False):
+    """
+    Chọn layout và cắt các ô từ ảnh phiếu đã làm phẳng (bước 2-3 của xu_ly_phieu_bau)
+    
+    Args:
+        duong_dan_anh: Đường dẫn tới ảnh phiếu bầu gốc (dùng đặt tên và auto-detect layout)
+        straightened_img: Ảnh phiếu đã làm phẳng bằng straighten_ballot
+        thu_muc_luu: Thư mục lưu ảnh trung gian (chỉ dùng khi luu_debug=True)
+        layout: Layout cụ thể (None để auto-detect)
+        luu_debug: True để lưu ảnh đã làm phẳng và ảnh từng ô vào thu_muc_luu
+        
+    Returns:
+        List[List[Dict]]: Ma trận 2D chứa thông tin các ảnh đã cắt
+    """
+    filename = os.path.basename(duong_dan_anh)
+    base_name = os.path.splitext(filename)[0]
+    
+    # Lưu ảnh đã làm phẳng
+    if luu_debug:
+        os.makedirs(thu_muc_luu, exist_ok=True)
+        straightened_path = os.path.join(thu_muc_luu, f"{base_name}_straightened.jpg")
+        cv2.imwrite(straightened_path, straightened_img)
+    
+    # Bước 2: Chọn layout phù hợp
+    if layout is None:
+        # Auto-detect layout dựa trên đường dẫn
+        layout = chon_layout(duong_dan_anh)
+    
+    # Bước 3: Cắt theo layout đã chọn
+    ket_qua_cat_anh = cat_o_phieu(straightened_img, layout, base_name,
+                                  thu_muc_luu if luu_debug else None)
+    
+    print(f"✅ Hoàn thành: {filename} - Cắt được {len(ket_qua_cat_anh)} dòng")
+    return ket_qua_cat_anh
+
+def xu_ly_phieu_bau(duong_dan_anh, thu_muc_luu="results/ket_qua_tien_xu_ly", layout=None, luu_debug=False):
+    """
+    Xử lý một phiếu bầu cụ thể với ArUco markers và layout tùy chọn
+    
+    Mặc định toàn bộ xử lý diễn ra trong bộ nhớ, không ghi file nào ra đĩa.
+    
+    Args:
+        duong_dan_anh: Đường dẫn tới ảnh phiếu bầu
+        thu_muc_luu: Thư mục lưu ảnh trung gian (chỉ dùng khi luu_debug=True)
+        layout: Layout cụ thể (None để auto-detect)
+        luu_debug: True để lưu ảnh đã làm phẳng và ảnh từng ô vào thu_muc_luu
+        
+    Returns:
+        List[List[Dict]]: Ma trận 2D chứa thông tin các ảnh đã cắt
+        ('duong_dan' là None nếu không lưu debug)
+    """
+    try:
+        # Bước 1: Làm phẳng ảnh
+        straightened_img = straighten_ballot(duong_dan_anh)
         
-        print(f"✅ Hoàn thành: {filename} - Cắt được {len(ket_qua_cat_anh)} dòng")
-        return ket_qua_cat_anh
+        # Bước 2-3: Chọn layout và cắt ô
+        return cat_phieu_da_lam_phang(duong_dan_anh, straightened_img, thu_muc_luu, layout, luu_debug)
         
     except Exception as e:
         print(f"❌ Lỗi xử lý {duong_dan_anh}: {e}")
@@ -1,24 +1,129 @@
 # nhan_dien_trocr.py
-import torch
-from transformers import pipeline
+import os
+import json
 from PIL import Image, ImageEnhance, ImageFilter
 import warnings
 import cv2
 import numpy as np
 import re
 
+from core.giai_ma import chan_lap_ngram
+
 # Tắt warning về deprecated class
 warnings.filterwarnings("ignore", category=FutureWarning)
 
-# Khởi tạo pipeline global để tái sử dụng
-_pipe = None
+# Khởi tạo pipeline global để tái sử dụng (mỗi chế độ một pipeline)
+_pipes = {}
+
+# Số ảnh từ tối đa trong một lần generate() của TrOCR
+TROCR_BATCH_SIZE = 16
+
+# Chế độ chạy TrOCR: fp32 (mặc định), int8 (lượng tử hóa động các lớp Linear, chỉ trên CPU)
+# hoặc onnx (ONNX Runtime trên CPU, không cần torch; xuất model bằng processors.xuat_onnx).
+# Đọc từ biến môi trường để các worker process và subprocess dùng cùng chế độ.
+# torch/transformers chỉ được import khi load model PyTorch.
+BIEN_MOI_TRUONG_CHE_DO = "TROCR_CHE_DO"
+CAC_CHE_DO_TROCR = ("fp32", "int8", "onnx")
+
+# Cấu hình giải mã khi đọc một từ của họ tên. Mặc định giải mã bằng generate() theo generation_config
+# của model (None: giữ giá trị của model); giải mã tham lam có giới hạn token chỉ bật khi đã đánh giá
+# độ chính xác trên tập nhãn (processors.danh_gia_trocr --trocr_decoding '{"tham_lam": true}')
+CAU_HINH_GIAI_MA_MAC_DINH = {
+    'tham_lam': False,         # True: giải mã tham lam theo lô, dừng sớm từng từ, tối đa max_new_tokens token
+    'max_new_tokens': None,    # Số token tối đa sinh cho một từ (tham lam: mặc định SO_TOKEN_TOI_DA_THAM_LAM)
+    'num_beams': None,         # Số beam của generate() (không dùng khi tham_lam)
+    'early_stopping': None,    # Beam search dừng khi đã có đủ num_beams chuỗi hoàn chỉnh
+    'use_cache': None,         # Dùng lại key/value của các token trước (KV cache) thay vì tính lại cả chuỗi
+}
+
+# Số token tối đa mỗi từ khi giải mã tham lam (mỗi từ của họ tên chỉ vài token)
+SO_TOKEN_TOI_DA_THAM_LAM = 16
+
+def che_do_trocr():
+    """
+    Chế độ chạy TrOCR hiện tại (biến môi trường TROCR_CHE_DO, mặc định fp32)
+    """
+    che_do = os.getenv(BIEN_MOI_TRUONG_CHE_DO, "fp32").strip().lower() or "fp32"
+    if che_do not in CAC_CHE_DO_TROCR:
+        raise ValueError(f"Chế độ TrOCR không hỗ trợ: {che_do} (chỉ hỗ trợ {', '.join(CAC_CHE_DO_TROCR)})")
+    return che_do
+
+def dat_che_do_trocr(che_do):
+    """
+    Đặt chế độ chạy TrOCR cho process hiện tại và các process con tạo sau đó
+    """
+    os.environ[BIEN_MOI_TRUONG_CHE_DO] = che_do
+    che_do_trocr()
+
+def tim_model_trocr():
+    """
+    Tìm thư mục snapshot của model TrOCR đã tải về (model_trocr nằm ở một thư mục cha của module này)
+
+    Returns:
+        Đường dẫn thư mục snapshot của model
+    """
+    # Tìm thư mục gốc project (nơi có ballot_processing_system)
+    cur = os.path.abspath(__file__)
+    while True:
+        parent = os.path.dirname(cur)
+        if os.path.isdir(os.path.join(parent, "model_trocr")):
+            model_trocr_root = os.path.join(parent, "model_trocr")
+            break
+        if parent == cur:
+            raise RuntimeError("Không tìm thấy thư mục model_trocr trong cây thư mục cha!")
+        cur = parent
+    local_model_dir = os.path.join(model_trocr_root, "models--microsoft--trocr-base-printed", "snapshots")
+    local_model_dir = os.path.normpath(local_model_dir)
+    # Tìm thư mục snapshot id (thường chỉ có 1 thư mục con)
+    snapshot_dirs = [os.path.join(local_model_dir, d) for d in os.listdir(local_model_dir) if os.path.isdir(os.path.join(local_model_dir, d))]
+    if not snapshot_dirs:
+        raise RuntimeError(f"Không tìm thấy model TrOCR đã tải về trong {local_model_dir}. Hãy chắc chắn đã tải model!")
+    return snapshot_dirs[0]
+
+def thong_tin_model_trocr(che_do=None):
+    """
+    Thông tin phiên bản model TrOCR đang dùng (tên model, snapshot id và chế độ chạy), không cần load model
+    """
+    return {'model': 'microsoft/trocr-base-printed', 'snapshot': os.path.basename(tim_model_trocr()),
+            'che_do': che_do or che_do_trocr()}
+
+def tai_model_int8(model_path):
+    """
+    Load model TrOCR fp32 từ snapshot (safetensors) rồi lượng tử hóa động INT8 các lớp Linear của encoder
+    và decoder ngay trong bộ nhớ; không lưu model đã lượng tử hóa ra đĩa (tránh load pickle bằng
+    torch.load(weights_only=False)), lượng tử hóa động chỉ mất vài giây mỗi lần load
 
-def get_pipeline():
+    Returns:
+        VisionEncoderDecoderModel đã lượng tử hóa (chỉ chạy trên CPU)
+    """
+    import torch
+    from transformers import VisionEncoderDecoderModel
+
+    model = VisionEncoderDecoderModel.from_pretrained(model_path).eval()
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    print("[INFO] Đã lượng tử hóa động TrOCR sang INT8")
+    return model
+
+def get_pipeline(che_do=None):
     """
     Lazy loading pipeline để tối ưu performance
+
+    Args:
+        che_do: fp32, int8 hoặc onnx (None: theo biến môi trường TROCR_CHE_DO)
     """
-    global _pipe
-    if _pipe is None:
+    che_do = che_do or che_do_trocr()
+    if che_do not in CAC_CHE_DO_TROCR:
+        raise ValueError(f"Chế độ TrOCR không hỗ trợ: {che_do} (chỉ hỗ trợ {', '.join(CAC_CHE_DO_TROCR)})")
+    if che_do == "onnx" and che_do not in _pipes:
+        from core.suy_luan_onnx import TrOCROnnx, thu_muc_trocr_onnx
+        thu_muc = thu_muc_trocr_onnx(tim_model_trocr())
+        if not os.path.exists(thu_muc):
+            raise RuntimeError(f"Chưa xuất TrOCR sang ONNX ({thu_muc}), hãy chạy: python -m processors.xuat_onnx")
+        _pipes[che_do] = TrOCROnnx(thu_muc)
+        print(f"[INFO] TrOCR ONNX Runtime đã được khởi tạo từ: {thu_muc}")
+    if che_do not in _pipes:
+        import torch
+        from transformers import pipeline
         # Kiểm tra GPU
         if torch.cuda.is_available():
             device = 0
@@ -26,36 +131,57 @@ def get_pipeline():
         else:
             device = -1
             print("[INFO] Không có GPU, TrOCR sẽ chạy trên CPU.")
-        # Đường dẫn local tới model đã tải về
-        import os
-        import os
-        # Tìm thư mục gốc project (nơi có ballot_processing_system)
-        cur = os.path.abspath(__file__)
-        while True:
-            parent = os.path.dirname(cur)
-            if os.path.isdir(os.path.join(parent, "model_trocr")):
-                model_trocr_root = os.path.join(parent, "model_trocr")
-                break
-            if parent == cur:
-                raise RuntimeError("Không tìm thấy thư mục model_trocr trong cây thư mục cha!")
-            cur = parent
-        local_model_dir = os.path.join(model_trocr_root, "models--microsoft--trocr-base-printed", "snapshots")
-        local_model_dir = os.path.normpath(local_model_dir)
-        # Tìm thư mục snapshot id (thường chỉ có 1 thư mục con)
-        snapshot_dirs = [os.path.join(local_model_dir, d) for d in os.listdir(local_model_dir) if os.path.isdir(os.path.join(local_model_dir, d))]
-        if not snapshot_dirs:
-            raise RuntimeError(f"Không tìm thấy model TrOCR đã tải về trong {local_model_dir}. Hãy chắc chắn đã tải model!")
-        model_path = snapshot_dirs[0]
-        _pipe = pipeline(
+        model_path = tim_model_trocr()
+        model = model_path
+        if che_do == "int8":
+            if device != -1:
+                print("[WARNING] Lượng tử hóa INT8 chỉ chạy trên CPU, TrOCR sẽ chạy trên CPU.")
+                device = -1
+            model = tai_model_int8(model_path)
+        _pipes[che_do] = pipeline(
             "image-to-text",
-            model=model_path,
+            model=model,
             tokenizer=model_path,
             image_processor=model_path,
             framework="pt",
             device=device
         )
-        print(f"[INFO] TrOCR pipeline đã được khởi tạo từ local: {model_path}")
-    return _pipe
+        print(f"[INFO] TrOCR pipeline ({che_do}) đã được khởi tạo từ local: {model_path}")
+    return _pipes[che_do]
+
+def mo_anh_rgb(anh):
+    """
+    Chuẩn hóa đầu vào ảnh về PIL Image RGB
+
+    Args:
+        anh: Đường dẫn ảnh, numpy array (BGR/grayscale như OpenCV trả về) hoặc PIL Image
+
+    Returns:
+        PIL.Image: Ảnh ở chế độ RGB
+    """
+    if isinstance(anh, np.ndarray):
+        if anh.ndim == 2:
+            anh = cv2.cvtColor(anh, cv2.COLOR_GRAY2RGB)
+        elif anh.shape[2] == 4:
+            anh = cv2.cvtColor(anh, cv2.COLOR_BGRA2RGB)
+        else:
+            anh = cv2.cvtColor(anh, cv2.COLOR_BGR2RGB)
+        return Image.fromarray(anh)
+
+    pil_img = anh if isinstance(anh, Image.Image) else Image.open(anh)
+
+    # Chuyển sang RGB nếu cần
+    if pil_img.mode != 'RGB':
+        pil_img = pil_img.convert('RGB')
+    return pil_img
+
+def mo_ta_anh(anh):
+    """Mô tả ngắn gọn ảnh đầu vào để ghi log lỗi"""
+    if isinstance(anh, np.ndarray):
+        return f"<numpy {anh.shape}>"
+    if isinstance(anh, Image.Image):
+        return f"<PIL {anh.size}>"
+    return str(anh)
 
 def tien_xu_ly_anh_ocr(pil_img):
     """
@@ -87,9 +213,12 @@ def tien_xu_ly_anh_ocr(pil_img):
     # Chuyển về PIL Image
     return Image.fromarray(cleaned)
 
-def cat_tu_rieng_biet(pil_img):
+def tim_hop_tu(pil_img):
     """
-    Cắt từng từ riêng biệt để OCR
+    Tìm khung bao (đã thêm padding) của từng từ, xếp từ trái sang phải
+
+    Returns:
+        List (x1, y1, x2, y2)
     """
     # Chuyển sang numpy array
     img_array = np.array(pil_img)
@@ -117,8 +246,7 @@ def cat_tu_rieng_biet(pil_img):
     # Sắp xếp từ trái sang phải
     word_boxes.sort(key=lambda box: box[0])
     
-    # Cắt từng từ
-    words = []
+    hop_tu = []
     for x, y, w, h in word_boxes:
         # Thêm padding
         padding = 5
@@ -126,11 +254,25 @@ def cat_tu_rieng_biet(pil_img):
         y1 = max(0, y - padding)
         x2 = min(pil_img.width, x + w + padding)
         y2 = min(pil_img.height, y + h + padding)
-        
-        word_img = pil_img.crop((x1, y1, x2, y2))
-        words.append(word_img)
+        hop_tu.append((x1, y1, x2, y2))
     
-    return words
+    return hop_tu
+
+def cat_tu_rieng_biet(pil_img):
+    """
+    Cắt từng từ riêng biệt để OCR
+    """
+    return [pil_img.crop(hop) for hop in tim_hop_tu(pil_img)]
+
+def cat_vung_chu(pil_img):
+    """
+    Cắt vùng bao tất cả các từ của ô (cả dòng họ tên), None nếu ô không có chữ
+    """
+    hop_tu = tim_hop_tu(pil_img)
+    if not hop_tu:
+        return None
+    return pil_img.crop((min(h[0] for h in hop_tu), min(h[1] for h in hop_tu),
+                         max(h[2] for h in hop_tu), max(h[3] for h in hop_tu)))
 
 def hau_xu_ly_text(text):
     """
@@ -166,46 +308,317 @@ def hau_xu_ly_text(text):
     
     return processed_text.strip()
 
-def doc_ten_tu_anh(duong_dan_anh):
+def cau_hinh_giai_ma(giai_ma=None):
+    """
+    Cấu hình giải mã đầy đủ (CAU_HINH_GIAI_MA_MAC_DINH ghi đè bởi giai_ma), kiểm tra khóa và giá trị
+    """
+    khong_ho_tro = set(giai_ma or {}) - set(CAU_HINH_GIAI_MA_MAC_DINH)
+    if khong_ho_tro:
+        raise ValueError(f"Tham số giải mã không hỗ trợ: {', '.join(sorted(khong_ho_tro))}")
+    cau_hinh = {**CAU_HINH_GIAI_MA_MAC_DINH, **(giai_ma or {})}
+    for khoa in ('max_new_tokens', 'num_beams'):
+        if cau_hinh[khoa] is not None and int(cau_hinh[khoa]) < 1:
+            raise ValueError(f"{khoa} phải >= 1")
+    if cau_hinh['tham_lam']:
+        if (cau_hinh['num_beams'] or 1) > 1:
+            raise ValueError("Giải mã tham lam không dùng beam search (bỏ num_beams hoặc tắt tham_lam)")
+        if cau_hinh['max_new_tokens'] is None:
+            cau_hinh['max_new_tokens'] = SO_TOKEN_TOI_DA_THAM_LAM
+    return cau_hinh
+
+def doc_cau_hinh_giai_ma(chuoi):
+    """
+    Đọc cấu hình giải mã từ chuỗi JSON của tham số dòng lệnh (None nếu không truyền)
+    """
+    if not chuoi:
+        return None
+    giai_ma = json.loads(chuoi)
+    if not isinstance(giai_ma, dict):
+        raise ValueError("Cấu hình giải mã phải là JSON object")
+    cau_hinh_giai_ma(giai_ma)
+    return giai_ma
+
+def _chon_lo_cache(past_key_values, chi_so):
+    """
+    Giữ lại các hàng chi_so của KV cache (Cache object của transformers mới hoặc tuple theo từng lớp)
+    """
+    if hasattr(past_key_values, 'reorder_cache'):
+        past_key_values.reorder_cache(chi_so)
+        return past_key_values
+    return tuple(tuple(t.index_select(0, chi_so) for t in lop) for lop in past_key_values)
+
+def _token_bat_dau_ket_thuc(model):
+    """
+    decoder_start_token_id và eos_token_id của VisionEncoderDecoderModel
+    """
+    eos = model.generation_config.eos_token_id
+    eos = eos if eos is not None else model.config.eos_token_id
+    eos = eos[0] if isinstance(eos, (list, tuple)) else eos
+    return model.config.decoder_start_token_id, eos
+
+def _ma_hoa_anh(model, pixel_values):
+    """
+    Chạy encoder (kèm phép chiếu sang kích thước decoder nếu có), gọi trong torch.inference_mode()
+    """
+    trang_thai = model.encoder(pixel_values=pixel_values).last_hidden_state
+    if getattr(model, 'enc_to_dec_proj', None) is not None:
+        trang_thai = model.enc_to_dec_proj(trang_thai)
+    return trang_thai
+
+def giai_ma_tham_lam(model, pixel_values, max_new_tokens, use_cache=True):
     """
-    Đọc tên từ ảnh bằng phương pháp cắt từng từ
+    Giải mã tham lam theo lô cho các ảnh từ ngắn: encoder (kèm phép chiếu sang decoder) chạy một lần,
+    mỗi bước decoder chỉ nhận token mới (KV cache), chuỗi gặp eos được bỏ khỏi lô ngay, nên thời gian
+    decoder theo độ dài thực của từ chứ không theo độ dài tối đa
+
+    Args:
+        model: VisionEncoderDecoderModel (fp32 hoặc int8)
+        pixel_values: Tensor ảnh đã qua image processor
+        max_new_tokens: Số token tối đa sinh thêm
+        use_cache: Dùng KV cache (False để tính lại cả chuỗi mỗi bước)
+
+    Returns:
+        Tensor token (số ảnh, độ dài), bắt đầu bằng decoder_start_token_id, phần sau eos là pad
+    """
+    import torch
+
+    cau_hinh_sinh = model.generation_config
+    bat_dau, eos = _token_bat_dau_ket_thuc(model)
+    pad = cau_hinh_sinh.pad_token_id if cau_hinh_sinh.pad_token_id is not None else model.config.pad_token_id
+    n_gram = cau_hinh_sinh.no_repeat_ngram_size or 0
+
+    with torch.inference_mode():
+        trang_thai = _ma_hoa_anh(model, pixel_values)
+
+        so_anh = len(pixel_values)
+        ket_qua = torch.full((so_anh, 1 + max_new_tokens), pad, dtype=torch.long, device=pixel_values.device)
+        ket_qua[:, 0] = bat_dau
+        dang_chay = torch.arange(so_anh, device=pixel_values.device)
+        chuoi = ket_qua[:, :1].clone()
+        past_key_values = None
+        for buoc in range(1, max_new_tokens + 1):
+            dau_vao = chuoi[:, -1:] if past_key_values is not None else chuoi
+            dau_ra = model.decoder(input_ids=dau_vao, encoder_hidden_states=trang_thai,
+                                   past_key_values=past_key_values, use_cache=use_cache)
+            past_key_values = dau_ra.past_key_values if use_cache else None
+            logits = dau_ra.logits[:, -1, :]
+            chan_lap_ngram(logits, chuoi, n_gram)
+            tiep = logits.argmax(dim=-1)
+            ket_qua[dang_chay, buoc] = tiep
+            chuoi = torch.cat([chuoi, tiep[:, None]], dim=1)
+
+            xong = tiep == eos
+            if xong.all():
+                break
+            if xong.any():
+                # Bỏ các chuỗi đã xong khỏi lô (cả trạng thái encoder và KV cache)
+                giu = (~xong).nonzero().squeeze(1)
+                dang_chay, chuoi, trang_thai = dang_chay[giu], chuoi[giu], trang_thai[giu]
+                if past_key_values is not None:
+                    past_key_values = _chon_lo_cache(past_key_values, giu)
+    return ket_qua[:, :buoc + 1]
+
+def _sinh_token_lo(pipe, lo_anh, giai_ma):
+    """
+    Sinh token cho một lô ảnh từ với pipeline transformers hoặc TrOCR ONNX
+    """
+    if hasattr(pipe, 'sinh_token'):
+        pixel_values = pipe.image_processor(images=lo_anh, return_tensors="np").pixel_values
+        return pipe.sinh_token(pixel_values, giai_ma)
+
+    pixel_values = pipe.image_processor(images=lo_anh, return_tensors="pt").pixel_values
+    pixel_values = pixel_values.to(device=pipe.model.device, dtype=pipe.model.dtype)
+    if giai_ma['tham_lam']:
+        return giai_ma_tham_lam(pipe.model, pixel_values, int(giai_ma['max_new_tokens']),
+                                giai_ma['use_cache'] is not False)
+    import torch
+    # Chỉ truyền tham số đã đặt, còn lại generate() lấy theo generation_config của model
+    tham_so = {khoa: giai_ma[khoa] for khoa in ('max_new_tokens', 'num_beams', 'early_stopping', 'use_cache')
+               if giai_ma[khoa] is not None}
+    with torch.inference_mode():
+        return pipe.model.generate(pixel_values, **tham_so)
+
+def nhan_dang_lo_tu(danh_sach_tu, batch_size=TROCR_BATCH_SIZE, giai_ma=None, che_do=None):
+    """
+    Chạy TrOCR trên danh sách ảnh từ đã tiền xử lý theo từng lô
+
+    Các từ được xếp theo tỷ lệ rộng/cao trước khi chia lô để các từ dài ngắn tương đương nằm cùng lô
+    (lô giải mã xong gần như cùng lúc).
+
+    Args:
+        danh_sach_tu: List ảnh PIL (mỗi ảnh là một từ đã qua tien_xu_ly_anh_ocr)
+        batch_size: Số ảnh đưa vào model trong một lần giải mã
+        giai_ma: Cấu hình giải mã ghi đè CAU_HINH_GIAI_MA_MAC_DINH
+        che_do: Chế độ chạy TrOCR (None: theo TROCR_CHE_DO)
+
+    Returns:
+        List[str]: Text nhận dạng được, cùng thứ tự với danh_sach_tu
+    """
+    if not danh_sach_tu:
+        return []
+
+    giai_ma = cau_hinh_giai_ma(giai_ma)
+    pipe = get_pipeline(che_do)
+    batch_size = max(1, batch_size)
+    thu_tu = sorted(range(len(danh_sach_tu)), key=lambda i: danh_sach_tu[i].width / max(danh_sach_tu[i].height, 1))
+
+    texts = [''] * len(danh_sach_tu)
+    for bat_dau in range(0, len(thu_tu), batch_size):
+        chi_so = thu_tu[bat_dau:bat_dau + batch_size]
+        token = _sinh_token_lo(pipe, [danh_sach_tu[i] for i in chi_so], giai_ma)
+        for i, text in zip(chi_so, pipe.tokenizer.batch_decode(token, skip_special_tokens=True)):
+            texts[i] = text
+    return texts
+
+def doc_ten_theo_lo(danh_sach_anh, batch_size=TROCR_BATCH_SIZE, giai_ma=None, che_do=None):
+    """
+    Đọc tên từ nhiều ảnh ô họ tên (một ô, một phiếu hoặc nhiều phiếu) trong cùng một lô TrOCR
+
+    Args:
+        danh_sach_anh: List ảnh ô họ tên (đường dẫn, numpy array BGR hoặc PIL Image)
+        batch_size: Số ảnh từ đưa vào model trong một lần giải mã
+        giai_ma: Cấu hình giải mã ghi đè CAU_HINH_GIAI_MA_MAC_DINH
+        che_do: Chế độ chạy TrOCR (None: theo TROCR_CHE_DO)
+
+    Returns:
+        List[str]: Tên đã hậu xử lý cho từng ảnh (None nếu ảnh đó bị lỗi)
     """
+    ket_qua = [None] * len(danh_sach_anh)
+
+    # Bước 1: Cắt và tiền xử lý toàn bộ từ của tất cả các ô, ghi nhớ từ thuộc ô nào
+    tat_ca_tu = []
+    chi_so_o = []
+    for i, anh in enumerate(danh_sach_anh):
+        try:
+            pil_img = mo_anh_rgb(anh)
+
+            words = cat_tu_rieng_biet(pil_img)
+            for word_img in words:
+                tat_ca_tu.append(tien_xu_ly_anh_ocr(word_img))
+                chi_so_o.append(i)
+            ket_qua[i] = ''
+        except Exception as e:
+            print(f"Lỗi khi xử lý ảnh {mo_ta_anh(anh)}: {str(e)}")
+
+    # Bước 2: Nhận dạng tất cả các từ theo lô
     try:
-        # Lấy pipeline
-        pipe = get_pipeline()
-        
-        pil_img = Image.open(duong_dan_anh)
-        
-        # Chuyển sang RGB nếu cần
-        if pil_img.mode != 'RGB':
-            pil_img = pil_img.convert('RGB')
-        
-        # Cắt từng từ riêng biệt
-        words = cat_tu_rieng_biet(pil_img)
-        word_texts = []
-        
-        for word_img in words:
-            # Tiền xử lý từng từ
-            enhanced_word = tien_xu_ly_anh_ocr(word_img)
-            result = pipe(enhanced_word)
-            if result:
-                word_text = result[0]['generated_text']
-                word_texts.append(word_text)
-        
-        # Ghép các từ lại
-        text = ' '.join(word_texts)
-        
-        # Hậu xử lý
-        processed_text = hau_xu_ly_text(text)
-        
-        return processed_text
-        
+        texts = nhan_dang_lo_tu(tat_ca_tu, batch_size, giai_ma, che_do)
     except Exception as e:
-        print(f"Lỗi khi xử lý ảnh {duong_dan_anh}: {str(e)}")
-        return None
+        print(f"Lỗi khi chạy TrOCR theo lô ({len(tat_ca_tu)} từ): {str(e)}")
+        return [None] * len(danh_sach_anh)
+
+    # Bước 3: Ghép các từ lại theo từng ô và hậu xử lý
+    word_texts = {}
+    for i, word_text in zip(chi_so_o, texts):
+        if word_text:
+            word_texts.setdefault(i, []).append(word_text)
+
+    for i in range(len(danh_sach_anh)):
+        if ket_qua[i] is not None:
+            ket_qua[i] = hau_xu_ly_text(' '.join(word_texts.get(i, [])))
+
+    return ket_qua
+
+def doc_ten_tu_anh(anh, batch_size=TROCR_BATCH_SIZE, giai_ma=None, che_do=None):
+    """
+    Đọc tên từ ảnh bằng phương pháp cắt từng từ (các từ được nhận dạng trong cùng một lô)
+
+    Args:
+        anh: Đường dẫn ảnh, numpy array (BGR) hoặc PIL Image
+    """
+    return doc_ten_theo_lo([anh], batch_size, giai_ma, che_do)[0]
+
+def _ham_log_xac_suat_token(pipe, lo_anh):
+    """
+    Chạy encoder một lần cho một lô ảnh, trả về hàm tính log xác suất token tiếp theo của các chuỗi
+    token (mỗi chuỗi gắn với một ảnh của lô) cho giải mã ràng buộc theo ứng viên
+    """
+    if hasattr(pipe, 'sinh_token'):
+        pixel_values = pipe.image_processor(images=lo_anh, return_tensors="np").pixel_values
+        trang_thai = pipe.ma_hoa(pixel_values)
+
+        def ham_log_xac_suat(chi_so_anh, chuoi):
+            logits = pipe.logits_token_tiep(chuoi, trang_thai[chi_so_anh])
+            logits = logits - logits.max(axis=-1, keepdims=True)
+            return logits - np.log(np.exp(logits).sum(axis=-1, keepdims=True))
+        return ham_log_xac_suat
+
+    import torch
+    model = pipe.model
+    pixel_values = pipe.image_processor(images=lo_anh, return_tensors="pt").pixel_values
+    pixel_values = pixel_values.to(device=model.device, dtype=model.dtype)
+    with torch.inference_mode():
+        trang_thai = _ma_hoa_anh(model, pixel_values)
+
+    def ham_log_xac_suat(chi_so_anh, chuoi):
+        with torch.inference_mode():
+            logits = model.decoder(input_ids=torch.from_numpy(chuoi).to(model.device),
+                                   encoder_hidden_states=trang_thai[torch.from_numpy(chi_so_anh).to(model.device)],
+                                   use_cache=False).logits[:, -1, :]
+            return torch.log_softmax(logits.float(), dim=-1).cpu().numpy()
+    return ham_log_xac_suat
+
+def tao_bo_giai_ma_ung_vien(danh_sach_ung_vien, so_beam=None, che_do=None):
+    """
+    Tạo bộ giải mã ràng buộc theo danh sách ứng viên với tokenizer của pipeline hiện tại
+
+    Args:
+        danh_sach_ung_vien: Các cặp (id, họ tên) ứng viên
+        so_beam: Số giả thuyết mỗi ô (mặc định SO_BEAM_UNG_VIEN)
+        che_do: Chế độ chạy TrOCR (None: theo TROCR_CHE_DO)
+    """
+    from core.giai_ma_ung_vien import BoGiaiMaUngVien, SO_BEAM_UNG_VIEN
+
+    pipe = get_pipeline(che_do)
+    if hasattr(pipe, 'sinh_token'):
+        bat_dau, eos = pipe.cau_hinh['decoder_start_token_id'], pipe.cau_hinh['eos_token_id']
+    else:
+        bat_dau, eos = _token_bat_dau_ket_thuc(pipe.model)
+    return BoGiaiMaUngVien(danh_sach_ung_vien, pipe.tokenizer, bat_dau, eos, so_beam or SO_BEAM_UNG_VIEN)
+
+def doc_ten_theo_ung_vien(danh_sach_anh, bo_giai_ma, batch_size=TROCR_BATCH_SIZE, che_do=None):
+    """
+    Đọc các ô họ tên bằng giải mã ràng buộc: TrOCR chỉ được sinh tên một ứng viên (cả dòng họ tên
+    trong một lần giải mã), trả về id ứng viên kèm độ tin cậy thay vì text tự do
+
+    Args:
+        danh_sach_anh: List ảnh ô họ tên (đường dẫn, numpy array BGR hoặc PIL Image)
+        bo_giai_ma: BoGiaiMaUngVien (tạo bằng tao_bo_giai_ma_ung_vien)
+        batch_size: Số ô đưa vào model trong một lần giải mã
+        che_do: Chế độ chạy TrOCR, cùng chế độ đã tạo bo_giai_ma (None: theo TROCR_CHE_DO)
+
+    Returns:
+        List dict {'ung_vien_id', 'ho_ten', 'do_tin_cay', 'log_xac_suat', 'xac_suat_token_tb'}
+        cho từng ảnh (None nếu ô trống hoặc bị lỗi)
+    """
+    ket_qua = [None] * len(danh_sach_anh)
+
+    cac_anh = []
+    chi_so_o = []
+    for i, anh in enumerate(danh_sach_anh):
+        try:
+            vung_chu = cat_vung_chu(mo_anh_rgb(anh))
+            if vung_chu is not None:
+                cac_anh.append(tien_xu_ly_anh_ocr(vung_chu))
+                chi_so_o.append(i)
+        except Exception as e:
+            print(f"Lỗi khi xử lý ảnh {mo_ta_anh(anh)}: {str(e)}")
+
+    pipe = get_pipeline(che_do)
+    batch_size = max(1, batch_size)
+    for bat_dau in range(0, len(cac_anh), batch_size):
+        lo_anh = cac_anh[bat_dau:bat_dau + batch_size]
+        try:
+            cac_ket_qua = bo_giai_ma.giai_ma(_ham_log_xac_suat_token(pipe, lo_anh), len(lo_anh))
+        except Exception as e:
+            print(f"Lỗi khi giải mã ràng buộc theo ứng viên ({len(lo_anh)} ô): {str(e)}")
+            continue
+        for i, ket_qua_o in zip(chi_so_o[bat_dau:bat_dau + batch_size], cac_ket_qua):
+            ket_qua[i] = ket_qua_o
+
+    return ket_qua
 
 if __name__ == "__main__":
-    import os
     
     thu_muc = "ket_qua_tien_xu_ly_v2/"
     
@@ -0,0 +1,151 @@
+# danh_gia_trocr.py - So sánh độ chính xác và tốc độ đọc họ tên của các chế độ chạy TrOCR (fp32/int8/onnx)
+import os
+import csv
+import json
+import time
+import argparse
+import statistics
+from typing import Dict, List, Tuple
+
+from core.trocr import doc_ten_theo_lo, get_pipeline, doc_cau_hinh_giai_ma, \
+    CAC_CHE_DO_TROCR, TROCR_BATCH_SIZE
+from core.so_khop_ung_vien import BoSoKhopUngVien, chuan_hoa_ten
+
+def doc_tap_nhan(duong_dan: str) -> List[Tuple[str, str]]:
+    """
+    Đọc tập ô họ tên đã gán nhãn: file JSON (list các {"anh": ..., "ho_ten": ...})
+    hoặc CSV có cột anh, ho_ten; đường dẫn ảnh tương đối tính theo thư mục chứa file nhãn
+
+    Returns:
+        List các cặp (đường dẫn ảnh, họ tên đúng)
+    """
+    thu_muc = os.path.dirname(os.path.abspath(duong_dan))
+    with open(duong_dan, 'r', encoding='utf-8') as f:
+        if duong_dan.lower().endswith('.csv'):
+            du_lieu = list(csv.DictReader(f))
+        else:
+            du_lieu = json.load(f)
+    return [(os.path.join(thu_muc, muc['anh']), muc['ho_ten']) for muc in du_lieu]
+
+def khoang_cach_sua(a: str, b: str) -> int:
+    """
+    Khoảng cách Levenshtein giữa hai chuỗi (số ký tự phải thêm/xóa/thay)
+    """
+    truoc = list(range(len(b) + 1))
+    for i, ky_tu_a in enumerate(a, 1):
+        hien_tai = [i]
+        for j, ky_tu_b in enumerate(b, 1):
+            hien_tai.append(min(truoc[j] + 1, hien_tai[j - 1] + 1, truoc[j - 1] + (ky_tu_a != ky_tu_b)))
+        truoc = hien_tai
+    return truoc[-1]
+
+def danh_gia_che_do(che_do: str, tap_nhan: List[Tuple[str, str]], batch_size: int, so_lan: int,
+                    giai_ma: Dict = None) -> Dict:
+    """
+    Đọc toàn bộ tập nhãn với một chế độ TrOCR, đo thời gian và độ chính xác
+
+    Args:
+        che_do: Chế độ TrOCR (fp32/int8/onnx)
+        tap_nhan: List (đường dẫn ảnh, họ tên đúng)
+        batch_size: Số ảnh từ tối đa trong một lần generate()
+        so_lan: Số lần đọc lại toàn bộ tập để lấy trung vị thời gian
+        giai_ma: Cấu hình giải mã TrOCR ghi đè CAU_HINH_GIAI_MA_MAC_DINH
+
+    Returns:
+        Dict kết quả của chế độ (thời gian load, ms/ô, tỷ lệ đúng, CER, tỷ lệ gắn đúng ứng viên)
+    """
+    bat_dau = time.perf_counter()
+    get_pipeline(che_do)
+    thoi_gian_load = time.perf_counter() - bat_dau
+
+    danh_sach_anh = [anh for anh, _ in tap_nhan]
+    # Chạy nóng một lô (lần generate đầu tiên chậm hơn hẳn)
+    doc_ten_theo_lo(danh_sach_anh[:batch_size], batch_size, giai_ma, che_do)
+
+    cac_thoi_gian = []
+    ket_qua_doc = []
+    for _ in range(so_lan):
+        bat_dau = time.perf_counter()
+        ket_qua_doc = doc_ten_theo_lo(danh_sach_anh, batch_size, giai_ma, che_do)
+        cac_thoi_gian.append(time.perf_counter() - bat_dau)
+    thoi_gian = statistics.median(cac_thoi_gian)
+
+    # Gắn ứng viên với danh sách các tên có trong tập nhãn, giống cách Django gắn ung_vien_id
+    cac_ten = sorted({chuan_hoa_ten(ten) for _, ten in tap_nhan})
+    bo_so_khop = BoSoKhopUngVien(list(enumerate(cac_ten)))
+
+    so_dung = so_gan_dung = tong_sua = tong_ky_tu = 0
+    chi_tiet = []
+    for (anh, ten_dung), ten_doc in zip(tap_nhan, ket_qua_doc):
+        ten_dung, ten_doc = chuan_hoa_ten(ten_dung), chuan_hoa_ten(ten_doc)
+        so_sua = khoang_cach_sua(ten_doc, ten_dung)
+        uv_id, _ = bo_so_khop.so_khop(ten_doc)
+        so_dung += ten_doc == ten_dung
+        so_gan_dung += uv_id is not None and cac_ten[uv_id] == ten_dung
+        tong_sua += so_sua
+        tong_ky_tu += len(ten_dung)
+        if so_sua:
+            chi_tiet.append({'anh': anh, 'ho_ten': ten_dung, 'doc_duoc': ten_doc, 'so_ky_tu_sai': so_sua})
+
+    return {
+        'che_do': che_do,
+        'so_o': len(tap_nhan),
+        'thoi_gian_load_s': round(thoi_gian_load, 3),
+        'ms_moi_o': round(1000 * thoi_gian / len(tap_nhan), 2),
+        'ty_le_dung': round(so_dung / len(tap_nhan), 4),
+        'cer': round(tong_sua / max(tong_ky_tu, 1), 4),
+        'ty_le_gan_dung_ung_vien': round(so_gan_dung / len(tap_nhan), 4),
+        'doc_sai': chi_tiet,
+    }
+
+def in_bao_cao(cac_ket_qua: List[Dict]):
+    """
+    In bảng so sánh các chế độ
+    """
+    print(f"\n{'Chế độ':<8}{'Load (s)':>10}{'ms/ô':>10}{'Đúng':>9}{'CER':>9}{'Gắn UV':>9}")
+    for kq in cac_ket_qua:
+        print(f"{kq['che_do']:<8}{kq['thoi_gian_load_s']:>10}{kq['ms_moi_o']:>10}"
+              f"{kq['ty_le_dung']:>9.2%}{kq['cer']:>9.4f}{kq['ty_le_gan_dung_ung_vien']:>9.2%}")
+    goc = cac_ket_qua[0]
+    for kq in cac_ket_qua[1:]:
+        if kq['ms_moi_o']:
+            print(f"[INFO] {kq['che_do']} so với {goc['che_do']}: nhanh hơn {goc['ms_moi_o'] / kq['ms_moi_o']:.2f} lần, "
+                  f"tỷ lệ đúng {100 * (kq['ty_le_dung'] - goc['ty_le_dung']):+.2f} điểm %")
+
+def main():
+    """
+    So sánh các chế độ TrOCR trên một tập ô họ tên đã gán nhãn
+    """
+    parser = argparse.ArgumentParser(description="Báo cáo độ chính xác và tốc độ của các chế độ TrOCR trên tập ô họ tên đã gán nhãn")
+    parser.add_argument("--labels", required=True, help="File nhãn JSON ([{\"anh\", \"ho_ten\"}]) hoặc CSV (cột anh, ho_ten)")
+    parser.add_argument("--modes", default="fp32,int8", help=f"Các chế độ cần so sánh, cách nhau bởi dấu phẩy ({', '.join(CAC_CHE_DO_TROCR)})")
+    parser.add_argument("--trocr_batch_size", type=int, default=TROCR_BATCH_SIZE, help="Số ảnh từ tối đa trong một lần generate() của TrOCR")
+    parser.add_argument("--trocr_decoding", type=str, help="JSON ghi đè cấu hình giải mã TrOCR (xem CAU_HINH_GIAI_MA_MAC_DINH trong core/trocr.py)")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đọc lại toàn bộ tập để lấy trung vị thời gian")
+    parser.add_argument("--output", type=str, help="File JSON lưu báo cáo (gồm danh sách các ô đọc sai)")
+
+    args = parser.parse_args()
+
+    giai_ma = doc_cau_hinh_giai_ma(args.trocr_decoding)
+    tap_nhan = doc_tap_nhan(args.labels)
+    if not tap_nhan:
+        print(f"[ERROR] Tập nhãn rỗng: {args.labels}")
+        return
+    thieu = [anh for anh, _ in tap_nhan if not os.path.exists(anh)]
+    if thieu:
+        print(f"[ERROR] Không tìm thấy {len(thieu)} ảnh, ví dụ: {thieu[0]}")
+        return
+
+    cac_ket_qua = []
+    for che_do in [m.strip() for m in args.modes.split(',') if m.strip()]:
+        print(f"[INFO] Đánh giá chế độ {che_do} trên {len(tap_nhan)} ô họ tên...")
+        cac_ket_qua.append(danh_gia_che_do(che_do, tap_nhan, args.trocr_batch_size, max(args.repeat, 1), giai_ma))
+
+    in_bao_cao(cac_ket_qua)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'nhan': os.path.abspath(args.labels), 'ket_qua': cac_ket_qua}, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] Đã lưu báo cáo: {args.output}")
+
+if __name__ == "__main__":
+    main()
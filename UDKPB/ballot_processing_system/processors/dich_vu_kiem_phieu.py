@@ -0,0 +1,185 @@
+# dich_vu_kiem_phieu.py - Dịch vụ kiểm phiếu chạy lâu dài, giữ model TrOCR + YOLO luôn nóng
+import os
+import json
+import argparse
+import traceback
+from multiprocessing.connection import Listener
+from typing import Dict
+
+from core.trocr import TROCR_BATCH_SIZE, CAC_CHE_DO_TROCR, che_do_trocr, doc_cau_hinh_giai_ma
+from core.suy_luan_onnx import dat_so_luong_onnx
+from processors.trocr_yolo import PhieuBauProcessor, YOLO_BATCH_SIZE, CAC_BACKEND
+from core.phan_loai_o_dau_x import doc_nguong_phan_loai
+from core.giai_ma_ung_vien import NGUONG_TIN_CAY_UNG_VIEN
+from core.mau_ten import NGUONG_KHOANG_CACH_BAM
+
+# Địa chỉ mặc định của dịch vụ (chỉ lắng nghe trên máy local)
+HOST_MAC_DINH = "127.0.0.1"
+PORT_MAC_DINH = 6070
+
+# Kích thước tối đa (bytes) của một thông điệp JSON nhận từ client (việc kiểm phiếu kèm danh sách ứng viên)
+KICH_THUOC_THONG_DIEP_TOI_DA = 16 * 1024 * 1024
+
+def gui_json(conn, thong_diep: Dict):
+    """
+    Gửi thông điệp dạng JSON qua kết nối (không dùng pickle của Connection.send)
+    """
+    conn.send_bytes(json.dumps(thong_diep, ensure_ascii=False, default=str).encode('utf-8'))
+
+def nhan_json(conn) -> Dict:
+    """
+    Nhận một thông điệp JSON (ValueError nếu không phải JSON hoặc quá KICH_THUOC_THONG_DIEP_TOI_DA)
+    """
+    return json.loads(conn.recv_bytes(KICH_THUOC_THONG_DIEP_TOI_DA))
+
+class DichVuKiemPhieu:
+    """
+    Dịch vụ nhận việc kiểm phiếu qua socket local và xử lý bằng một processor dùng chung
+    """
+
+    def __init__(self, processor: PhieuBauProcessor, so_worker: int = 1, cau_hinh_pipeline: Dict = None):
+        """
+        Args:
+            processor: Processor đã load model
+            so_worker: Số process xử lý song song (pool được mở một lần và dùng lại cho mọi việc)
+            cau_hinh_pipeline: Cấu hình chế độ pipeline, None để không dùng
+        """
+        self.processor = processor
+        self.so_worker = so_worker
+        self.cau_hinh_pipeline = cau_hinh_pipeline
+
+    def lam_nong_model(self):
+        """
+        Load trước TrOCR và YOLO (processor chỉ load khi dùng lần đầu) hoặc mở pool worker,
+        mỗi worker load cả hai model khi khởi động
+        """
+        if self.so_worker > 1 and self.cau_hinh_pipeline is None:
+            self.processor.mo_pool_worker(self.so_worker)
+        else:
+            self.processor.lam_nong_model()
+
+    def _gui(self, conn, thong_diep: Dict):
+        """
+        Gửi thông điệp cho client, bỏ qua nếu client đã ngắt kết nối (việc vẫn chạy tiếp)
+        """
+        try:
+            gui_json(conn, thong_diep)
+            return True
+        except (OSError, EOFError):
+            return False
+
+    def xu_ly_viec(self, conn, viec: Dict):
+        """
+        Chạy một việc kiểm phiếu và chuyển tiếp sự kiện tiến độ (bat_dau_phieu, xong_phieu, loi_phieu...) về client
+        """
+        poll_id = viec.get('poll_id')
+        input_dir = viec['input_dir']
+        output_dir = viec.get('output_dir') or input_dir
+        print(f"[INFO] Nhận việc kiểm phiếu poll {poll_id}: {input_dir}")
+
+        self._gui(conn, {'loai': 'nhan_viec', 'poll_id': poll_id})
+
+        def bao_su_kien(su_kien):
+            self._gui(conn, dict(su_kien, poll_id=poll_id))
+
+        try:
+            ket_qua = self.processor.xu_ly_nhieu_phieu_bau(input_dir, output_dir,
+                                                          so_worker=self.so_worker,
+                                                          cau_hinh_pipeline=self.cau_hinh_pipeline,
+                                                          bao_su_kien=bao_su_kien,
+                                                          danh_sach_ung_vien=viec.get('ung_vien'),
+                                                          thu_muc_cache=viec.get('thu_muc_cache'),
+                                                          tiep_tuc=viec.get('tiep_tuc', False))
+            self._gui(conn, {'loai': 'hoan_thanh', 'poll_id': poll_id, 'so_phieu': len(ket_qua)})
+        except Exception as e:
+            traceback.print_exc()
+            self._gui(conn, {'loai': 'loi', 'poll_id': poll_id, 'thong_bao': str(e)})
+
+    def chay(self, host: str = HOST_MAC_DINH, port: int = PORT_MAC_DINH, authkey: bytes = None):
+        """
+        Lắng nghe và xử lý lần lượt từng việc (các client khác chờ trong hàng đợi kết nối)
+
+        Args:
+            authkey: Khóa xác thực dùng chung với Django, bắt buộc (client không có khóa bị từ chối khi kết nối)
+        """
+        if not authkey:
+            raise ValueError("Dịch vụ kiểm phiếu cần khóa xác thực (COUNTING_SERVICE_AUTHKEY hoặc --authkey)")
+        self.lam_nong_model()
+        with Listener((host, port), authkey=authkey) as listener:
+            print(f"[INFO] Dịch vụ kiểm phiếu đang lắng nghe tại {host}:{port}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"[WARNING] Kết nối không hợp lệ: {e}")
+                    continue
+
+                with conn:
+                    try:
+                        viec = nhan_json(conn)
+                    except (OSError, EOFError, ValueError) as e:
+                        print(f"[WARNING] Thông điệp không hợp lệ: {e}")
+                        continue
+
+                    lenh = viec.get('lenh') if isinstance(viec, dict) else None
+                    if lenh == 'ping':
+                        self._gui(conn, {'loai': 'pong'})
+                    elif lenh == 'kiem_phieu':
+                        self.xu_ly_viec(conn, viec)
+                    else:
+                        self._gui(conn, {'loai': 'loi', 'thong_bao': f'Lệnh không hợp lệ: {lenh}'})
+
+def main():
+    """
+    Khởi động dịch vụ kiểm phiếu
+    """
+    parser = argparse.ArgumentParser(description="Dịch vụ kiểm phiếu giữ model TrOCR + YOLO luôn nóng")
+    parser.add_argument("--host", default=HOST_MAC_DINH, help="Địa chỉ lắng nghe (mặc định chỉ local)")
+    parser.add_argument("--port", type=int, default=PORT_MAC_DINH, help="Cổng lắng nghe")
+    parser.add_argument("--authkey", default=os.getenv('COUNTING_SERVICE_AUTHKEY', ''), help="Khóa xác thực dùng chung với Django, bắt buộc (mặc định lấy từ COUNTING_SERVICE_AUTHKEY)")
+    parser.add_argument("--weights", default="models/best.pt", help="Đường dẫn YOLO weights")
+    parser.add_argument("--trocr_batch_size", type=int, default=TROCR_BATCH_SIZE, help="Số ảnh từ tối đa trong một lần generate() của TrOCR")
+    parser.add_argument("--trocr_decoding", type=str, help="JSON ghi đè cấu hình giải mã TrOCR, mặc định generate() theo generation_config của model; ví dụ {\"tham_lam\": true, \"max_new_tokens\": 12} để giải mã tham lam có giới hạn token (xem CAU_HINH_GIAI_MA_MAC_DINH trong core/trocr.py)")
+    parser.add_argument("--yolo_batch_size", type=int, default=YOLO_BATCH_SIZE, help="Số ảnh ô tối đa trong một lần predict của YOLO")
+    parser.add_argument("--trocr_mode", choices=CAC_CHE_DO_TROCR, default=che_do_trocr(), help="Chế độ chạy TrOCR: fp32, int8 (lượng tử hóa động khi load, chỉ CPU) hoặc onnx; mặc định lấy từ TROCR_CHE_DO")
+    parser.add_argument("--backend", choices=CAC_BACKEND, default="pytorch", help="Backend suy luận: pytorch hoặc onnx (TrOCR và YOLO chạy bằng ONNX Runtime trên CPU, xuất model trước bằng processors.xuat_onnx)")
+    parser.add_argument("--onnx_threads", type=int, help="Số thread intra-op của ONNX Runtime (mặc định: chia đều CPU cho các worker)")
+    parser.add_argument("--onnx_inter_threads", type=int, help="Số thread inter-op của ONNX Runtime (>1 để chạy song song các nhánh của đồ thị)")
+    parser.add_argument("--fast_path", action="store_true", help="Bật phân loại nhanh ô đồng ý/không đồng ý theo mật độ mực, chỉ ô không rõ ràng mới chạy YOLO (mặc định mọi ô đều chạy YOLO)")
+    parser.add_argument("--fast_path_thresholds", type=str, help="JSON ghi đè ngưỡng phân loại nhanh (xem NGUONG_MAC_DINH trong core/phan_loai_o_dau_x.py)")
+    parser.add_argument("--candidate_decoding", action="store_true", help="Đọc ô họ tên bằng giải mã TrOCR ràng buộc theo tên các ứng viên của việc kiểm phiếu (ô không đủ tin cậy mới đọc tự do rồi so khớp)")
+    parser.add_argument("--candidate_confidence", type=float, default=NGUONG_TIN_CAY_UNG_VIEN, help="Độ tin cậy tối thiểu để nhận ứng viên từ giải mã ràng buộc")
+    parser.add_argument("--template_names", action="store_true", help="Đọc họ tên một lần từ phiếu tham chiếu của mỗi cuộc bỏ phiếu (mau_ten.json trong thư mục kết quả), các phiếu sau chỉ so dHash ô họ tên, dòng không khớp mới chạy TrOCR")
+    parser.add_argument("--template_distance", type=int, default=NGUONG_KHOANG_CACH_BAM, help="Số bit dHash (trên 256) khác nhau tối đa để ô họ tên được coi là trùng với mẫu")
+    parser.add_argument("--workers", type=int, default=1, help="Số process xử lý song song (pool được giữ suốt vòng đời dịch vụ)")
+    parser.add_argument("--pipeline", action="store_true", help="Chạy mỗi việc theo pipeline: làm phẳng, cắt ô và suy luận chạy đồng thời")
+
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error("cần khóa xác thực: đặt COUNTING_SERVICE_AUTHKEY hoặc truyền --authkey")
+
+    dat_so_luong_onnx(args.onnx_threads, args.onnx_inter_threads)
+    processor = PhieuBauProcessor(yolo_weights_path=args.weights,
+                                  trocr_batch_size=args.trocr_batch_size,
+                                  yolo_batch_size=args.yolo_batch_size,
+                                  phan_loai_nhanh=args.fast_path,
+                                  nguong_phan_loai=doc_nguong_phan_loai(args.fast_path_thresholds),
+                                  backend=args.backend,
+                                  trocr_mode=args.trocr_mode,
+                                  giai_ma_trocr=doc_cau_hinh_giai_ma(args.trocr_decoding),
+                                  giai_ma_ung_vien=args.candidate_decoding,
+                                  nguong_tin_cay_ung_vien=args.candidate_confidence,
+                                  mau_ten=args.template_names,
+                                  nguong_mau_ten=args.template_distance)
+    dich_vu = DichVuKiemPhieu(processor,
+                              so_worker=args.workers,
+                              cau_hinh_pipeline={} if args.pipeline else None)
+    try:
+        dich_vu.chay(args.host, args.port, args.authkey.encode('utf-8'))
+    except KeyboardInterrupt:
+        print("[INFO] Dừng dịch vụ kiểm phiếu")
+    finally:
+        processor.dong_pool_worker()
+
+if __name__ == "__main__":
+    main()
@@ -3,23 +3,39 @@ import os
 import shutil
 import argparse
 import json
+from collections import Counter
 from typing import List, Dict
 from datetime import datetime
 
 # Import các module tự viết
 from core.tien_xu_ly import xu_ly_phieu_bau
-from core.trocr import doc_ten_tu_anh
+from core.trocr import doc_ten_tu_anh, doc_ten_theo_lo, TROCR_BATCH_SIZE, CAC_CHE_DO_TROCR, che_do_trocr, dat_che_do_trocr, \
+    cau_hinh_giai_ma, doc_cau_hinh_giai_ma
+from core.phan_loai_o_dau_x import BoPhanLoaiODauX, DANH_DAU, KHONG_RO, TRONG, doc_nguong_phan_loai
 
 class PhieuBauTrOCRProcessor:
     """
     Lớp xử lý phiếu bầu chỉ sử dụng TrOCR
     """
     
-    def __init__(self):
+    def __init__(self, trocr_batch_size: int = TROCR_BATCH_SIZE, luu_anh_debug: bool = False,
+                 phan_loai_nhanh: bool = False, nguong_phan_loai: Dict = None, giai_ma_trocr: Dict = None):
         """
         Khởi tạo processor chỉ với TrOCR
+        
+        Args:
+            trocr_batch_size: Số ảnh từ tối đa trong một lần generate() của TrOCR
+            luu_anh_debug: True để lưu ảnh đã làm phẳng và ảnh từng ô ra thư mục temp (mặc định xử lý hoàn toàn trong bộ nhớ)
+            phan_loai_nhanh: Phân loại trước ô đồng ý/không đồng ý theo mật độ mực, chỉ ô không rõ ràng mới chạy TrOCR
+                (mặc định tắt: ngưỡng cần được kiểm chứng trên phiếu thật trước khi bật)
+            nguong_phan_loai: Ngưỡng ghi đè NGUONG_MAC_DINH của bộ phân loại nhanh
+            giai_ma_trocr: Cấu hình giải mã TrOCR ghi đè CAU_HINH_GIAI_MA_MAC_DINH
         """
-        pass
+        cau_hinh_giai_ma(giai_ma_trocr)
+        self.trocr_batch_size = trocr_batch_size
+        self.giai_ma_trocr = giai_ma_trocr
+        self.luu_anh_debug = luu_anh_debug
+        self.bo_phan_loai = BoPhanLoaiODauX(nguong_phan_loai) if phan_loai_nhanh else None
     
     def phan_tich_ky_tu_cho_dau_x(self, text: str) -> Dict:
         """
@@ -118,19 +134,39 @@ class PhieuBauTrOCRProcessor:
             'loai': loai
         }
 
-    def kiem_tra_dau_x_bang_trocr(self, duong_dan_anh: str) -> Dict:
+    def _ket_qua_dau_x_phan_loai_nhanh(self, phan_loai: Dict) -> Dict:
+        """
+        Kết quả kiểm tra ô đã được bộ phân loại nhanh quyết định (không chạy TrOCR)
+        """
+        co_dau_x = phan_loai['phan_loai'] == DANH_DAU
+        return {
+            'co_dau_x': co_dau_x,
+            'text_nhan_dien': '',
+            'confidence': 'cao' if co_dau_x else 'cao_khong_co',
+            'diem_so': 0,
+            'ly_do': 'phan_loai_nhanh',
+            'loai': 'CÓ DẤU X' if co_dau_x else 'TRỐNG',
+            'loi': None,
+            'phan_loai_nhanh': phan_loai
+        }
+
+    def kiem_tra_dau_x_bang_trocr(self, anh, text_san=False) -> Dict:
         """
         Kiểm tra ảnh đồng ý/không đồng ý: chỉ có 2 trạng thái TRỐNG hoặc CÓ DẤU X
         
         Args:
-            duong_dan_anh: Đường dẫn đến ảnh
+            anh: Ảnh ô cần kiểm tra (numpy array BGR, PIL Image hoặc đường dẫn)
+            text_san: Text TrOCR đã đọc sẵn theo lô (False để đọc lại từ ảnh)
             
         Returns:
             Dict chứa thông tin về dấu X
         """
         try:
             # Sử dụng TrOCR để đọc text trong ảnh
-            text = doc_ten_tu_anh(duong_dan_anh)
+            if text_san is False:
+                text = doc_ten_tu_anh(anh, self.trocr_batch_size, self.giai_ma_trocr)
+            else:
+                text = text_san
             
             # Phân tích đơn giản: TRỐNG vs CÓ X
             phan_tich = self.phan_tich_ky_tu_cho_dau_x(text)
@@ -166,13 +202,15 @@ class PhieuBauTrOCRProcessor:
                 'loi': str(e)
             }
     
-    def xu_ly_mot_dong(self, dong_anh: List[Dict], so_dong: int) -> Dict:
+    def xu_ly_mot_dong(self, dong_anh: List[Dict], so_dong: int, ket_qua_san: Dict = None) -> Dict:
         """
         Xử lý một dòng gồm 4 ảnh: STT, Họ tên, Đồng ý, Không đồng ý
         
         Args:
             dong_anh: List chứa 4 dict với thông tin ảnh
             so_dong: Số thứ tự dòng (bắt đầu từ 1)
+            ket_qua_san: Text TrOCR đã đọc sẵn theo loại ô (vd {'hoten': '...', 'dongy': 'X'}),
+                ô đồng ý/không đồng ý đã phân loại nhanh thì là dict kết quả
             
         Returns:
             Dict chứa kết quả xử lý
@@ -190,10 +228,14 @@ class PhieuBauTrOCRProcessor:
             }
         }
         
+        if ket_qua_san is None:
+            ket_qua_san = {}
+        
         # Xử lý từng ô
         for o in dong_anh:
             loai = o['loai']
-            duong_dan = o['duong_dan']
+            # Dùng trực tiếp ảnh đã cắt trong bộ nhớ, không đọc lại file tạm
+            anh = o['anh']
             
             try:
                 if loai == 'stt':
@@ -201,20 +243,25 @@ class PhieuBauTrOCRProcessor:
                     pass
                     
                 elif loai == 'hoten':
-                    # OCR cho họ tên
-                    ten_text = doc_ten_tu_anh(duong_dan)
+                    # OCR cho họ tên (dùng kết quả OCR theo lô nếu đã có)
+                    if 'hoten' in ket_qua_san:
+                        ten_text = ket_qua_san['hoten']
+                    else:
+                        ten_text = doc_ten_tu_anh(anh, self.trocr_batch_size, self.giai_ma_trocr)
                     ket_qua['ho_ten'] = ten_text if ten_text else ''
                     ket_qua['chi_tiet']['ho_ten_ocr'] = ten_text
                     
                 elif loai == 'dongy':
                     # TrOCR cho ô đồng ý
-                    trocr_result = self.kiem_tra_dau_x_bang_trocr(duong_dan)
+                    san = ket_qua_san.get('dongy', False)
+                    trocr_result = san if isinstance(san, dict) else self.kiem_tra_dau_x_bang_trocr(anh, san)
                     ket_qua['dong_y'] = trocr_result['co_dau_x']
                     ket_qua['chi_tiet']['dong_y_trocr'] = trocr_result
                     
                 elif loai == 'khongdongy':
                     # TrOCR cho ô không đồng ý
-                    trocr_result = self.kiem_tra_dau_x_bang_trocr(duong_dan)
+                    san = ket_qua_san.get('khongdongy', False)
+                    trocr_result = san if isinstance(san, dict) else self.kiem_tra_dau_x_bang_trocr(anh, san)
                     ket_qua['khong_dong_y'] = trocr_result['co_dau_x']
                     ket_qua['chi_tiet']['khong_dong_y_trocr'] = trocr_result
                     
@@ -227,33 +274,56 @@ class PhieuBauTrOCRProcessor:
     
     def xu_ly_phieu_bau_hoan_chinh(self, 
                                    duong_dan_anh: str,
-                                   thu_muc_temp: str = "results/ket_qua_only_trocr/temp_processing") -> List[Dict]:
+                                   thu_muc_temp: str = "results/ket_qua_only_trocr/temp_processing",
+                                   thong_ke_phan_loai: Counter = None) -> List[Dict]:
         """
         Xử lý hoàn chỉnh một phiếu bầu
         
         Args:
             duong_dan_anh: Đường dẫn đến ảnh phiếu bầu gốc
-            thu_muc_temp: Thư mục tạm để lưu ảnh đã cắt
+            thu_muc_temp: Thư mục lưu ảnh đã cắt (chỉ dùng khi bật luu_anh_debug)
+            thong_ke_phan_loai: Counter của lần chạy, cộng số ô đồng ý/không đồng ý theo đường xử lý
+                (trong, danh_dau: phân loại nhanh; khong_ro: chạy TrOCR)
             
         Returns:
             List các kết quả xử lý cho từng dòng
         """
         # Bước 1: Tiền xử lý và cắt ảnh
-        ma_tran_anh = xu_ly_phieu_bau(duong_dan_anh, thu_muc_temp)
+        ma_tran_anh = xu_ly_phieu_bau(duong_dan_anh, thu_muc_temp, luu_debug=self.luu_anh_debug)
         
         if not ma_tran_anh:
             print("  [ERROR] Không thể tiền xử lý ảnh")
             return []
         
-        # Bước 2: Xử lý từng dòng với TrOCR
+        # Bước 2: Phân loại nhanh ô đồng ý/không đồng ý theo mật độ mực, ô chắc chắn trống/có dấu X không cần OCR
+        ket_qua_san_theo_dong = [{} for _ in ma_tran_anh]
+        cac_o = [(i, o) for i, dong_anh in enumerate(ma_tran_anh)
+                 for o in dong_anh if o['loai'] in ('hoten', 'dongy', 'khongdongy')]
+        if self.bo_phan_loai:
+            o_dau_x = [(i, o) for i, o in cac_o if o['loai'] != 'hoten']
+            cac_phan_loai = self.bo_phan_loai.phan_loai([o.get('anh_goc', o['anh']) for _, o in o_dau_x])
+            for (i, o), phan_loai in zip(o_dau_x, cac_phan_loai):
+                if thong_ke_phan_loai is not None:
+                    thong_ke_phan_loai[phan_loai['phan_loai']] += 1
+                if phan_loai['phan_loai'] != KHONG_RO:
+                    ket_qua_san_theo_dong[i][o['loai']] = self._ket_qua_dau_x_phan_loai_nhanh(phan_loai)
+            cac_o = [(i, o) for i, o in cac_o if o['loai'] not in ket_qua_san_theo_dong[i]]
+        
+        # Bước 3: Đọc các ô còn lại của phiếu (họ tên, ô đánh dấu không rõ) trong một lô TrOCR
+        if cac_o:
+            text_cac_o = doc_ten_theo_lo([o['anh'] for _, o in cac_o], self.trocr_batch_size, self.giai_ma_trocr)
+            for (i, o), text in zip(cac_o, text_cac_o):
+                ket_qua_san_theo_dong[i][o['loai']] = text
+        
+        # Bước 4: Xử lý từng dòng với TrOCR
         ket_qua_tong = []
         
         for i, dong_anh in enumerate(ma_tran_anh, 1):
-            ket_qua_dong = self.xu_ly_mot_dong(dong_anh, i)
+            ket_qua_dong = self.xu_ly_mot_dong(dong_anh, i, ket_qua_san_theo_dong[i - 1])
             ket_qua_dong['so_dong'] = i
             ket_qua_tong.append(ket_qua_dong)
         
-        # Bước 3: Tổng hợp kết quả
+        # Bước 5: Tổng hợp kết quả
         self.in_ket_qua_tong_hop(ket_qua_tong)
         
         return ket_qua_tong
@@ -332,6 +402,7 @@ class PhieuBauTrOCRProcessor:
         ket_qua_tong_hop = {}
         total_files = 0
         total_success = 0
+        thong_ke_phan_loai = Counter()
         
         for input_dir in thu_muc_anh:
             if not os.path.exists(input_dir):
@@ -356,9 +427,8 @@ class PhieuBauTrOCRProcessor:
             
             total_files += len(image_files)
             
-            # Tạo thư mục temp cho thư mục này
+            # Thư mục lưu ảnh trung gian, chỉ được tạo khi bật chế độ debug
             thu_muc_temp = os.path.join(sub_output_dir, "temp_processing")
-            os.makedirs(thu_muc_temp, exist_ok=True)
             
             success_count = 0
             
@@ -367,7 +437,7 @@ class PhieuBauTrOCRProcessor:
                     ten_file = os.path.splitext(os.path.basename(image_path))[0]
                     
                     # Xử lý phiếu bầu
-                    ket_qua = self.xu_ly_phieu_bau_hoan_chinh(image_path, thu_muc_temp)
+                    ket_qua = self.xu_ly_phieu_bau_hoan_chinh(image_path, thu_muc_temp, thong_ke_phan_loai)
                     ket_qua_tong_hop[image_path] = ket_qua
                     
                     # Lưu kết quả chi tiết riêng cho từng phiếu
@@ -381,9 +451,9 @@ class PhieuBauTrOCRProcessor:
                     ket_qua_tong_hop[image_path] = []
             
             
-            # Xóa thư mục temp sau khi hoàn thành thư mục này
+            # Xóa thư mục temp sau khi hoàn thành thư mục này (giữ lại nếu đang debug)
             try:
-                if os.path.exists(thu_muc_temp):
+                if not self.luu_anh_debug and os.path.exists(thu_muc_temp):
                     shutil.rmtree(thu_muc_temp)
             except Exception:
                 pass
@@ -401,6 +471,12 @@ class PhieuBauTrOCRProcessor:
         print(f"Phiếu lỗi: {tong_hop_don_gian['tong_so_phieu_loi']}")
         print(f"Đã xử lý: {total_success}/{total_files} ảnh từ {len(thu_muc_anh)} thư mục")
         
+        tong_o = sum(thong_ke_phan_loai.values())
+        if tong_o:
+            print(f"\nPhân loại nhanh ô đánh dấu ({tong_o} ô):")
+            for nhan, khoa in (("Trống", TRONG), ("Có dấu X", DANH_DAU), ("Chuyển TrOCR", KHONG_RO)):
+                print(f"  - {nhan}: {thong_ke_phan_loai[khoa]} ô ({thong_ke_phan_loai[khoa] / tong_o:.1%})")
+        
         if tong_hop_don_gian['danh_sach_phieu_loi']:
             print(f"\nDanh sách phiếu lỗi:")
             for phieu_loi in tong_hop_don_gian['danh_sach_phieu_loi']:
@@ -505,6 +581,18 @@ def main():
                        help="Thư mục lưu kết quả (mặc định: results/ket_qua_only_trocr)")
     parser.add_argument("--single", type=str, 
                        help="Xử lý một ảnh cụ thể")
+    parser.add_argument("--trocr_batch_size", type=int, default=TROCR_BATCH_SIZE,
+                       help="Số ảnh từ tối đa trong một lần generate() của TrOCR")
+    parser.add_argument("--debug_crops", action="store_true",
+                       help="Lưu ảnh đã làm phẳng và ảnh từng ô ra thư mục temp_processing để debug")
+    parser.add_argument("--fast_path", action="store_true",
+                       help="Bật phân loại nhanh ô đồng ý/không đồng ý theo mật độ mực, chỉ ô không rõ ràng mới chạy TrOCR (mặc định mọi ô đều chạy TrOCR)")
+    parser.add_argument("--fast_path_thresholds", type=str,
+                       help="JSON ghi đè ngưỡng phân loại nhanh (xem NGUONG_MAC_DINH trong core/phan_loai_o_dau_x.py)")
+    parser.add_argument("--trocr_decoding", type=str,
+                       help="JSON ghi đè cấu hình giải mã TrOCR, mặc định generate() theo generation_config của model; ví dụ {\"tham_lam\": true, \"max_new_tokens\": 12} để giải mã tham lam có giới hạn token (xem CAU_HINH_GIAI_MA_MAC_DINH trong core/trocr.py)")
+    parser.add_argument("--trocr_mode", choices=CAC_CHE_DO_TROCR, default=che_do_trocr(),
+                       help="Chế độ chạy TrOCR: fp32, int8 (lượng tử hóa động, chỉ CPU) hoặc onnx (ONNX Runtime); mặc định lấy từ TROCR_CHE_DO")
     
     args = parser.parse_args()
     
@@ -518,7 +606,12 @@ def main():
         input_dirs = None  # Sẽ dùng mặc định ["ballot/data1", "ballot/data2"]
     
     # Khởi tạo processor
-    processor = PhieuBauTrOCRProcessor()
+    dat_che_do_trocr(args.trocr_mode)
+    processor = PhieuBauTrOCRProcessor(trocr_batch_size=args.trocr_batch_size,
+                                       luu_anh_debug=args.debug_crops,
+                                       phan_loai_nhanh=args.fast_path,
+                                       nguong_phan_loai=doc_nguong_phan_loai(args.fast_path_thresholds),
+                                       giai_ma_trocr=doc_cau_hinh_giai_ma(args.trocr_decoding))
     
     if args.single:
         # Xử lý một ảnh
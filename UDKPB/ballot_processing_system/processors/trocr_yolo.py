@@ -1,21 +1,63 @@
 # trocr_yolo.py - Hệ thống tích hợp xử lý phiếu bầu
 import os
+import sys
 import shutil
 import argparse
 import json
-from typing import List, Dict
+import time
+import multiprocessing
+import threading
+import itertools
+from collections import Counter
+from typing import List, Dict, Callable
 from datetime import datetime
 
 # Import các module tự xây dựng
-from core.tien_xu_ly import xu_ly_phieu_bau
-from core.trocr import doc_ten_tu_anh
+from core.tien_xu_ly import xu_ly_phieu_bau, straighten_ballot, cat_phieu_da_lam_phang, ten_layout, thong_tin_tien_xu_ly
+from core.bo_nho_dem_ket_qua import BoNhoDemKetQua, bam_file, ma_phien_ban
+from core.so_ghi_kiem_phieu import SoGhiKiemPhieu
+from core.phan_loai_o_dau_x import BoPhanLoaiODauX, DANH_DAU, KHONG_RO, TRONG, doc_nguong_phan_loai
+from core.pipeline import GiaiDoan, chay_pipeline
+from core.so_khop_ung_vien import BoSoKhopUngVien, doc_danh_sach_ung_vien
+from core.trocr import doc_ten_tu_anh, doc_ten_theo_lo, thong_tin_model_trocr, TROCR_BATCH_SIZE, \
+    CAC_CHE_DO_TROCR, che_do_trocr, cau_hinh_giai_ma, doc_cau_hinh_giai_ma, \
+    doc_ten_theo_ung_vien, tao_bo_giai_ma_ung_vien, get_pipeline
+from core.giai_ma_ung_vien import NGUONG_TIN_CAY_UNG_VIEN, tin_cay_du
+from core.mau_ten import MauTen, bam_o_ho_ten, khop_mau, NGUONG_KHOANG_CACH_BAM, NGUONG_KHOP_UNG_VIEN_MAU
 
-# Import YOLO
-try:
-    from ultralytics import YOLO
-except ImportError:
-    print("[WARNING] Chưa cài ultralytics. Sẽ chỉ sử dụng TrOCR.")
-    YOLO = None
+from core.suy_luan_onnx import YoloOnnx, duong_dan_yolo_onnx, dat_so_luong_onnx, BIEN_MOI_TRUONG_INTRA
+
+def _lop_yolo():
+    """
+    Import YOLO của ultralytics khi cần (import chậm và kéo theo torch, backend onnx không dùng)
+    """
+    try:
+        from ultralytics import YOLO
+        return YOLO
+    except ImportError:
+        print("[WARNING] Chưa cài ultralytics. Sẽ chỉ sử dụng TrOCR.")
+        return None
+
+# Backend suy luận: pytorch (transformers + ultralytics) hoặc onnx (ONNX Runtime trên CPU)
+CAC_BACKEND = ("pytorch", "onnx")
+
+# Số ảnh ô tối đa trong một lần predict của YOLO (1 phiếu = 20 ô đồng ý/không đồng ý)
+YOLO_BATCH_SIZE = 40
+
+# Cấu hình mặc định của chế độ pipeline (làm phẳng -> cắt ô -> suy luận)
+CAU_HINH_PIPELINE_MAC_DINH = {
+    'so_luong_lam_phang': 2,     # Số thread đọc ảnh + làm phẳng ArUco
+    'so_luong_cat_o': 1,         # Số thread cắt ô
+    'so_luong_suy_luan': 1,      # Số thread chạy TrOCR + YOLO (dùng chung model nên lần lượt suy luận)
+    'so_phieu_moi_lo': 2,        # Số phiếu tối đa gom vào một lần suy luận
+    'kich_thuoc_hang_doi': 4,    # Số phiếu tối đa chờ giữa hai giai đoạn
+}
+
+# Số phiếu tối đa thử làm phiếu tham chiếu cho mẫu họ tên của một layout (phiếu đầu có thể không cắt được)
+SO_PHIEU_THAM_CHIEU_TOI_DA = 3
+
+# Tiền tố của dòng sự kiện tiến độ in ra stdout (--progress), để tiến trình cha tách khỏi log thường
+TIEN_TO_SU_KIEN = "PROGRESS "
 
 class PhieuBauProcessor:
     """
@@ -23,123 +65,360 @@ class PhieuBauProcessor:
     """
     
     def __init__(self, 
-                 yolo_weights_path: str = "models/best.pt"):
+                 yolo_weights_path: str = "models/best.pt",
+                 trocr_batch_size: int = TROCR_BATCH_SIZE,
+                 luu_anh_debug: bool = False,
+                 yolo_batch_size: int = YOLO_BATCH_SIZE,
+                 phan_loai_nhanh: bool = False,
+                 nguong_phan_loai: Dict = None,
+                 backend: str = "pytorch",
+                 trocr_mode: str = None,
+                 giai_ma_trocr: Dict = None,
+                 giai_ma_ung_vien: bool = False,
+                 nguong_tin_cay_ung_vien: float = NGUONG_TIN_CAY_UNG_VIEN,
+                 mau_ten: bool = False,
+                 nguong_mau_ten: int = NGUONG_KHOANG_CACH_BAM):
         """
         Khởi tạo processor
         
         Args:
             yolo_weights_path: Đường dẫn đến weights YOLO
+            trocr_batch_size: Số ảnh từ tối đa trong một lần generate() của TrOCR
+            luu_anh_debug: True để lưu ảnh đã làm phẳng và ảnh từng ô ra thư mục temp (mặc định xử lý hoàn toàn trong bộ nhớ)
+            yolo_batch_size: Số ảnh ô tối đa trong một lần predict của YOLO
+            phan_loai_nhanh: Phân loại trước ô đồng ý/không đồng ý theo mật độ mực, chỉ ô không rõ ràng mới chạy YOLO
+                (mặc định tắt: ngưỡng cần được kiểm chứng trên phiếu thật trước khi bật)
+            nguong_phan_loai: Ngưỡng ghi đè NGUONG_MAC_DINH của bộ phân loại nhanh
+            backend: pytorch hoặc onnx (TrOCR và YOLO chạy bằng ONNX Runtime, model xuất bằng processors.xuat_onnx)
+            trocr_mode: Chế độ chạy TrOCR với backend pytorch (fp32, int8; None: theo TROCR_CHE_DO),
+                backend onnx luôn chạy TrOCR bằng ONNX Runtime
+            giai_ma_trocr: Cấu hình giải mã TrOCR ghi đè CAU_HINH_GIAI_MA_MAC_DINH (max_new_tokens, num_beams...)
+            giai_ma_ung_vien: Khi xử lý kèm danh sách ứng viên, đọc ô họ tên bằng giải mã ràng buộc theo tên
+                các ứng viên (trả về ứng viên và độ tin cậy), chỉ ô không đủ tin cậy mới đọc tự do rồi so khớp
+            nguong_tin_cay_ung_vien: Độ tin cậy tối thiểu để nhận ứng viên từ giải mã ràng buộc
+            mau_ten: Khi xử lý nhiều phiếu, đọc họ tên một lần từ phiếu tham chiếu của mỗi layout (lưu mau_ten.json
+                trong thư mục kết quả), các phiếu sau chỉ so dHash ô họ tên với mẫu, dòng không khớp mới chạy TrOCR
+            nguong_mau_ten: Số bit dHash khác nhau tối đa để ô họ tên được coi là trùng với mẫu
         """
+        if backend not in CAC_BACKEND:
+            raise ValueError(f"Backend không hỗ trợ: {backend} (chỉ hỗ trợ {', '.join(CAC_BACKEND)})")
+        if backend == "onnx":
+            if trocr_mode not in (None, "onnx"):
+                print(f"[WARNING] Backend onnx chạy TrOCR bằng ONNX Runtime, bỏ qua trocr_mode={trocr_mode}")
+            trocr_mode = "onnx"
+        elif trocr_mode is not None and trocr_mode not in CAC_CHE_DO_TROCR:
+            raise ValueError(f"Chế độ TrOCR không hỗ trợ: {trocr_mode} (chỉ hỗ trợ {', '.join(CAC_CHE_DO_TROCR)})")
+        cau_hinh_giai_ma(giai_ma_trocr)
+        # Chế độ TrOCR được truyền vào từng lần gọi (không đổi biến môi trường của process)
+        self.che_do_trocr = trocr_mode or che_do_trocr()
+        self.trocr_batch_size = trocr_batch_size
+        self.giai_ma_trocr = giai_ma_trocr
+        self.giai_ma_ung_vien = giai_ma_ung_vien
+        self.nguong_tin_cay_ung_vien = nguong_tin_cay_ung_vien
+        self.mau_ten = mau_ten
+        self.nguong_mau_ten = nguong_mau_ten
+        self.luu_anh_debug = luu_anh_debug
+        self.yolo_batch_size = yolo_batch_size
+        self.bo_phan_loai = BoPhanLoaiODauX(nguong_phan_loai) if phan_loai_nhanh else None
         
-        # Load YOLO model
-        self.yolo_model = None
-        if YOLO and os.path.exists(yolo_weights_path):
+        # Cấu hình khởi tạo, dùng để tạo lại processor trong các worker process
+        self.cau_hinh = {
+            'yolo_weights_path': yolo_weights_path,
+            'trocr_batch_size': trocr_batch_size,
+            'luu_anh_debug': luu_anh_debug,
+            'yolo_batch_size': yolo_batch_size,
+            'phan_loai_nhanh': phan_loai_nhanh,
+            'nguong_phan_loai': nguong_phan_loai,
+            'backend': backend,
+            'trocr_mode': self.che_do_trocr,
+            'giai_ma_trocr': giai_ma_trocr,
+            'giai_ma_ung_vien': giai_ma_ung_vien,
+            'nguong_tin_cay_ung_vien': nguong_tin_cay_ung_vien,
+            'mau_ten': mau_ten,
+            'nguong_mau_ten': nguong_mau_ten,
+        }
+        
+        # Ứng viên của lần xử lý hiện tại cho giải mã ràng buộc (đặt bằng dat_ung_vien_giai_ma)
+        self.ung_vien_giai_ma = None
+        self._bo_giai_ma_ung_vien = None
+        # Mẫu họ tên theo layout của lần xử lý hiện tại (đặt bằng dat_mau_ten)
+        self.mau_ten_lan_chay = None
+        
+        # Pool worker dùng lại giữa nhiều lần xử lý batch (xem mo_pool_worker)
+        self.pool_worker = None
+        self.so_worker_pool = 0
+        
+        # YOLO model được load khi dùng lần đầu (xem yolo_model): ở chế độ pool, process cha
+        # chỉ chia việc cho worker nên không phải load
+        self.duong_dan_yolo = duong_dan_yolo_onnx(yolo_weights_path) if backend == "onnx" else yolo_weights_path
+        self._yolo_model = None
+        self._da_load_yolo = False
+        self._khoa_yolo = threading.Lock()
+        # Model TrOCR/YOLO không an toàn khi nhiều thread cùng gọi: các thread suy luận của pipeline chạy lần lượt
+        self._khoa_suy_luan = threading.Lock()
+    
+    @property
+    def yolo_model(self):
+        """
+        YOLO model, load khi được dùng lần đầu (None nếu không khả dụng)
+        """
+        if not self._da_load_yolo:
+            with self._khoa_yolo:
+                if not self._da_load_yolo:
+                    self._yolo_model = self._load_yolo()
+                    self._da_load_yolo = True
+        return self._yolo_model
+    
+    def lam_nong_model(self):
+        """
+        Load trước TrOCR và YOLO (theo backend) để việc đầu tiên không phải chờ load model
+        """
+        get_pipeline(self.che_do_trocr)
+        self.yolo_model
+    
+    def _load_yolo(self):
+        """
+        Load YOLO model theo backend (None nếu chưa cài thư viện, thiếu weights hoặc lỗi khi load)
+        """
+        YOLO = _lop_yolo() if self.cau_hinh['backend'] == "pytorch" else YoloOnnx
+        if not YOLO or not os.path.exists(self.duong_dan_yolo):
+            print("[WARNING] YOLO model không khả dụng")
+            return None
+        try:
+            return YOLO(self.duong_dan_yolo)
+        except Exception as e:
+            print(f"[WARNING] Không thể load YOLO model: {e}")
+            return None
+    
+    def _ket_qua_dau_x_rong(self, loi: str) -> Dict:
+        """
+        Kết quả kiểm tra dấu X khi không chạy được YOLO
+        """
+        return {
+            'co_dau_x': False,
+            'so_luong_x_mark': 0,
+            'so_luong_x_cancelled': 0,
+            'confidence_x_mark': [],
+            'confidence_x_cancelled': [],
+            'chi_tiet_detection': [],
+            'loi': loi
+        }
+    
+    def _ket_qua_dau_x_phan_loai_nhanh(self, phan_loai: Dict) -> Dict:
+        """
+        Kết quả kiểm tra dấu X của ô đã được bộ phân loại nhanh quyết định (không chạy YOLO)
+        """
+        co_dau_x = phan_loai['phan_loai'] == DANH_DAU
+        ket_qua = self._ket_qua_dau_x_rong(None)
+        ket_qua.update({
+            'co_dau_x': co_dau_x,
+            'so_luong_x_mark': int(co_dau_x),
+            'phan_loai_nhanh': phan_loai,
+        })
+        return ket_qua
+    
+    def _phan_tich_ket_qua_yolo(self, result) -> Dict:
+        """
+        Chuyển kết quả YOLO (ultralytics) của một ảnh thành dict thông tin dấu X
+        """
+        if result.boxes is None or len(result.boxes) == 0:
+            return self._ket_qua_dau_x_tu_phat_hien([], [], [], result.names)
+        # Lấy thông tin boxes, classes và confidences
+        return self._ket_qua_dau_x_tu_phat_hien(result.boxes.xyxy.cpu().numpy(),  # Tọa độ boxes
+                                                result.boxes.cls.cpu().numpy(),   # Class IDs
+                                                result.boxes.conf.cpu().numpy(),  # Confidence scores
+                                                result.names)  # Dict: {0: 'x_mark', 1: 'x_cancelled', ...}
+    
+    def _ket_qua_dau_x_tu_phat_hien(self, boxes, classes, confidences, class_names: Dict) -> Dict:
+        """
+        Chuyển các phát hiện của một ảnh (dùng chung cho backend pytorch và onnx) thành dict thông tin dấu X
+        """
+        # Khởi tạo các biến đếm
+        so_luong_x_mark = 0
+        so_luong_x_cancelled = 0
+        confidence_x_mark = []
+        confidence_x_cancelled = []
+        chi_tiet_detection = []
+        
+        if len(boxes) > 0:
+            for i, (box, cls_id, conf) in enumerate(zip(boxes, classes, confidences)):
+                cls_name = class_names[int(cls_id)]
+                
+                # Lưu chi tiết detection
+                detection_info = {
+                    'class': cls_name,
+                    'confidence': float(conf),
+                    'bbox': box.tolist()
+                }
+                chi_tiet_detection.append(detection_info)
+                
+                # Phân loại theo class
+                if cls_name == 'x_mark':
+                    so_luong_x_mark += 1
+                    confidence_x_mark.append(float(conf))
+                elif cls_name == 'x_cancelled':
+                    so_luong_x_cancelled += 1
+                    confidence_x_cancelled.append(float(conf))
+        
+        # Xác định có dấu X hợp lệ hay không
+        # Chỉ tính x_mark, bỏ qua x_cancelled
+        co_dau_x_hop_le = so_luong_x_mark > 0
+        
+        return {
+            'co_dau_x': co_dau_x_hop_le,
+            'so_luong_x_mark': so_luong_x_mark,
+            'so_luong_x_cancelled': so_luong_x_cancelled,
+            'confidence_x_mark': confidence_x_mark,
+            'confidence_x_cancelled': confidence_x_cancelled,
+            'chi_tiet_detection': chi_tiet_detection,
+            'loi': None
+        }
+    
+    def kiem_tra_dau_x_theo_lo(self, danh_sach_anh: List) -> List[Dict]:
+        """
+        Kiểm tra dấu X cho nhiều ô (của một hoặc nhiều phiếu) bằng các lần predict theo lô
+        
+        Args:
+            danh_sach_anh: List ảnh ô cần kiểm tra (numpy array BGR hoặc đường dẫn đến ảnh)
+            
+        Returns:
+            List[Dict] thông tin dấu X của từng ô, cùng thứ tự với danh_sach_anh
+        """
+        if not danh_sach_anh:
+            return []
+        
+        if not self.yolo_model:
+            return [self._ket_qua_dau_x_rong('YOLO model không khả dụng') for _ in danh_sach_anh]
+        
+        ket_qua = []
+        batch_size = max(1, self.yolo_batch_size)
+        for bat_dau in range(0, len(danh_sach_anh), batch_size):
+            lo_anh = danh_sach_anh[bat_dau:bat_dau + batch_size]
             try:
-                self.yolo_model = YOLO(yolo_weights_path)
+                if self.cau_hinh['backend'] == "onnx":
+                    ket_qua.extend(self._ket_qua_dau_x_tu_phat_hien(*phat_hien, self.yolo_model.names)
+                                   for phat_hien in self.yolo_model.du_doan(lo_anh))
+                    continue
+                # Predict với YOLO: một list ảnh được xử lý thành một batch
+                results = self.yolo_model.predict(
+                    source=lo_anh,
+                    save=False,
+                    verbose=False
+                )
+                ket_qua.extend(self._phan_tich_ket_qua_yolo(result) for result in results)
             except Exception as e:
-                print(f"[WARNING] Không thể load YOLO model: {e}")
-        else:
-            print("[WARNING] YOLO model không khả dụng")
+                ket_qua.extend(self._ket_qua_dau_x_rong(str(e)) for _ in lo_anh)
+        
+        return ket_qua
     
-    def kiem_tra_dau_x(self, duong_dan_anh: str) -> Dict:
+    def kiem_tra_dau_x(self, anh) -> Dict:
         """
         Kiểm tra có dấu X trong ảnh không
         Phân biệt x_mark (dấu X hợp lệ) và x_cancelled (dấu X bị gạch bỏ)
         
         Args:
-            duong_dan_anh: Đường dẫn đến ảnh
+            anh: Ảnh ô cần kiểm tra (numpy array BGR hoặc đường dẫn đến ảnh)
             
         Returns:
             Dict chứa thông tin về dấu X
         """
-        if not self.yolo_model:
-            return {
-                'co_dau_x': False,
-                'so_luong_x_mark': 0,
-                'so_luong_x_cancelled': 0,
-                'confidence_x_mark': [],
-                'confidence_x_cancelled': [],
-                'chi_tiet_detection': [],
-                'loi': 'YOLO model không khả dụng'
-            }
+        return self.kiem_tra_dau_x_theo_lo([anh])[0]
+    
+    def dat_ung_vien_giai_ma(self, danh_sach_ung_vien: List = None):
+        """
+        Đặt danh sách ứng viên cho giải mã ràng buộc ô họ tên (không có tác dụng nếu tắt giai_ma_ung_vien);
+        cây tiền tố được tạo lại khi danh sách đổi
+        """
+        ung_vien = [tuple(uv) for uv in danh_sach_ung_vien] if self.giai_ma_ung_vien and danh_sach_ung_vien else None
+        if ung_vien != self.ung_vien_giai_ma:
+            self.ung_vien_giai_ma = ung_vien
+            self._bo_giai_ma_ung_vien = None
+    
+    def _doc_ten_theo_ung_vien(self, danh_sach_anh: List) -> List[Dict]:
+        """
+        Giải mã ràng buộc các ô họ tên theo ứng viên đã đặt, đánh dấu chap_nhan cho kết quả đủ tin cậy
+        """
+        if self._bo_giai_ma_ung_vien is None:
+            self._bo_giai_ma_ung_vien = tao_bo_giai_ma_ung_vien(self.ung_vien_giai_ma, che_do=self.che_do_trocr)
+        cac_ket_qua = doc_ten_theo_ung_vien(danh_sach_anh, self._bo_giai_ma_ung_vien, self.trocr_batch_size,
+                                            self.che_do_trocr)
+        for ket_qua in cac_ket_qua:
+            if ket_qua is not None:
+                ket_qua['chap_nhan'] = tin_cay_du(ket_qua, self.nguong_tin_cay_ung_vien)
+        return cac_ket_qua
+    
+    def dat_mau_ten(self, mau_theo_layout: Dict = None):
+        """
+        Đặt mẫu họ tên (tên layout -> các dòng {'ho_ten', 'bam', 'ho_ten_ung_vien'}) cho các phiếu xử lý sau đó
+        (không có tác dụng nếu tắt mau_ten)
+        """
+        self.mau_ten_lan_chay = mau_theo_layout if self.mau_ten and mau_theo_layout else None
+    
+    def _doi_chieu_mau_ten(self, o_ho_ten: List, danh_sach_duong_dan: List[str], ket_qua_san: List) -> List:
+        """
+        Lấy họ tên theo mẫu cho các ô họ tên có dHash khớp dòng tương ứng của mẫu cùng layout
         
-        try:
-            # Predict với YOLO
-            results = self.yolo_model.predict(
-                source=duong_dan_anh,
-                save=False,
-                verbose=False
-            )
-            
-            result = results[0]
-            
-            # Khởi tạo các biến đếm
-            so_luong_x_mark = 0
-            so_luong_x_cancelled = 0
-            confidence_x_mark = []
-            confidence_x_cancelled = []
-            chi_tiet_detection = []
-            
-            if result.boxes is not None and len(result.boxes) > 0:
-                # Lấy thông tin boxes, classes và confidences
-                boxes = result.boxes.xyxy.cpu().numpy()  # Tọa độ boxes
-                classes = result.boxes.cls.cpu().numpy()  # Class IDs
-                confidences = result.boxes.conf.cpu().numpy()  # Confidence scores
-                
-                # Lấy tên class từ model
-                class_names = result.names  # Dict: {0: 'x_mark', 1: 'x_cancelled', ...}
-                
-                for i, (box, cls_id, conf) in enumerate(zip(boxes, classes, confidences)):
-                    cls_name = class_names[int(cls_id)]
-                    
-                    # Lưu chi tiết detection
-                    detection_info = {
-                        'class': cls_name,
-                        'confidence': float(conf),
-                        'bbox': box.tolist()
-                    }
-                    chi_tiet_detection.append(detection_info)
-                    
-                    # Phân loại theo class
-                    if cls_name == 'x_mark':
-                        so_luong_x_mark += 1
-                        confidence_x_mark.append(float(conf))
-                    elif cls_name == 'x_cancelled':
-                        so_luong_x_cancelled += 1
-                        confidence_x_cancelled.append(float(conf))
-            
-            # Xác định có dấu X hợp lệ hay không
-            # Chỉ tính x_mark, bỏ qua x_cancelled
-            co_dau_x_hop_le = so_luong_x_mark > 0
-            
-            return {
-                'co_dau_x': co_dau_x_hop_le,
-                'so_luong_x_mark': so_luong_x_mark,
-                'so_luong_x_cancelled': so_luong_x_cancelled,
-                'confidence_x_mark': confidence_x_mark,
-                'confidence_x_cancelled': confidence_x_cancelled,
-                'chi_tiet_detection': chi_tiet_detection,
-                'loi': None
-            }
-                
-        except Exception as e:
-            return {
-                'co_dau_x': False,
-                'so_luong_x_mark': 0,
-                'so_luong_x_cancelled': 0,
-                'confidence_x_mark': [],
-                'confidence_x_cancelled': [],
-                'chi_tiet_detection': [],
-                'loi': str(e)
-            }
+        Args:
+            o_ho_ten: List (phiếu, dòng, ô) các ô họ tên
+            danh_sach_duong_dan: Đường dẫn ảnh của từng phiếu (để chọn mẫu theo layout)
+            ket_qua_san: Kết quả đã tính sẵn theo (phiếu, dòng), được ghi thêm họ tên lấy theo mẫu
+        
+        Returns:
+            List các ô họ tên không khớp mẫu (vẫn phải chạy TrOCR)
+        """
+        con_lai = []
+        for p, i, o in o_ho_ten:
+            mau = self.mau_ten_lan_chay.get(ten_layout(danh_sach_duong_dan[p]) or 'data1')
+            khoang_cach = None
+            if mau:
+                khoang_cach = khop_mau(bam_o_ho_ten(o.get('anh_goc', o['anh'])), i,
+                                       [dong['bam'] for dong in mau], self.nguong_mau_ten)
+            if khoang_cach is None:
+                con_lai.append((p, i, o))
+                continue
+            ket_qua_san[p][i]['hoten'] = mau[i]['ho_ten']
+            ket_qua_san[p][i]['hoten_mau'] = {'khoang_cach': khoang_cach}
+            if mau[i].get('ho_ten_ung_vien'):
+                ket_qua_san[p][i]['hoten_ung_vien'] = dict(mau[i]['ho_ten_ung_vien'])
+        return con_lai
+    
+    def _doc_o_ho_ten(self, o_ho_ten: List, ket_qua_san: List):
+        """
+        Đọc các ô họ tên theo lô (giải mã ràng buộc theo ứng viên nếu bật, ô còn lại OCR tự do),
+        ghi kết quả vào ket_qua_san[phiếu][dòng]
+        
+        Args:
+            o_ho_ten: List (phiếu, dòng, ô) các ô họ tên
+            ket_qua_san: Kết quả đã tính sẵn theo (phiếu, dòng)
+        """
+        # Giải mã ràng buộc theo ứng viên: ô đủ tin cậy lấy luôn tên ứng viên, không cần OCR tự do
+        if o_ho_ten and self.ung_vien_giai_ma:
+            ket_qua_ung_vien = self._doc_ten_theo_ung_vien([o['anh'] for _, _, o in o_ho_ten])
+            o_doc_tu_do = []
+            for (p, i, o), ket_qua_o in zip(o_ho_ten, ket_qua_ung_vien):
+                if ket_qua_o is not None:
+                    ket_qua_san[p][i]['hoten_ung_vien'] = ket_qua_o
+                if ket_qua_o is not None and ket_qua_o['chap_nhan']:
+                    ket_qua_san[p][i]['hoten'] = ket_qua_o['ho_ten']
+                else:
+                    o_doc_tu_do.append((p, i, o))
+            o_ho_ten = o_doc_tu_do
+        
+        # OCR toàn bộ ô họ tên trong một lô TrOCR
+        if o_ho_ten:
+            ten_cac_o = doc_ten_theo_lo([o['anh'] for _, _, o in o_ho_ten], self.trocr_batch_size,
+                                        self.giai_ma_trocr, self.che_do_trocr)
+            for (p, i, _), ten_text in zip(o_ho_ten, ten_cac_o):
+                ket_qua_san[p][i]['hoten'] = ten_text
     
-    def xu_ly_mot_dong(self, dong_anh: List[Dict], so_dong: int) -> Dict:
+    def xu_ly_mot_dong(self, dong_anh: List[Dict], so_dong: int, ket_qua_san: Dict = None) -> Dict:
         """
         Xử lý một dòng gồm 4 ảnh: STT, Họ tên, Đồng ý, Không đồng ý
         
         Args:
             dong_anh: List chứa 4 dict với thông tin ảnh
             so_dong: Số thứ tự dòng (bắt đầu từ 1)
+            ket_qua_san: Kết quả đã tính sẵn theo loại ô (vd {'hoten': '...', 'dongy': {...}}), ô có trong dict sẽ không chạy model lại
             
         Returns:
             Dict chứa kết quả xử lý
@@ -158,34 +437,45 @@ class PhieuBauProcessor:
             }
         }
         
+        if ket_qua_san is None:
+            ket_qua_san = {}
+        
         # Xử lý từng ô
         for o in dong_anh:
             loai = o['loai']
-            duong_dan = o['duong_dan']
+            # Dùng trực tiếp ảnh đã cắt trong bộ nhớ, không đọc lại file tạm
+            anh = o['anh']
             
             try:
                 if loai == 'stt':
                     # Comment tạm thời - OCR cho STT (chỉ để ghi log, không dùng làm kết quả)
-                    # stt_text = doc_ten_tu_anh(duong_dan)
+                    # stt_text = doc_ten_tu_anh(anh)
                     # ket_qua['chi_tiet']['stt_ocr'] = stt_text
                     # STT đã được set theo số dòng ở trên
                     pass
                     
                 elif loai == 'hoten':
-                    # OCR cho họ tên
-                    ten_text = doc_ten_tu_anh(duong_dan)
+                    # OCR cho họ tên (dùng kết quả OCR theo lô nếu đã có)
+                    if 'hoten' in ket_qua_san:
+                        ten_text = ket_qua_san['hoten']
+                    else:
+                        ten_text = doc_ten_tu_anh(anh, self.trocr_batch_size, self.giai_ma_trocr, self.che_do_trocr)
                     ket_qua['ho_ten'] = ten_text if ten_text else ''
                     ket_qua['chi_tiet']['ho_ten_ocr'] = ten_text
+                    if 'hoten_ung_vien' in ket_qua_san:
+                        ket_qua['chi_tiet']['ho_ten_ung_vien'] = ket_qua_san['hoten_ung_vien']
+                    if 'hoten_mau' in ket_qua_san:
+                        ket_qua['chi_tiet']['ho_ten_mau'] = ket_qua_san['hoten_mau']
                     
                 elif loai == 'dongy':
-                    # YOLO cho ô đồng ý
-                    yolo_result = self.kiem_tra_dau_x(duong_dan)
+                    # YOLO cho ô đồng ý (dùng kết quả predict theo lô nếu đã có)
+                    yolo_result = ket_qua_san.get('dongy') or self.kiem_tra_dau_x(anh)
                     ket_qua['dong_y'] = yolo_result['co_dau_x']
                     ket_qua['chi_tiet']['dong_y_yolo'] = yolo_result
                     
                 elif loai == 'khongdongy':
-                    # YOLO cho ô không đồng ý
-                    yolo_result = self.kiem_tra_dau_x(duong_dan)
+                    # YOLO cho ô không đồng ý (dùng kết quả predict theo lô nếu đã có)
+                    yolo_result = ket_qua_san.get('khongdongy') or self.kiem_tra_dau_x(anh)
                     ket_qua['khong_dong_y'] = yolo_result['co_dau_x']
                     ket_qua['chi_tiet']['khong_dong_y_yolo'] = yolo_result
                     
@@ -196,33 +486,98 @@ class PhieuBauProcessor:
         
         return ket_qua
     
+    def suy_luan_theo_lo(self, danh_sach_ma_tran: List[List[List[Dict]]],
+                         danh_sach_duong_dan: List[str] = None) -> List[List[Dict]]:
+        """
+        Chạy TrOCR và YOLO theo lô cho các ô đã cắt của một hoặc nhiều phiếu
+        
+        Args:
+            danh_sach_ma_tran: List ma trận ô (kết quả xu_ly_phieu_bau) của từng phiếu
+            danh_sach_duong_dan: Đường dẫn ảnh của từng phiếu (cần để đối chiếu mẫu họ tên theo layout)
+            
+        Returns:
+            List kết quả từng dòng của mỗi phiếu, cùng thứ tự với danh_sach_ma_tran
+        """
+        # Gom toàn bộ ô của các phiếu, ghi nhớ vị trí (phiếu, dòng) của từng ô
+        ket_qua_san = [[{} for _ in ma_tran_anh] for ma_tran_anh in danh_sach_ma_tran]
+        o_ho_ten = []
+        o_dau_x = []
+        for p, ma_tran_anh in enumerate(danh_sach_ma_tran):
+            for i, dong_anh in enumerate(ma_tran_anh):
+                for o in dong_anh:
+                    if o['loai'] == 'hoten':
+                        o_ho_ten.append((p, i, o))
+                    elif o['loai'] in ('dongy', 'khongdongy'):
+                        o_dau_x.append((p, i, o))
+        
+        # Ô họ tên khớp mẫu lấy họ tên theo mẫu, chỉ các ô còn lại mới đọc bằng TrOCR
+        if o_ho_ten and self.mau_ten_lan_chay and danh_sach_duong_dan:
+            o_ho_ten = self._doi_chieu_mau_ten(o_ho_ten, danh_sach_duong_dan, ket_qua_san)
+        self._doc_o_ho_ten(o_ho_ten, ket_qua_san)
+        
+        # Phân loại nhanh theo mật độ mực: ô chắc chắn trống/có dấu X không cần chạy YOLO
+        if o_dau_x and self.bo_phan_loai:
+            cac_phan_loai = self.bo_phan_loai.phan_loai([o.get('anh_goc', o['anh']) for _, _, o in o_dau_x])
+            o_can_yolo = []
+            for (p, i, o), phan_loai in zip(o_dau_x, cac_phan_loai):
+                if phan_loai['phan_loai'] == KHONG_RO:
+                    o_can_yolo.append((p, i, o, phan_loai))
+                else:
+                    ket_qua_san[p][i][o['loai']] = self._ket_qua_dau_x_phan_loai_nhanh(phan_loai)
+        else:
+            o_can_yolo = [(p, i, o, None) for p, i, o in o_dau_x]
+        
+        # Kiểm tra dấu X các ô còn lại theo lô YOLO
+        if o_can_yolo:
+            ket_qua_yolo = self.kiem_tra_dau_x_theo_lo([o['anh'] for _, _, o, _ in o_can_yolo])
+            for (p, i, o, phan_loai), yolo_result in zip(o_can_yolo, ket_qua_yolo):
+                if phan_loai is not None:
+                    yolo_result['phan_loai_nhanh'] = phan_loai
+                ket_qua_san[p][i][o['loai']] = yolo_result
+        
+        # Ghép kết quả theo từng dòng
+        ket_qua = []
+        for p, ma_tran_anh in enumerate(danh_sach_ma_tran):
+            ket_qua_tong = []
+            for i, dong_anh in enumerate(ma_tran_anh, 1):
+                ket_qua_dong = self.xu_ly_mot_dong(dong_anh, i, ket_qua_san[p][i - 1])
+                ket_qua_dong['so_dong'] = i
+                ket_qua_tong.append(ket_qua_dong)
+            ket_qua.append(ket_qua_tong)
+        
+        return ket_qua
+    
     def xu_ly_phieu_bau_hoan_chinh(self, 
                                    duong_dan_anh: str,
-                                   thu_muc_temp: str = "results/ket_qua_trocr_yolo/temp_processing") -> List[Dict]:
+                                   thu_muc_temp: str = "results/ket_qua_trocr_yolo/temp_processing",
+                                   thoi_gian_giai_doan: Dict = None) -> List[Dict]:
         """
         Xử lý hoàn chỉnh một phiếu bầu
         
         Args:
             duong_dan_anh: Đường dẫn đến ảnh phiếu bầu gốc
-            thu_muc_temp: Thư mục tạm để lưu ảnh đã cắt
+            thu_muc_temp: Thư mục lưu ảnh đã cắt (chỉ dùng khi bật luu_anh_debug)
+            thoi_gian_giai_doan: Dict (nếu truyền) để ghi thời gian của từng giai đoạn (giây)
             
         Returns:
             List các kết quả xử lý cho từng dòng
         """
+        if thoi_gian_giai_doan is None:
+            thoi_gian_giai_doan = {}
+        
         # Bước 1: Tiền xử lý và cắt ảnh (auto-detect layout trong xu_ly_phieu_bau)
-        ma_tran_anh = xu_ly_phieu_bau(duong_dan_anh, thu_muc_temp)
+        bat_dau = time.perf_counter()
+        ma_tran_anh = xu_ly_phieu_bau(duong_dan_anh, thu_muc_temp, luu_debug=self.luu_anh_debug)
+        thoi_gian_giai_doan['tien_xu_ly'] = time.perf_counter() - bat_dau
         
         if not ma_tran_anh:
             print("  [ERROR] Không thể tiền xử lý ảnh")
             return []
         
-        # Bước 2: Xử lý từng dòng với TrOCR + YOLO
-        ket_qua_tong = []
-        
-        for i, dong_anh in enumerate(ma_tran_anh, 1):
-            ket_qua_dong = self.xu_ly_mot_dong(dong_anh, i)
-            ket_qua_dong['so_dong'] = i
-            ket_qua_tong.append(ket_qua_dong)
+        # Bước 2: Xử lý từng dòng với TrOCR + YOLO (chạy model theo lô cho cả phiếu)
+        bat_dau = time.perf_counter()
+        ket_qua_tong = self.suy_luan_theo_lo([ma_tran_anh], [duong_dan_anh])[0]
+        thoi_gian_giai_doan['suy_luan'] = time.perf_counter() - bat_dau
         
         # Bước 3: Tổng hợp kết quả
         self.in_ket_qua_tong_hop(ket_qua_tong)
@@ -276,18 +631,350 @@ class PhieuBauProcessor:
             
             print(f"Dòng {kq['so_dong']:2d} | STT: {kq['stt']:3d} | {kq['ho_ten']:25s} | {trang_thai}{cancelled_info}")
     
+    def _xu_ly_mot_cong_viec(self, image_path: str, thu_muc_temp: str) -> Dict:
+        """
+        Xử lý một phiếu trong batch, bắt lỗi và đo thời gian xử lý
+        
+        Returns:
+            Dict gồm image_path, ket_qua, loi, worker (pid), thoi_gian (giây)
+            và thoi_gian_giai_doan (giây theo từng giai đoạn)
+        """
+        bat_dau = time.perf_counter()
+        loi = None
+        thoi_gian_giai_doan = {}
+        try:
+            ket_qua = self.xu_ly_phieu_bau_hoan_chinh(image_path, thu_muc_temp, thoi_gian_giai_doan)
+        except Exception as e:
+            ket_qua = []
+            loi = str(e)
+        return {
+            'image_path': image_path,
+            'ket_qua': ket_qua,
+            'loi': loi,
+            'worker': os.getpid(),
+            'thoi_gian': time.perf_counter() - bat_dau,
+            'thoi_gian_giai_doan': thoi_gian_giai_doan
+        }
+    
+    def _chay_tuan_tu(self, cong_viec: List, bao_bat_dau: Callable = None):
+        """
+        Xử lý lần lượt các phiếu trong process hiện tại
+        """
+        for image_path, thu_muc_temp in cong_viec:
+            if bao_bat_dau:
+                bao_bat_dau(image_path)
+            yield self._xu_ly_mot_cong_viec(image_path, thu_muc_temp)
+    
+    def _tao_pool(self, so_worker: int):
+        """
+        Tạo pool process, mỗi process load TrOCR và YOLO đúng một lần khi khởi động
+        """
+        # Chia đều số thread của torch cho các worker để tránh tranh chấp CPU
+        so_thread = max(1, (os.cpu_count() or 1) // so_worker)
+        print(f"[INFO] Khởi chạy {so_worker} worker, mỗi worker {so_thread} thread")
+        
+        ctx = multiprocessing.get_context('spawn')
+        return ctx.Pool(so_worker, initializer=_khoi_tao_worker, initargs=(self.cau_hinh, so_thread))
+    
+    def mo_pool_worker(self, so_worker: int):
+        """
+        Mở pool worker dùng lại cho mọi lần gọi xu_ly_nhieu_phieu_bau sau đó (model luôn nóng)
+        """
+        self.dong_pool_worker()
+        if so_worker > 1:
+            self.pool_worker = self._tao_pool(so_worker)
+            self.so_worker_pool = so_worker
+    
+    def dong_pool_worker(self):
+        """
+        Đóng pool worker đã mở bằng mo_pool_worker
+        """
+        if self.pool_worker is not None:
+            self.pool_worker.close()
+            self.pool_worker.join()
+            self.pool_worker = None
+            self.so_worker_pool = 0
+    
+    def _chay_song_song(self, cong_viec: List, so_worker: int):
+        """
+        Chia các phiếu cho một pool process (dùng lại pool đã mở nếu có)
+        """
+        # Ứng viên giải mã ràng buộc và mẫu họ tên đi kèm từng phiếu (pool có thể được dùng lại cho cuộc bỏ phiếu khác)
+        cong_viec = [(image_path, thu_muc_temp, self.ung_vien_giai_ma, self.mau_ten_lan_chay)
+                     for image_path, thu_muc_temp in cong_viec]
+        if self.pool_worker is not None:
+            for ket_qua in self.pool_worker.imap_unordered(_xu_ly_phieu_trong_worker, cong_viec):
+                yield ket_qua
+            return
+        
+        with self._tao_pool(so_worker) as pool:
+            for ket_qua in pool.imap_unordered(_xu_ly_phieu_trong_worker, cong_viec):
+                yield ket_qua
+    
+    def _pipeline_lam_phang(self, muc: Dict):
+        """
+        Giai đoạn 1 của pipeline: đọc ảnh và làm phẳng phiếu dựa trên ArUco markers
+        """
+        try:
+            muc['anh_phang'] = straighten_ballot(muc['image_path'])
+        except Exception as e:
+            print(f"❌ Lỗi xử lý {muc['image_path']}: {e}")
+            muc['anh_phang'] = None
+    
+    def _pipeline_cat_o(self, muc: Dict):
+        """
+        Giai đoạn 2 của pipeline: chọn layout và cắt các ô từ ảnh đã làm phẳng
+        """
+        anh_phang = muc.pop('anh_phang')
+        muc['ma_tran_anh'] = None
+        if anh_phang is None:
+            return
+        try:
+            muc['ma_tran_anh'] = cat_phieu_da_lam_phang(muc['image_path'], anh_phang, muc['thu_muc_temp'],
+                                                        luu_debug=self.luu_anh_debug)
+        except Exception as e:
+            print(f"❌ Lỗi xử lý {muc['image_path']}: {e}")
+    
+    def _pipeline_suy_luan(self, lo: List[Dict]):
+        """
+        Giai đoạn 3 của pipeline: chạy TrOCR + YOLO theo lô cho các phiếu đã cắt
+        """
+        hop_le = []
+        for muc in lo:
+            if muc['ma_tran_anh']:
+                hop_le.append(muc)
+            else:
+                print("  [ERROR] Không thể tiền xử lý ảnh")
+                muc['ket_qua'] = []
+        
+        if hop_le:
+            with self._khoa_suy_luan:
+                cac_ket_qua = self.suy_luan_theo_lo([muc['ma_tran_anh'] for muc in hop_le],
+                                                    [muc['image_path'] for muc in hop_le])
+            for muc, ket_qua_tong in zip(hop_le, cac_ket_qua):
+                self.in_ket_qua_tong_hop(ket_qua_tong)
+                muc['ket_qua'] = ket_qua_tong
+        
+        # Giải phóng ảnh đã cắt ngay khi không còn dùng
+        for muc in lo:
+            muc.pop('ma_tran_anh', None)
+    
+    def _chay_pipeline(self, cong_viec: List, cau_hinh_pipeline: Dict = None, bao_bat_dau: Callable = None):
+        """
+        Xử lý các phiếu qua pipeline nhiều giai đoạn chạy đồng thời:
+        làm phẳng (OpenCV) -> cắt ô -> suy luận (TrOCR + YOLO), nối bằng hàng đợi có giới hạn
+        """
+        cau_hinh = dict(CAU_HINH_PIPELINE_MAC_DINH)
+        cau_hinh.update(cau_hinh_pipeline or {})
+        print(f"[INFO] Chạy pipeline: {cau_hinh}")
+        
+        def lam_phang(muc: Dict):
+            if bao_bat_dau:
+                bao_bat_dau(muc['image_path'])
+            self._pipeline_lam_phang(muc)
+        
+        cac_giai_doan = [
+            GiaiDoan('lam_phang', lam_phang, cau_hinh['so_luong_lam_phang']),
+            GiaiDoan('cat_o', self._pipeline_cat_o, cau_hinh['so_luong_cat_o']),
+            GiaiDoan('suy_luan', self._pipeline_suy_luan, cau_hinh['so_luong_suy_luan'], cau_hinh['so_phieu_moi_lo']),
+        ]
+        nguon = ({'image_path': image_path, 'thu_muc_temp': thu_muc_temp} for image_path, thu_muc_temp in cong_viec)
+        
+        for muc in chay_pipeline(nguon, cac_giai_doan, cau_hinh['kich_thuoc_hang_doi']):
+            thoi_gian_giai_doan = muc.get('thoi_gian_giai_doan', {})
+            yield {
+                'image_path': muc['image_path'],
+                'ket_qua': muc.get('ket_qua', []),
+                'loi': muc.get('loi'),
+                'worker': 'pipeline',
+                'thoi_gian': sum(thoi_gian_giai_doan.values()),
+                'thoi_gian_giai_doan': thoi_gian_giai_doan
+            }
+    
+    def thong_tin_phien_ban(self) -> Dict:
+        """
+        Thông tin quyết định kết quả xử lý phiếu (phiên bản tiền xử lý, layout, model TrOCR, weights YOLO),
+        dùng làm phiên bản của bộ nhớ đệm kết quả
+        """
+        if not hasattr(self, '_thong_tin_phien_ban'):
+            self._thong_tin_phien_ban = {
+                'tien_xu_ly': thong_tin_tien_xu_ly(),
+                'trocr': thong_tin_model_trocr(self.che_do_trocr),
+                'giai_ma_trocr': cau_hinh_giai_ma(self.giai_ma_trocr),
+                'yolo': bam_file(self.duong_dan_yolo) if os.path.exists(self.duong_dan_yolo) else None,
+                'phan_loai_nhanh': self.bo_phan_loai.nguong if self.bo_phan_loai else None,
+            }
+        return self._thong_tin_phien_ban
+    
+    def _thong_tin_phien_ban_lan_chay(self) -> Dict:
+        """
+        Phiên bản kết quả của lần xử lý hiện tại: kết quả giải mã ràng buộc phụ thuộc cả danh sách
+        ứng viên và ngưỡng tin cậy, họ tên lấy theo mẫu phụ thuộc ngưỡng dHash, nên được thêm vào khi bật
+        """
+        thong_tin = dict(self.thong_tin_phien_ban())
+        if self.ung_vien_giai_ma:
+            thong_tin['giai_ma_ung_vien'] = {'ung_vien': self.ung_vien_giai_ma, 'nguong_tin_cay': self.nguong_tin_cay_ung_vien}
+        if self.mau_ten:
+            thong_tin['mau_ten'] = {'nguong': self.nguong_mau_ten}
+        return thong_tin
+    
+    def _doc_mau_ten(self, image_path: str, thu_muc_temp: str, danh_sach_ung_vien: List = None) -> List[Dict]:
+        """
+        Đọc mẫu họ tên từ một phiếu tham chiếu: OCR các ô họ tên (như phiếu thường), tên khớp ứng viên
+        được thay bằng đúng tên ứng viên
+        
+        Returns:
+            List dòng mẫu {'ho_ten', 'bam', 'ho_ten_ung_vien'}, None nếu không cắt/đọc được phiếu
+        """
+        ma_tran_anh = xu_ly_phieu_bau(image_path, thu_muc_temp, luu_debug=self.luu_anh_debug)
+        if not ma_tran_anh:
+            return None
+        o_ho_ten = []
+        for i, dong_anh in enumerate(ma_tran_anh):
+            o = next((o for o in dong_anh if o['loai'] == 'hoten'), None)
+            if o is None:
+                return None
+            o_ho_ten.append((0, i, o))
+        
+        ket_qua_san = [[{} for _ in ma_tran_anh]]
+        self._doc_o_ho_ten(o_ho_ten, ket_qua_san)
+        
+        bo_so_khop = BoSoKhopUngVien(danh_sach_ung_vien) if danh_sach_ung_vien else None
+        ten_ung_vien = dict(danh_sach_ung_vien or [])
+        cac_dong = []
+        for _, i, o in o_ho_ten:
+            ho_ten = ket_qua_san[0][i].get('hoten')
+            if ho_ten is None:
+                return None
+            giai_ma = ket_qua_san[0][i].get('hoten_ung_vien')
+            if bo_so_khop and not (giai_ma and giai_ma['chap_nhan']):
+                uv_id, diem = bo_so_khop.so_khop(ho_ten)
+                if uv_id is not None and diem >= NGUONG_KHOP_UNG_VIEN_MAU:
+                    ho_ten = ten_ung_vien[uv_id]
+            cac_dong.append({'ho_ten': ho_ten, 'bam': bam_o_ho_ten(o.get('anh_goc', o['anh'])),
+                             'ho_ten_ung_vien': giai_ma})
+        return cac_dong
+    
+    def _chuan_bi_mau_ten(self, cong_viec: List, thu_muc_output: str, danh_sach_ung_vien: List = None):
+        """
+        Đọc mẫu họ tên đã lưu (mau_ten.json trong thư mục kết quả), tạo mẫu cho các layout chưa có
+        từ phiếu đầu tiên của layout đó, rồi đặt mẫu cho các phiếu của lần xử lý này
+        """
+        phien_ban = ma_phien_ban({**self._thong_tin_phien_ban_lan_chay(), 'ung_vien': danh_sach_ung_vien})
+        mau_ten = MauTen(thu_muc_output, phien_ban)
+        
+        theo_layout = {}
+        for image_path, thu_muc_temp in cong_viec:
+            theo_layout.setdefault(ten_layout(image_path) or 'data1', []).append((image_path, thu_muc_temp))
+        
+        da_doi = False
+        for layout, cac_phieu in theo_layout.items():
+            if layout in mau_ten.layout:
+                continue
+            for image_path, thu_muc_temp in cac_phieu[:SO_PHIEU_THAM_CHIEU_TOI_DA]:
+                cac_dong = self._doc_mau_ten(image_path, thu_muc_temp, danh_sach_ung_vien)
+                if cac_dong:
+                    mau_ten.dat(layout, image_path, cac_dong)
+                    da_doi = True
+                    print(f"[INFO] Đã tạo mẫu họ tên layout {layout} ({len(cac_dong)} dòng) từ {image_path}")
+                    break
+            else:
+                print(f"[WARNING] Không tạo được mẫu họ tên layout {layout}, các phiếu sẽ OCR họ tên như thường")
+        if da_doi:
+            mau_ten.luu()
+        self.dat_mau_ten(mau_ten.theo_layout())
+    
+    def _tra_bo_nho_dem(self, bo_nho_dem: BoNhoDemKetQua, cong_viec: List, bam_theo_anh: Dict):
+        """
+        Tra bộ nhớ đệm cho các phiếu theo hash nội dung ảnh và layout
+        
+        Args:
+            bam_theo_anh: Dict image_path -> hash nội dung ảnh (ảnh không đọc được thì không có trong dict)
+        
+        Returns:
+            Tuple (list kết quả lấy từ bộ nhớ đệm (cùng dạng với _xu_ly_mot_cong_viec),
+            list công việc còn phải xử lý, dict image_path -> khóa bộ nhớ đệm)
+        """
+        ket_qua_san = []
+        con_lai = []
+        khoa_theo_anh = {}
+        for image_path, thu_muc_temp in cong_viec:
+            bat_dau = time.perf_counter()
+            if image_path not in bam_theo_anh:
+                con_lai.append((image_path, thu_muc_temp))
+                continue
+            khoa = f"{bam_theo_anh[image_path]}-{ten_layout(image_path) or 'data1'}"
+            khoa_theo_anh[image_path] = khoa
+            ket_qua = bo_nho_dem.lay(khoa)
+            if ket_qua is None:
+                con_lai.append((image_path, thu_muc_temp))
+                continue
+            ket_qua_san.append({
+                'image_path': image_path,
+                'ket_qua': ket_qua,
+                'loi': None,
+                'worker': 'cache',
+                'thoi_gian': time.perf_counter() - bat_dau,
+                'thoi_gian_giai_doan': {},
+                'tu_cache': True,
+            })
+        print(f"[INFO] Dùng lại kết quả đã lưu của {len(ket_qua_san)}/{len(cong_viec)} phiếu "
+              f"(bộ nhớ đệm {bo_nho_dem.ma_phien_ban})")
+        return ket_qua_san, con_lai, khoa_theo_anh
+    
+    def in_thong_ke_phan_loai(self, thong_ke_phan_loai: Counter):
+        """
+        In số ô đồng ý/không đồng ý được bộ phân loại nhanh quyết định và số ô phải chạy YOLO
+        """
+        tong = sum(thong_ke_phan_loai.values())
+        if not self.bo_phan_loai or not tong:
+            return
+        print(f"\nPhân loại nhanh ô đánh dấu ({tong} ô):")
+        for nhan, khoa in (("Trống", TRONG), ("Có dấu X", DANH_DAU), ("Chuyển YOLO", KHONG_RO)):
+            print(f"  - {nhan}: {thong_ke_phan_loai[khoa]} ô ({thong_ke_phan_loai[khoa] / tong:.1%})")
+    
+    def in_thong_ke_worker(self, thong_ke_worker: Dict, tong_thoi_gian: float):
+        """
+        In số phiếu và tốc độ xử lý của từng worker
+        """
+        tong_so_phieu = sum(tk['so_phieu'] for tk in thong_ke_worker.values())
+        print(f"\nThông lượng theo worker:")
+        for worker, tk in sorted(thong_ke_worker.items()):
+            toc_do = tk['so_phieu'] / tk['thoi_gian'] if tk['thoi_gian'] > 0 else 0
+            print(f"  - Worker {worker}: {tk['so_phieu']} phiếu, {tk['thoi_gian']:.1f}s xử lý, {toc_do:.2f} phiếu/s")
+        if tong_thoi_gian > 0:
+            print(f"  Tổng: {tong_so_phieu} phiếu trong {tong_thoi_gian:.1f}s ({tong_so_phieu / tong_thoi_gian:.2f} phiếu/s)")
+    
     def xu_ly_nhieu_phieu_bau(self, 
                               thu_muc_anh=None,
-                              thu_muc_output: str = "results/ket_qua_trocr_yolo") -> Dict:
+                              thu_muc_output: str = "results/ket_qua_trocr_yolo",
+                              so_worker: int = 1,
+                              cau_hinh_pipeline: Dict = None,
+                              bao_su_kien: Callable = None,
+                              danh_sach_ung_vien: List = None,
+                              thu_muc_cache: str = None,
+                              tiep_tuc: bool = False) -> Dict:
         """
         Xử lý nhiều phiếu bầu trong các thư mục (hỗ trợ ballot/data1, ballot/data2)
         
         Args:
             thu_muc_anh: Thư mục hoặc danh sách thư mục chứa ảnh phiếu bầu (mặc định: ["ballot/data1", "ballot/data2"])
             thu_muc_output: Thư mục lưu kết quả
+            so_worker: Số process xử lý song song (1 để xử lý tuần tự trong process hiện tại)
+            cau_hinh_pipeline: Cấu hình chế độ pipeline (xem CAU_HINH_PIPELINE_MAC_DINH), None để không dùng pipeline
+            bao_su_kien: Hàm nhận sự kiện tiến độ (dict có 'loai', 'da_xu_ly', 'tong', 'thoi_diem'):
+                bat_dau, bat_dau_phieu (không có khi chạy nhiều process), xong_phieu, loi_phieu
+                (kèm image_path, thoi_gian, thoi_gian_giai_doan) và ket_thuc. Có thể được gọi từ thread khác.
+            danh_sach_ung_vien: Các cặp (id, họ tên) ứng viên; nếu có, mỗi dòng kết quả được gắn
+                ung_vien_id và diem_khop của ứng viên khớp nhất (dùng cho giải mã ràng buộc nếu bật giai_ma_ung_vien)
+            thu_muc_cache: Thư mục bộ nhớ đệm kết quả theo nội dung ảnh; ảnh đã xử lý với cùng
+                model và layout được dùng lại kết quả, bỏ qua làm phẳng, OCR và YOLO (None để tắt)
+            tiep_tuc: Ghi sổ các phiếu đã xử lý (so_ghi_kiem_phieu.jsonl trong thư mục kết quả) và bỏ qua
+                các phiếu đã có kết quả với cùng nội dung ảnh, phiên bản model/layout và danh sách ứng viên,
+                để chạy tiếp sau khi bị dừng giữa chừng hoặc chỉ xử lý phiếu mới/đã đổi ảnh
             
         Returns:
-            Dict chứa kết quả tổng hợp
+            Dict chứa kết quả tổng hợp (không gồm các phiếu được bỏ qua nhờ sổ ghi)
         """
         # Xử lý tham số đầu vào
         if thu_muc_anh is None:
@@ -301,6 +988,18 @@ class PhieuBauProcessor:
         ket_qua_tong_hop = {}
         total_files = 0
         total_success = 0
+        bo_so_khop = BoSoKhopUngVien(danh_sach_ung_vien) if danh_sach_ung_vien else None
+        self.dat_ung_vien_giai_ma(danh_sach_ung_vien)
+        self.dat_mau_ten(None)
+        
+        # Bước 1: Gom danh sách phiếu cần xử lý của tất cả thư mục
+        cong_viec = []
+        thu_muc_ket_qua = {}  # image_path -> thư mục lưu JSON của phiếu
+        cac_thu_muc = []
+        so_ghi_theo_thu_muc = {}  # thư mục kết quả -> sổ ghi các phiếu đã xử lý
+        phien_ban_so_ghi = None
+        if tiep_tuc:
+            phien_ban_so_ghi = ma_phien_ban({**self._thong_tin_phien_ban_lan_chay(), 'ung_vien': danh_sach_ung_vien})
         
         for input_dir in thu_muc_anh:
             if not os.path.exists(input_dir):
@@ -310,6 +1009,8 @@ class PhieuBauProcessor:
             # Tạo thư mục con cho từng input_dir
             sub_output_dir = os.path.join(thu_muc_output, f"ket_qua_{os.path.basename(input_dir)}")
             os.makedirs(sub_output_dir, exist_ok=True)
+            if tiep_tuc:
+                so_ghi_theo_thu_muc[sub_output_dir] = SoGhiKiemPhieu(sub_output_dir, phien_ban_so_ghi)
             
             # Lấy danh sách ảnh
             image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
@@ -325,35 +1026,141 @@ class PhieuBauProcessor:
             
             total_files += len(image_files)
             
-            # Tạo thư mục temp cho thư mục này
+            # Thư mục lưu ảnh trung gian, chỉ được tạo khi bật chế độ debug
             thu_muc_temp = os.path.join(sub_output_dir, "temp_processing")
-            os.makedirs(thu_muc_temp, exist_ok=True)
+            cac_thu_muc.append((sub_output_dir, thu_muc_temp))
             
-            success_count = 0
-            
-            for i, image_path in enumerate(image_files, 1):
+            for image_path in image_files:
+                cong_viec.append((image_path, thu_muc_temp))
+                thu_muc_ket_qua[image_path] = sub_output_dir
+        
+        # Hash nội dung ảnh (dùng cho sổ ghi và bộ nhớ đệm)
+        bam_theo_anh = {}
+        if tiep_tuc or thu_muc_cache:
+            for image_path, _ in cong_viec:
+                so_ghi = so_ghi_theo_thu_muc.get(thu_muc_ket_qua[image_path])
                 try:
-                    ten_file = os.path.splitext(os.path.basename(image_path))[0]
-
-                    
-                    # Xử lý phiếu bầu
-                    ket_qua = self.xu_ly_phieu_bau_hoan_chinh(image_path, thu_muc_temp)
-                    ket_qua_tong_hop[image_path] = ket_qua
-                    
-                    # Lưu kết quả chi tiết riêng cho từng phiếu
-                    self.luu_ket_qua_json(ket_qua, os.path.join(sub_output_dir, f"{ten_file}.json"))
-                    
-                    success_count += 1
-                    total_success += 1
-                    
+                    bam_theo_anh[image_path] = so_ghi.bam(image_path) if so_ghi else bam_file(image_path)
+                except OSError as e:
+                    print(f"[WARNING] Không đọc được {image_path} để tính hash: {e}")
+        
+        # Bỏ qua các phiếu đã xử lý ở lần chạy trước (theo sổ ghi)
+        so_bo_qua = 0
+        cong_viec_can_xu_ly = cong_viec
+        if tiep_tuc:
+            cong_viec_can_xu_ly = []
+            for image_path, thu_muc_temp in cong_viec:
+                so_ghi = so_ghi_theo_thu_muc[thu_muc_ket_qua[image_path]]
+                if image_path in bam_theo_anh and so_ghi.da_xu_ly(image_path, bam_theo_anh[image_path]):
+                    so_bo_qua += 1
+                else:
+                    cong_viec_can_xu_ly.append((image_path, thu_muc_temp))
+            print(f"[INFO] Bỏ qua {so_bo_qua}/{len(cong_viec)} phiếu đã xử lý ở lần chạy trước (sổ ghi {phien_ban_so_ghi})")
+        
+        # Sự kiện tiến độ (khóa vì pipeline báo bắt đầu phiếu từ thread làm phẳng)
+        khoa_su_kien = threading.Lock()
+        
+        def gui_su_kien(loai: str, **du_lieu):
+            if not bao_su_kien:
+                return
+            with khoa_su_kien:
+                su_kien = {'loai': loai, 'da_xu_ly': so_bo_qua + len(ket_qua_tong_hop), 'tong': total_files,
+                           'thoi_diem': time.time(), **du_lieu}
+                try:
+                    bao_su_kien(su_kien)
                 except Exception as e:
-                    print(f"❌ Lỗi xử lý {image_path}: {str(e)}")
-                    ket_qua_tong_hop[image_path] = []
-    
+                    print(f"[WARNING] Không gửi được sự kiện tiến độ: {e}")
+        
+        def bao_bat_dau(image_path):
+            gui_su_kien('bat_dau_phieu', image_path=image_path)
+        
+        # Dùng lại kết quả của các ảnh đã xử lý trước đó (cùng nội dung, model và layout)
+        bo_nho_dem = None
+        khoa_cache = {}
+        ket_qua_cache = []
+        if thu_muc_cache:
+            bo_nho_dem = BoNhoDemKetQua(thu_muc_cache, self._thong_tin_phien_ban_lan_chay())
+            ket_qua_cache, cong_viec_can_xu_ly, khoa_cache = self._tra_bo_nho_dem(bo_nho_dem, cong_viec_can_xu_ly, bam_theo_anh)
+        
+        # Mẫu họ tên của cuộc bỏ phiếu (đọc hoặc tạo từ phiếu tham chiếu trước khi chia việc)
+        if self.mau_ten and cong_viec_can_xu_ly:
+            self._chuan_bi_mau_ten(cong_viec_can_xu_ly, thu_muc_output, danh_sach_ung_vien)
+        
+        # Bước 2: Xử lý các phiếu (tuần tự, pipeline hoặc song song) và lưu kết quả ngay khi có
+        if cau_hinh_pipeline is not None:
+            if so_worker > 1:
+                print("[WARNING] Chế độ pipeline chạy trong một process, bỏ qua --workers")
+            cac_ket_qua = self._chay_pipeline(cong_viec_can_xu_ly, cau_hinh_pipeline, bao_bat_dau)
+        elif self.pool_worker is not None or (so_worker > 1 and len(cong_viec_can_xu_ly) > 1):
+            cac_ket_qua = self._chay_song_song(cong_viec_can_xu_ly, min(so_worker, len(cong_viec_can_xu_ly)))
+        else:
+            cac_ket_qua = self._chay_tuan_tu(cong_viec_can_xu_ly, bao_bat_dau)
+        cac_ket_qua = itertools.chain(ket_qua_cache, cac_ket_qua)
+        
+        thong_ke_worker = {}
+        thong_ke_phan_loai = Counter()
+        thong_ke_mau_ten = Counter()
+        bat_dau = time.perf_counter()
+        gui_su_kien('bat_dau', bo_qua=so_bo_qua)
+        
+        for kq in cac_ket_qua:
+            image_path = kq['image_path']
+            ket_qua_tong_hop[image_path] = kq['ket_qua']
             
-            # Xóa thư mục temp sau khi hoàn thành thư mục này
+            tk = thong_ke_worker.setdefault(kq['worker'], {'so_phieu': 0, 'thoi_gian': 0.0})
+            tk['so_phieu'] += 1
+            tk['thoi_gian'] += kq['thoi_gian']
+            
+            if kq['loi'] is not None:
+                print(f"❌ Lỗi xử lý {image_path}: {kq['loi']}")
+            else:
+                if not kq.get('tu_cache'):
+                    dem_phan_loai_nhanh(kq['ket_qua'], thong_ke_phan_loai)
+                    if self.mau_ten_lan_chay:
+                        dem_o_ho_ten_theo_mau(kq['ket_qua'], thong_ke_mau_ten)
+                on_dinh = ket_qua_on_dinh(kq['ket_qua'])
+                # Lưu kết quả gốc (trước khi gắn ứng viên của cuộc bỏ phiếu) để lần sau dùng lại
+                if bo_nho_dem and not kq.get('tu_cache') and image_path in khoa_cache and on_dinh:
+                    bo_nho_dem.luu(khoa_cache[image_path], kq['ket_qua'])
+                if bo_so_khop:
+                    bo_so_khop.gan_ung_vien(kq['ket_qua'])
+                # Lưu kết quả chi tiết riêng cho từng phiếu
+                ten_file = f"{os.path.splitext(os.path.basename(image_path))[0]}.json"
+                self.luu_ket_qua_json(kq['ket_qua'], os.path.join(thu_muc_ket_qua[image_path], ten_file))
+                # Ghi sổ sau khi đã có file kết quả, để phiếu dừng giữa chừng được xử lý lại
+                so_ghi = so_ghi_theo_thu_muc.get(thu_muc_ket_qua[image_path])
+                if so_ghi and image_path in bam_theo_anh:
+                    so_ghi.ghi(image_path, bam_theo_anh[image_path], ten_file, on_dinh)
+                total_success += 1
+            
+            thong_tin_phieu = {
+                'image_path': image_path,
+                'worker': kq['worker'],
+                'thoi_gian': kq['thoi_gian'],
+                'thoi_gian_giai_doan': kq.get('thoi_gian_giai_doan', {}),
+                'tu_cache': kq.get('tu_cache', False),
+            }
+            if kq['loi'] is not None:
+                gui_su_kien('loi_phieu', loi=kq['loi'], **thong_tin_phieu)
+            elif not kq['ket_qua']:
+                gui_su_kien('loi_phieu', loi="Không thể tiền xử lý ảnh", **thong_tin_phieu)
+            else:
+                gui_su_kien('xong_phieu', so_dong=len(kq['ket_qua']), **thong_tin_phieu)
+        
+        tong_thoi_gian = time.perf_counter() - bat_dau
+        gui_su_kien('ket_thuc', thanh_cong=total_success, thoi_gian=tong_thoi_gian, tu_cache=len(ket_qua_cache),
+                    bo_qua=so_bo_qua, phan_loai_o=dict(thong_ke_phan_loai), o_ho_ten=dict(thong_ke_mau_ten))
+        for so_ghi in so_ghi_theo_thu_muc.values():
+            so_ghi.dong()
+        
+        # Giữ thứ tự kết quả theo danh sách ảnh đầu vào (worker trả kết quả không theo thứ tự)
+        ket_qua_tong_hop = {image_path: ket_qua_tong_hop[image_path]
+                            for image_path, _ in cong_viec if image_path in ket_qua_tong_hop}
+        
+        for sub_output_dir, thu_muc_temp in cac_thu_muc:
+            # Xóa thư mục temp sau khi hoàn thành thư mục này (giữ lại nếu đang debug)
             try:
-                if os.path.exists(thu_muc_temp):
+                if not self.luu_anh_debug and os.path.exists(thu_muc_temp):
                     shutil.rmtree(thu_muc_temp)
                 # Nếu thư mục cha (sub_output_dir) rỗng thì xoá luôn
                 if os.path.exists(sub_output_dir) and not os.listdir(sub_output_dir):
@@ -373,6 +1180,8 @@ class PhieuBauProcessor:
         print(f"Phiếu hợp lệ: {tong_hop_don_gian['tong_so_phieu_hop_le']}")
         print(f"Phiếu lỗi: {tong_hop_don_gian['tong_so_phieu_loi']}")
         print(f"Đã xử lý: {total_success}/{total_files} ảnh từ {len(thu_muc_anh)} thư mục")
+        if tiep_tuc:
+            print(f"Bỏ qua (đã xử lý ở lần chạy trước): {so_bo_qua} ảnh")
         
         if tong_hop_don_gian['danh_sach_phieu_loi']:
             print(f"\nDanh sách phiếu lỗi:")
@@ -383,6 +1192,13 @@ class PhieuBauProcessor:
         for i, ung_vien in enumerate(tong_hop_don_gian['ket_qua_binh_chon'][:5], 1):
             print(f"  {i}. {ung_vien['ho_ten']}: {ung_vien['so_luot_dong_y']} lượt")
         
+        self.in_thong_ke_phan_loai(thong_ke_phan_loai)
+        if thong_ke_mau_ten:
+            tong = sum(thong_ke_mau_ten.values())
+            print(f"\nÔ họ tên lấy theo mẫu: {thong_ke_mau_ten['theo_mau']}/{tong} ({thong_ke_mau_ten['theo_mau'] / tong:.1%}), "
+                  f"chạy TrOCR: {thong_ke_mau_ten['ocr']}")
+        self.in_thong_ke_worker(thong_ke_worker, tong_thoi_gian)
+        
         return ket_qua_tong_hop
     
     def tao_tong_hop_don_gian(self, ket_qua_tong_hop: Dict) -> Dict:
@@ -467,6 +1283,77 @@ class PhieuBauProcessor:
         except Exception:
             pass
 
+def ket_qua_on_dinh(ket_qua: List[Dict]) -> bool:
+    """
+    Kết quả phiếu có thể lưu để dùng lại: có dòng và không dòng nào gặp lỗi OCR/YOLO (lỗi có thể chỉ là tạm thời)
+    """
+    if not ket_qua:
+        return False
+    for dong in ket_qua:
+        chi_tiet = dong.get('chi_tiet', {})
+        if chi_tiet.get('loi'):
+            return False
+        for loai in ('dong_y_yolo', 'khong_dong_y_yolo'):
+            if chi_tiet.get(loai, {}).get('loi'):
+                return False
+    return True
+
+def dem_phan_loai_nhanh(ket_qua: List[Dict], thong_ke: Counter):
+    """
+    Cộng số ô đồng ý/không đồng ý của một phiếu theo đường xử lý: trong, danh_dau (bộ phân loại nhanh
+    quyết định) hoặc khong_ro (đã chạy YOLO)
+    """
+    for dong in ket_qua:
+        chi_tiet = dong.get('chi_tiet', {})
+        for loai in ('dong_y_yolo', 'khong_dong_y_yolo'):
+            phan_loai = chi_tiet.get(loai, {}).get('phan_loai_nhanh')
+            if phan_loai:
+                thong_ke[phan_loai['phan_loai']] += 1
+
+def dem_o_ho_ten_theo_mau(ket_qua: List[Dict], thong_ke: Counter):
+    """
+    Cộng số ô họ tên của một phiếu lấy theo mẫu (theo_mau) và phải chạy TrOCR (ocr)
+    """
+    for dong in ket_qua:
+        thong_ke['theo_mau' if 'ho_ten_mau' in dong.get('chi_tiet', {}) else 'ocr'] += 1
+
+# Processor riêng của từng worker process (được tạo một lần khi khởi động worker)
+_processor_worker = None
+
+def _khoi_tao_worker(cau_hinh: Dict, so_thread: int):
+    """
+    Khởi tạo worker: giới hạn số thread và load model một lần cho cả vòng đời process
+    """
+    global _processor_worker
+    if cau_hinh.get('backend') == "onnx":
+        if not os.getenv(BIEN_MOI_TRUONG_INTRA):
+            dat_so_luong_onnx(intra=so_thread)
+    else:
+        try:
+            import torch
+            torch.set_num_threads(so_thread)
+        except ImportError:
+            pass
+    _processor_worker = PhieuBauProcessor(**cau_hinh)
+    _processor_worker.lam_nong_model()
+
+def _xu_ly_phieu_trong_worker(cong_viec):
+    """
+    Xử lý một phiếu trong worker process
+    """
+    image_path, thu_muc_temp, ung_vien_giai_ma, mau_ten = cong_viec
+    _processor_worker.dat_ung_vien_giai_ma(ung_vien_giai_ma)
+    _processor_worker.dat_mau_ten(mau_ten)
+    return _processor_worker._xu_ly_mot_cong_viec(image_path, thu_muc_temp)
+
+def in_su_kien_tien_do(su_kien: Dict):
+    """
+    In sự kiện tiến độ ra stdout trên một dòng riêng (dạng 'PROGRESS {json}') cho tiến trình cha đọc
+    """
+    # Ghi cả dòng trong một lần để không bị xen với log của các worker process
+    sys.stdout.write(TIEN_TO_SU_KIEN + json.dumps(su_kien, ensure_ascii=False, default=str) + "\n")
+    sys.stdout.flush()
+
 def main():
     """
     Hàm main để test hệ thống
@@ -478,6 +1365,31 @@ def main():
     parser.add_argument("--single", type=str, help="Xử lý một ảnh cụ thể")
     parser.add_argument("--input_dir", type=str, help="Thư mục chứa ảnh để xử lý batch (ưu tiên nếu truyền)")
     parser.add_argument("--output_dir", type=str, help="Thư mục lưu kết quả batch (ưu tiên nếu truyền)")
+    parser.add_argument("--trocr_batch_size", type=int, default=TROCR_BATCH_SIZE, help="Số ảnh từ tối đa trong một lần generate() của TrOCR")
+    parser.add_argument("--trocr_decoding", type=str, help="JSON ghi đè cấu hình giải mã TrOCR, mặc định generate() theo generation_config của model; ví dụ {\"tham_lam\": true, \"max_new_tokens\": 12} để giải mã tham lam có giới hạn token (xem CAU_HINH_GIAI_MA_MAC_DINH trong core/trocr.py)")
+    parser.add_argument("--yolo_batch_size", type=int, default=YOLO_BATCH_SIZE, help="Số ảnh ô tối đa trong một lần predict của YOLO")
+    parser.add_argument("--trocr_mode", choices=CAC_CHE_DO_TROCR, default=che_do_trocr(), help="Chế độ chạy TrOCR: fp32, int8 (lượng tử hóa động khi load, chỉ CPU) hoặc onnx; mặc định lấy từ TROCR_CHE_DO")
+    parser.add_argument("--backend", choices=CAC_BACKEND, default="pytorch", help="Backend suy luận: pytorch hoặc onnx (TrOCR và YOLO chạy bằng ONNX Runtime trên CPU, xuất model trước bằng processors.xuat_onnx)")
+    parser.add_argument("--onnx_threads", type=int, help="Số thread intra-op của ONNX Runtime (mặc định: chia đều CPU cho các worker)")
+    parser.add_argument("--onnx_inter_threads", type=int, help="Số thread inter-op của ONNX Runtime (>1 để chạy song song các nhánh của đồ thị)")
+    parser.add_argument("--workers", type=int, default=1, help="Số process xử lý song song khi chạy batch (mỗi process load model riêng)")
+    parser.add_argument("--pipeline", action="store_true", help="Chạy batch theo pipeline: làm phẳng, cắt ô và suy luận chạy đồng thời")
+    parser.add_argument("--pipeline_straighten", type=int, default=CAU_HINH_PIPELINE_MAC_DINH['so_luong_lam_phang'], help="Số thread làm phẳng ảnh trong pipeline")
+    parser.add_argument("--pipeline_crop", type=int, default=CAU_HINH_PIPELINE_MAC_DINH['so_luong_cat_o'], help="Số thread cắt ô trong pipeline")
+    parser.add_argument("--pipeline_infer", type=int, default=CAU_HINH_PIPELINE_MAC_DINH['so_luong_suy_luan'], help="Số thread suy luận TrOCR + YOLO trong pipeline")
+    parser.add_argument("--pipeline_batch", type=int, default=CAU_HINH_PIPELINE_MAC_DINH['so_phieu_moi_lo'], help="Số phiếu tối đa gom vào một lần suy luận")
+    parser.add_argument("--pipeline_queue", type=int, default=CAU_HINH_PIPELINE_MAC_DINH['kich_thuoc_hang_doi'], help="Số phiếu tối đa chờ giữa hai giai đoạn")
+    parser.add_argument("--debug_crops", action="store_true", help="Lưu ảnh đã làm phẳng và ảnh từng ô ra thư mục temp_processing để debug")
+    parser.add_argument("--fast_path", action="store_true", help="Bật phân loại nhanh ô đồng ý/không đồng ý theo mật độ mực, chỉ ô không rõ ràng mới chạy YOLO (mặc định mọi ô đều chạy YOLO)")
+    parser.add_argument("--fast_path_thresholds", type=str, help="JSON ghi đè ngưỡng phân loại nhanh (xem NGUONG_MAC_DINH trong core/phan_loai_o_dau_x.py)")
+    parser.add_argument("--candidates", type=str, help="File JSON danh sách ứng viên ([{\"id\", \"ho_ten\"}]) để gắn ung_vien_id cho từng dòng kết quả")
+    parser.add_argument("--candidate_decoding", action="store_true", help="Đọc ô họ tên bằng giải mã TrOCR ràng buộc theo tên các ứng viên trong --candidates (ô không đủ tin cậy mới đọc tự do rồi so khớp)")
+    parser.add_argument("--candidate_confidence", type=float, default=NGUONG_TIN_CAY_UNG_VIEN, help="Độ tin cậy tối thiểu để nhận ứng viên từ giải mã ràng buộc")
+    parser.add_argument("--template_names", action="store_true", help="Đọc họ tên một lần từ phiếu tham chiếu của mỗi layout (lưu mau_ten.json trong thư mục kết quả), các phiếu sau chỉ so dHash ô họ tên, dòng không khớp mới chạy TrOCR")
+    parser.add_argument("--template_distance", type=int, default=NGUONG_KHOANG_CACH_BAM, help="Số bit dHash (trên 256) khác nhau tối đa để ô họ tên được coi là trùng với mẫu")
+    parser.add_argument("--cache_dir", type=str, help="Thư mục bộ nhớ đệm kết quả theo nội dung ảnh (dùng lại kết quả của ảnh đã xử lý với cùng model và layout)")
+    parser.add_argument("--resume", action="store_true", help="Ghi sổ các phiếu đã xử lý và bỏ qua phiếu đã có kết quả với cùng ảnh, model/layout và ứng viên (chạy tiếp sau khi bị dừng, chỉ xử lý phiếu mới/đã đổi)")
+    parser.add_argument("--progress", action="store_true", help="In sự kiện tiến độ dạng 'PROGRESS {json}' ra stdout (bắt đầu/xong/lỗi từng phiếu)")
 
     args = parser.parse_args()
 
@@ -496,8 +1408,21 @@ def main():
             input_dirs = None  # Sẽ dùng mặc định ["ballot/data1", "ballot/data2"]
         output_dir = args.output
 
-    # Khởi tạo processor
-    processor = PhieuBauProcessor(yolo_weights_path=args.weights)
+    # Khởi tạo processor (chế độ TrOCR nằm trong cấu hình processor nên các worker process dùng cùng chế độ)
+    dat_so_luong_onnx(args.onnx_threads, args.onnx_inter_threads)
+    processor = PhieuBauProcessor(yolo_weights_path=args.weights,
+                                  trocr_batch_size=args.trocr_batch_size,
+                                  luu_anh_debug=args.debug_crops,
+                                  yolo_batch_size=args.yolo_batch_size,
+                                  phan_loai_nhanh=args.fast_path,
+                                  nguong_phan_loai=doc_nguong_phan_loai(args.fast_path_thresholds),
+                                  backend=args.backend,
+                                  trocr_mode=args.trocr_mode,
+                                  giai_ma_trocr=doc_cau_hinh_giai_ma(args.trocr_decoding),
+                                  giai_ma_ung_vien=args.candidate_decoding,
+                                  nguong_tin_cay_ung_vien=args.candidate_confidence,
+                                  mau_ten=args.template_names,
+                                  nguong_mau_ten=args.template_distance)
 
     if args.single:
         # Xử lý một ảnh
@@ -514,7 +1439,21 @@ def main():
             print(f"[ERROR] File không tồn tại: {args.single}")
     else:
         # Xử lý batch
-        ket_qua = processor.xu_ly_nhieu_phieu_bau(input_dirs, output_dir)
+        cau_hinh_pipeline = None
+        if args.pipeline:
+            cau_hinh_pipeline = {
+                'so_luong_lam_phang': args.pipeline_straighten,
+                'so_luong_cat_o': args.pipeline_crop,
+                'so_luong_suy_luan': args.pipeline_infer,
+                'so_phieu_moi_lo': args.pipeline_batch,
+                'kich_thuoc_hang_doi': args.pipeline_queue,
+            }
+        ket_qua = processor.xu_ly_nhieu_phieu_bau(input_dirs, output_dir, so_worker=args.workers,
+                                                  cau_hinh_pipeline=cau_hinh_pipeline,
+                                                  bao_su_kien=in_su_kien_tien_do if args.progress else None,
+                                                  danh_sach_ung_vien=doc_danh_sach_ung_vien(args.candidates) if args.candidates else None,
+                                                  thu_muc_cache=args.cache_dir,
+                                                  tiep_tuc=args.resume)
 
 if __name__ == "__main__":
     main()
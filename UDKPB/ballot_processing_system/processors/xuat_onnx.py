@@ -0,0 +1,122 @@
+# xuat_onnx.py - Xuất TrOCR và YOLO sang ONNX, so sánh kết quả backend onnx với pytorch
+import os
+import time
+import argparse
+from typing import Dict, List
+
+from core.tien_xu_ly import xu_ly_phieu_bau
+from core.trocr import doc_ten_theo_lo, tim_model_trocr, TROCR_BATCH_SIZE
+from core.suy_luan_onnx import xuat_trocr_onnx, thu_muc_trocr_onnx, xuat_yolo_onnx
+from processors.trocr_yolo import PhieuBauProcessor
+
+# Cấu hình giải mã TrOCR khi so sánh: backend ONNX chỉ giải mã tham lam, nên PyTorch cũng phải giải mã tham lam
+# (không theo generation_config của model, có thể là beam search) để chỉ so sánh backend
+GIAI_MA_SO_SANH = {'tham_lam': True}
+
+# Sai lệch confidence/tọa độ (pixel) tối đa để coi hai phát hiện YOLO là trùng nhau
+SAI_LECH_CONF = 0.02
+SAI_LECH_TOA_DO = 2.0
+
+def cat_o_cac_phieu(thu_muc_phieu: str, so_phieu: int) -> Dict[str, List]:
+    """
+    Cắt ô họ tên và ô đồng ý/không đồng ý của một số phiếu để so sánh hai backend
+
+    Returns:
+        Dict {'hoten': [ảnh], 'dau_x': [ảnh]}
+    """
+    duoi_anh = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+    cac_phieu = sorted(f for f in os.listdir(thu_muc_phieu) if f.lower().endswith(duoi_anh))[:so_phieu]
+    cac_o = {'hoten': [], 'dau_x': []}
+    for ten_file in cac_phieu:
+        ma_tran_anh = xu_ly_phieu_bau(os.path.join(thu_muc_phieu, ten_file))
+        for dong in ma_tran_anh or []:
+            for o in dong:
+                if o['loai'] == 'hoten':
+                    cac_o['hoten'].append(o['anh'])
+                elif o['loai'] in ('dongy', 'khongdongy'):
+                    cac_o['dau_x'].append(o['anh'])
+    return cac_o
+
+def _phat_hien_khop(a: Dict, b: Dict) -> bool:
+    """
+    Hai kết quả kiểm tra dấu X có cùng các phát hiện (cùng class, confidence và hộp trong ngưỡng sai lệch)
+    """
+    if a['loi'] or b['loi'] or len(a['chi_tiet_detection']) != len(b['chi_tiet_detection']):
+        return False
+    sap_xep = lambda ket_qua: sorted(ket_qua['chi_tiet_detection'], key=lambda d: (d['class'], -d['confidence']))
+    for da, db in zip(sap_xep(a), sap_xep(b)):
+        if da['class'] != db['class'] or abs(da['confidence'] - db['confidence']) > SAI_LECH_CONF:
+            return False
+        if max(abs(x - y) for x, y in zip(da['bbox'], db['bbox'])) > SAI_LECH_TOA_DO:
+            return False
+    return True
+
+def so_sanh_backend(thu_muc_phieu: str, yolo_weights_path: str, so_phieu: int, batch_size: int) -> bool:
+    """
+    Chạy TrOCR (giải mã tham lam) và YOLO bằng cả hai backend trên các ô cắt từ phiếu mẫu, in số ô khớp và thời gian
+
+    Returns:
+        True nếu mọi ô đều khớp
+    """
+    cac_o = cat_o_cac_phieu(thu_muc_phieu, so_phieu)
+    print(f"[INFO] So sánh trên {len(cac_o['hoten'])} ô họ tên, {len(cac_o['dau_x'])} ô đánh dấu")
+
+    ket_qua = {}
+    for backend in ('pytorch', 'onnx'):
+        che_do = 'fp32' if backend == 'pytorch' else 'onnx'
+        processor = PhieuBauProcessor(yolo_weights_path=yolo_weights_path, phan_loai_nhanh=False, backend=backend,
+                                      trocr_mode=che_do)
+        # Chạy nóng trước khi đo (lần đầu gồm cả thời gian load model)
+        doc_ten_theo_lo(cac_o['hoten'][:1], batch_size, giai_ma=GIAI_MA_SO_SANH, che_do=che_do)
+        processor.kiem_tra_dau_x_theo_lo(cac_o['dau_x'][:1])
+
+        bat_dau = time.perf_counter()
+        ten = doc_ten_theo_lo(cac_o['hoten'], batch_size, giai_ma=GIAI_MA_SO_SANH, che_do=che_do)
+        thoi_gian_trocr = time.perf_counter() - bat_dau
+        bat_dau = time.perf_counter()
+        dau_x = processor.kiem_tra_dau_x_theo_lo(cac_o['dau_x'])
+        thoi_gian_yolo = time.perf_counter() - bat_dau
+        ket_qua[backend] = (ten, dau_x)
+        print(f"[INFO] {backend}: TrOCR {thoi_gian_trocr:.2f}s, YOLO {thoi_gian_yolo:.2f}s")
+
+    (ten_pt, dau_x_pt), (ten_onnx, dau_x_onnx) = ket_qua['pytorch'], ket_qua['onnx']
+    so_ten_khop = sum(a == b for a, b in zip(ten_pt, ten_onnx))
+    so_dau_x_khop = sum(_phat_hien_khop(a, b) for a, b in zip(dau_x_pt, dau_x_onnx))
+    print(f"[INFO] Họ tên khớp: {so_ten_khop}/{len(ten_pt)}, dấu X khớp: {so_dau_x_khop}/{len(dau_x_pt)}")
+    for a, b in zip(ten_pt, ten_onnx):
+        if a != b:
+            print(f"[WARNING] Họ tên lệch: pytorch={a!r}, onnx={b!r}")
+    return so_ten_khop == len(ten_pt) and so_dau_x_khop == len(dau_x_pt)
+
+def main():
+    """
+    Xuất model sang ONNX (cần torch, transformers, ultralytics) và kiểm tra kết quả trên phiếu mẫu
+    """
+    parser = argparse.ArgumentParser(description="Xuất TrOCR và YOLO sang ONNX cho backend onnx")
+    parser.add_argument("--weights", default="models/best.pt", help="Đường dẫn YOLO weights (.onnx được lưu cùng thư mục)")
+    parser.add_argument("--opset", type=int, default=17, help="Phiên bản opset ONNX")
+    parser.add_argument("--skip_trocr", action="store_true", help="Không xuất TrOCR")
+    parser.add_argument("--skip_yolo", action="store_true", help="Không xuất YOLO")
+    parser.add_argument("--check", type=str, help="Thư mục ảnh phiếu mẫu để so sánh kết quả hai backend sau khi xuất (TrOCR giải mã tham lam ở cả hai backend: ONNX chỉ trùng PyTorch khi giải mã tham lam)")
+    parser.add_argument("--check_ballots", type=int, default=5, help="Số phiếu mẫu dùng để so sánh")
+    parser.add_argument("--trocr_batch_size", type=int, default=TROCR_BATCH_SIZE, help="Số ảnh từ tối đa trong một lần generate() của TrOCR")
+
+    args = parser.parse_args()
+
+    if not args.skip_trocr:
+        model_path = tim_model_trocr()
+        xuat_trocr_onnx(model_path, thu_muc_trocr_onnx(model_path), opset=args.opset)
+    if not args.skip_yolo:
+        if os.path.exists(args.weights):
+            xuat_yolo_onnx(args.weights, opset=args.opset)
+        else:
+            print(f"[WARNING] Không tìm thấy YOLO weights: {args.weights}")
+
+    if args.check:
+        if so_sanh_backend(args.check, args.weights, args.check_ballots, args.trocr_batch_size):
+            print("[INFO] Backend onnx cho kết quả trùng với pytorch")
+        else:
+            print("[WARNING] Backend onnx có kết quả khác pytorch, xem chi tiết ở trên")
+
+if __name__ == "__main__":
+    main()
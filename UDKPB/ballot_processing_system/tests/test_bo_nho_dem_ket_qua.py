@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from core.bo_nho_dem_ket_qua import BoNhoDemKetQua, bam_file, ma_phien_ban
+
+
+class BoNhoDemKetQuaTest(unittest.TestCase):
+    def setUp(self):
+        self.thu_muc = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.thu_muc, ignore_errors=True)
+
+    def test_bam_file_theo_noi_dung(self):
+        a, b = os.path.join(self.thu_muc, 'a.jpg'), os.path.join(self.thu_muc, 'b.jpg')
+        for duong_dan in (a, b):
+            with open(duong_dan, 'wb') as f:
+                f.write(b'anh phieu' * 20000)
+        self.assertEqual(bam_file(a), bam_file(b))
+        with open(b, 'ab') as f:
+            f.write(b'!')
+        self.assertNotEqual(bam_file(a), bam_file(b))
+
+    def test_ma_phien_ban_khong_phu_thuoc_thu_tu_khoa(self):
+        self.assertEqual(ma_phien_ban({'model': 'x', 'layout': 1}), ma_phien_ban({'layout': 1, 'model': 'x'}))
+        self.assertNotEqual(ma_phien_ban({'model': 'x', 'layout': 1}), ma_phien_ban({'model': 'x', 'layout': 2}))
+
+    def test_luu_va_lay_theo_phien_ban(self):
+        khoa = 'ab' * 32
+        bo_nho_dem = BoNhoDemKetQua(self.thu_muc, {'model': 'v1'})
+        self.assertIsNone(bo_nho_dem.lay(khoa))
+        bo_nho_dem.luu(khoa, [{'dong': 1}])
+        self.assertEqual(BoNhoDemKetQua(self.thu_muc, {'model': 'v1'}).lay(khoa), [{'dong': 1}])
+
+        # Đổi model: kết quả cũ nằm ở thư mục phiên bản khác nên không được dùng lại
+        self.assertIsNone(BoNhoDemKetQua(self.thu_muc, {'model': 'v2'}).lay(khoa))
+
+    def test_file_hong_coi_nhu_chua_co(self):
+        khoa = 'cd' * 32
+        bo_nho_dem = BoNhoDemKetQua(self.thu_muc, {'model': 'v1'})
+        bo_nho_dem.luu(khoa, [{'dong': 1}])
+        with open(bo_nho_dem._duong_dan(khoa), 'w', encoding='utf-8') as f:
+            f.write('{"dong"')
+        self.assertIsNone(bo_nho_dem.lay(khoa))
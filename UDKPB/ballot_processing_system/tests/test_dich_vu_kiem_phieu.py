@@ -0,0 +1,33 @@
+import unittest
+from unittest import mock
+
+from processors.dich_vu_kiem_phieu import DichVuKiemPhieu
+from processors.trocr_yolo import PhieuBauProcessor
+
+
+class LamNongModelTest(unittest.TestCase):
+    def tao_processor(self, backend):
+        processor = PhieuBauProcessor(backend=backend)
+        processor._load_yolo = mock.Mock(return_value='yolo')
+        return processor
+
+    def test_load_ca_trocr_va_yolo(self):
+        for backend, che_do in (('pytorch', None), ('onnx', 'onnx')):
+            processor = self.tao_processor(backend)
+            with mock.patch('processors.trocr_yolo.get_pipeline') as get_pipeline:
+                DichVuKiemPhieu(processor).lam_nong_model()
+            get_pipeline.assert_called_once_with(processor.che_do_trocr)
+            if che_do:
+                self.assertEqual(processor.che_do_trocr, che_do)
+            processor._load_yolo.assert_called_once_with()
+            # Việc đầu tiên dùng lại YOLO đã load
+            self.assertEqual(processor.yolo_model, 'yolo')
+            processor._load_yolo.assert_called_once_with()
+
+    def test_che_do_pool_mo_worker(self):
+        processor = self.tao_processor('pytorch')
+        with mock.patch.object(processor, 'mo_pool_worker') as mo_pool_worker, \
+                mock.patch('processors.trocr_yolo.get_pipeline') as get_pipeline:
+            DichVuKiemPhieu(processor, so_worker=2).lam_nong_model()
+        mo_pool_worker.assert_called_once_with(2)
+        get_pipeline.assert_not_called()
@@ -0,0 +1,136 @@
+import importlib.util
+import math
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from core.giai_ma_ung_vien import BoGiaiMaUngVien, bien_the_ten, tin_cay_du
+
+BOS, EOS, BAT_DAU = 0, 2, 1
+BANG_CHU = " ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+KICH_THUOC_TU_DIEN = 10 + len(BANG_CHU)
+UNG_VIEN = [(1, 'NGUYEN VAN AN'), (2, 'NGUYEN VAN ANH'), (3, 'TRAN THI AN')]
+
+
+class TokenizerKyTu:
+    """
+    Tokenizer giả: mỗi ký tự một token (token đặc biệt như tokenizer của TrOCR)
+    """
+
+    def __init__(self, bos_token_id=BOS):
+        self.bos_token_id = bos_token_id
+
+    def __call__(self, text, add_special_tokens=True):
+        return SimpleNamespace(input_ids=[10 + BANG_CHU.index(c) for c in text])
+
+
+def ma_hoa(text):
+    return TokenizerKyTu()(text).input_ids
+
+
+def ham_doc(cac_chuoi_dung, xac_suat_dung=0.95, cac_loi_goi=None):
+    """
+    Hàm log xác suất giả: ảnh a "đọc" ra cac_chuoi_dung[a] (token sau decoder_start, kết thúc bằng eos)
+    với xác suất xac_suat_dung mỗi token, phần còn lại chia đều cho các token khác
+    """
+    def ham_log_xac_suat(chi_so_anh, chuoi):
+        log_p = np.full((len(chuoi), KICH_THUOC_TU_DIEN), math.log((1 - xac_suat_dung) / (KICH_THUOC_TU_DIEN - 1)))
+        for r, (a, hang) in enumerate(zip(chi_so_anh, chuoi)):
+            if cac_loi_goi is not None:
+                cac_loi_goi.append(hang.tolist())
+            dung = cac_chuoi_dung[a]
+            vi_tri = len(hang) - 1
+            if vi_tri < len(dung) and list(hang[1:]) == dung[:vi_tri]:
+                log_p[r, dung[vi_tri]] = math.log(xac_suat_dung)
+        return log_p
+    return ham_log_xac_suat
+
+
+class BoGiaiMaUngVienTest(unittest.TestCase):
+    def setUp(self):
+        self.bo_giai_ma = BoGiaiMaUngVien(UNG_VIEN, TokenizerKyTu(), BAT_DAU, EOS)
+        self.cac_chuoi_ung_vien = [ma_hoa(ten) for _, ten in UNG_VIEN]
+
+    def test_chi_sinh_tien_to_ten_ung_vien(self):
+        cac_loi_goi = []
+        # Ảnh thứ hai ghi tên ngoài danh sách: decoder vẫn chỉ được đi theo tên ứng viên
+        ket_qua = self.bo_giai_ma.giai_ma(ham_doc([ma_hoa('NGUYEN VAN AN') + [EOS], ma_hoa('LE THI BINH') + [EOS]],
+                                                  cac_loi_goi=cac_loi_goi), 2)
+        self.assertEqual(ket_qua[0]['ung_vien_id'], 1)
+        self.assertTrue(tin_cay_du(ket_qua[0]))
+        for chuoi in cac_loi_goi:
+            self.assertEqual(chuoi[0], BAT_DAU)
+            than = chuoi[2:] if chuoi[1:2] == [BOS] else chuoi[1:]
+            self.assertTrue(any(ung_vien[:len(than)] == than for ung_vien in self.cac_chuoi_ung_vien), chuoi)
+            self.assertNotIn(EOS, chuoi)
+
+    def test_eos_chi_o_cuoi_ten(self):
+        # Model muốn kết thúc ngay sau "NGUYEN VAN A": eos không được phép giữa tên nên vẫn phải đi hết một tên
+        dung = ma_hoa('NGUYEN VAN A') + [EOS]
+        ket_qua = self.bo_giai_ma.giai_ma(ham_doc([dung]), 1)[0]
+        self.assertIn(ket_qua['ung_vien_id'], (1, 2))
+        self.assertFalse(tin_cay_du(ket_qua))
+
+        # "AN" là tên hoàn chỉnh: eos sau "AN" chọn ứng viên 1, đọc tiếp "H" chọn ứng viên 2
+        self.assertEqual(self.bo_giai_ma.giai_ma(ham_doc([ma_hoa('NGUYEN VAN AN') + [EOS]]), 1)[0]['ung_vien_id'], 1)
+        self.assertEqual(self.bo_giai_ma.giai_ma(ham_doc([ma_hoa('NGUYEN VAN ANH') + [EOS]]), 1)[0]['ung_vien_id'], 2)
+
+    def test_loai_ket_qua_duoi_nguong(self):
+        # Tên ngoài danh sách: xác suất token trung bình thấp
+        ket_qua = self.bo_giai_ma.giai_ma(ham_doc([ma_hoa('LE THI BINH') + [EOS]]), 1)[0]
+        self.assertLess(ket_qua['xac_suat_token_tb'], 0.5)
+        self.assertFalse(tin_cay_du(ket_qua))
+
+        # Ảnh mờ (mọi token gần như đều nhau): không ứng viên nào đủ độ tin cậy
+        ket_qua = self.bo_giai_ma.giai_ma(ham_doc([ma_hoa('NGUYEN VAN AN') + [EOS]], xac_suat_dung=0.05), 1)[0]
+        self.assertFalse(tin_cay_du(ket_qua))
+
+    def test_bos_sau_token_bat_dau(self):
+        ket_qua = self.bo_giai_ma.giai_ma(ham_doc([[BOS] + ma_hoa('TRAN THI AN') + [EOS]]), 1)[0]
+        self.assertEqual(ket_qua['ung_vien_id'], 3)
+        self.assertTrue(tin_cay_du(ket_qua))
+
+        # Tokenizer không có bos: chỉ có nhánh vào thẳng tên
+        bo_giai_ma = BoGiaiMaUngVien(UNG_VIEN, TokenizerKyTu(bos_token_id=None), BAT_DAU, EOS)
+        self.assertNotIn(BOS, bo_giai_ma.goc.con)
+
+
+def _tokenizer_trocr():
+    if not importlib.util.find_spec('transformers'):
+        return None
+    from core.trocr import tim_model_trocr
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(tim_model_trocr())
+    except (RuntimeError, OSError):
+        return None
+
+
+TOKENIZER = _tokenizer_trocr()
+
+
+@unittest.skipUnless(TOKENIZER, "cần transformers và model TrOCR đã tải về")
+class TokenizerTrOCRTest(unittest.TestCase):
+    def test_moi_nhanh_cua_cay_la_mot_cach_viet_ten(self):
+        ung_vien = [(1, 'Nguyễn Văn An'), (2, 'Nguyễn Văn Anh'), (3, 'Trần Thị Ân')]
+        bo_giai_ma = BoGiaiMaUngVien(ung_vien, TOKENIZER, 2, TOKENIZER.eos_token_id)
+        cac_ten = {uv_id: bien_the_ten(ten) for uv_id, ten in ung_vien}
+
+        def duyet(nut, chuoi):
+            for token, con in nut.con.items():
+                if token != TOKENIZER.eos_token_id:
+                    duyet(con, chuoi + [token])
+                    continue
+                than = chuoi[1:] if chuoi[:1] == [TOKENIZER.bos_token_id] else chuoi
+                for uv_id in con.ung_vien:
+                    self.assertIn(TOKENIZER.decode(than), cac_ten[uv_id])
+
+        duyet(bo_giai_ma.goc, [])
+        # Mỗi cách viết có thể giải mã lại từ chuỗi token tokenizer sinh ra cho nó
+        for uv_id, ten in ung_vien:
+            for bien_the in bien_the_ten(ten):
+                nut = bo_giai_ma.goc
+                for token in TOKENIZER(bien_the, add_special_tokens=False).input_ids + [TOKENIZER.eos_token_id]:
+                    nut = nut.con[token]
+                self.assertIn(uv_id, nut.ung_vien)
@@ -0,0 +1,56 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from core.mau_ten import bam_o_ho_ten, khop_mau
+
+UNG_VIEN = ['NGUYEN VAN AN', 'TRAN THI BINH', 'LE VAN CUONG', 'PHAM THI DUNG']
+
+
+def o_ho_ten(ho_ten, lech_x=0, lech_y=0, do_mo=0.0, do_nhieu=0.0, seed=0):
+    """
+    Ô họ tên in tổng hợp (có đường kẻ bảng trên và dưới) như sau khi làm phẳng phiếu
+    """
+    anh = np.full((64, 440), 235, dtype=np.uint8)
+    cv2.line(anh, (0, 1), (439, 1), 0, 2)
+    cv2.line(anh, (0, 62), (439, 62), 0, 2)
+    cv2.putText(anh, ho_ten, (40 + lech_x, 42 + lech_y), cv2.FONT_HERSHEY_SIMPLEX, 0.9, 0, 2)
+    if do_mo:
+        anh = cv2.GaussianBlur(anh, (0, 0), do_mo)
+    if do_nhieu:
+        nhieu = np.random.default_rng(seed).normal(0, do_nhieu, anh.shape)
+        anh = np.clip(anh + nhieu, 0, 255).astype(np.uint8)
+    return anh
+
+
+class KhopMauTest(unittest.TestCase):
+    def setUp(self):
+        self.bam_mau = [bam_o_ho_ten(o_ho_ten(ho_ten)) for ho_ten in UNG_VIEN]
+
+    def test_cung_ten_lech_nhe_khop(self):
+        for dong, ho_ten in enumerate(UNG_VIEN):
+            for lech_x, lech_y, do_mo, do_nhieu in ((0, 0, 0, 0), (2, 1, 0, 6), (-2, -1, 0.5, 0), (3, 2, 0, 12)):
+                bam = bam_o_ho_ten(o_ho_ten(ho_ten, lech_x, lech_y, do_mo, do_nhieu, seed=dong))
+                self.assertIsNotNone(khop_mau(bam, dong, self.bam_mau), (ho_ten, lech_x, lech_y, do_mo, do_nhieu))
+
+    def test_ten_khac_bi_loai(self):
+        # Tên không có trong mẫu, kể cả chỉ khác một chữ cái, không được nhận là dòng tương ứng
+        for ho_ten in ('NGUYEN VAN AM', 'HOANG VAN EM', 'TRAN THI BINH'):
+            for lech_x in (-4, 0, 4):
+                bam = bam_o_ho_ten(o_ho_ten(ho_ten, lech_x, 0, 0.8, 6))
+                self.assertIsNone(khop_mau(bam, 0, self.bam_mau), (ho_ten, lech_x))
+
+    def test_dong_mau_gan_nhau_bi_loai(self):
+        # Hai dòng mẫu gần như trùng nhau: không xác nhận được thứ tự dòng nên không khớp
+        bam_mau = self.bam_mau + [self.bam_mau[0]]
+        bam = bam_o_ho_ten(o_ho_ten(UNG_VIEN[0], 1, 1))
+        self.assertIsNotNone(khop_mau(bam, 0, self.bam_mau))
+        self.assertIsNone(khop_mau(bam, 0, bam_mau))
+
+    def test_o_trong(self):
+        o_trong = np.full((64, 440), 235, dtype=np.uint8)
+        cv2.line(o_trong, (0, 1), (439, 1), 0, 2)
+        self.assertEqual(bam_o_ho_ten(o_trong), 0)
+        self.assertIsNone(khop_mau(0, 0, self.bam_mau))
+        self.assertIsNone(khop_mau(self.bam_mau[0], len(self.bam_mau), self.bam_mau))
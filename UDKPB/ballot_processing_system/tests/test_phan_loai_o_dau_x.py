@@ -0,0 +1,62 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from core.phan_loai_o_dau_x import DANH_DAU, KHONG_RO, TRONG, BoPhanLoaiODauX, doc_nguong_phan_loai
+
+
+def tao_o(nen=235, vien=True):
+    # Ô đánh dấu 100x80 trên nền giấy có nhiễu nhẹ, kèm đường kẻ bảng ở mép
+    rng = np.random.default_rng(0)
+    o = np.clip(rng.normal(nen, 3, (80, 100)), 0, 255).astype(np.uint8)
+    if vien:
+        cv2.rectangle(o, (0, 0), (99, 79), 40, 2)
+    return o
+
+
+def ve_dau_x(o, mau, do_day=2):
+    cv2.line(o, (35, 25), (65, 55), mau, do_day)
+    cv2.line(o, (65, 25), (35, 55), mau, do_day)
+    return o
+
+
+class BoPhanLoaiODauXTest(unittest.TestCase):
+    def setUp(self):
+        self.bo_phan_loai = BoPhanLoaiODauX()
+
+    def phan_loai(self, *cac_o):
+        return [kq['phan_loai'] for kq in self.bo_phan_loai.phan_loai(list(cac_o))]
+
+    def test_o_trong_va_dau_x_ro(self):
+        cham_ban = tao_o()
+        cv2.circle(cham_ban, (50, 40), 1, 30, -1)
+        self.assertEqual(self.phan_loai(tao_o(), cham_ban, ve_dau_x(tao_o(), 30)), [TRONG, TRONG, DANH_DAU])
+
+    def test_anh_mau(self):
+        o = cv2.cvtColor(ve_dau_x(tao_o(), 30), cv2.COLOR_GRAY2BGR)
+        self.assertEqual(self.phan_loai(o), [DANH_DAU])
+
+    def test_dau_x_nhat_chuyen_model(self):
+        # Dấu bút chì/ảnh thiếu tương phản: tối hơn nền ít hơn do_dam_muc nên không có mực, nhưng không được coi là trống
+        self.assertEqual(self.phan_loai(ve_dau_x(tao_o(), 210)), [KHONG_RO])
+
+    def test_to_dam_chuyen_model(self):
+        # Vết tô kín: các hàng/cột gần như toàn mực không được bỏ như đường kẻ để ô thành trống
+        to_mot_phan = tao_o()
+        cv2.rectangle(to_mot_phan, (30, 22), (70, 58), 20, -1)
+        to_kin = tao_o()
+        cv2.rectangle(to_kin, (15, 12), (85, 68), 20, -1)
+        self.assertEqual(self.phan_loai(to_mot_phan, to_kin), [KHONG_RO, KHONG_RO])
+
+    def test_nguong(self):
+        self.assertIsNone(doc_nguong_phan_loai(''))
+        self.assertEqual(doc_nguong_phan_loai('{"do_dam_muc": 50}'), {'do_dam_muc': 50})
+        with self.assertRaises(ValueError):
+            doc_nguong_phan_loai('[1]')
+        with self.assertRaises(ValueError):
+            BoPhanLoaiODauX({'khong_co': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import threading
+import unittest
+
+from core.pipeline import GiaiDoan, chay_pipeline
+
+
+class ChayPipelineTest(unittest.TestCase):
+    def test_moi_phan_tu_qua_du_cac_giai_doan(self):
+        def nhan_doi(muc):
+            muc['gia_tri'] *= 2
+
+        def cong_lo(lo):
+            for muc in lo:
+                muc['gia_tri'] += 1
+
+        cac_giai_doan = [GiaiDoan('nhan_doi', nhan_doi, 2), GiaiDoan('cong', cong_lo, 1, 3)]
+        ket_qua = list(chay_pipeline(({'gia_tri': i} for i in range(20)), cac_giai_doan, 2))
+        self.assertEqual(sorted(muc['gia_tri'] for muc in ket_qua), [2 * i + 1 for i in range(20)])
+        self.assertTrue(all(set(muc['thoi_gian_giai_doan']) == {'nhan_doi', 'cong'} for muc in ket_qua))
+
+    def test_loi_giai_doan_ghi_vao_phan_tu(self):
+        def hong(muc):
+            if muc['gia_tri'] == 1:
+                raise ValueError('ảnh hỏng')
+
+        ket_qua = list(chay_pipeline(({'gia_tri': i} for i in range(3)), [GiaiDoan('doc', hong)]))
+        self.assertEqual([muc.get('loi') for muc in sorted(ket_qua, key=lambda muc: muc['gia_tri'])],
+                         [None, 'doc: ảnh hỏng', None])
+
+    def test_nguon_loi_khong_treo(self):
+        def nguon():
+            yield {'gia_tri': 0}
+            raise OSError('không đọc được thư mục ảnh')
+
+        ket_qua = []
+        loi = []
+
+        def chay():
+            try:
+                ket_qua.extend(chay_pipeline(nguon(), [GiaiDoan('x', lambda muc: None, 2)]))
+            except OSError as e:
+                loi.append(e)
+
+        thread = threading.Thread(target=chay, daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(ket_qua), 1)
+        self.assertEqual(str(loi[0]), 'không đọc được thư mục ảnh')
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from core.bo_nho_dem_ket_qua import bam_file
+from core.so_ghi_kiem_phieu import TEN_FILE_SO_GHI, SoGhiKiemPhieu, doc_so_ghi
+
+
+class SoGhiKiemPhieuTest(unittest.TestCase):
+    def setUp(self):
+        self.thu_muc = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.thu_muc, ignore_errors=True)
+        self.anh = self.tao_file('p1.jpg', b'anh phieu 1')
+
+    def tao_file(self, ten, noi_dung):
+        duong_dan = os.path.join(self.thu_muc, ten)
+        with open(duong_dan, 'wb') as f:
+            f.write(noi_dung)
+        return duong_dan
+
+    def ghi(self, phien_ban='v1', on_dinh=True):
+        so_ghi = SoGhiKiemPhieu(self.thu_muc, phien_ban)
+        bam = so_ghi.bam(self.anh)
+        self.tao_file('p1.json', b'[]')
+        so_ghi.ghi(self.anh, bam, 'p1.json', on_dinh)
+        so_ghi.dong()
+        return bam
+
+    def test_chay_tiep_bo_qua_phieu_da_xu_ly(self):
+        bam = self.ghi()
+        so_ghi = SoGhiKiemPhieu(self.thu_muc, 'v1')
+        self.assertEqual(so_ghi.bam(self.anh), bam)
+        self.assertEqual(so_ghi.da_xu_ly(self.anh, bam)['ket_qua'], 'p1.json')
+
+    def test_xu_ly_lai_khi_doi_anh_phien_ban_hoac_ket_qua_loi(self):
+        bam = self.ghi(on_dinh=False)
+        self.assertIsNone(SoGhiKiemPhieu(self.thu_muc, 'v1').da_xu_ly(self.anh, bam))
+
+        bam = self.ghi()
+        self.assertIsNone(SoGhiKiemPhieu(self.thu_muc, 'v2').da_xu_ly(self.anh, bam))
+
+        self.tao_file('p1.jpg', b'anh phieu 1 da thay')
+        so_ghi = SoGhiKiemPhieu(self.thu_muc, 'v1')
+        bam_moi = so_ghi.bam(self.anh)
+        self.assertEqual(bam_moi, bam_file(self.anh))
+        self.assertIsNone(so_ghi.da_xu_ly(self.anh, bam_moi))
+
+    def test_xu_ly_lai_khi_mat_file_ket_qua(self):
+        bam = self.ghi()
+        os.remove(os.path.join(self.thu_muc, 'p1.json'))
+        self.assertIsNone(SoGhiKiemPhieu(self.thu_muc, 'v1').da_xu_ly(self.anh, bam))
+
+    def test_bo_qua_dong_ghi_do(self):
+        bam = self.ghi()
+        duong_dan = os.path.join(self.thu_muc, TEN_FILE_SO_GHI)
+        with open(duong_dan, 'a', encoding='utf-8') as f:
+            f.write('{"anh": "p2.jpg", "ba')
+        self.assertEqual(list(doc_so_ghi(duong_dan)), ['p1.jpg'])
+
+        # Lần chạy sau ghi tiếp trên dòng mới, dòng ghi dở không làm hỏng dòng mới
+        self.ghi()
+        self.assertEqual(doc_so_ghi(duong_dan)['p1.jpg']['bam'], bam)
+
+    def test_gon_lai_so_ghi(self):
+        so_ghi = SoGhiKiemPhieu(self.thu_muc, 'v1')
+        bam = so_ghi.bam(self.anh)
+        self.tao_file('p1.json', b'[]')
+        for _ in range(120):
+            so_ghi.ghi(self.anh, bam, 'p1.json', True)
+        so_ghi.dong()
+        duong_dan = os.path.join(self.thu_muc, TEN_FILE_SO_GHI)
+        SoGhiKiemPhieu(self.thu_muc, 'v1').dong()
+        with open(duong_dan, 'r', encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertIn('p1.jpg', doc_so_ghi(duong_dan))
@@ -0,0 +1,32 @@
+import unittest
+
+from core.so_khop_ung_vien import BoSoKhopUngVien
+
+
+class BoSoKhopUngVienTest(unittest.TestCase):
+    def setUp(self):
+        self.ung_vien = [(1, 'LE VAN AN'), (2, 'NGUYEN VAN ANH'), (3, 'TRAN THI AN')]
+
+    def test_khop_dung_ten(self):
+        bo_so_khop = BoSoKhopUngVien(self.ung_vien)
+        self.assertEqual(bo_so_khop.so_khop('Nguyen  Van Anh'), (2, 1.0))
+        self.assertEqual(bo_so_khop.so_khop(''), bo_so_khop.so_khop(''))
+
+    def test_ung_vien_xet_khop_tot(self):
+        bo_so_khop = BoSoKhopUngVien(self.ung_vien, so_ung_vien_xet=1)
+        ung_vien_id, diem = bo_so_khop.so_khop('LE VAN ANH')
+        self.assertEqual(ung_vien_id, 1)
+        self.assertGreaterEqual(diem, 0.9)
+
+    def test_chon_sai_theo_ngram_thi_xet_het(self):
+        # Chỉ xét 1 ứng viên theo n-gram: ứng viên đó không phải ứng viên khớp nhất, điểm thấp nên xét hết
+        bo_so_khop = BoSoKhopUngVien(self.ung_vien, so_ung_vien_xet=1)
+        self.assertEqual(bo_so_khop.so_khop('NGUYFN VAN AN')[0], 2)
+        self.assertEqual(bo_so_khop.so_khop('TRAN VAN AN')[0], 3)
+
+    def test_khong_co_ung_vien(self):
+        self.assertEqual(BoSoKhopUngVien([]).so_khop('NGUYEN VAN A'), (None, 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import importlib.util
+import os
+import unittest
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from core.suy_luan_onnx import thu_muc_trocr_onnx
+from core.trocr import tim_model_trocr, cau_hinh_giai_ma
+
+
+def _thu_muc_model():
+    """
+    (snapshot PyTorch, thư mục ONNX) nếu đã tải model và xuất ONNX, ngược lại None
+    """
+    try:
+        model_path = tim_model_trocr()
+    except (RuntimeError, OSError):
+        return None
+    thu_muc = thu_muc_trocr_onnx(model_path)
+    return (model_path, thu_muc) if os.path.isdir(thu_muc) else None
+
+
+def _anh_tu(text):
+    anh = np.full((64, 40 * len(text), 3), 255, dtype=np.uint8)
+    cv2.putText(anh, text, (8, 46), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (0, 0, 0), 3)
+    return Image.fromarray(anh)
+
+
+CO_ONNX = all(importlib.util.find_spec(ten) for ten in ('onnxruntime', 'transformers'))
+MODEL = _thu_muc_model() if CO_ONNX else None
+
+
+@unittest.skipUnless(MODEL, "cần onnxruntime, transformers và TrOCR đã xuất ONNX (processors.xuat_onnx)")
+class TrOCROnnxTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from core.suy_luan_onnx import TrOCROnnx
+        cls.trocr = TrOCROnnx(MODEL[1])
+        cls.cac_anh = [_anh_tu(text) for text in ('NGUYEN', 'VAN', 'AN', 'TRAN')]
+        cls.pixel_values = cls.trocr.image_processor(images=cls.cac_anh, return_tensors="np").pixel_values
+
+    def test_kv_cache_trung_tinh_lai_ca_chuoi(self):
+        if self.trocr.decoder_cache is None:
+            self.skipTest("bản xuất ONNX cũ không có decoder_with_past.onnx")
+        co_cache = self.trocr.sinh_token(self.pixel_values, cau_hinh_giai_ma({'use_cache': True}))
+        khong_cache = self.trocr.sinh_token(self.pixel_values, cau_hinh_giai_ma({'use_cache': False}))
+        np.testing.assert_array_equal(co_cache, khong_cache)
+
+    @unittest.skipUnless(importlib.util.find_spec('torch'), "cần torch để so với PyTorch")
+    def test_trung_pytorch(self):
+        import torch
+        from transformers import VisionEncoderDecoderModel
+        from core.trocr import giai_ma_tham_lam
+
+        model = VisionEncoderDecoderModel.from_pretrained(MODEL[0]).eval()
+        giai_ma = cau_hinh_giai_ma({'tham_lam': True})
+        token_pt = giai_ma_tham_lam(model, torch.from_numpy(self.pixel_values), giai_ma['max_new_tokens']).numpy()
+        token_onnx = self.trocr.sinh_token(self.pixel_values, giai_ma)
+        self.assertEqual(self.trocr.tokenizer.batch_decode(token_onnx, skip_special_tokens=True),
+                         self.trocr.tokenizer.batch_decode(token_pt, skip_special_tokens=True))
@@ -14,6 +14,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import sys
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv(os.path.join(BASE_DIR, '.env'))
@@ -83,12 +84,14 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
-        'OPTIONS': {
-            'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
-        },
         'ATOMIC_REQUESTS': True,
     }
 }
+# init_command chỉ có ở MySQL (chạy test bằng SQLite: DB_ENGINE=django.db.backends.sqlite3)
+if DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+    }
 
 
 # Password validation
@@ -142,4 +145,36 @@ AUTH_USER_MODEL = 'quan_ly_phieu_bau.Account'
 # Đường dẫn login cho login_required
 LOGIN_URL = '/login/'
 
+# Số process xử lý song song khi kiểm phiếu (truyền cho processors.trocr_yolo --workers)
+COUNTING_WORKERS = int(os.getenv('COUNTING_WORKERS', '1'))
+# Chạy kiểm phiếu theo pipeline (làm phẳng, cắt ô và suy luận chạy đồng thời)
+COUNTING_PIPELINE = os.getenv('COUNTING_PIPELINE', 'False') == 'True'
+# Dịch vụ kiểm phiếu chạy lâu dài (processors.dich_vu_kiem_phieu), để trống port để luôn chạy subprocess;
+# khóa xác thực bắt buộc (thiếu khóa thì luôn chạy subprocess)
+COUNTING_SERVICE_HOST = os.getenv('COUNTING_SERVICE_HOST', '127.0.0.1')
+COUNTING_SERVICE_PORT = int(os.getenv('COUNTING_SERVICE_PORT') or 0) or None
+COUNTING_SERVICE_AUTHKEY = os.getenv('COUNTING_SERVICE_AUTHKEY', '')
+# Bộ nhớ đệm kết quả kiểm phiếu theo nội dung ảnh (ảnh đã kiểm với cùng model/layout không phải chạy lại),
+# đường dẫn tuyệt đối; mặc định tắt
+COUNTING_CACHE_DIR = os.getenv('COUNTING_CACHE_DIR', '')
+# Chế độ chạy TrOCR khi kiểm phiếu bằng subprocess: fp32 hoặc int8 (lượng tử hóa động, chỉ CPU)
+COUNTING_TROCR_MODE = os.getenv('COUNTING_TROCR_MODE', 'fp32')
+# Backend suy luận khi kiểm phiếu bằng subprocess: pytorch hoặc onnx (ONNX Runtime, cần xuất model trước)
+COUNTING_BACKEND = os.getenv('COUNTING_BACKEND', 'pytorch')
+# Cấu hình giải mã TrOCR (JSON, ví dụ {"tham_lam": true, "max_new_tokens": 12}), để trống để dùng generation_config của model
+COUNTING_TROCR_DECODING = os.getenv('COUNTING_TROCR_DECODING', '')
+# Đọc ô họ tên bằng giải mã ràng buộc theo danh sách ứng viên của cuộc bỏ phiếu khi kiểm phiếu bằng subprocess
+COUNTING_CANDIDATE_DECODING = os.getenv('COUNTING_CANDIDATE_DECODING', 'False') == 'True'
+# Đọc họ tên một lần từ phiếu tham chiếu của cuộc bỏ phiếu, các phiếu sau chỉ so dHash ô họ tên (kiểm phiếu bằng subprocess)
+COUNTING_TEMPLATE_NAMES = os.getenv('COUNTING_TEMPLATE_NAMES', 'False') == 'True'
+# Phân loại nhanh ô đồng ý/không đồng ý theo mật độ mực khi kiểm phiếu bằng subprocess (mặc định tắt, mọi ô chạy YOLO)
+COUNTING_FAST_PATH = os.getenv('COUNTING_FAST_PATH', 'False') == 'True'
+# Số file tối đa trong một lần tải lên (mặc định của Django là 100, không đủ cho tải phiếu hàng loạt)
+DATA_UPLOAD_MAX_NUMBER_FILES = int(os.getenv('DATA_UPLOAD_MAX_NUMBER_FILES', '5000'))
+# Thư mục ballot_processing_system (thư mục chạy subprocess kiểm phiếu); module dùng chung được import
+# theo gói ballot_processing_system.core nên thư mục UDKPB được thêm vào sys.path (không cần đặt PYTHONPATH)
+BALLOT_PROCESSING_DIR = os.path.abspath(os.path.join(BASE_DIR, '..', 'ballot_processing_system'))
+if os.path.dirname(BALLOT_PROCESSING_DIR) not in sys.path:
+    sys.path.append(os.path.dirname(BALLOT_PROCESSING_DIR))
+
 STATIC_ROOT = os.path.join(BASE_DIR, os.getenv('STATIC_ROOT', 'staticfiles'))
\ No newline at end of file
@@ -0,0 +1,165 @@
+import os
+import json
+import subprocess
+import threading
+from multiprocessing.connection import Client
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Tiền tố dòng sự kiện tiến độ do processors.trocr_yolo --progress in ra (TIEN_TO_SU_KIEN)
+TIEN_TO_SU_KIEN = "PROGRESS "
+# Kích thước tối đa (bytes) của một thông điệp JSON nhận từ dịch vụ kiểm phiếu
+KICH_THUOC_THONG_DIEP_TOI_DA = 16 * 1024 * 1024
+
+
+def dich_vu_duoc_cau_hinh():
+    """
+    Kiểm tra đã cấu hình dịch vụ kiểm phiếu (COUNTING_SERVICE_PORT) hay chưa
+    """
+    return bool(getattr(settings, 'COUNTING_SERVICE_PORT', None))
+
+
+def _ket_noi():
+    """
+    Mở kết nối tới dịch vụ kiểm phiếu, ném lỗi (ConnectionRefusedError, AuthenticationError...) nếu không kết nối được
+
+    Raises:
+        ImproperlyConfigured: Nếu chưa đặt COUNTING_SERVICE_AUTHKEY (dịch vụ không nhận kết nối không xác thực)
+    """
+    authkey = settings.COUNTING_SERVICE_AUTHKEY.encode('utf-8')
+    if not authkey:
+        raise ImproperlyConfigured('Chưa đặt COUNTING_SERVICE_AUTHKEY cho dịch vụ kiểm phiếu')
+    return Client((settings.COUNTING_SERVICE_HOST, settings.COUNTING_SERVICE_PORT), authkey=authkey)
+
+
+def _gui_json(conn, thong_diep):
+    """
+    Gửi thông điệp dạng JSON (không dùng pickle của Connection.send)
+    """
+    conn.send_bytes(json.dumps(thong_diep, ensure_ascii=False).encode('utf-8'))
+
+
+def _nhan_json(conn):
+    """
+    Nhận một thông điệp JSON từ dịch vụ
+    """
+    return json.loads(conn.recv_bytes(KICH_THUOC_THONG_DIEP_TOI_DA))
+
+
+def gui_viec_kiem_phieu(poll_id, input_dir, output_dir, danh_sach_ung_vien=None, thu_muc_cache=None, tiep_tuc=False):
+    """
+    Gửi việc kiểm phiếu cho dịch vụ đang chạy
+
+    Kết nối được mở ngay khi gọi hàm, nên nếu dịch vụ không chạy thì lỗi được ném ra
+    tại đây để view chuyển sang chạy subprocess.
+
+    Args:
+        danh_sach_ung_vien: Các cặp (candidate_id, tên) để dịch vụ gắn ung_vien_id cho từng dòng kết quả
+        thu_muc_cache: Thư mục bộ nhớ đệm kết quả theo nội dung ảnh (None để tắt)
+        tiep_tuc: Ghi sổ phiếu đã xử lý và bỏ qua phiếu đã có kết quả ở lần chạy trước
+
+    Returns:
+        Generator các thông điệp từ dịch vụ (dict có khóa 'loai': nhan_viec, các sự kiện tiến độ
+        bat_dau, bat_dau_phieu, xong_phieu, loi_phieu, ket_thuc, rồi hoan_thanh hoặc loi),
+        kết thúc sau thông điệp hoan_thanh hoặc loi
+    """
+    conn = _ket_noi()
+    try:
+        _gui_json(conn, {
+            'lenh': 'kiem_phieu',
+            'poll_id': poll_id,
+            'input_dir': input_dir,
+            'output_dir': output_dir,
+            'ung_vien': danh_sach_ung_vien,
+            'thu_muc_cache': thu_muc_cache,
+            'tiep_tuc': tiep_tuc,
+        })
+    except Exception:
+        conn.close()
+        raise
+
+    def doc_thong_diep():
+        with conn:
+            while True:
+                try:
+                    thong_diep = _nhan_json(conn)
+                except (EOFError, OSError, ValueError):
+                    # Dịch vụ bị tắt giữa chừng hoặc gửi thông điệp hỏng
+                    yield {'loai': 'loi', 'thong_bao': 'Mất kết nối tới dịch vụ kiểm phiếu'}
+                    return
+                yield thong_diep
+                if thong_diep.get('loai') in ('hoan_thanh', 'loi'):
+                    return
+
+    return doc_thong_diep()
+
+
+def _xoa_file_tam(cac_file_tam):
+    """
+    Xóa các file tạm của một lần chạy subprocess (bỏ qua file đã bị xóa)
+    """
+    for duong_dan in cac_file_tam:
+        try:
+            os.remove(duong_dan)
+        except OSError:
+            pass
+
+
+def _doc_het_stdout(proc, cac_file_tam=()):
+    """
+    Đọc bỏ phần stdout còn lại của process (tránh process bị chặn khi pipe đầy), chờ process kết thúc
+    rồi xóa các file tạm
+    """
+    for _ in proc.stdout:
+        pass
+    proc.stdout.close()
+    proc.wait()
+    _xoa_file_tam(cac_file_tam)
+
+
+def chay_subprocess_kiem_phieu(cmd, cwd, cac_file_tam=()):
+    """
+    Chạy processors.trocr_yolo (có --progress) bằng subprocess và đọc sự kiện tiến độ từ stdout
+
+    Các dòng log thường được in lại ra console của Django.
+
+    Args:
+        cac_file_tam: Các file tạm truyền cho subprocess (danh sách ứng viên...), xóa khi process kết thúc
+
+    Returns:
+        Generator các sự kiện tiến độ (cùng dạng với dịch vụ), kết thúc bằng hoan_thanh
+        hoặc loi khi process kết thúc
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED='1', PYTHONIOENCODING='utf-8')
+    try:
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                                text=True, encoding='utf-8', errors='replace', bufsize=1)
+    except Exception:
+        _xoa_file_tam(cac_file_tam)
+        raise
+    try:
+        for dong in proc.stdout:
+            # Log của worker process có thể bị ghi xen vào đầu dòng sự kiện
+            vi_tri = dong.find(TIEN_TO_SU_KIEN)
+            if vi_tri < 0:
+                print(dong, end='')
+                continue
+            if vi_tri > 0:
+                print(dong[:vi_tri])
+            try:
+                yield json.loads(dong[vi_tri + len(TIEN_TO_SU_KIEN):])
+            except ValueError:
+                print(dong[vi_tri:], end='')
+    except GeneratorExit:
+        # Trình duyệt ngắt kết nối: tiếp tục đọc stdout ở thread nền để process kiểm phiếu chạy đến hết
+        threading.Thread(target=_doc_het_stdout, args=(proc, cac_file_tam), daemon=True).start()
+        raise
+
+    proc.stdout.close()
+    ma_thoat = proc.wait()
+    _xoa_file_tam(cac_file_tam)
+    if ma_thoat == 0:
+        yield {'loai': 'hoan_thanh'}
+    else:
+        yield {'loai': 'loi', 'thong_bao': f'Quá trình kiểm phiếu kết thúc với mã lỗi {ma_thoat}'}
@@ -0,0 +1,207 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from quan_ly_phieu_bau.models import Ballot, Ballot_Selection, Candidate, Poll
+
+# Tiền tố tiêu đề của các cuộc bỏ phiếu sinh ra để đo (dùng để dọn dữ liệu)
+TIEU_DE_BENCHMARK = '[benchmark_chi_muc]'
+# Các model có chỉ mục tổng hợp khai báo trong Meta.indexes
+MODEL_CO_CHI_MUC = (Ballot, Ballot_Selection)
+
+
+class Command(BaseCommand):
+    help = ('Sinh dữ liệu phiếu giả lập và so sánh kế hoạch truy vấn, thời gian của các truy vấn '
+            'thường dùng khi không có và khi có các chỉ mục tổng hợp của Ballot/Ballot_Selection')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--so-phieu', type=int, default=1_000_000, help='Tổng số phiếu giả lập')
+        parser.add_argument('--so-cuoc', type=int, default=5, help='Số cuộc bỏ phiếu chia nhau số phiếu')
+        parser.add_argument('--so-ung-vien', type=int, default=20, help='Số ứng viên mỗi cuộc bỏ phiếu')
+        parser.add_argument('--so-lua-chon', type=int, default=3, help='Số lựa chọn tối đa trên mỗi phiếu')
+        parser.add_argument('--lo', type=int, default=5000, help='Số dòng mỗi lần bulk_create')
+        parser.add_argument('--so-lan', type=int, default=5, help='Số lần chạy mỗi truy vấn khi đo')
+        parser.add_argument('--giu-du-lieu', action='store_true', help='Không xóa dữ liệu giả lập sau khi đo')
+        parser.add_argument('--dung-lai', action='store_true',
+                            help='Dùng lại dữ liệu giả lập đã giữ từ lần chạy trước thay vì sinh mới')
+        parser.add_argument('--dong-y-ghi-csdl', action='store_true',
+                            help='Cho phép chạy khi DEBUG tắt: lệnh ghi hàng triệu phiếu giả lập vào DATABASES["default"] '
+                                 'và bỏ/tạo lại chỉ mục của bảng Ballot/Ballot_Selection')
+
+    def handle(self, *args, **options):
+        # DATABASES['default'] thường là MySQL đang chạy thật: chỉ ghi dữ liệu giả lập và đổi chỉ mục
+        # khi DEBUG bật hoặc người chạy xác nhận rõ
+        if not (settings.DEBUG or options['dong_y_ghi_csdl']):
+            raise CommandError(
+                f'Lệnh ghi dữ liệu giả lập và bỏ/tạo lại chỉ mục trên cơ sở dữ liệu '
+                f'{connection.settings_dict.get("NAME")!r} ({connection.vendor}). '
+                'Chỉ chạy trên cơ sở dữ liệu thử: bật DEBUG hoặc thêm --dong-y-ghi-csdl')
+        polls = list(Poll.objects.filter(title__startswith=TIEU_DE_BENCHMARK).order_by('poll_id'))
+        if not (options['dung_lai'] and polls):
+            polls = self.sinh_du_lieu(options)
+
+        poll = polls[0]
+        candidate = Candidate.objects.filter(poll=poll).order_by('candidate_id').first()
+        cac_truy_van = self.cac_truy_van(poll.poll_id, candidate.candidate_id)
+
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING('== Không có chỉ mục tổng hợp =='))
+            self.doi_chi_muc(bo=True)
+            truoc = self.do_cac_truy_van(cac_truy_van, options['so_lan'])
+        finally:
+            self.doi_chi_muc(bo=False)
+        self.stdout.write(self.style.MIGRATE_HEADING('== Có chỉ mục tổng hợp =='))
+        sau = self.do_cac_truy_van(cac_truy_van, options['so_lan'])
+
+        self.stdout.write(self.style.MIGRATE_HEADING('== Tóm tắt (trung vị, ms) =='))
+        for ten, _ in cac_truy_van:
+            he_so = truoc[ten] / sau[ten] if sau[ten] else float('inf')
+            self.stdout.write(f'{ten:<32} {truoc[ten]:>10.2f} -> {sau[ten]:>10.2f}  (x{he_so:.1f})')
+
+        if options['giu_du_lieu']:
+            self.stdout.write(f'[INFO] Giữ dữ liệu giả lập: poll_id {[p.poll_id for p in polls]}')
+        else:
+            self.xoa_du_lieu(polls)
+
+    def sinh_du_lieu(self, options):
+        """
+        Sinh các cuộc bỏ phiếu, ứng viên, phiếu và lựa chọn giả lập (xóa dữ liệu giả lập cũ trước)
+
+        Returns:
+            List các Poll vừa tạo
+        """
+        self.xoa_du_lieu(list(Poll.objects.filter(title__startswith=TIEU_DE_BENCHMARK)))
+        ngau_nhien = random.Random(0)
+        so_cuoc = max(1, options['so_cuoc'])
+        lo = max(1, options['lo'])
+        bat_dau = time.perf_counter()
+
+        polls = []
+        for i in range(so_cuoc):
+            polls.append(Poll.objects.create(title=f'{TIEU_DE_BENCHMARK} {i + 1}', status='benchmark'))
+        ung_vien = {}
+        for poll in polls:
+            Candidate.objects.bulk_create([
+                Candidate(poll=poll, name=f'Ứng viên {j + 1}') for j in range(options['so_ung_vien'])
+            ])
+            # bulk_create trên MySQL không trả về khóa chính nên đọc lại id
+            ung_vien[poll.poll_id] = list(Candidate.objects.filter(poll=poll).values_list('candidate_id', flat=True))
+
+        # Phiếu được chia đều theo lượt cho các cuộc bỏ phiếu để chỉ mục theo poll có tác dụng
+        moc_thoi_gian = timezone.now() - timedelta(days=1)
+        for dau_lo in range(0, options['so_phieu'], lo):
+            with transaction.atomic():
+                Ballot.objects.bulk_create([
+                    Ballot(
+                        poll=polls[k % so_cuoc],
+                        timestamp=moc_thoi_gian + timedelta(seconds=ngau_nhien.randrange(86400)),
+                        is_checked=ngau_nhien.random() < 0.8,
+                        is_valid=ngau_nhien.random() < 0.9,
+                        ballot_file_path=f'benchmark/{k}.jpg',
+                    )
+                    for k in range(dau_lo, min(dau_lo + lo, options['so_phieu']))
+                ])
+        self.stdout.write(f'[INFO] Đã tạo {options["so_phieu"]} phiếu ({time.perf_counter() - bat_dau:.1f}s)')
+
+        phieu = Ballot.objects.filter(poll__in=polls).values_list('ballot_id', 'poll_id').order_by()
+        lo_lua_chon = []
+        for ballot_id, poll_id in phieu.iterator(chunk_size=lo):
+            so_chon = ngau_nhien.randint(1, max(1, options['so_lua_chon']))
+            for candidate_id in ngau_nhien.sample(ung_vien[poll_id], min(so_chon, len(ung_vien[poll_id]))):
+                lo_lua_chon.append(Ballot_Selection(ballot_id=ballot_id, candidate_id=candidate_id))
+            if len(lo_lua_chon) >= lo:
+                Ballot_Selection.objects.bulk_create(lo_lua_chon)
+                lo_lua_chon = []
+        if lo_lua_chon:
+            Ballot_Selection.objects.bulk_create(lo_lua_chon)
+        self.stdout.write(f'[INFO] Đã tạo lựa chọn cho các phiếu ({time.perf_counter() - bat_dau:.1f}s)')
+        return polls
+
+    def xoa_du_lieu(self, polls):
+        """
+        Xóa dữ liệu giả lập bằng câu DELETE trực tiếp (tránh ORM nạp hàng triệu phiếu để xử lý cascade)
+        """
+        if not polls:
+            return
+        poll_ids = [poll.poll_id for poll in polls]
+        Ballot_Selection.objects.filter(ballot__poll_id__in=poll_ids).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {connection.ops.quote_name(Ballot._meta.db_table)} '
+                f'WHERE poll_id IN ({", ".join(["%s"] * len(poll_ids))})',
+                poll_ids
+            )
+        Poll.objects.filter(poll_id__in=poll_ids).delete()
+        self.stdout.write(f'[INFO] Đã xóa dữ liệu giả lập: poll_id {poll_ids}')
+
+    def doi_chi_muc(self, bo):
+        """
+        Bỏ (bo=True) hoặc tạo lại (bo=False) các chỉ mục tổng hợp khai báo trong Meta.indexes
+        """
+        with connection.schema_editor() as schema_editor:
+            for model in MODEL_CO_CHI_MUC:
+                for index in model._meta.indexes:
+                    if bo:
+                        schema_editor.remove_index(model, index)
+                    else:
+                        schema_editor.add_index(model, index)
+
+    def cac_truy_van(self, poll_id, candidate_id):
+        """
+        Các truy vấn nóng của views/truy_van_thong_ke/tong_hop_phieu trên một cuộc bỏ phiếu
+
+        Returns:
+            List (tên, hàm trả về QuerySet)
+        """
+        return [
+            # dem_phieu_theo_poll (thong_ke) và các bộ đếm của poll_detail
+            ('dem_phieu_theo_trang_thai', lambda: Ballot.objects.filter(poll_id=poll_id).values('poll_id').annotate(
+                total_ballots=Count('ballot_id'),
+                checked_ballots=Count('ballot_id', filter=Q(is_checked=True)),
+                valid_checked_ballots=Count('ballot_id', filter=Q(is_checked=True, is_valid=True)),
+            ).order_by()),
+            # tinh_lai_tong_hop: số phiếu đã kiểm và hợp lệ
+            ('dem_phieu_hop_le_da_kiem', lambda: Ballot.objects.filter(
+                poll_id=poll_id, is_valid=True, is_checked=True
+            ).values('poll_id').annotate(so=Count('ballot_id')).order_by()),
+            # ballot_list / ballot_view: trang đầu danh sách phiếu theo thời gian
+            ('trang_phieu_theo_thoi_gian', lambda: Ballot.objects.filter(poll_id=poll_id).order_by(
+                'timestamp', 'ballot_id'
+            ).values('ballot_id', 'timestamp')[:50]),
+            # tinh_lai_tong_hop: lượt chọn của từng ứng viên trên phiếu đã kiểm và hợp lệ
+            ('luot_chon_theo_ung_vien', lambda: Candidate.objects.filter(poll_id=poll_id).annotate(
+                so=Count('ballot_selection', filter=Q(ballot_selection__ballot__is_valid=True,
+                                                      ballot_selection__ballot__is_checked=True))
+            ).values_list('candidate_id', 'so')),
+            # Số phiếu chọn một ứng viên
+            ('phieu_chon_mot_ung_vien', lambda: Ballot_Selection.objects.filter(
+                candidate_id=candidate_id
+            ).values('candidate_id').annotate(so=Count('ballot_id')).order_by()),
+        ]
+
+    def do_cac_truy_van(self, cac_truy_van, so_lan):
+        """
+        In kế hoạch truy vấn (EXPLAIN) và đo thời gian chạy của từng truy vấn
+
+        Returns:
+            Dict tên truy vấn -> thời gian trung vị (ms)
+        """
+        ket_qua = {}
+        for ten, tao_truy_van in cac_truy_van:
+            self.stdout.write(self.style.SQL_TABLE(f'-- {ten}'))
+            self.stdout.write(tao_truy_van().explain())
+            thoi_gian = []
+            for _ in range(max(1, so_lan)):
+                bat_dau = time.perf_counter()
+                list(tao_truy_van())
+                thoi_gian.append((time.perf_counter() - bat_dau) * 1000)
+            ket_qua[ten] = statistics.median(thoi_gian)
+            self.stdout.write(f'   min {min(thoi_gian):.2f} ms, trung vị {ket_qua[ten]:.2f} ms')
+        return ket_qua
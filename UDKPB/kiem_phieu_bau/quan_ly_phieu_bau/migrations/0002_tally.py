@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def tinh_tong_hop_ban_dau(apps, schema_editor):
+    """
+    Tính bảng tổng hợp từ dữ liệu kiểm phiếu đã có
+    """
+    Poll = apps.get_model('quan_ly_phieu_bau', 'Poll')
+    Candidate = apps.get_model('quan_ly_phieu_bau', 'Candidate')
+    Poll_Tally = apps.get_model('quan_ly_phieu_bau', 'Poll_Tally')
+    Candidate_Tally = apps.get_model('quan_ly_phieu_bau', 'Candidate_Tally')
+
+    polls = Poll.objects.annotate(
+        so_hop_le=Count('ballot', filter=Q(ballot__is_valid=True, ballot__is_checked=True)),
+        so_khong_hop_le=Count('ballot', filter=Q(ballot__is_valid=False)),
+    )
+    Poll_Tally.objects.bulk_create([
+        Poll_Tally(poll_id=poll.poll_id, valid_ballots=poll.so_hop_le, invalid_ballots=poll.so_khong_hop_le)
+        for poll in polls
+    ], batch_size=500)
+
+    candidates = Candidate.objects.filter(poll__isnull=False).annotate(
+        so_luot=Count('ballot_selection', filter=Q(ballot_selection__ballot__is_valid=True,
+                                                   ballot_selection__ballot__is_checked=True)),
+    )
+    Candidate_Tally.objects.bulk_create([
+        Candidate_Tally(candidate_id=c.candidate_id, poll_id=c.poll_id, selection_count=c.so_luot)
+        for c in candidates
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quan_ly_phieu_bau', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Poll_Tally',
+            fields=[
+                ('poll', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='tally', serialize=False, to='quan_ly_phieu_bau.poll')),
+                ('valid_ballots', models.IntegerField(default=0)),
+                ('invalid_ballots', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Candidate_Tally',
+            fields=[
+                ('candidate', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='tally', serialize=False, to='quan_ly_phieu_bau.candidate')),
+                ('selection_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quan_ly_phieu_bau.poll')),
+            ],
+        ),
+        migrations.RunPython(tinh_tong_hop_ban_dau, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quan_ly_phieu_bau', '0002_tally'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ballot',
+            index=models.Index(fields=['poll', 'is_valid', 'is_checked'], name='ballot_poll_valid_checked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ballot',
+            index=models.Index(fields=['poll', 'timestamp'], name='ballot_poll_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ballot_selection',
+            index=models.Index(fields=['candidate', 'ballot'], name='selection_candidate_ballot_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:51
+
+import os
+import shutil
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _doi_ten_file(ballot, ten_moi, duong_dan_da_dung):
+    """
+    Đổi tên file ảnh của phiếu theo khóa mới (sao chép nếu phiếu khác cũng dùng file này), trả về đường dẫn tương đối mới
+    """
+    goc = os.path.join(settings.MEDIA_ROOT, ballot.ballot_file_path)
+    if not os.path.exists(goc):
+        return ballot.ballot_file_path
+    moi = os.path.join(os.path.dirname(goc), ten_moi + os.path.splitext(goc)[1])
+    if os.path.exists(moi):
+        return ballot.ballot_file_path
+    if ballot.ballot_file_path in duong_dan_da_dung:
+        shutil.copyfile(goc, moi)
+    else:
+        os.replace(goc, moi)
+    return os.path.relpath(moi, settings.MEDIA_ROOT)
+
+
+def gan_ballot_key(apps, schema_editor):
+    """
+    Gán ballot_key cho các phiếu đã có; trùng tên trong cùng cuộc bỏ phiếu thì phiếu đầu tiên
+    giữ khóa (như cách gắn kết quả kiểm phiếu trước đây), các phiếu còn lại được đổi thành ten_2, ten_3...
+    (đổi tên cả file ảnh) để phiếu nào cũng có khóa và gắn được kết quả kiểm phiếu
+    """
+    Ballot = apps.get_model('quan_ly_phieu_bau', 'Ballot')
+    da_dung = set()
+    duong_dan_da_dung = set()
+    bi_trung = []
+    lo = []
+    for ballot in Ballot.objects.exclude(ballot_file_path=None).only('ballot_id', 'poll_id', 'ballot_file_path').order_by('ballot_id').iterator(chunk_size=2000):
+        ten = unicodedata.normalize('NFC', os.path.splitext(os.path.basename(ballot.ballot_file_path))[0])
+        if not ten:
+            continue
+        if (ballot.poll_id, ten) in da_dung:
+            bi_trung.append((ballot, ten))
+            continue
+        da_dung.add((ballot.poll_id, ten))
+        duong_dan_da_dung.add(ballot.ballot_file_path)
+        ballot.ballot_key = ten
+        lo.append(ballot)
+        if len(lo) >= 2000:
+            Ballot.objects.bulk_update(lo, ['ballot_key'])
+            lo = []
+    if lo:
+        Ballot.objects.bulk_update(lo, ['ballot_key'])
+
+    # Các khóa gốc đã được gán hết nên hậu tố mới không trùng khóa của phiếu khác
+    for ballot, ten in bi_trung:
+        so = 2
+        while (ballot.poll_id, f'{ten}_{so}') in da_dung:
+            so += 1
+        ballot.ballot_key = f'{ten}_{so}'
+        da_dung.add((ballot.poll_id, ballot.ballot_key))
+        ballot.ballot_file_path = _doi_ten_file(ballot, ballot.ballot_key, duong_dan_da_dung)
+        ballot.save(update_fields=['ballot_key', 'ballot_file_path'])
+        print(f"[WARNING] Phiếu {ballot.ballot_id} trùng tên '{ten}' trong cuộc bỏ phiếu {ballot.poll_id}, đổi khóa thành '{ballot.ballot_key}'")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quan_ly_phieu_bau', '0003_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ballot',
+            name='ballot_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(gan_ballot_key, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ballot',
+            constraint=models.UniqueConstraint(fields=('poll', 'ballot_key'), name='ballot_poll_key_uniq'),
+        ),
+    ]
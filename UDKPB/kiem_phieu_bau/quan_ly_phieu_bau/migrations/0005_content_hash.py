@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quan_ly_phieu_bau', '0004_ballot_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ballot',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ballot',
+            index=models.Index(fields=['poll', 'content_hash'], name='ballot_poll_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:59
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def danh_dau_phieu_da_kiem(apps, schema_editor):
+    """
+    Đánh dấu các phiếu đã có kết quả kiểm (cuộc bỏ phiếu đã kiểm, phiếu đã kiểm hoặc không hợp lệ)
+    là đã kiểm: dùng content_hash nếu có, không thì '' (không rõ ảnh lúc kiểm), để lần kiểm bổ sung
+    đầu tiên không ghi đè kết quả cũ
+    """
+    Ballot = apps.get_model('quan_ly_phieu_bau', 'Ballot')
+    da_kiem = Ballot.objects.filter(poll__status='counted').filter(Q(is_checked=True) | Q(is_valid=False))
+    da_kiem.filter(content_hash__isnull=False).update(counted_hash=models.F('content_hash'))
+    da_kiem.filter(content_hash__isnull=True).update(counted_hash='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quan_ly_phieu_bau', '0005_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ballot',
+            name='counted_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(danh_dau_phieu_da_kiem, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quan_ly_phieu_bau', '0006_counted_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ballot',
+            name='counted_version',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import os
+import unicodedata
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 # Bảng tài khoản kế thừa User của Django
@@ -46,9 +48,62 @@ class Ballot(models.Model): # phiếu bầu
 	is_valid = models.BooleanField(default=True)  # Hợp lệ không
 	ballot_file_path = models.CharField(max_length=512, null=True)  # Đường dẫn đến file lá phiếu
 	metadata = models.JSONField(null=True)  # Thông tin mở rộng
+	ballot_key = models.CharField(max_length=255, null=True, blank=True)  # Tên phiếu chuẩn hóa (tên file bỏ phần mở rộng), duy nhất trong cuộc bỏ phiếu
+	content_hash = models.CharField(max_length=64, null=True, blank=True)  # SHA-256 nội dung file ảnh (bỏ qua ảnh trùng khi tải lên)
+	counted_hash = models.CharField(max_length=64, null=True, blank=True)  # SHA-256 của ảnh đã được lưu kết quả kiểm phiếu (None: chưa kiểm, '': đã kiểm trước khi có cột này)
+	counted_version = models.CharField(max_length=64, null=True, blank=True)  # Phiên bản kiểm phiếu (model, layout, danh sách ứng viên) của kết quả đã lưu, theo sổ ghi của bên kiểm phiếu
+
+	class Meta:
+		indexes = [
+			# Lọc/đếm phiếu theo cuộc bỏ phiếu và trạng thái hợp lệ, đã kiểm
+			models.Index(fields=['poll', 'is_valid', 'is_checked'], name='ballot_poll_valid_checked_idx'),
+			# Danh sách phiếu của cuộc bỏ phiếu sắp xếp theo thời gian
+			models.Index(fields=['poll', 'timestamp'], name='ballot_poll_timestamp_idx'),
+			# Tìm ảnh trùng nội dung trong cuộc bỏ phiếu
+			models.Index(fields=['poll', 'content_hash'], name='ballot_poll_hash_idx'),
+		]
+		constraints = [
+			# Tra phiếu theo tên (ví dụ khi gắn file kết quả kiểm phiếu) bằng chỉ mục duy nhất
+			models.UniqueConstraint(fields=['poll', 'ballot_key'], name='ballot_poll_key_uniq'),
+		]
+
+	@staticmethod
+	def tao_ballot_key(duong_dan):
+		"""
+		Tạo khóa phiếu từ đường dẫn hoặc tên file: bỏ thư mục và phần mở rộng, chuẩn hóa Unicode NFC
+		(ví dụ '1/ballot_1.jpg' -> 'ballot_1', trùng với tên file kết quả kiểm phiếu 'ballot_1.json')
+		"""
+		if not duong_dan:
+			return None
+		ten = os.path.splitext(os.path.basename(duong_dan))[0]
+		return unicodedata.normalize('NFC', ten) or None
+
+	@property
+	def ballot_name(self):
+		# Tên hiển thị của phiếu bầu
+		return self.ballot_key or self.tao_ballot_key(self.ballot_file_path)
 
 # Bảng lưu lựa chọn của từng phiếu bầu
 class Ballot_Selection(models.Model):
 	selection_id = models.AutoField(primary_key=True)  # Mã lựa chọn
 	ballot = models.ForeignKey(Ballot, on_delete=models.CASCADE, null=True)  # Phiếu bầu
-	candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE, null=True)  # Ứng cử viên được chọn
\ No newline at end of file
+	candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE, null=True)  # Ứng cử viên được chọn
+
+	class Meta:
+		indexes = [
+			# Đếm lượt chọn theo ứng viên (join sang phiếu bằng ballot_id có sẵn trong chỉ mục)
+			models.Index(fields=['candidate', 'ballot'], name='selection_candidate_ballot_idx'),
+		]
+# Bảng tổng hợp số lượt chọn của từng ứng viên (cập nhật dần khi kiểm phiếu, chỉ tính phiếu đã kiểm và hợp lệ)
+class Candidate_Tally(models.Model):
+	candidate = models.OneToOneField(Candidate, on_delete=models.CASCADE, primary_key=True, related_name='tally')  # Ứng cử viên
+	poll = models.ForeignKey(Poll, on_delete=models.CASCADE)  # Thuộc cuộc bỏ phiếu
+	selection_count = models.IntegerField(default=0)  # Số lượt được chọn
+	updated_at = models.DateTimeField(auto_now=True)  # Thời gian cập nhật
+
+# Bảng tổng hợp số phiếu hợp lệ/không hợp lệ của từng cuộc bỏ phiếu
+class Poll_Tally(models.Model):
+	poll = models.OneToOneField(Poll, on_delete=models.CASCADE, primary_key=True, related_name='tally')  # Cuộc bỏ phiếu
+	valid_ballots = models.IntegerField(default=0)  # Số phiếu đã kiểm và hợp lệ
+	invalid_ballots = models.IntegerField(default=0)  # Số phiếu không hợp lệ
+	updated_at = models.DateTimeField(auto_now=True)  # Thời gian cập nhật
@@ -0,0 +1,104 @@
+import json
+import base64
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import Ballot
+
+# Số phiếu mỗi trang của danh sách phiếu bầu
+KICH_THUOC_TRANG = 50
+KICH_THUOC_TRANG_TOI_DA = 200
+# Các cột cần cho danh sách phiếu (không nạp metadata)
+COT_DANH_SACH_PHIEU = ('ballot_id', 'poll_id', 'timestamp', 'ballot_file_path', 'ballot_key', 'is_checked', 'is_valid')
+
+
+def ma_hoa_con_tro(ballot, so_da_hien_thi):
+    """
+    Mã hóa vị trí phiếu cuối trang (timestamp, ballot_id) và số phiếu đã hiển thị thành chuỗi con trỏ
+    """
+    du_lieu = {
+        't': ballot.timestamp.isoformat() if ballot.timestamp else None,
+        'id': ballot.ballot_id,
+        'n': so_da_hien_thi,
+    }
+    return base64.urlsafe_b64encode(json.dumps(du_lieu).encode('utf-8')).decode('ascii')
+
+
+def giai_ma_con_tro(con_tro):
+    """
+    Giải mã chuỗi con trỏ
+
+    Returns:
+        Tuple (timestamp hoặc None, ballot_id, số phiếu đã hiển thị)
+
+    Raises:
+        ValueError: Nếu con trỏ không hợp lệ
+    """
+    try:
+        du_lieu = json.loads(base64.urlsafe_b64decode(con_tro.encode('ascii')))
+        timestamp = parse_datetime(du_lieu['t']) if du_lieu['t'] else None
+        if du_lieu['t'] and timestamp is None:
+            raise ValueError(du_lieu['t'])
+        return timestamp, int(du_lieu['id']), int(du_lieu.get('n', 0))
+    except (TypeError, KeyError, UnicodeError, ValueError) as e:
+        raise ValueError(f'Con trỏ phân trang không hợp lệ: {con_tro}') from e
+
+
+def _sau_con_tro(timestamp, ballot_id):
+    """
+    Điều kiện lấy các phiếu đứng sau vị trí (timestamp, ballot_id) theo thứ tự (timestamp, ballot_id)
+
+    Vị trí của phiếu chưa có timestamp (NULL) theo thứ tự mặc định của database:
+    đứng đầu trên MySQL/SQLite, đứng cuối trên PostgreSQL/Oracle.
+    """
+    null_dung_cuoi = connection.features.nulls_order_largest
+    if timestamp is None:
+        dieu_kien = Q(timestamp__isnull=True, ballot_id__gt=ballot_id)
+        if not null_dung_cuoi:
+            dieu_kien |= Q(timestamp__isnull=False)
+    else:
+        dieu_kien = Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, ballot_id__gt=ballot_id)
+        if null_dung_cuoi:
+            dieu_kien |= Q(timestamp__isnull=True)
+    return dieu_kien
+
+
+def lay_trang_phieu(poll_id, filter_type=None, con_tro=None, kich_thuoc=KICH_THUOC_TRANG):
+    """
+    Lấy một trang phiếu bầu của cuộc bỏ phiếu theo con trỏ (keyset) trên (timestamp, ballot_id),
+    chi phí mỗi trang không phụ thuộc số phiếu của cuộc bỏ phiếu (dùng chỉ mục (poll, timestamp))
+
+    Args:
+        filter_type: 'valid', 'invalid' hoặc None (tất cả)
+        con_tro: Chuỗi con trỏ của trang trước (None để lấy trang đầu)
+        kich_thuoc: Số phiếu mỗi trang
+
+    Returns:
+        Tuple (list Ballot có thêm thuộc tính so_thu_tu, con trỏ trang sau hoặc None)
+
+    Raises:
+        ValueError: Nếu con trỏ không hợp lệ
+    """
+    kich_thuoc = max(1, min(kich_thuoc, KICH_THUOC_TRANG_TOI_DA))
+    ballots = Ballot.objects.filter(poll_id=poll_id).only(*COT_DANH_SACH_PHIEU)
+    if filter_type == 'valid':
+        ballots = ballots.filter(is_valid=True)
+    elif filter_type == 'invalid':
+        ballots = ballots.filter(is_valid=False)
+
+    so_da_hien_thi = 0
+    if con_tro:
+        timestamp, ballot_id, so_da_hien_thi = giai_ma_con_tro(con_tro)
+        ballots = ballots.filter(_sau_con_tro(timestamp, ballot_id))
+
+    # Lấy thừa một phiếu để biết còn trang sau hay không
+    trang = list(ballots.order_by('timestamp', 'ballot_id')[:kich_thuoc + 1])
+    con_trang_sau = len(trang) > kich_thuoc
+    trang = trang[:kich_thuoc]
+    for i, ballot in enumerate(trang, start=so_da_hien_thi + 1):
+        ballot.so_thu_tu = i
+
+    con_tro_sau = ma_hoa_con_tro(trang[-1], so_da_hien_thi + len(trang)) if con_trang_sau else None
+    return trang, con_tro_sau
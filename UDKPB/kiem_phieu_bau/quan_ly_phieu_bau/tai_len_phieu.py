@@ -0,0 +1,273 @@
+import os
+import uuid
+import shutil
+import hashlib
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Ballot
+from .tong_hop_phieu import dat_lai_ket_qua_phieu
+
+# Phần mở rộng ảnh phiếu bầu được lấy ra từ file ZIP
+DUOI_ANH_PHIEU = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+# Kích thước mỗi lần đọc khi ghi file và tính hash
+KICH_THUOC_DOC = 64 * 1024
+# Số dòng mỗi lần bulk_create/bulk_update phiếu bầu
+KICH_THUOC_LO_TAO_PHIEU = 500
+# Giới hạn của một file ZIP tải lên: số mục trong ZIP và tổng kích thước ảnh sau giải nén
+SO_MUC_ZIP_TOI_DA = 20000
+KICH_THUOC_GIAI_NEN_TOI_DA = 4 * 1024 ** 3
+
+
+class LoiTaiLen(ValueError):
+    """
+    File tải lên không hợp lệ (ZIP hỏng hoặc vượt giới hạn), thông báo hiển thị được cho người dùng
+    """
+
+
+def la_file_zip(f):
+    """
+    Kiểm tra file tải lên có phải file ZIP hay không (theo tên file)
+    """
+    return f.name.lower().endswith('.zip')
+
+
+def ghi_file_va_bam(cac_doan, duong_dan):
+    """
+    Ghi dữ liệu ra file theo từng đoạn, đồng thời tính SHA-256 (không giữ cả file trong bộ nhớ)
+
+    Args:
+        cac_doan: Iterable các đoạn bytes
+        duong_dan: Đường dẫn file cần ghi
+
+    Returns:
+        Chuỗi hex SHA-256 của nội dung file
+    """
+    bam = hashlib.sha256()
+    with open(duong_dan, 'wb') as destination:
+        for doan in cac_doan:
+            bam.update(doan)
+            destination.write(doan)
+    return bam.hexdigest()
+
+
+def xoa_file_neu_co(duong_dan):
+    """
+    Xóa file nếu còn tồn tại (bỏ qua lỗi, ví dụ file đã bị xóa)
+    """
+    try:
+        os.remove(duong_dan)
+    except OSError:
+        pass
+
+
+def _doc_theo_doan(f):
+    """
+    Đọc file-like object theo từng đoạn KICH_THUOC_DOC
+    """
+    while True:
+        doan = f.read(KICH_THUOC_DOC)
+        if not doan:
+            return
+        yield doan
+
+
+def cac_file_trong_zip(f):
+    """
+    Duyệt các ảnh phiếu bầu trong file ZIP tải lên mà không giải nén cả file vào bộ nhớ
+
+    Bỏ qua thư mục, file ẩn/siêu dữ liệu (__MACOSX) và file không phải ảnh; chỉ giữ tên file
+    (bỏ đường dẫn trong ZIP) để không ghi ra ngoài thư mục của cuộc bỏ phiếu.
+
+    Returns:
+        Generator các cặp (tên file, generator các đoạn bytes của file)
+
+    Raises:
+        LoiTaiLen: File không phải ZIP hợp lệ, hoặc vượt SO_MUC_ZIP_TOI_DA / KICH_THUOC_GIAI_NEN_TOI_DA
+            (kiểm tra trước khi đọc file nào)
+    """
+    try:
+        zf = zipfile.ZipFile(f)
+    except zipfile.BadZipFile:
+        raise LoiTaiLen('File ZIP không hợp lệ!')
+    with zf:
+        cac_muc = zf.infolist()
+        if len(cac_muc) > SO_MUC_ZIP_TOI_DA:
+            raise LoiTaiLen(f'File ZIP có quá nhiều file (tối đa {SO_MUC_ZIP_TOI_DA})!')
+        cac_anh = []
+        for info in cac_muc:
+            ten = os.path.basename(info.filename.replace('\\', '/'))
+            if info.is_dir() or not ten or ten.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            if not ten.lower().endswith(DUOI_ANH_PHIEU):
+                continue
+            cac_anh.append((ten, info))
+        # zipfile không giải nén quá kích thước khai báo của mỗi file nên tổng kích thước khai báo là giới hạn thật
+        if sum(info.file_size for _, info in cac_anh) > KICH_THUOC_GIAI_NEN_TOI_DA:
+            raise LoiTaiLen(f'Ảnh trong file ZIP sau giải nén vượt quá {KICH_THUOC_GIAI_NEN_TOI_DA // 1024 ** 2} MB!')
+        for ten, info in cac_anh:
+            with zf.open(info) as entry:
+                yield ten, _doc_theo_doan(entry)
+
+
+def cac_file_tai_len(files):
+    """
+    Chuẩn hóa danh sách file tải lên (ảnh hoặc file ZIP chứa ảnh) thành các cặp (tên file, các đoạn bytes)
+    """
+    for f in files:
+        if la_file_zip(f):
+            yield from cac_file_trong_zip(f)
+        else:
+            yield f.name, f.chunks()
+
+
+def _ghi_file_tam(cac_file, thu_muc_tam, hash_da_co):
+    """
+    Ghi tất cả file tải lên vào thư mục tạm (chưa đụng tới ảnh đang có), bỏ qua ảnh trùng nội dung
+
+    Returns:
+        Tuple (dict ballot_key -> (tên file, file tạm, hash), số ảnh trùng nội dung)
+    """
+    cac_file_tam = {}
+    trung_lap = 0
+    try:
+        for ten, cac_doan in cac_file:
+            ballot_key = Ballot.tao_ballot_key(ten)
+            if not ballot_key:
+                continue
+            file_tam = os.path.join(thu_muc_tam, uuid.uuid4().hex)
+            content_hash = ghi_file_va_bam(cac_doan, file_tam)
+            if content_hash in hash_da_co:
+                os.remove(file_tam)
+                trung_lap += 1
+                continue
+            hash_da_co.add(content_hash)
+            # Nhiều file cùng khóa phiếu trong một lần tải lên: giữ file sau cùng
+            if ballot_key in cac_file_tam:
+                _, file_bo, hash_bo = cac_file_tam.pop(ballot_key)
+                os.remove(file_bo)
+                hash_da_co.discard(hash_bo)
+            cac_file_tam[ballot_key] = (ten, file_tam, content_hash)
+    except zipfile.BadZipFile as e:
+        # Lỗi CRC hoặc dữ liệu nén hỏng khi đọc một file trong ZIP
+        raise LoiTaiLen(f'File ZIP không hợp lệ: {e}')
+    return cac_file_tam, trung_lap
+
+
+def _dua_file_vao(cac_file):
+    """
+    Đổi tên các file tạm thành ảnh phiếu; ảnh cũ cùng tên được chuyển sang file sao lưu.
+    Lỗi giữa chừng thì trả lại ảnh cũ cho các file đã đổi rồi ném lại lỗi.
+
+    Args:
+        cac_file: List (file tạm, đường dẫn ảnh phiếu)
+    """
+    da_dua = []
+    try:
+        for file_tam, dich in cac_file:
+            sao_luu = None
+            if os.path.exists(dich):
+                sao_luu = file_tam + '.cu'
+                os.replace(dich, sao_luu)
+            da_dua.append((dich, sao_luu))
+            os.replace(file_tam, dich)
+    except BaseException:
+        for dich, sao_luu in reversed(da_dua):
+            if sao_luu:
+                os.replace(sao_luu, dich)
+            else:
+                xoa_file_neu_co(dich)
+        raise
+
+
+def _don_dep_sau_tai_len(thu_muc_tam, cac_file_cu):
+    """
+    Xóa thư mục tạm (kèm ảnh cũ đã sao lưu) và ảnh cũ khác tên của các phiếu đã đổi ảnh
+    """
+    shutil.rmtree(thu_muc_tam, ignore_errors=True)
+    for duong_dan in cac_file_cu:
+        xoa_file_neu_co(duong_dan)
+
+
+def luu_phieu_tai_len(poll, files):
+    """
+    Lưu các file phiếu bầu tải lên: ghi file kèm tính hash, bỏ qua ảnh trùng nội dung,
+    tạo phiếu mới bằng bulk_create và cập nhật phiếu đã có cùng tên bằng bulk_update (phiếu đổi ảnh
+    được bỏ kết quả kiểm cũ để kiểm lại)
+
+    Các file được ghi vào thư mục tạm trước; chỉ khi đọc xong tất cả mới ghi database và đưa ảnh
+    vào thư mục cuộc bỏ phiếu trong cùng transaction, nên lỗi giữa chừng không để lại phiếu hay ảnh dở dang.
+
+    Args:
+        poll: Cuộc bỏ phiếu
+        files: Danh sách UploadedFile (ảnh hoặc file ZIP chứa ảnh)
+
+    Returns:
+        Dict số file: them_moi (phiếu mới), cap_nhat (ghi đè phiếu cùng tên), trung_lap (ảnh trùng nội dung bị bỏ qua)
+
+    Raises:
+        LoiTaiLen: File ZIP không hợp lệ hoặc vượt giới hạn
+    """
+    poll_dir = os.path.join(settings.MEDIA_ROOT, str(poll.poll_id))
+    os.makedirs(poll_dir, exist_ok=True)
+
+    # Hash và khóa của các phiếu đã có trong cuộc bỏ phiếu (một truy vấn)
+    da_co = {}
+    hash_da_co = set()
+    cac_truong = ('ballot_id', 'poll_id', 'ballot_key', 'content_hash', 'ballot_file_path',
+                  'is_checked', 'is_valid', 'counted_hash', 'counted_version')
+    for ballot in Ballot.objects.filter(poll=poll).only(*cac_truong):
+        if ballot.ballot_key:
+            da_co[ballot.ballot_key] = ballot
+        if ballot.content_hash:
+            hash_da_co.add(ballot.content_hash)
+
+    # Thư mục tạm nằm trong thư mục cuộc bỏ phiếu để đổi tên file không phải sao chép giữa ổ đĩa
+    thu_muc_tam = tempfile.mkdtemp(prefix='.tai_len_', dir=poll_dir)
+    try:
+        cac_file_tam, trung_lap = _ghi_file_tam(cac_file_tai_len(files), thu_muc_tam, hash_da_co)
+
+        # Thời điểm tải lên của các phiếu mới (danh sách phiếu sắp xếp và phân trang theo timestamp)
+        thoi_diem_tai_len = timezone.now()
+        phieu_moi = []
+        phieu_cap_nhat = []
+        cac_file = []
+        cac_file_cu = []
+        for ballot_key, (ten, file_tam, content_hash) in cac_file_tam.items():
+            file_path = os.path.join(poll_dir, ten)
+            rel_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
+            cac_file.append((file_tam, file_path))
+
+            # Tải lại file cùng tên thì ghi đè ảnh, giữ phiếu đã có (khóa phiếu duy nhất trong cuộc bỏ phiếu)
+            ballot = da_co.get(ballot_key)
+            if ballot is None:
+                phieu_moi.append(Ballot(poll=poll, ballot_key=ballot_key, ballot_file_path=rel_path,
+                                        content_hash=content_hash, timestamp=thoi_diem_tai_len))
+                continue
+            if ballot.ballot_file_path and ballot.ballot_file_path != rel_path:
+                cac_file_cu.append(os.path.join(settings.MEDIA_ROOT, ballot.ballot_file_path))
+            ballot.ballot_file_path = rel_path
+            ballot.content_hash = content_hash
+            phieu_cap_nhat.append(ballot)
+        # Ảnh cũ khác tên không được trùng ảnh vừa tải lên (phiếu khác có thể đã đổi sang tên đó)
+        cac_dich = {dich for _, dich in cac_file}
+        cac_file_cu = [duong_dan for duong_dan in cac_file_cu if duong_dan not in cac_dich]
+
+        with transaction.atomic():
+            Ballot.objects.bulk_create(phieu_moi, batch_size=KICH_THUOC_LO_TAO_PHIEU)
+            # Ảnh mới khác nội dung ảnh cũ (ảnh trùng đã bị bỏ qua): lựa chọn và trạng thái kiểm cũ không còn đúng
+            dat_lai_ket_qua_phieu(phieu_cap_nhat)
+            Ballot.objects.bulk_update(phieu_cap_nhat, ['ballot_file_path', 'content_hash'], batch_size=KICH_THUOC_LO_TAO_PHIEU)
+            # Đưa ảnh vào sau cùng: lỗi khi đổi tên file thì ảnh cũ được trả lại và database được rollback
+            _dua_file_vao(cac_file)
+    except BaseException:
+        shutil.rmtree(thu_muc_tam, ignore_errors=True)
+        raise
+
+    # Ảnh cũ chỉ bị xóa khi phiếu đã được lưu (transaction của request, nếu có, đã commit)
+    transaction.on_commit(lambda: _don_dep_sau_tai_len(thu_muc_tam, cac_file_cu))
+    return {'them_moi': len(phieu_moi), 'cap_nhat': len(phieu_cap_nhat), 'trung_lap': trung_lap}
@@ -0,0 +1,24 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase, override_settings
+
+from quan_ly_phieu_bau.models import Ballot, Poll
+
+
+class BenchmarkChiMucTest(TransactionTestCase):
+	# Lệnh bỏ/tạo lại chỉ mục bằng schema_editor, không chạy được trong transaction của TestCase
+	@override_settings(DEBUG=False)
+	def test_tu_choi_khi_chua_xac_nhan(self):
+		with self.assertRaises(CommandError):
+			call_command('benchmark_chi_muc', so_phieu=10)
+		self.assertFalse(Poll.objects.exists())
+
+	@override_settings(DEBUG=False)
+	def test_chay_khi_xac_nhan(self):
+		call_command('benchmark_chi_muc', so_phieu=50, so_cuoc=2, so_ung_vien=3, so_lan=1, dong_y_ghi_csdl=True,
+					 stdout=StringIO())
+		# Dữ liệu giả lập được xóa sau khi đo
+		self.assertFalse(Poll.objects.exists())
+		self.assertFalse(Ballot.objects.exists())
@@ -0,0 +1,48 @@
+import json
+import threading
+from multiprocessing.connection import Listener
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from quan_ly_phieu_bau.dich_vu_kiem_phieu import gui_viec_kiem_phieu
+
+KHOA = 'khoa-kiem-thu'
+
+
+class GuiViecKiemPhieuTest(SimpleTestCase):
+	def chay_dich_vu_gia(self, thong_diep_tra_ve):
+		# Dịch vụ giả: nhận một việc dạng JSON rồi trả lần lượt các thông điệp JSON
+		listener = Listener(('127.0.0.1', 0), authkey=KHOA.encode('utf-8'))
+		self.addCleanup(listener.close)
+		viec_nhan_duoc = []
+
+		def phuc_vu():
+			with listener.accept() as conn:
+				viec_nhan_duoc.append(json.loads(conn.recv_bytes()))
+				for thong_diep in thong_diep_tra_ve:
+					conn.send_bytes(json.dumps(thong_diep).encode('utf-8'))
+
+		thread = threading.Thread(target=phuc_vu, daemon=True)
+		thread.start()
+		self.addCleanup(thread.join, 5)
+		return listener.address[1], viec_nhan_duoc
+
+	def test_trao_doi_json(self):
+		port, viec_nhan_duoc = self.chay_dich_vu_gia([{'loai': 'nhan_viec'}, {'loai': 'hoan_thanh', 'so_phieu': 2}])
+		with override_settings(COUNTING_SERVICE_HOST='127.0.0.1', COUNTING_SERVICE_PORT=port, COUNTING_SERVICE_AUTHKEY=KHOA):
+			thong_diep = list(gui_viec_kiem_phieu(1, '/media/1', '/media/1', [(5, 'Nguyễn Văn A')], tiep_tuc=True))
+		self.assertEqual([t['loai'] for t in thong_diep], ['nhan_viec', 'hoan_thanh'])
+		self.assertEqual(viec_nhan_duoc[0]['lenh'], 'kiem_phieu')
+		self.assertEqual(viec_nhan_duoc[0]['ung_vien'], [[5, 'Nguyễn Văn A']])
+
+	def test_mat_ket_noi_giua_chung(self):
+		port, _ = self.chay_dich_vu_gia([{'loai': 'nhan_viec'}])
+		with override_settings(COUNTING_SERVICE_HOST='127.0.0.1', COUNTING_SERVICE_PORT=port, COUNTING_SERVICE_AUTHKEY=KHOA):
+			thong_diep = list(gui_viec_kiem_phieu(1, '/media/1', '/media/1'))
+		self.assertEqual(thong_diep[-1]['loai'], 'loi')
+
+	@override_settings(COUNTING_SERVICE_HOST='127.0.0.1', COUNTING_SERVICE_PORT=6070, COUNTING_SERVICE_AUTHKEY='')
+	def test_thieu_khoa_xac_thuc(self):
+		with self.assertRaises(ImproperlyConfigured):
+			gui_viec_kiem_phieu(1, '/media/1', '/media/1')
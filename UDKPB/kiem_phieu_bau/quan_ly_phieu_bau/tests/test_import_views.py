@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+
+class ImportViewsTest(SimpleTestCase):
+	def test_import_views_khong_can_pythonpath(self):
+		# Web chạy như khi triển khai: không có thư mục UDKPB trong PYTHONPATH, settings tự thêm vào sys.path
+		moi_truong = {k: v for k, v in os.environ.items() if k != 'PYTHONPATH'}
+		moi_truong.update(DJANGO_SETTINGS_MODULE='kiem_phieu_bau.settings', SECRET_KEY=settings.SECRET_KEY,
+						  DB_ENGINE='django.db.backends.sqlite3', DB_NAME='khong_dung.sqlite3')
+		ket_qua = subprocess.run([sys.executable, '-c', 'import django; django.setup(); import quan_ly_phieu_bau.views'],
+								 cwd=settings.BASE_DIR, env=moi_truong, capture_output=True, text=True, timeout=120)
+		self.assertEqual(ket_qua.returncode, 0, ket_qua.stderr)
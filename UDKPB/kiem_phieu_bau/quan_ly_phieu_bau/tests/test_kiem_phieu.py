@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from quan_ly_phieu_bau.models import Ballot, Ballot_Selection, Candidate, Candidate_Tally, Poll
+from quan_ly_phieu_bau.views import counting_stream_generator, luu_thong_tin_kiem_phieu
+
+TEN_FILE_SO_GHI = 'so_ghi_kiem_phieu.jsonl'
+
+
+class KiemPhieuTest(TestCase):
+	def setUp(self):
+		self.media = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+		cai_dat = override_settings(MEDIA_ROOT=self.media, COUNTING_SERVICE_PORT=None, COUNTING_CACHE_DIR='')
+		cai_dat.enable()
+		self.addCleanup(cai_dat.disable)
+
+		self.poll = Poll.objects.create(title='Bầu ban chấp hành')
+		self.a = Candidate.objects.create(poll=self.poll, name='Nguyễn Văn A')
+		self.b = Candidate.objects.create(poll=self.poll, name='Trần Thị B')
+		self.cac_phieu = [Ballot.objects.create(poll=self.poll, ballot_key=f'p{i}', ballot_file_path=f'{self.poll.poll_id}/p{i}.jpg',
+												content_hash=f'{i}' * 64) for i in range(1, 3)]
+		self.ket_qua_dir = os.path.join(self.media, str(self.poll.poll_id), f'ket_qua_{self.poll.poll_id}')
+		os.makedirs(self.ket_qua_dir)
+
+	def ghi_ket_qua(self, ballot, cac_dong, on_dinh=True, phien_ban='v1'):
+		# Ghi file kết quả (None: không có file) và dòng sổ ghi của một phiếu như bên kiểm phiếu
+		if cac_dong is not None:
+			with open(os.path.join(self.ket_qua_dir, f'{ballot.ballot_key}.json'), 'w', encoding='utf-8') as f:
+				json.dump(cac_dong, f, ensure_ascii=False)
+		with open(os.path.join(self.ket_qua_dir, TEN_FILE_SO_GHI), 'a', encoding='utf-8') as f:
+			f.write(json.dumps({'anh': f'{ballot.ballot_key}.jpg', 'bam': ballot.content_hash, 'phien_ban': phien_ban,
+								'ket_qua': f'{ballot.ballot_key}.json', 'on_dinh': on_dinh}) + '\n')
+
+	def dong(self, ung_vien, dong_y=True):
+		return {'ho_ten': ung_vien.name.upper(), 'ung_vien_id': ung_vien.candidate_id, 'dong_y': dong_y, 'khong_dong_y': not dong_y}
+
+	def lua_chon(self, ballot):
+		return sorted(Ballot_Selection.objects.filter(ballot=ballot).values_list('candidate_id', flat=True))
+
+	def chay_kiem_phieu(self, cac_su_kien):
+		with mock.patch('quan_ly_phieu_bau.views.chay_subprocess_kiem_phieu', return_value=iter(cac_su_kien)):
+			return [json.loads(dong[len('data: '):]) for dong in counting_stream_generator(self.poll.poll_id)]
+
+	def test_loi_giua_chung_van_luu_phieu_da_xong(self):
+		self.ghi_ket_qua(self.cac_phieu[0], [
+			{'ho_ten': 'NGUYEN VAN A', 'ung_vien_id': self.a.candidate_id, 'dong_y': True, 'khong_dong_y': False},
+			{'ho_ten': 'TRAN THI B', 'ung_vien_id': self.b.candidate_id, 'dong_y': False, 'khong_dong_y': True},
+		])
+		thong_diep = self.chay_kiem_phieu([
+			{'loai': 'xong_phieu', 'image_path': 'p1.jpg', 'da_xu_ly': 1, 'tong': 2},
+			{'loai': 'loi', 'thong_bao': 'Quá trình kiểm phiếu kết thúc với mã lỗi 1'},
+		])
+
+		self.assertEqual(thong_diep[-1]['progress'], -1)
+		self.assertIn('Đã lưu kết quả 1 phiếu', thong_diep[-1]['message'])
+		phieu = Ballot.objects.get(pk=self.cac_phieu[0].pk)
+		self.assertTrue(phieu.is_checked)
+		self.assertEqual(list(Ballot_Selection.objects.filter(ballot=phieu).values_list('candidate_id', flat=True)),
+						 [self.a.candidate_id])
+		self.assertFalse(Ballot.objects.get(pk=self.cac_phieu[1].pk).is_checked)
+		self.assertNotEqual(Poll.objects.get(pk=self.poll.pk).status, 'counted')
+
+	def test_kiem_lai_chi_luu_phieu_doi_phien_ban(self):
+		p1, p2 = self.cac_phieu
+		self.ghi_ket_qua(p1, [self.dong(self.a), self.dong(self.b, False)])
+		self.ghi_ket_qua(p2, [self.dong(self.a, False), self.dong(self.b)])
+		self.assertEqual(len(luu_thong_tin_kiem_phieu(self.poll.poll_id)[0]), 2)
+		# Cùng ảnh và phiên bản: không lưu lại
+		self.assertEqual(luu_thong_tin_kiem_phieu(self.poll.poll_id)[0], [])
+
+		# Đổi danh sách ứng viên (phiên bản mới) với p1: kết quả cũ được thay, tổng hợp không bị cộng hai lần
+		self.ghi_ket_qua(p1, [self.dong(self.a, False), self.dong(self.b)], phien_ban='v2')
+		self.assertEqual(luu_thong_tin_kiem_phieu(self.poll.poll_id)[0], [p1.ballot_id])
+		phieu = Ballot.objects.get(pk=p1.pk)
+		self.assertEqual((phieu.counted_hash, phieu.counted_version), (p1.content_hash, 'v2'))
+		self.assertEqual(self.lua_chon(phieu), [self.b.candidate_id])
+		luot_chon = dict(Candidate_Tally.objects.filter(poll=self.poll).values_list('candidate_id', 'selection_count'))
+		self.assertEqual(luot_chon, {self.a.candidate_id: 0, self.b.candidate_id: 2})
+
+	def test_file_ket_qua_loi_khong_ghi_nhan_hash(self):
+		p1, p2 = self.cac_phieu
+		self.ghi_ket_qua(p1, None)
+		self.ghi_ket_qua(p2, [self.dong(self.a), {'ho_ten': 'TRAN THI B', 'dong_y': True, 'khong_dong_y': True}])
+		self.assertEqual(luu_thong_tin_kiem_phieu(self.poll.poll_id)[0], [p2.ballot_id])
+
+		# Không đọc được file: phiếu chưa được ghi nhận, lần sau lưu lại
+		phieu = Ballot.objects.get(pk=p1.pk)
+		self.assertEqual((phieu.is_checked, phieu.counted_hash), (False, None))
+		# Phiếu không hợp lệ: ghi nhận đã kiểm với đúng ảnh, không có lựa chọn
+		phieu = Ballot.objects.get(pk=p2.pk)
+		self.assertEqual((phieu.is_valid, phieu.counted_hash), (False, p2.content_hash))
+		self.assertEqual(self.lua_chon(phieu), [])
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from quan_ly_phieu_bau.models import Ballot, Poll
+from quan_ly_phieu_bau.phan_trang_phieu import giai_ma_con_tro, lay_trang_phieu, ma_hoa_con_tro
+
+
+class PhanTrangPhieuTest(TestCase):
+	def setUp(self):
+		self.poll = Poll.objects.create(title='Bầu ban chấp hành')
+		goc = timezone.now()
+		# Nhiều phiếu cùng timestamp (tải lên cùng lô) và vài phiếu chưa có timestamp
+		for i in range(7):
+			Ballot.objects.create(poll=self.poll, ballot_key=f'p{i}', timestamp=goc + timedelta(seconds=i // 3),
+								  is_valid=i % 2 == 0)
+		for i in range(7, 9):
+			Ballot.objects.create(poll=self.poll, ballot_key=f'p{i}')
+
+	def lay_het(self, filter_type=None, kich_thuoc=2):
+		cac_phieu, con_tro = [], None
+		while True:
+			trang, con_tro = lay_trang_phieu(self.poll.poll_id, filter_type, con_tro, kich_thuoc)
+			cac_phieu.extend(trang)
+			if con_tro is None:
+				return cac_phieu
+
+	def test_duyet_het_khong_trung_khong_sot(self):
+		cac_phieu = self.lay_het()
+		mong_doi = list(Ballot.objects.filter(poll=self.poll).order_by('timestamp', 'ballot_id').values_list('ballot_id', flat=True))
+		self.assertEqual([b.ballot_id for b in cac_phieu], mong_doi)
+		self.assertEqual([b.so_thu_tu for b in cac_phieu], list(range(1, 10)))
+
+	def test_loc_phieu_hop_le(self):
+		cac_phieu = self.lay_het('valid', kich_thuoc=3)
+		self.assertEqual(len(cac_phieu), Ballot.objects.filter(poll=self.poll, is_valid=True).count())
+		self.assertTrue(all(b.is_valid for b in cac_phieu))
+
+	def test_con_tro(self):
+		phieu = Ballot.objects.filter(poll=self.poll, timestamp__isnull=False).first()
+		timestamp, ballot_id, so_da_hien_thi = giai_ma_con_tro(ma_hoa_con_tro(phieu, 5))
+		self.assertEqual((timestamp, ballot_id, so_da_hien_thi), (phieu.timestamp, phieu.ballot_id, 5))
+		with self.assertRaises(ValueError):
+			giai_ma_con_tro('khong-hop-le')
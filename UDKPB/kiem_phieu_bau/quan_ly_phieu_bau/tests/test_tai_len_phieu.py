@@ -0,0 +1,193 @@
+import hashlib
+import importlib
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+import unicodedata
+from unittest import mock
+
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from quan_ly_phieu_bau.models import Ballot, Ballot_Selection, Candidate, Candidate_Tally, Poll, Poll_Tally
+from quan_ly_phieu_bau import tai_len_phieu
+from quan_ly_phieu_bau.tai_len_phieu import LoiTaiLen, cac_file_trong_zip, luu_phieu_tai_len
+from quan_ly_phieu_bau.tong_hop_phieu import cong_don_lo_ket_qua
+
+
+def tao_zip(cac_file):
+	du_lieu = io.BytesIO()
+	with zipfile.ZipFile(du_lieu, 'w') as zf:
+		for ten, noi_dung in cac_file.items():
+			zf.writestr(ten, noi_dung)
+	du_lieu.seek(0)
+	return du_lieu
+
+
+class TaoBallotKeyTest(TestCase):
+	def test_bo_thu_muc_va_phan_mo_rong(self):
+		self.assertEqual(Ballot.tao_ballot_key('1/ballot_1.jpg'), 'ballot_1')
+		self.assertEqual(Ballot.tao_ballot_key('ballot_1.json'), 'ballot_1')
+		self.assertIsNone(Ballot.tao_ballot_key(''))
+		self.assertIsNone(Ballot.tao_ballot_key(None))
+
+	def test_chuan_hoa_nfc(self):
+		# Tên viết dạng tổ hợp (NFD, ví dụ từ macOS) cho cùng khóa với dạng dựng sẵn (NFC)
+		ten = 'phiếu_1'
+		self.assertEqual(Ballot.tao_ballot_key(unicodedata.normalize('NFD', ten) + '.jpg'), unicodedata.normalize('NFC', ten))
+
+
+class CacFileTrongZipTest(TestCase):
+	def test_chi_lay_ten_file_anh(self):
+		du_lieu = tao_zip({
+			'a.jpg': b'a',
+			'thu_muc/b.PNG': b'b',
+			'../../ngoai.jpg': b'c',
+			'__MACOSX/._a.jpg': b'x',
+			'.an.jpg': b'x',
+			'ghi_chu.txt': b'x',
+			'thu_muc/': b'',
+		})
+		ket_qua = [(ten, b''.join(cac_doan)) for ten, cac_doan in cac_file_trong_zip(du_lieu)]
+		self.assertEqual(ket_qua, [('a.jpg', b'a'), ('b.PNG', b'b'), ('ngoai.jpg', b'c')])
+
+	def test_gioi_han_zip(self):
+		with mock.patch.object(tai_len_phieu, 'SO_MUC_ZIP_TOI_DA', 2):
+			with self.assertRaises(LoiTaiLen):
+				list(cac_file_trong_zip(tao_zip({'a.jpg': b'a', 'b.jpg': b'b', 'c.txt': b'c'})))
+		with mock.patch.object(tai_len_phieu, 'KICH_THUOC_GIAI_NEN_TOI_DA', 1024):
+			with self.assertRaises(LoiTaiLen):
+				list(cac_file_trong_zip(tao_zip({'a.jpg': b'\0' * 2048})))
+		with self.assertRaises(LoiTaiLen):
+			list(cac_file_trong_zip(io.BytesIO(b'khong phai zip')))
+
+
+class LuuPhieuTaiLenTest(TestCase):
+	def setUp(self):
+		self.media = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+		cai_dat = override_settings(MEDIA_ROOT=self.media)
+		cai_dat.enable()
+		self.addCleanup(cai_dat.disable)
+		self.poll = Poll.objects.create(title='Bầu ban chấp hành')
+
+	def test_bo_qua_anh_trung_noi_dung(self):
+		ket_qua = luu_phieu_tai_len(self.poll, [
+			SimpleUploadedFile('p1.jpg', b'anh 1'),
+			SimpleUploadedFile('p2.jpg', b'anh 1'),
+			SimpleUploadedFile('p3.jpg', b'anh 3'),
+		])
+		self.assertEqual(ket_qua, {'them_moi': 2, 'cap_nhat': 0, 'trung_lap': 1})
+		self.assertEqual(sorted(Ballot.objects.filter(poll=self.poll).values_list('ballot_key', flat=True)), ['p1', 'p3'])
+
+	def test_phieu_moi_co_thoi_diem_tai_len(self):
+		truoc = timezone.now()
+		luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh 1'), SimpleUploadedFile('p2.jpg', b'anh 2')])
+		thoi_diem = dict(Ballot.objects.filter(poll=self.poll).values_list('ballot_key', 'timestamp'))
+		self.assertEqual(set(thoi_diem), {'p1', 'p2'})
+		self.assertTrue(all(t is not None and truoc <= t <= timezone.now() for t in thoi_diem.values()))
+
+		# Tải lại file cùng tên giữ thời điểm tải lên ban đầu
+		luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh 1 moi')])
+		self.assertEqual(Ballot.objects.get(poll=self.poll, ballot_key='p1').timestamp, thoi_diem['p1'])
+
+	def test_tai_lai_cung_ten_ghi_de(self):
+		luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh cu')])
+		ket_qua = luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh moi')])
+		self.assertEqual(ket_qua, {'them_moi': 0, 'cap_nhat': 1, 'trung_lap': 0})
+
+		phieu = Ballot.objects.get(poll=self.poll)
+		with open(os.path.join(self.media, phieu.ballot_file_path), 'rb') as f:
+			self.assertEqual(f.read(), b'anh moi')
+
+	def test_tai_lai_anh_khac_bo_ket_qua_cu(self):
+		ung_vien = Candidate.objects.create(poll=self.poll, name='Nguyễn Văn A')
+		luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh cu')])
+		phieu = Ballot.objects.get(poll=self.poll)
+		# Kết quả kiểm của ảnh cũ
+		phieu.is_checked, phieu.counted_hash = True, phieu.content_hash
+		phieu.save()
+		Ballot_Selection.objects.create(ballot=phieu, candidate=ung_vien)
+		cong_don_lo_ket_qua(self.poll.poll_id, [((False, True), phieu, [ung_vien.candidate_id])])
+
+		luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh moi')])
+		phieu = Ballot.objects.get(poll=self.poll)
+		self.assertEqual((phieu.is_checked, phieu.is_valid, phieu.counted_hash), (False, True, None))
+		self.assertFalse(Ballot_Selection.objects.filter(ballot=phieu).exists())
+		self.assertEqual(Poll_Tally.objects.get(poll=self.poll).valid_ballots, 0)
+		self.assertEqual(Candidate_Tally.objects.get(candidate=ung_vien).selection_count, 0)
+
+	def anh_cua(self, ten):
+		with open(os.path.join(self.media, str(self.poll.poll_id), ten), 'rb') as f:
+			return f.read()
+
+	def test_loi_giua_chung_khong_de_lai_phieu_hay_anh(self):
+		luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh cu')])
+		file_loi = SimpleUploadedFile('p2.jpg', b'anh 2')
+		file_loi.chunks = mock.Mock(side_effect=OSError('mất kết nối'))
+		with self.assertRaises(OSError):
+			luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh moi'), file_loi])
+
+		self.assertEqual(list(Ballot.objects.filter(poll=self.poll).values_list('ballot_key', flat=True)), ['p1'])
+		self.assertEqual(self.anh_cua('p1.jpg'), b'anh cu')
+		self.assertFalse(os.path.exists(os.path.join(self.media, str(self.poll.poll_id), 'p2.jpg')))
+
+	def test_loi_khi_dua_anh_vao_tra_lai_anh_cu(self):
+		# Dọn thư mục tạm sau khi lưu (chạy khi transaction commit)
+		with self.captureOnCommitCallbacks(execute=True):
+			luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh cu')])
+		doi_ten = os.replace
+
+		def doi_ten_loi(nguon, dich):
+			if dich.endswith('p2.jpg'):
+				raise OSError('hết dung lượng')
+			return doi_ten(nguon, dich)
+
+		with mock.patch.object(tai_len_phieu.os, 'replace', side_effect=doi_ten_loi):
+			with self.assertRaises(OSError):
+				luu_phieu_tai_len(self.poll, [SimpleUploadedFile('p1.jpg', b'anh moi'), SimpleUploadedFile('p2.jpg', b'anh 2')])
+
+		phieu = Ballot.objects.get(poll=self.poll)
+		self.assertEqual(self.anh_cua('p1.jpg'), b'anh cu')
+		self.assertEqual(phieu.content_hash, hashlib.sha256(b'anh cu').hexdigest())
+		self.assertEqual(sorted(os.listdir(os.path.join(self.media, str(self.poll.poll_id)))), ['p1.jpg'])
+
+	def test_zip_khong_ghi_ra_ngoai_thu_muc(self):
+		luu_phieu_tai_len(self.poll, [SimpleUploadedFile('lo.zip', tao_zip({'../../ngoai.jpg': b'x'}).read())])
+		phieu = Ballot.objects.get(poll=self.poll)
+		self.assertEqual(phieu.ballot_file_path, os.path.join(str(self.poll.poll_id), 'ngoai.jpg'))
+		self.assertTrue(os.path.exists(os.path.join(self.media, str(self.poll.poll_id), 'ngoai.jpg')))
+
+
+class GanBallotKeyTest(TestCase):
+	def setUp(self):
+		self.media = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+		cai_dat = override_settings(MEDIA_ROOT=self.media)
+		cai_dat.enable()
+		self.addCleanup(cai_dat.disable)
+		self.poll = Poll.objects.create(title='Bầu ban chấp hành')
+
+	def test_phieu_trung_ten_duoc_doi_khoa(self):
+		poll_dir = os.path.join(self.media, str(self.poll.poll_id))
+		os.makedirs(poll_dir)
+		for ten in ('p1.jpg', 'p1.png'):
+			with open(os.path.join(poll_dir, ten), 'wb') as f:
+				f.write(ten.encode())
+		cac_duong_dan = [f'{self.poll.poll_id}/p1.jpg', f'{self.poll.poll_id}/p1.png', f'{self.poll.poll_id}/p1_2.jpg']
+		cac_phieu = [Ballot.objects.create(poll=self.poll, ballot_file_path=duong_dan) for duong_dan in cac_duong_dan]
+
+		migration = importlib.import_module('quan_ly_phieu_bau.migrations.0004_ballot_key')
+		migration.gan_ballot_key(apps, None)
+
+		khoa = {b.ballot_id: (b.ballot_key, b.ballot_file_path) for b in Ballot.objects.filter(poll=self.poll)}
+		self.assertEqual(khoa[cac_phieu[0].ballot_id], ('p1', cac_duong_dan[0]))
+		self.assertEqual(khoa[cac_phieu[2].ballot_id], ('p1_2', cac_duong_dan[2]))
+		# Phiếu trùng tên nhận hậu tố chưa dùng, file ảnh được đổi tên theo khóa mới
+		self.assertEqual(khoa[cac_phieu[1].ballot_id], ('p1_3', f'{self.poll.poll_id}/p1_3.png'))
+		with open(os.path.join(poll_dir, 'p1_3.png'), 'rb') as f:
+			self.assertEqual(f.read(), b'p1.png')
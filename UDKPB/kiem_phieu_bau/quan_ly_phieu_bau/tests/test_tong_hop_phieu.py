@@ -0,0 +1,73 @@
+from django.test import TestCase
+
+from quan_ly_phieu_bau.models import Ballot, Ballot_Selection, Candidate, Candidate_Tally, Poll, Poll_Tally
+from quan_ly_phieu_bau.tong_hop_phieu import (
+	bo_phieu_khoi_tong_hop, cap_nhat_trang_thai_phieu, cong_don_lo_ket_qua, tinh_lai_tong_hop,
+)
+
+
+class TongHopPhieuTest(TestCase):
+	def setUp(self):
+		self.poll = Poll.objects.create(title='Bầu ban chấp hành')
+		self.a = Candidate.objects.create(poll=self.poll, name='Nguyễn Văn A')
+		self.b = Candidate.objects.create(poll=self.poll, name='Trần Thị B')
+
+	def tong_hop(self):
+		poll_tally = Poll_Tally.objects.get(poll=self.poll)
+		luot_chon = dict(Candidate_Tally.objects.filter(poll=self.poll).values_list('candidate_id', 'selection_count'))
+		return poll_tally.valid_ballots, poll_tally.invalid_ballots, luot_chon
+
+	def ghi_ket_qua(self, ballot, is_valid, cac_ung_vien):
+		# Ghi kết quả kiểm phiếu như ghi_lo_ket_qua_kiem_phieu và cộng dồn vào tổng hợp
+		truoc = (ballot.is_checked, ballot.is_valid)
+		ballot.is_checked, ballot.is_valid = True, is_valid
+		ballot.save()
+		Ballot_Selection.objects.bulk_create([Ballot_Selection(ballot=ballot, candidate=c) for c in cac_ung_vien])
+		cong_don_lo_ket_qua(self.poll.poll_id, [(truoc, ballot, [c.candidate_id for c in cac_ung_vien])])
+
+	def test_cong_don_khop_tinh_lai(self):
+		p1 = Ballot.objects.create(poll=self.poll, ballot_key='p1')
+		p2 = Ballot.objects.create(poll=self.poll, ballot_key='p2')
+		p3 = Ballot.objects.create(poll=self.poll, ballot_key='p3')
+		self.ghi_ket_qua(p1, True, [self.a, self.b])
+		self.ghi_ket_qua(p2, True, [self.a])
+		self.ghi_ket_qua(p3, False, [])
+
+		cong_don = self.tong_hop()
+		self.assertEqual(cong_don, (2, 1, {self.a.candidate_id: 2, self.b.candidate_id: 1}))
+		tinh_lai_tong_hop(self.poll.poll_id)
+		self.assertEqual(self.tong_hop(), cong_don)
+
+	def test_doi_trang_thai_phieu(self):
+		phieu = Ballot.objects.create(poll=self.poll, ballot_key='p1')
+		self.ghi_ket_qua(phieu, True, [self.a])
+
+		# Đánh dấu không hợp lệ: lượt chọn của phiếu bị trừ khỏi kết quả
+		phieu.is_valid = False
+		phieu.save()
+		cap_nhat_trang_thai_phieu(phieu, (True, True))
+		self.assertEqual(self.tong_hop(), (0, 1, {self.a.candidate_id: 0, self.b.candidate_id: 0}))
+
+		# Đánh dấu lại hợp lệ: lượt chọn được cộng lại
+		phieu.is_valid = True
+		phieu.save()
+		cap_nhat_trang_thai_phieu(phieu, (True, False))
+		self.assertEqual(self.tong_hop(), (1, 0, {self.a.candidate_id: 1, self.b.candidate_id: 0}))
+
+	def test_xoa_phieu(self):
+		p1 = Ballot.objects.create(poll=self.poll, ballot_key='p1')
+		p2 = Ballot.objects.create(poll=self.poll, ballot_key='p2')
+		self.ghi_ket_qua(p1, True, [self.a, self.b])
+		self.ghi_ket_qua(p2, False, [])
+
+		bo_phieu_khoi_tong_hop(p1)
+		p1.delete()
+		bo_phieu_khoi_tong_hop(p2)
+		p2.delete()
+		self.assertEqual(self.tong_hop(), (0, 0, {self.a.candidate_id: 0, self.b.candidate_id: 0}))
+
+	def test_phieu_chua_kiem_khong_duoc_tinh(self):
+		phieu = Ballot.objects.create(poll=self.poll, ballot_key='p1')
+		Ballot_Selection.objects.create(ballot=phieu, candidate=self.a)
+		tinh_lai_tong_hop(self.poll.poll_id)
+		self.assertEqual(self.tong_hop(), (0, 0, {self.a.candidate_id: 0, self.b.candidate_id: 0}))
@@ -0,0 +1,166 @@
+from collections import Counter
+
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+
+from .models import Ballot, Ballot_Selection, Candidate, Candidate_Tally, Poll_Tally
+
+# Bảng tổng hợp chỉ tính phiếu đã kiểm và hợp lệ (lượt chọn của ứng viên, số phiếu hợp lệ);
+# phiếu không hợp lệ được đếm riêng theo is_valid. Các hàm cập nhật cần được gọi trong
+# cùng transaction với thao tác ghi phiếu/lựa chọn tương ứng.
+
+
+def phieu_duoc_tinh(is_checked, is_valid):
+    """
+    Phiếu có được tính vào kết quả hay không (đã kiểm và hợp lệ)
+    """
+    return bool(is_checked and is_valid)
+
+
+def _delta_trang_thai(truoc, ballot):
+    """
+    Thay đổi số phiếu hợp lệ/không hợp lệ khi phiếu chuyển từ trạng thái truoc (is_checked, is_valid)
+    sang trạng thái hiện tại của ballot
+
+    Returns:
+        Tuple (duoc_tinh_truoc, duoc_tinh_sau, delta_hop_le, delta_khong_hop_le)
+    """
+    duoc_tinh_truoc = phieu_duoc_tinh(*truoc)
+    duoc_tinh_sau = phieu_duoc_tinh(ballot.is_checked, ballot.is_valid)
+    return (duoc_tinh_truoc, duoc_tinh_sau,
+            int(duoc_tinh_sau) - int(duoc_tinh_truoc),
+            int(not ballot.is_valid) - int(not truoc[1]))
+
+
+def dam_bao_tong_hop(poll_id):
+    """
+    Tạo dòng tổng hợp của cuộc bỏ phiếu và các ứng viên nếu chưa có
+    """
+    Poll_Tally.objects.get_or_create(poll_id=poll_id)
+    candidate_ids = Candidate.objects.filter(poll_id=poll_id, tally__isnull=True).values_list('candidate_id', flat=True)
+    Candidate_Tally.objects.bulk_create(
+        [Candidate_Tally(candidate_id=cid, poll_id=poll_id) for cid in candidate_ids],
+        ignore_conflicts=True
+    )
+
+
+def cong_don_tong_hop(poll_id, delta_ung_vien=None, delta_hop_le=0, delta_khong_hop_le=0):
+    """
+    Cộng dồn thay đổi vào bảng tổng hợp (mỗi bảng một câu UPDATE)
+
+    Args:
+        delta_ung_vien: Dict candidate_id -> số lượt chọn tăng thêm (có thể âm)
+        delta_hop_le: Số phiếu hợp lệ tăng thêm
+        delta_khong_hop_le: Số phiếu không hợp lệ tăng thêm
+    """
+    delta_ung_vien = {cid: so for cid, so in (delta_ung_vien or {}).items() if so}
+    if not delta_ung_vien and not delta_hop_le and not delta_khong_hop_le:
+        return
+    dam_bao_tong_hop(poll_id)
+
+    if delta_hop_le or delta_khong_hop_le:
+        Poll_Tally.objects.filter(poll_id=poll_id).update(
+            valid_ballots=F('valid_ballots') + delta_hop_le,
+            invalid_ballots=F('invalid_ballots') + delta_khong_hop_le,
+        )
+    if delta_ung_vien:
+        Candidate_Tally.objects.filter(candidate_id__in=delta_ung_vien.keys()).update(
+            selection_count=F('selection_count') + Case(
+                *[When(candidate_id=cid, then=Value(so)) for cid, so in delta_ung_vien.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+
+
+def cong_don_lo_ket_qua(poll_id, thay_doi):
+    """
+    Cộng dồn kết quả của một lô phiếu vừa ghi
+
+    Args:
+        thay_doi: List (trạng thái trước (is_checked, is_valid), ballot sau khi cập nhật,
+            list candidate_id vừa tạo cho phiếu)
+    """
+    delta_ung_vien = Counter()
+    delta_hop_le = 0
+    delta_khong_hop_le = 0
+    for truoc, ballot, candidate_ids in thay_doi:
+        _, duoc_tinh_sau, hop_le, khong_hop_le = _delta_trang_thai(truoc, ballot)
+        delta_hop_le += hop_le
+        delta_khong_hop_le += khong_hop_le
+        if duoc_tinh_sau:
+            delta_ung_vien.update(candidate_ids)
+    cong_don_tong_hop(poll_id, delta_ung_vien, delta_hop_le, delta_khong_hop_le)
+
+
+def _dem_luot_chon(ballot):
+    """
+    Đếm số lượt chọn theo ứng viên của một phiếu
+    """
+    so_luot = Ballot_Selection.objects.filter(ballot=ballot, candidate__isnull=False).values('candidate_id').annotate(so=Count('selection_id'))
+    return {dong['candidate_id']: dong['so'] for dong in so_luot}
+
+
+def cap_nhat_trang_thai_phieu(ballot, truoc):
+    """
+    Cập nhật bảng tổng hợp khi trạng thái của một phiếu thay đổi (gọi sau khi lưu ballot)
+
+    Args:
+        truoc: Trạng thái (is_checked, is_valid) trước khi sửa
+    """
+    duoc_tinh_truoc, duoc_tinh_sau, delta_hop_le, delta_khong_hop_le = _delta_trang_thai(truoc, ballot)
+    delta_ung_vien = {}
+    if duoc_tinh_sau != duoc_tinh_truoc:
+        # Lượt chọn của phiếu được thêm vào hoặc bỏ ra khỏi kết quả
+        dau = 1 if duoc_tinh_sau else -1
+        delta_ung_vien = {cid: dau * so for cid, so in _dem_luot_chon(ballot).items()}
+    cong_don_tong_hop(ballot.poll_id, delta_ung_vien, delta_hop_le, delta_khong_hop_le)
+
+
+def bo_phieu_khoi_tong_hop(ballot):
+    """
+    Trừ phiếu khỏi bảng tổng hợp, gọi trước khi xóa phiếu
+    """
+    duoc_tinh = phieu_duoc_tinh(ballot.is_checked, ballot.is_valid)
+    delta_ung_vien = {}
+    if duoc_tinh:
+        delta_ung_vien = {cid: -so for cid, so in _dem_luot_chon(ballot).items()}
+    cong_don_tong_hop(ballot.poll_id, delta_ung_vien, -int(duoc_tinh), -int(not ballot.is_valid))
+
+
+def dat_lai_ket_qua_phieu(cac_phieu):
+    """
+    Bỏ kết quả kiểm cũ của các phiếu đã đổi ảnh (lựa chọn và phần đã cộng vào bảng tổng hợp),
+    đưa phiếu về trạng thái chưa kiểm để được kiểm lại ở lần kiểm bổ sung
+
+    Args:
+        cac_phieu: List ballot với is_checked, is_valid đang lưu trong database
+    """
+    for ballot in cac_phieu:
+        bo_phieu_khoi_tong_hop(ballot)
+        ballot.is_checked = False
+        ballot.is_valid = True
+        ballot.counted_hash = None
+        ballot.counted_version = None
+    Ballot_Selection.objects.filter(ballot__in=cac_phieu).delete()
+    Ballot.objects.bulk_update(cac_phieu, ['is_checked', 'is_valid', 'counted_hash', 'counted_version'])
+
+
+def tinh_lai_tong_hop(poll_id):
+    """
+    Tính lại toàn bộ bảng tổng hợp của một cuộc bỏ phiếu từ dữ liệu phiếu và lựa chọn
+    """
+    dam_bao_tong_hop(poll_id)
+    dem = Ballot.objects.filter(poll_id=poll_id).aggregate(
+        hop_le=Count('ballot_id', filter=Q(is_valid=True, is_checked=True)),
+        khong_hop_le=Count('ballot_id', filter=Q(is_valid=False)),
+    )
+    Poll_Tally.objects.filter(poll_id=poll_id).update(valid_ballots=dem['hop_le'], invalid_ballots=dem['khong_hop_le'])
+
+    so_luot = dict(Candidate.objects.filter(poll_id=poll_id).annotate(
+        so=Count('ballot_selection', filter=Q(ballot_selection__ballot__is_valid=True,
+                                              ballot_selection__ballot__is_checked=True))
+    ).values_list('candidate_id', 'so'))
+    tallies = list(Candidate_Tally.objects.filter(poll_id=poll_id))
+    for tally in tallies:
+        tally.selection_count = so_luot.get(tally.candidate_id, 0)
+    Candidate_Tally.objects.bulk_update(tallies, ['selection_count'])
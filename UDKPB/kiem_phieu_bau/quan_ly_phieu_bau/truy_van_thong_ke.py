@@ -0,0 +1,108 @@
+from django.db.models import Count, Q
+from django.db.models.functions import Coalesce
+from django.shortcuts import get_object_or_404
+
+from .models import Ballot, Candidate, Poll, Poll_Tally
+
+
+def dem_lua_chon_ung_vien(polls):
+    """
+    Lấy số lượt được chọn của từng ứng viên (từ bảng tổng hợp) cho nhiều cuộc bỏ phiếu trong một truy vấn
+
+    Args:
+        polls: QuerySet (hoặc list id) các cuộc bỏ phiếu cần thống kê
+
+    Returns:
+        Dict poll_id -> list {'candidate_id', 'name', 'count'} xếp theo lượt chọn giảm dần, rồi theo tên
+    """
+    ket_qua = {}
+    candidates = Candidate.objects.filter(poll__in=polls).annotate(
+        count=Coalesce('tally__selection_count', 0)
+    ).values('poll_id', 'candidate_id', 'name', 'count').order_by('poll_id', '-count', 'name')
+    for candidate in candidates:
+        ket_qua.setdefault(candidate.pop('poll_id'), []).append(candidate)
+    return ket_qua
+
+
+def dem_phieu_theo_poll(polls):
+    """
+    Đếm số phiếu (tổng, đã kiểm, hợp lệ đã kiểm) của nhiều cuộc bỏ phiếu trong một truy vấn
+
+    Returns:
+        Dict poll_id -> {'total_ballots', 'checked_ballots', 'valid_checked_ballots'}
+    """
+    ket_qua = {}
+    thong_ke = Ballot.objects.filter(poll__in=polls).values('poll_id').annotate(
+        total_ballots=Count('ballot_id'),
+        checked_ballots=Count('ballot_id', filter=Q(is_checked=True)),
+        valid_checked_ballots=Count('ballot_id', filter=Q(is_checked=True, is_valid=True)),
+    ).order_by()
+    for dong in thong_ke:
+        ket_qua[dong.pop('poll_id')] = dong
+    return ket_qua
+
+
+def thong_ke_cac_cuoc_bo_phieu(polls):
+    """
+    Thống kê ứng viên dẫn đầu và số phiếu của các cuộc bỏ phiếu với số truy vấn cố định (3 truy vấn)
+
+    Returns:
+        List dict theo thứ tự polls: poll_id, poll_title, top_candidate, top_count, status,
+        total_ballots, checked_ballots, valid_checked_ballots
+    """
+    polls = list(polls)
+    poll_ids = [poll.poll_id for poll in polls]
+    lua_chon = dem_lua_chon_ung_vien(poll_ids)
+    so_phieu = dem_phieu_theo_poll(poll_ids)
+
+    thong_ke_data = []
+    for poll in polls:
+        cac_ung_vien = lua_chon.get(poll.poll_id, [])
+        # Ứng viên được chọn nhiều nhất
+        top_candidate = cac_ung_vien[0] if cac_ung_vien else None
+        dem = so_phieu.get(poll.poll_id, {})
+        thong_ke_data.append({
+            'poll_id': poll.poll_id,
+            'poll_title': poll.title,
+            'top_candidate': top_candidate['name'] if top_candidate else '-',
+            'top_count': top_candidate['count'] if top_candidate else 0,
+            'status': poll.status or '-',
+            'total_ballots': dem.get('total_ballots', 0),
+            'checked_ballots': dem.get('checked_ballots', 0),
+            'valid_checked_ballots': dem.get('valid_checked_ballots', 0),
+        })
+    return thong_ke_data
+
+
+def thong_ke_mot_cuoc_bo_phieu(poll):
+    """
+    Thống kê chi tiết một cuộc bỏ phiếu từ bảng tổng hợp (2 truy vấn, đọc O(số ứng viên) dòng)
+
+    Returns:
+        Dict gồm candidate_stats (list {'candidate_id', 'name', 'count'}), valid_ballots và invalid_ballots
+    """
+    tally = Poll_Tally.objects.filter(poll_id=poll.poll_id).first()
+    return {
+        'candidate_stats': dem_lua_chon_ung_vien([poll.poll_id]).get(poll.poll_id, []),
+        'valid_ballots': tally.valid_ballots if tally else 0,
+        'invalid_ballots': tally.invalid_ballots if tally else 0,
+    }
+
+
+def tom_tat_cuoc_bo_phieu(poll_id):
+    """
+    Lấy cuộc bỏ phiếu kèm người tạo, các bộ đếm phiếu (một truy vấn đếm có điều kiện)
+    và danh sách ứng viên (prefetch), tổng cộng 2 truy vấn
+
+    Returns:
+        Poll có thêm các thuộc tính total_ballots, checked_ballots, unchecked_ballots,
+        valid_ballots, invalid_ballots; poll.candidate_set.all() đã được load sẵn
+    """
+    polls = Poll.objects.select_related('created_by').annotate(
+        total_ballots=Count('ballot'),
+        checked_ballots=Count('ballot', filter=Q(ballot__is_checked=True)),
+        unchecked_ballots=Count('ballot', filter=Q(ballot__is_checked=False)),
+        valid_ballots=Count('ballot', filter=Q(ballot__is_valid=True)),
+        invalid_ballots=Count('ballot', filter=Q(ballot__is_valid=False)),
+    ).prefetch_related('candidate_set')
+    return get_object_or_404(polls, poll_id=poll_id)
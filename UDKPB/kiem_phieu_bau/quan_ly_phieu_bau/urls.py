@@ -28,6 +28,7 @@ urlpatterns = [
     path('poll/<int:poll_id>/upload_ballots/', views.upload_ballots, name='upload_ballots'),
     path('poll/<int:poll_id>/ballots/', views.ballot_list, name='ballot_list'),
     path('poll/<int:poll_id>/ballots/view/', views.ballot_view, name='ballot_view'),
+    path('poll/<int:poll_id>/ballots/page/', views.ballot_page_json, name='ballot_page_json'),
     path('poll/delete/<int:poll_id>/', views.delete_poll, name='delete_poll'),
     
     path('ajax/stream-counting/<int:poll_id>/', views.kiem_phieu_stream, name='kiem_phieu_stream'),
@@ -9,7 +9,9 @@ from django.shortcuts import render, redirect, get_object_or_404, HttpResponse
 from django.contrib.auth.hashers import make_password
 from .models import Account
 from .models import Poll, Candidate, Ballot
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseBadRequest
+from django.utils import timezone
+from django.utils.formats import date_format
 import time # Để giả lập xử lý
 import json
 from django.http import StreamingHttpResponse
@@ -20,10 +22,19 @@ import glob
 import json as pyjson
 import datetime
 from django.contrib import messages
-from django.db.models import Count
+from django.db.models import Count, F, Q
 from django.urls import reverse
+from .dich_vu_kiem_phieu import dich_vu_duoc_cau_hinh, gui_viec_kiem_phieu, chay_subprocess_kiem_phieu
+from ballot_processing_system.core.so_khop_ung_vien import BoSoKhopUngVien
+from ballot_processing_system.core.so_ghi_kiem_phieu import TEN_FILE_SO_GHI, doc_so_ghi
+from .tong_hop_phieu import cong_don_lo_ket_qua, cap_nhat_trang_thai_phieu, bo_phieu_khoi_tong_hop, dat_lai_ket_qua_phieu, tinh_lai_tong_hop
+from .phan_trang_phieu import KICH_THUOC_TRANG, lay_trang_phieu
+from .tai_len_phieu import LoiTaiLen, luu_phieu_tai_len, ghi_file_va_bam, xoa_file_neu_co
+from .truy_van_thong_ke import thong_ke_cac_cuoc_bo_phieu, thong_ke_mot_cuoc_bo_phieu, tom_tat_cuoc_bo_phieu
 from django.contrib.auth.decorators import login_required
+import uuid
 import zipfile
+import tempfile
 from io import BytesIO
 
 def home(request):
@@ -43,37 +54,20 @@ def thong_ke(request):
 		# User khác chỉ xem được các cuộc bỏ phiếu do mình tạo
 		polls = Poll.objects.filter(created_by=request.user)
 	
-	thong_ke_data = []
-	for poll in polls:
-		# Annotate số lượt chọn cho từng ứng viên thuộc poll này
-		candidates = Candidate.objects.filter(poll=poll).annotate(
-			num_selected=Count('ballot_selection')
-		)
-		# Tìm ứng viên được chọn nhiều nhất
-		top_candidate = candidates.order_by('-num_selected', 'name').first()
-		thong_ke_data.append({
-			'poll_id': poll.poll_id,
-			'poll_title': poll.title,
-			'top_candidate': top_candidate.name if top_candidate else '-',
-			'top_count': top_candidate.num_selected if top_candidate else 0,
-			'status': poll.status or '-',
-		})
+	# Ứng viên dẫn đầu và số phiếu của mọi cuộc bỏ phiếu (số truy vấn không phụ thuộc số cuộc bỏ phiếu)
+	thong_ke_data = thong_ke_cac_cuoc_bo_phieu(polls)
 	return render(request, 'quan_ly_phieu_bau/thong_ke.html', {'thong_ke_data': thong_ke_data})
 
 # Thống kê chi tiết cho 1 cuộc bỏ phiếu
 @login_required
 def thong_ke_detail(request, poll_id):
 	poll = get_object_or_404(Poll, poll_id=poll_id)
-	# Lấy danh sách ứng cử viên và số lượt được chọn
-	from django.db.models import Count
-	candidate_stats = Candidate.objects.filter(poll=poll).annotate(
-		count=Count('ballot_selection')
-	).values('name', 'count').order_by('-count', 'name')
-	valid_checked_ballots = Ballot.objects.filter(poll=poll, is_valid=True, is_checked=True).count()
+	# Lấy danh sách ứng cử viên, số lượt được chọn và số phiếu hợp lệ đã kiểm
+	thong_ke_poll = thong_ke_mot_cuoc_bo_phieu(poll)
 	return render(request, 'quan_ly_phieu_bau/thong_ke/detail.html', {
 		'poll': poll,
-		'candidate_stats': candidate_stats,
-		'total_ballots': valid_checked_ballots,
+		'candidate_stats': thong_ke_poll['candidate_stats'],
+		'total_ballots': thong_ke_poll['valid_ballots'],
 	})
 
 @login_required
@@ -368,14 +362,9 @@ def poll_detail(request, poll_id):
 	# 		})
 	# 	return redirect('permission_denied')
 	
-	poll = get_object_or_404(Poll, poll_id=poll_id)
-	candidates = Candidate.objects.filter(poll=poll)
-	ballots = Ballot.objects.filter(poll=poll)
-	total_ballots = ballots.count()
-	checked_ballots = ballots.filter(is_checked=True).count()
-	unchecked_ballots = ballots.filter(is_checked=False).count()
-	valid_ballots = ballots.filter(is_valid=True).count()
-	invalid_ballots = ballots.filter(is_valid=False).count()
+	# Cuộc bỏ phiếu, các bộ đếm phiếu và danh sách ứng viên trong 2 truy vấn
+	poll = tom_tat_cuoc_bo_phieu(poll_id)
+	candidates = poll.candidate_set.all()
 	# Lấy username người tạo nếu có
 	created_by_username = None
 	if poll.created_by:
@@ -390,11 +379,11 @@ def poll_detail(request, poll_id):
 	return render(request, 'quan_ly_phieu_bau/poll/detail.html', {
 		'poll': poll,
 		'candidates': candidates,
-		'total_ballots': total_ballots,
-		'checked_ballots': checked_ballots,
-		'unchecked_ballots': unchecked_ballots,
-		'valid_ballots': valid_ballots,
-		'invalid_ballots': invalid_ballots,
+		'total_ballots': poll.total_ballots,
+		'checked_ballots': poll.checked_ballots,
+		'unchecked_ballots': poll.unchecked_ballots,
+		'valid_ballots': poll.valid_ballots,
+		'invalid_ballots': poll.invalid_ballots,
 		'created_by_username': created_by_username,
 		'tutorial': tutorial,
 	})
@@ -579,23 +568,21 @@ def upload_ballots(request, poll_id):
 	poll = get_object_or_404(Poll, poll_id=poll_id)
 	if request.method == 'POST' and request.FILES.getlist('ballot_files'):
 		files = request.FILES.getlist('ballot_files')
-		poll_dir = os.path.join(settings.MEDIA_ROOT, str(poll_id))
-		os.makedirs(poll_dir, exist_ok=True)
-		count = 0
-		for f in files:
-			file_path = os.path.join(poll_dir, f.name)
-			with open(file_path, 'wb+') as destination:
-				for chunk in f.chunks():
-					destination.write(chunk)
-			rel_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
-			Ballot.objects.create(poll=poll, ballot_file_path=rel_path)
-			count += 1
+		# Ảnh hoặc file ZIP chứa ảnh: ghi file kèm tính hash, bỏ ảnh trùng, tạo phiếu hàng loạt
+		try:
+			ket_qua = luu_phieu_tai_len(poll, files)
+		except LoiTaiLen as e:
+			return JsonResponse({'success': False, 'message': str(e)})
+		count = ket_qua['them_moi'] + ket_qua['cap_nhat']
+		message = f'Tải lên {count} phiếu bầu thành công!'
+		if ket_qua['trung_lap']:
+			message += f" Bỏ qua {ket_qua['trung_lap']} ảnh trùng nội dung."
 		if request.headers.get('x-requested-with') == 'XMLHttpRequest':
 			redirect_url = reverse('poll_detail', kwargs={'poll_id': poll_id})
 			return JsonResponse({
 				'success': True,
 				'redirect_url': redirect_url,
-				'message': f'Tải lên {count} phiếu bầu thành công!'
+				'message': message
 			})
 	return render(request, 'quan_ly_phieu_bau/ballot/upload.html', {'poll': poll})
 
@@ -611,75 +598,61 @@ def ballot_list(request, poll_id):
 	# 			'message': 'Bạn không có quyền truy cập chức năng này!'
 	# 		})
 	# 	return redirect('permission_denied')
-	poll = get_object_or_404(Poll, poll_id=poll_id)
-	filter_type = request.GET.get('filter')
-	ballots = Ballot.objects.filter(poll=poll).order_by('timestamp')
-	if filter_type == 'valid':
-		ballots = ballots.filter(is_valid=True)
-	elif filter_type == 'invalid':
-		ballots = ballots.filter(is_valid=False)
-
-	# Add ballot_name property to each ballot
-	def extract_ballot_name(ballot_file_path):
-		if not ballot_file_path:
-			return None
-		import os
-		filename = os.path.basename(ballot_file_path)
-		for ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
-			if filename.lower().endswith(ext):
-				return filename[:-len(ext)]
-		return os.path.splitext(filename)[0]
-
-	for ballot in ballots:
-		ballot.ballot_name = extract_ballot_name(ballot.ballot_file_path)
-
-	return render(request, 'quan_ly_phieu_bau/ballot/list.html', {
-		'poll': poll,
-		'ballots': ballots,
-		'MEDIA_URL': settings.MEDIA_URL,
-	})
+	return _render_trang_phieu(request, poll_id, 'quan_ly_phieu_bau/ballot/list.html')
 
 @login_required
 def ballot_view(request, poll_id):
+	return _render_trang_phieu(request, poll_id, 'quan_ly_phieu_bau/ballot/view.html')
+
+def _render_trang_phieu(request, poll_id, template):
+	"""
+	Hiển thị một trang phiếu bầu (phân trang theo con trỏ, giữ bộ lọc hợp lệ/không hợp lệ)
+	"""
 	poll = get_object_or_404(Poll, poll_id=poll_id)
 	filter_type = request.GET.get('filter')
-	ballots = Ballot.objects.filter(poll=poll).order_by('timestamp')
-	if filter_type == 'valid':
-		ballots = ballots.filter(is_valid=True)
-	elif filter_type == 'invalid':
-		ballots = ballots.filter(is_valid=False)
-	# Add ballot_name property to each ballot (reuse logic from ballot_list)
-	def extract_ballot_name(ballot_file_path):
-		if not ballot_file_path:
-			return None
-		import os
-		filename = os.path.basename(ballot_file_path)
-		for ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
-			if filename.lower().endswith(ext):
-				return filename[:-len(ext)]
-		return os.path.splitext(filename)[0]
-	for ballot in ballots:
-		ballot.ballot_name = extract_ballot_name(ballot.ballot_file_path)
-	return render(request, 'quan_ly_phieu_bau/ballot/view.html', {
+	try:
+		ballots, next_cursor = lay_trang_phieu(poll.poll_id, filter_type, request.GET.get('cursor'))
+	except ValueError:
+		return HttpResponseBadRequest('Con trỏ phân trang không hợp lệ')
+	return render(request, template, {
 		'poll': poll,
 		'ballots': ballots,
+		'filter_type': filter_type or '',
+		'next_cursor': next_cursor,
+		'is_first_page': not request.GET.get('cursor'),
 		'MEDIA_URL': settings.MEDIA_URL,
 	})
 
+# Trang phiếu bầu dạng JSON cho cuộn vô hạn
+@login_required
+def ballot_page_json(request, poll_id):
+	get_object_or_404(Poll, poll_id=poll_id)
+	try:
+		kich_thuoc = int(request.GET.get('page_size', KICH_THUOC_TRANG))
+		ballots, next_cursor = lay_trang_phieu(poll_id, request.GET.get('filter'), request.GET.get('cursor'), kich_thuoc)
+	except ValueError:
+		return JsonResponse({'success': False, 'message': 'Tham số phân trang không hợp lệ'}, status=400)
+	return JsonResponse({
+		'success': True,
+		'ballots': [{
+			'ballot_id': ballot.ballot_id,
+			'stt': ballot.so_thu_tu,
+			'ballot_name': ballot.ballot_name,
+			'timestamp': ballot.timestamp.isoformat() if ballot.timestamp else None,
+			'timestamp_display': date_format(timezone.localtime(ballot.timestamp), 'DATETIME_FORMAT') if ballot.timestamp else None,
+			'image_url': f"{settings.MEDIA_URL}{ballot.ballot_file_path}" if ballot.ballot_file_path else None,
+			'is_checked': ballot.is_checked,
+			'is_valid': ballot.is_valid,
+			'detail_url': reverse('ballot_detail', args=[ballot.ballot_id]),
+			'delete_url': reverse('delete_ballot', args=[ballot.ballot_id]),
+			'view_url': reverse('ballot_view_detail', args=[ballot.ballot_id]),
+		} for ballot in ballots],
+		'next_cursor': next_cursor,
+	})
+
 @login_required
 def ballot_view_detail(request, ballot_id):
 	ballot = get_object_or_404(Ballot, ballot_id=ballot_id)
-	# Add ballot_name property for display
-	def extract_ballot_name(ballot_file_path):
-		if not ballot_file_path:
-			return None
-		import os
-		filename = os.path.basename(ballot_file_path)
-		for ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
-			if filename.lower().endswith(ext):
-				return filename[:-len(ext)]
-		return os.path.splitext(filename)[0]
-	ballot.ballot_name = extract_ballot_name(ballot.ballot_file_path)
 	return render(request, 'quan_ly_phieu_bau/ballot/view_detail.html', {
 		'ballot': ballot,
 		'MEDIA_URL': settings.MEDIA_URL,
@@ -693,6 +666,41 @@ def ballot_list_redirect(request, poll_id):
 	else:
 		return redirect('ballot_view', poll_id=poll_id)
 	
+def theo_doi_tien_do_kiem_phieu(nguon_su_kien, total_ballots):
+	"""
+	Chuyển các sự kiện tiến độ (từ dịch vụ kiểm phiếu hoặc subprocess) thành sự kiện SSE ngay khi nhận được.
+	Trả về thông báo lỗi nếu quá trình kiểm phiếu báo lỗi (None nếu chạy xong), để counting_stream_generator
+	vẫn lưu kết quả các phiếu đã xử lý xong trước khi báo lỗi.
+	"""
+	import math
+	for su_kien in nguon_su_kien:
+		loai = su_kien.get('loai')
+		if loai == 'loi':
+			return su_kien.get('thong_bao', 'Quá trình kiểm phiếu gặp lỗi')
+		if loai not in ('bat_dau_phieu', 'xong_phieu', 'loi_phieu'):
+			continue
+
+		count = su_kien.get('da_xu_ly', 0)
+		tong = su_kien.get('tong') or total_ballots
+		ten_phieu = os.path.basename(su_kien.get('image_path', ''))
+		if loai == 'bat_dau_phieu':
+			message = f'Đang kiểm phiếu {ten_phieu} ({count}/{tong} phiếu đã xong)...'
+		elif loai == 'xong_phieu':
+			message = f'Đã kiểm được {count}/{tong} phiếu...'
+		else:
+			message = f'Lỗi khi kiểm phiếu {ten_phieu}: {su_kien.get("loi")} ({count}/{tong})'
+			print(f"[WARNING] {message}")
+		progress = min(99, max(5, math.floor((count / tong) * 100))) if tong else 99
+		update_data = {
+			'message': message,
+			'progress': progress,
+			'event': loai,
+			'ballot': ten_phieu,
+			'stage_times': su_kien.get('thoi_gian_giai_doan', {}),
+			'cached': su_kien.get('tu_cache', False)
+		}
+		yield f"data: {json.dumps(update_data)}\n\n"
+
 def counting_stream_generator(poll_id):
 	"""
 	Đây là một hàm generator. Nó sẽ chạy, trả về dữ liệu với 'yield',
@@ -716,73 +724,85 @@ def counting_stream_generator(poll_id):
 		error_data = {'message': 'Lỗi: Chưa có danh sách phiếu bầu!', 'progress': -1}
 		yield f"data: {json.dumps(error_data)}\n\n"
 		return
-	if poll.status == 'counted':
-		error_data = {'message': 'Lỗi: Cuộc bỏ phiếu đã được kiểm!', 'progress': -1}
-		yield f"data: {json.dumps(error_data)}\n\n"
-		return
+	# Cuộc bỏ phiếu đã kiểm vẫn được kiểm lại: bên kiểm phiếu và bước lưu kết quả chỉ xử lý các phiếu
+	# mới, đã đổi ảnh, hoặc có kết quả thuộc phiên bản cũ (đổi danh sách ứng viên, model...)
 
 	try:
 		# Đường dẫn input/output
 		input_dir = os.path.join(settings.MEDIA_ROOT, str(poll_id))
 		output_dir = input_dir  # theo yêu cầu
-		ket_qua_dir = os.path.join(input_dir, f"ket_qua_{poll_id}")
-
-		# Xóa thư mục ket_qua cũ nếu có (nếu muốn làm sạch)
-		if os.path.exists(ket_qua_dir):
-			import shutil
-			shutil.rmtree(ket_qua_dir)
+		# Giữ thư mục ket_qua và sổ ghi của lần chạy trước: bên kiểm phiếu chỉ xử lý
+		# các phiếu chưa có kết quả (chạy tiếp sau khi bị dừng) hoặc đã đổi ảnh
 
 		# Giai đoạn 1: Thông báo bắt đầu
 		update_data = {'message': 'Bắt đầu quá trình kiểm phiếu...', 'progress': 5}
 		yield f"data: {json.dumps(update_data)}\n\n"
 
-		# Chạy lệnh kiểm phiếu bằng subprocess (không chờ hoàn thành)
-		cmd = [
-			'python',
-			'-m', 'processors.trocr_yolo',
-			'--input_dir', input_dir,
-			'--output_dir', output_dir
-		]
-		# Xác định đường dẫn tuyệt đối tới ballot_processing_system
-		ballot_processing_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../ballot_processing_system'))
-		#proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=ballot_processing_dir)
-		proc = subprocess.Popen(cmd, cwd=ballot_processing_dir)
-
-		print("Đã khởi chạy quá trình kiểm phiếu...")
-		# Theo dõi tiến trình sinh file json mỗi 5s
-		import glob
-		import math
-		last_count = 0
-		while True:
-			time.sleep(10)
-			# Đếm số file json trong ket_qua_{poll_id}
-			json_files = glob.glob(os.path.join(ket_qua_dir, '*.json'))
-			count = len(json_files)
-			if count > last_count:
-				last_count = count
-			print(f"Đã phát hiện {count} phiếu...")
-			progress = min(99, max(5, math.floor((count / total_ballots) * 100))) if total_ballots else 99
-			update_data = {
-				'message': f'Đã kiểm được {count}/{total_ballots} phiếu...',
-				'progress': progress
-			}
-			yield f"data: {json.dumps(update_data)}\n\n"
-			# Nếu đã đủ số phiếu hoặc process đã kết thúc thì break
-			if count >= total_ballots:
-				break
-			if proc.poll() is not None:
-				# Nếu process đã kết thúc nhưng chưa đủ file, vẫn break để tránh lặp vô hạn
-				break
+		# Danh sách ứng viên để bên kiểm phiếu gắn sẵn ung_vien_id cho từng dòng
+		danh_sach_ung_vien = list(Candidate.objects.filter(poll=poll).values_list('candidate_id', 'name'))
 
-		# Đợi process kết thúc hẳn (nếu chưa)
-		proc.wait()
+		# Ưu tiên gửi việc cho dịch vụ kiểm phiếu đang chạy (model đã load sẵn)
+		nguon_su_kien = None
+		if dich_vu_duoc_cau_hinh():
+			try:
+				nguon_su_kien = gui_viec_kiem_phieu(poll_id, input_dir, output_dir, danh_sach_ung_vien,
+													settings.COUNTING_CACHE_DIR or None, tiep_tuc=True)
+				print("Đã gửi việc cho dịch vụ kiểm phiếu...")
+			except Exception as e:
+				print(f"[WARNING] Không kết nối được dịch vụ kiểm phiếu, chuyển sang subprocess: {e}")
+
+		if nguon_su_kien is None:
+			# Danh sách ứng viên ghi ra file tạm ngoài thư mục media, xóa khi subprocess kết thúc
+			with tempfile.NamedTemporaryFile('w', encoding='utf-8', prefix=f'ung_vien_{poll_id}_', suffix='.json',
+											 delete=False) as f:
+				pyjson.dump([{'id': cid, 'ho_ten': name} for cid, name in danh_sach_ung_vien], f, ensure_ascii=False)
+				ung_vien_path = f.name
+
+			# Chạy lệnh kiểm phiếu bằng subprocess, đọc sự kiện tiến độ từ stdout
+			cmd = [
+				'python',
+				'-m', 'processors.trocr_yolo',
+				'--input_dir', input_dir,
+				'--output_dir', output_dir,
+				'--workers', str(settings.COUNTING_WORKERS),
+				'--candidates', ung_vien_path,
+				'--resume',
+				'--progress',
+				'--trocr_mode', settings.COUNTING_TROCR_MODE,
+				'--backend', settings.COUNTING_BACKEND
+			]
+			if settings.COUNTING_PIPELINE:
+				cmd.append('--pipeline')
+			if settings.COUNTING_CACHE_DIR:
+				cmd.extend(['--cache_dir', settings.COUNTING_CACHE_DIR])
+			if settings.COUNTING_TROCR_DECODING:
+				cmd.extend(['--trocr_decoding', settings.COUNTING_TROCR_DECODING])
+			if settings.COUNTING_CANDIDATE_DECODING:
+				cmd.append('--candidate_decoding')
+			if settings.COUNTING_TEMPLATE_NAMES:
+				cmd.append('--template_names')
+			if settings.COUNTING_FAST_PATH:
+				cmd.append('--fast_path')
+			nguon_su_kien = chay_subprocess_kiem_phieu(cmd, settings.BALLOT_PROCESSING_DIR, [ung_vien_path])
+			print("Đã khởi chạy quá trình kiểm phiếu...")
+
+		loi_kiem_phieu = yield from theo_doi_tien_do_kiem_phieu(nguon_su_kien, total_ballots)
 
 		# Thông báo đang lưu dữ liệu vào database
 		update_data = {'message': 'Đang tiến hành lưu dữ liệu vào database...', 'progress': 99}
 		yield f"data: {json.dumps(update_data)}\n\n"
 
-		# Gọi hàm lưu thông tin kiểm phiếu
-		luu_thong_tin_kiem_phieu(poll_id)
+		# Gọi hàm lưu thông tin kiểm phiếu (chỉ các phiếu có kết quả mới); khi kiểm phiếu bị lỗi
+		# giữa chừng vẫn lưu các phiếu đã có trong sổ ghi, lần kiểm sau chỉ xử lý các phiếu còn lại
+		ballot_id_list, _, _ = luu_thong_tin_kiem_phieu(poll_id)
+		if loi_kiem_phieu:
+			error_data = {
+				'message': f'Lỗi kiểm phiếu: {loi_kiem_phieu}. Đã lưu kết quả {len(ballot_id_list)} phiếu đã xử lý xong, '
+						   'kiểm phiếu lại để xử lý các phiếu còn lại.',
+				'progress': -1
+			}
+			yield f"data: {json.dumps(error_data)}\n\n"
+			return
 
 		# Ghi nhận thời gian kết thúc kiểm phiếu và cập nhật trạng thái
 		poll.counting_end_time = datetime.datetime.now()
@@ -790,7 +810,7 @@ def counting_stream_generator(poll_id):
 		poll.save(update_fields=["counting_end_time", "status"])
 
 		# Giai đoạn cuối: Báo cáo thành công
-		success_data = {'message': 'Kiểm phiếu hoàn tất!', 'progress': 100}
+		success_data = {'message': f'Kiểm phiếu hoàn tất! Đã lưu kết quả {len(ballot_id_list)} phiếu.', 'progress': 100}
 		yield f"data: {json.dumps(success_data)}\n\n"
 	except Exception as e:
 		error_data = {'message': f'Lỗi hệ thống: {str(e)}', 'progress': -1}
@@ -818,78 +838,167 @@ def kiem_phieu_stream(request, poll_id):
 	response['X-Accel-Buffering'] = 'no'
 	return response
 
+# Số phiếu được ghi vào database trong một transaction khi lưu kết quả kiểm phiếu
+KICH_THUOC_LO_LUU_KET_QUA = 500
+
+class PhieuKhongHopLe(ValueError):
+	"""
+	Kết quả kiểm phiếu đọc được nhưng phiếu không hợp lệ (khác với lỗi đọc file kết quả)
+	"""
+
+def doc_lua_chon_tu_ket_qua(json_path, bo_so_khop):
+	"""
+	Đọc file kết quả kiểm phiếu của một phiếu và trả về danh sách candidate_id được đồng ý.
+	Dùng ung_vien_id do bên kiểm phiếu gắn sẵn nếu hợp lệ, nếu không thì so khớp họ tên bằng bo_so_khop.
+	Ném PhieuKhongHopLe nếu phiếu không hợp lệ (cả đồng ý và không đồng ý cùng True hoặc cùng False),
+	lỗi khác nếu không đọc được file kết quả.
+	"""
+	with open(json_path, 'r', encoding='utf-8') as f:
+		data = pyjson.load(f)
+	candidate_ids = []
+	# data là list các dict
+	for row in data:
+		# Kiểm tra hợp lệ từng dòng
+		dong_y = row.get('dong_y')
+		khong_dong_y = row.get('khong_dong_y')
+		if dong_y is not None and khong_dong_y is not None:
+			if (dong_y and khong_dong_y) or (not dong_y and not khong_dong_y):
+				raise PhieuKhongHopLe('Phiếu không hợp lệ do cả đồng ý và không đồng ý cùng True hoặc cùng False')
+		if not dong_y:
+			continue
+		# Nếu hợp lệ, chọn ứng viên khớp nhất với trường ho_ten
+		best_cid = row.get('ung_vien_id')
+		if best_cid not in bo_so_khop.tap_id:
+			best_cid, best_ratio = bo_so_khop.so_khop(row.get('ho_ten', ''))
+		if best_cid:
+			candidate_ids.append(best_cid)
+	return candidate_ids
+
+def ghi_lo_ket_qua_kiem_phieu(lo_ket_qua):
+	"""
+	Ghi một lô kết quả kiểm phiếu vào database trong một transaction, cập nhật luôn bảng tổng hợp.
+	lo_ket_qua là list (ballot, list candidate_id, hash ảnh, phiên bản của kết quả), list candidate_id là None
+	nếu phiếu không hợp lệ. counted_hash/counted_version chỉ được ghi cùng kết quả đã lưu thành công.
+	Nếu ghi cả lô bị lỗi thì ghi lại từng phiếu để lỗi của một phiếu không ảnh hưởng phiếu khác;
+	phiếu vẫn lỗi được giữ nguyên (chưa có counted_hash) để lần kiểm sau lưu lại.
+
+	Returns:
+		List các ballot đã được lưu kết quả
+	"""
+	selections = []
+	thay_doi = []
+	for ballot, candidate_ids, bam, phien_ban in lo_ket_qua:
+		truoc = (ballot.is_checked, ballot.is_valid)
+		ballot.counted_hash, ballot.counted_version = bam, phien_ban
+		if candidate_ids is None:
+			ballot.is_valid = False
+		else:
+			# Đánh dấu đã kiểm phiếu
+			ballot.is_checked = True
+			selections.extend(Ballot_Selection(ballot=ballot, candidate_id=cid) for cid in candidate_ids)
+		thay_doi.append((truoc, ballot, candidate_ids or []))
+
+	cac_truong = ['is_valid', 'is_checked', 'counted_hash', 'counted_version']
+	try:
+		with transaction.atomic():
+			Ballot_Selection.objects.bulk_create(selections)
+			Ballot.objects.bulk_update([ballot for ballot, _, _, _ in lo_ket_qua], cac_truong)
+			cong_don_lo_ket_qua(lo_ket_qua[0][0].poll_id, thay_doi)
+		return [ballot for ballot, _, _, _ in lo_ket_qua]
+	except Exception as e:
+		print(f"[WARNING] Lỗi khi lưu lô {len(lo_ket_qua)} phiếu, lưu lại từng phiếu: {e}")
+
+	da_luu = []
+	for truoc, ballot, candidate_ids in thay_doi:
+		try:
+			with transaction.atomic():
+				Ballot_Selection.objects.bulk_create([Ballot_Selection(ballot=ballot, candidate_id=cid) for cid in candidate_ids])
+				ballot.save(update_fields=cac_truong)
+				cong_don_lo_ket_qua(ballot.poll_id, [(truoc, ballot, candidate_ids)])
+			da_luu.append(ballot)
+		except Exception as e:
+			# Transaction đã rollback: trả ballot về trạng thái đang lưu, không ghi nhận hash để kiểm lại
+			ballot.is_checked, ballot.is_valid = truoc
+			ballot.counted_hash = ballot.counted_version = None
+			print(f"[ERROR] Không lưu được kết quả phiếu {ballot.ballot_key}: {e}")
+	return da_luu
+
 def luu_thong_tin_kiem_phieu(poll_id):
 	"""
 	Hàm này sẽ lưu thông tin kiểm phiếu vào cơ sở dữ liệu.
+	Chỉ lưu các phiếu có trong sổ ghi của bên kiểm phiếu mà chưa được lưu với đúng ảnh và phiên bản đó
+	(phiếu mới, phiếu đã đổi ảnh, kết quả lần trước có lỗi OCR/YOLO, hoặc đã đổi danh sách ứng viên/model);
+	phiếu đã có kết quả được bỏ kết quả cũ trước. Phiếu không đọc được file kết quả được bỏ qua để lần sau lưu lại.
 	"""
 	poll = get_object_or_404(Poll, poll_id=poll_id)
 
-	# Lấy danh sách ballot của poll này
-	ballots = Ballot.objects.filter(poll=poll)
-	ballot_id_list = []
-	ballot_name_list = []
-	for ballot in ballots:
-		ballot_id_list.append(ballot.ballot_id)
-		# Lấy tên gốc từ ballot_file_path, ví dụ: '1/ballot_1.jpg' -> 'ballot_1'
-		if ballot.ballot_file_path:
-			base = os.path.basename(ballot.ballot_file_path)
-			name, _ = os.path.splitext(base)
-			ballot_name_list.append(name)
-		else:
-			ballot_name_list.append("")
-
 	# Lấy danh sách Candidate, lưu (id, name viết hoa)
 	candidates = Candidate.objects.filter(poll=poll)
 	candidate_info_list = [(c.candidate_id, c.name.upper() if c.name else "") for c in candidates]
+	bo_so_khop = BoSoKhopUngVien(candidate_info_list)
 
 	# Đường dẫn kết quả kiểm phiếu
-	ket_qua_dir = os.path.join('media', str(poll_id), f'ket_qua_{poll_id}')
-	
-	json_files = glob.glob(os.path.join(ket_qua_dir, '*.json'))
-
-	for json_path in json_files:
-		file_name = os.path.basename(json_path)
-		name_no_ext, _ = os.path.splitext(file_name)
-		if name_no_ext in ballot_name_list:
-			idx = ballot_name_list.index(name_no_ext)
-			ballot_id = ballot_id_list[idx]
-			ballot = Ballot.objects.get(ballot_id=ballot_id)
+	ket_qua_dir = os.path.join(settings.MEDIA_ROOT, str(poll_id), f'ket_qua_{poll_id}')
+
+	# Sổ ghi: tên ảnh -> hash ảnh và file kết quả (mỗi ảnh một dòng mới nhất)
+	cac_muc = list(doc_so_ghi(os.path.join(ket_qua_dir, TEN_FILE_SO_GHI)).values())
+
+	ballot_id_list = []
+	ballot_name_list = []
+	for dau_lo in range(0, len(cac_muc), KICH_THUOC_LO_LUU_KET_QUA):
+		# Tên ảnh trùng với khóa phiếu: tra các phiếu của lô bằng chỉ mục (poll, ballot_key)
+		muc_theo_khoa = {}
+		for muc in cac_muc[dau_lo:dau_lo + KICH_THUOC_LO_LUU_KET_QUA]:
+			muc_theo_khoa.setdefault(Ballot.tao_ballot_key(muc['anh']), muc)
+		ballot_theo_khoa = {
+			ballot.ballot_key: ballot
+			for ballot in Ballot.objects.filter(poll=poll, ballot_key__in=muc_theo_khoa.keys())
+		}
+
+		lo_ket_qua = []
+		kiem_lai = []
+		chi_gan_hash = []
+		for ballot_key, muc in muc_theo_khoa.items():
+			ballot = ballot_theo_khoa.get(ballot_key)
+			if ballot is None:
+				continue
+			phien_ban = muc.get('phien_ban')
+			if ballot.counted_hash == muc['bam'] and muc.get('on_dinh'):
+				if ballot.counted_version == phien_ban:
+					# Đã lưu kết quả của đúng ảnh và phiên bản này ở lần kiểm trước
+					continue
+				if ballot.counted_version is None:
+					# Lưu trước khi có cột phiên bản: giữ kết quả cũ, chỉ ghi nhận phiên bản
+					ballot.counted_version = phien_ban
+					chi_gan_hash.append(ballot)
+					continue
+			if ballot.counted_hash == '':
+				# Đã kiểm trước khi có sổ ghi (không rõ ảnh lúc kiểm): giữ kết quả cũ, chỉ ghi nhận hash
+				ballot.counted_hash, ballot.counted_version = muc['bam'], phien_ban
+				chi_gan_hash.append(ballot)
+				continue
 			try:
-				with transaction.atomic():
-					with open(json_path, 'r', encoding='utf-8') as f:
-						data = pyjson.load(f)
-					# data là list các dict
-					import difflib
-					for row in data:
-						# Kiểm tra hợp lệ dòng đầu tiên
-						dong_y = row.get('dong_y')
-						khong_dong_y = row.get('khong_dong_y')
-						if dong_y is not None and khong_dong_y is not None:
-							if (dong_y and khong_dong_y) or (not dong_y and not khong_dong_y):
-								ballot.is_valid = False
-								ballot.save(update_fields=['is_valid'])
-								# Nếu không hợp lệ, rollback transaction và sang file tiếp theo
-								raise Exception('Phiếu không hợp lệ do cả đồng ý và không đồng ý cùng True hoặc cùng False')
-						# Nếu hợp lệ, kiểm tra trường ho_ten bằng similarity
-						ho_ten = row.get('ho_ten', '').strip().upper()
-						ratios = []
-						for cid, cname in candidate_info_list:
-							ratio = difflib.SequenceMatcher(None, ho_ten, cname).ratio()
-							ratios.append((cid, ratio))
-						# Chọn ứng viên có tỉ lệ similarity cao nhất
-						if ratios:
-							best_cid, best_ratio = max(ratios, key=lambda x: x[1])
-							if best_cid and dong_y:
-								Ballot_Selection.objects.create(ballot=ballot, candidate_id=best_cid)
-					# Đánh dấu đã kiểm phiếu
-					ballot.is_checked = True
-					ballot.save(update_fields=['is_checked'])
+				candidate_ids = doc_lua_chon_tu_ket_qua(os.path.join(ket_qua_dir, muc['ket_qua']), bo_so_khop)
+			except PhieuKhongHopLe:
+				# Phiếu không hợp lệ: không tạo lựa chọn nào cho ballot này
+				candidate_ids = None
 			except Exception as e:
-				# Nếu có lỗi, rollback transaction, không tạo gì cho ballot này
-				ballot.is_valid = False
-				ballot.save(update_fields=['is_valid'])
+				print(f"[WARNING] Không đọc được kết quả phiếu {ballot_key}, bỏ qua: {e}")
 				continue
-	# Trả về các danh sách nếu cần debug
+			if ballot.counted_hash is not None:
+				kiem_lai.append(ballot)
+			lo_ket_qua.append((ballot, candidate_ids, muc['bam'], phien_ban))
+
+		if chi_gan_hash:
+			Ballot.objects.bulk_update(chi_gan_hash, ['counted_hash', 'counted_version'])
+		if kiem_lai:
+			with transaction.atomic():
+				dat_lai_ket_qua_phieu(kiem_lai)
+		if lo_ket_qua:
+			for ballot in ghi_lo_ket_qua_kiem_phieu(lo_ket_qua):
+				ballot_id_list.append(ballot.ballot_id)
+				ballot_name_list.append(ballot.ballot_key)
+	# Trả về các danh sách (phiếu vừa được lưu kết quả) nếu cần debug
 	return ballot_id_list, ballot_name_list, candidate_info_list
 
 @login_required
@@ -972,6 +1081,7 @@ def delete_all_ballots(request, poll_id):
 				except Exception:
 					pass
 		ballot.delete()
+	tinh_lai_tong_hop(poll_id)
 	# Redirect to poll detail with notification
 	return redirect(f'/poll/{poll_id}/?deleted_ballots={count}')
 
@@ -989,6 +1099,8 @@ def ballot_detail(request, ballot_id):
 	# 	return redirect('permission_denied')
 	ballot = get_object_or_404(Ballot, ballot_id=ballot_id)
 	if request.method == 'POST':
+		# Trạng thái trước khi sửa để cập nhật bảng tổng hợp
+		truoc = (ballot.is_checked, ballot.is_valid)
 		# Update timestamp
 		timestamp = request.POST.get('timestamp')
 		if timestamp:
@@ -1001,6 +1113,7 @@ def ballot_detail(request, ballot_id):
 				ballot.timestamp = datetime.datetime.strptime(timestamp, '%Y-%m-%d %H:%M')
 			except Exception:
 				pass
+		doi_anh = False
 		# Update is_checked
 		is_checked = request.POST.get('is_checked')
 		ballot.is_checked = (is_checked == 'True')
@@ -1010,16 +1123,41 @@ def ballot_detail(request, ballot_id):
 		# Handle file upload
 		if request.FILES.get('ballot_file'):
 			f = request.FILES['ballot_file']
-			poll_id = ballot.poll.poll_id
+			poll_id = ballot.poll_id
+			ballot_key = Ballot.tao_ballot_key(f.name)
+			if Ballot.objects.filter(poll_id=poll_id, ballot_key=ballot_key).exclude(ballot_id=ballot.ballot_id).exists():
+				message = f'Đã có phiếu bầu khác tên {ballot_key} trong cuộc bỏ phiếu này!'
+				if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+					return JsonResponse({'success': False, 'message': message})
+				messages.error(request, message)
+				return redirect('ballot_detail', ballot_id=ballot.ballot_id)
 			poll_dir = os.path.join(settings.MEDIA_ROOT, str(poll_id))
 			os.makedirs(poll_dir, exist_ok=True)
-			file_path = os.path.join(poll_dir, f.name)
-			with open(file_path, 'wb+') as destination:
-				for chunk in f.chunks():
-					destination.write(chunk)
+			file_path = os.path.join(poll_dir, os.path.basename(f.name))
+			# Ghi ra file tạm rồi mới đổi tên, để ảnh lỗi giữa chừng không ghi đè ảnh đang có
+			file_tam = os.path.join(poll_dir, f'.tai_len_{uuid.uuid4().hex}')
+			try:
+				content_hash = ghi_file_va_bam(f.chunks(), file_tam)
+				os.replace(file_tam, file_path)
+			finally:
+				xoa_file_neu_co(file_tam)
 			rel_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
+			if ballot.ballot_file_path and ballot.ballot_file_path != rel_path:
+				# Ảnh cũ khác tên: xóa sau khi lưu phiếu thành công
+				file_cu = os.path.join(settings.MEDIA_ROOT, ballot.ballot_file_path)
+				transaction.on_commit(lambda: xoa_file_neu_co(file_cu))
+			doi_anh = content_hash != ballot.content_hash
+			ballot.content_hash = content_hash
 			ballot.ballot_file_path = rel_path
-		ballot.save()
+			ballot.ballot_key = ballot_key
+		with transaction.atomic():
+			if doi_anh:
+				# Ảnh mới: bỏ kết quả kiểm của ảnh cũ (trạng thái đang lưu), phiếu chờ kiểm lại
+				ballot.is_checked, ballot.is_valid = truoc
+				dat_lai_ket_qua_phieu([ballot])
+				truoc = (ballot.is_checked, ballot.is_valid)
+			ballot.save()
+			cap_nhat_trang_thai_phieu(ballot, truoc)
 		if request.headers.get('x-requested-with') == 'XMLHttpRequest':
 			return JsonResponse({
 				'success': True,
@@ -1054,7 +1192,9 @@ def delete_ballot(request, ballot_id):
 				os.remove(file_path)
 			except Exception:
 				pass
-	ballot.delete()
+	with transaction.atomic():
+		bo_phieu_khoi_tong_hop(ballot)
+		ballot.delete()
 	return redirect('ballot_list', poll_id=poll_id)
 
 def download_sample_ballots(request):